@@ -0,0 +1,179 @@
+import asyncio
+import json
+
+from agents import function_tool
+from agents.mcp import MCPServer
+
+from agent.tracing import trace_meta
+from maps.geo_utils import parse_point
+
+# route_between_places / matrix_between_places for the default two-server setup.
+# maps/map_server.py has the same tools, but there both halves live in one process;
+# here they chain geocode_place on the geo server into route_between / distance_matrix
+# on the routing server, so Nominatim and OSRM are still only reached through the
+# server (and rate limiter) that owns them, and without a model round trip in between.
+
+
+def _normalize(text: str) -> str:
+    # same as geo_server._normalize_query: one lookup per distinct name
+    return " ".join(text.casefold().split())
+
+
+async def _call(server: MCPServer, tool: str, arguments: dict) -> dict:
+    # max_bytes=0: the whole result, it is trimmed to what the model needs below
+    result = await server.call_tool(tool, {**arguments, "max_bytes": 0}, meta=trace_meta())
+    body = json.loads(result.content[0].text)
+    if result.isError or "error" in body:
+        raise ValueError(f"{tool}: {body.get('error', body)}")
+    return body
+
+
+async def _resolve(geo: MCPServer, places: list[str], country_code: str | None) -> dict[str, dict]:
+    """
+    Geocode distinct place names concurrently → {normalized name: resolved place}.
+    Raises ValueError naming every place that has no match.
+    """
+    unique: dict[str, str] = {}
+    for place in places:
+        if not isinstance(place, str) or not place.strip():
+            raise ValueError("Place names must be non-empty strings.")
+        unique.setdefault(_normalize(place), place)
+
+    async def lookup(place: str) -> dict | None:
+        # "33.9,35.48" is already a point, no need to ask Nominatim
+        point = parse_point(place)
+        if point is not None:
+            return {"query": place, "lat": point[0], "lon": point[1]}
+        arguments = {"query": place, "limit": 1}
+        if country_code:
+            arguments["country_code"] = country_code
+        # the geo server queues these at NOMINATIM_RATE itself
+        results = (await _call(geo, "geocode_place", arguments))["results"]
+        if not results:
+            return None
+        best = results[0]
+        return {
+            "query": place,
+            "name": best["display_name"],
+            "lat": float(best["lat"]),
+            "lon": float(best["lon"]),
+        }
+
+    resolved = dict(zip(unique, await asyncio.gather(*(lookup(p) for p in unique.values()))))
+    missing = [unique[key] for key, found in resolved.items() if found is None]
+    if missing:
+        raise ValueError(f"No geocoding match for: {', '.join(repr(p) for p in missing)}")
+    return resolved
+
+
+def _error(context, error: Exception) -> str:
+    # like the servers' {"error": ...}, so the model sees which names didn't match
+    return json.dumps({"error": str(error)})
+
+
+def composite_tools(geo: MCPServer, routing: MCPServer) -> list:
+    """
+    Function tools over two connected servers (maps.geo_server, maps.routing_server).
+    """
+
+    @function_tool(failure_error_function=_error)
+    async def route_between_places(
+        origin: str,
+        destination: str,
+        profile: str = "driving",
+        country_code: str | None = None,
+        overview: str = "false",
+    ) -> str:
+        """
+        Geocode two places and route between them in one call. Prefer this over
+        geocode_place + route_between when the user names the places.
+
+        Args:
+            origin: Place name or address, or "lat,lon".
+            destination: Place name or address, or "lat,lon".
+            profile: OSRM profile: driving, walking or cycling.
+            country_code: Optional ISO country code to restrict geocoding, e.g. 'lb'.
+            overview: 'false' (no geometry), 'simplified' or 'full' (polyline5 geometry).
+        """
+        places = await _resolve(geo, [origin, destination], country_code)
+        start = places[_normalize(origin)]
+        end = places[_normalize(destination)]
+        arguments = {
+            "start_lat": start["lat"],
+            "start_lon": start["lon"],
+            "end_lat": end["lat"],
+            "end_lon": end["lon"],
+            "profile": profile,
+            "overview": overview,
+        }
+        if overview != "false":
+            arguments["encoding"] = "polyline"
+        route = await _call(routing, "route_between", arguments)
+
+        result = {
+            "origin": start,
+            "destination": end,
+            "profile": profile,
+            "distance_m": route["distance_m"],
+            "duration_s": route["duration_s"],
+        }
+        if overview != "false" and route.get("geometry"):
+            result["geometry"] = route["geometry"]
+            result["geometry_encoding"] = "polyline5"
+        return json.dumps(result)
+
+    @function_tool(failure_error_function=_error)
+    async def matrix_between_places(
+        places: list[str] | None = None,
+        sources: list[str] | None = None,
+        destinations: list[str] | None = None,
+        profile: str = "driving",
+        annotations: str = "duration",
+        country_code: str | None = None,
+        handle: bool = False,
+    ) -> str:
+        """
+        Geocode places and build their travel-time / distance matrix in one call.
+        Prefer this over geocoding each place and calling distance_matrix.
+
+        Args:
+            places: Names or "lat,lon" for an all-to-all matrix.
+            sources: Origin names (with destinations, instead of places).
+            destinations: Destination names (with sources, instead of places).
+            profile: OSRM profile: driving, walking or cycling.
+            annotations: 'duration', 'distance' or 'duration,distance'.
+            country_code: Optional ISO country code to restrict geocoding, e.g. 'lb'.
+            handle: Keep the matrix on the routing server and return a handle for extend_matrix.
+        """
+        if sources and destinations:
+            source_names, destination_names = sources, destinations
+            symmetric = False
+        elif places:
+            source_names = destination_names = places
+            symmetric = True
+        else:
+            raise ValueError("Provide 'places', or both 'sources' and 'destinations'.")
+
+        resolved = await _resolve(geo, source_names + ([] if symmetric else destination_names), country_code)
+        source_places = [resolved[_normalize(name)] for name in source_names]
+        destination_places = source_places if symmetric else [resolved[_normalize(n)] for n in destination_names]
+
+        arguments = {"profile": profile, "annotations": annotations, "handle": handle}
+        if symmetric:
+            arguments["coordinates"] = [[p["lat"], p["lon"]] for p in source_places]
+        else:
+            arguments["sources"] = [[p["lat"], p["lon"]] for p in source_places]
+            arguments["destinations"] = [[p["lat"], p["lon"]] for p in destination_places]
+        matrix = await _call(routing, "distance_matrix", arguments)
+
+        result = {"profile": profile}
+        if matrix.get("handle"):
+            result["handle"] = matrix["handle"]
+        result["sources"] = source_places
+        if not symmetric:
+            result["destinations"] = destination_places
+        result["durations"] = matrix.get("durations")
+        result["distances"] = matrix.get("distances")
+        return json.dumps(result)
+
+    return [route_between_places, matrix_between_places]
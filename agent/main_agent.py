@@ -1,10 +1,54 @@
 import asyncio
+import contextlib
 import os
 import sys
 
 from dotenv import load_dotenv
 from agents import Agent, Runner
-from agents.mcp import MCPServerStdio
+from agents.mcp import MCPServerSse, MCPServerStdio, MCPServerStreamableHttp
+
+from agent.composite_tools import composite_tools
+from agent.tracing import server_env, setup_tracing, trace_meta
+from maps.config import env_flag, env_float, env_str
+
+# how long the agent waits for one tool call. Upstream calls are queued at NOMINATIM_RATE /
+# OSRM_RATE (1 req/s by default), so a batch_geocode of 200 addresses, a refined isochrone
+# or a long snap_points / match_trace trace can take minutes, far past the SDK's 5 s default.
+# Read when the servers are set up, after main() has loaded .env.
+def _client_timeout() -> float:
+    return env_float("MAPS_CLIENT_TIMEOUT_S", 600.0)
+
+
+def _mcp_server(name: str, module: str, url_env: str):
+    """
+    Connect to an already-running server when `url_env` is set, e.g.
+    GEO_SERVER_URL=http://maps-node:8765/mcp (or .../sse for the older SSE transport);
+    otherwise spawn `python -m <module>` over stdio as before.
+    """
+    url = env_str(url_env, "")
+    timeout = _client_timeout()
+    if url:
+        # the result of a long call arrives over SSE, so its read timeout has to match too
+        params = {"url": url, "sse_read_timeout": timeout}
+        server_cls = MCPServerSse if url.rstrip("/").endswith("/sse") else MCPServerStreamableHttp
+        return server_cls(
+            name=name,
+            params=params,
+            client_session_timeout_seconds=timeout,
+            tool_meta_resolver=trace_meta,
+        )
+    return MCPServerStdio(
+        name=name,
+        params={
+            # use the same Python that is running this script (should be the venv one)
+            "command": sys.executable,
+            "args": ["-m", module],  # e.g. runs `python -m maps.geo_server`
+            "env": server_env(),
+        },
+        client_session_timeout_seconds=timeout,
+        # passes the tool call's trace context along in the request _meta
+        tool_meta_resolver=trace_meta,
+    )
 
 
 async def main() -> None:
@@ -18,29 +62,31 @@ async def main() -> None:
             "before running this script."
         )
 
-    # use the same Python that is running this script (should be the venv one)
-    python_cmd = sys.executable
+    # MAPS_TRACE_FILE=trace.jsonl → spans from this process and both servers
+    # (summarize with `python -m maps.tracing trace.jsonl`)
+    setup_tracing()
 
-    # MCP server for geocoding / reverse / POI search
-    geo_server = MCPServerStdio(
-        name="Geo MCP Server",
-        params={
-            "command": python_cmd,
-            "args": ["-m", "maps.geo_server"],  # runs `python -m maps.geo_server`
-        },
-    )
-
-    # MCP server for routing / distance matrix
-    routing_server = MCPServerStdio(
-        name="Routing MCP Server",
-        params={
-            "command": python_cmd,
-            "args": ["-m", "maps.routing_server"],
-        },
-    )
+    # two servers by default; MAPS_SINGLE_SERVER=1 (or MAP_SERVER_URL) → the combined one
+    single = env_flag("MAPS_SINGLE_SERVER", False) or bool(env_str("MAP_SERVER_URL", ""))
+    if single:
+        # every tool from one process (maps/map_server.py): one interpreter and one
+        # mcp import instead of two, so sessions come up faster and use less memory,
+        # (or one shared, already-running combined server when MAP_SERVER_URL is set)
+        servers = [_mcp_server("Map MCP Server", "maps.map_server", "MAP_SERVER_URL")]
+    else:
+        servers = [
+            # MCP server for geocoding / reverse / POI search
+            _mcp_server("Geo MCP Server", "maps.geo_server", "GEO_SERVER_URL"),
+            # MCP server for routing / distance matrix
+            _mcp_server("Routing MCP Server", "maps.routing_server", "ROUTING_SERVER_URL"),
+        ]
 
-    # start both MCP servers and attach them to the agent
-    async with geo_server as geo, routing_server as routing:
+    # start the MCP server(s) and attach them to the agent
+    async with contextlib.AsyncExitStack() as stack:
+        mcp_servers = [await stack.enter_async_context(server) for server in servers]
+        # route_between_places / matrix_between_places: the combined server has them
+        # itself, with two servers they run here and call both
+        tools = [] if single else composite_tools(*mcp_servers)
         # this is the main agent that will call the MCP tools under the hood
         agent = Agent(
             name="Map Assistant",
@@ -48,9 +94,13 @@ async def main() -> None:
                 "You are a helpful map assistant. "
                 "Use the available MCP tools to: "
                 "1) geocode places, 2) search POIs, 3) plan routes and distance matrices. "
+                "When the user names the places, use route_between_places and "
+                "matrix_between_places instead of geocoding each place first: "
+                "they geocode and route in one call. "
                 "Always explain what you did and summarize the results clearly."
             ),
-            mcp_servers=[geo, routing],
+            tools=tools,
+            mcp_servers=mcp_servers,
         )
 
         print("🚀 Map agent ready. Ask things like:")
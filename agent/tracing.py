@@ -0,0 +1,165 @@
+import os
+from datetime import datetime
+
+from agents import add_trace_processor, get_current_span, get_current_trace
+from agents.tracing import Span, Trace, TracingProcessor
+
+from maps.config import server_config_env
+from maps.tracing import SpanContext, Tracer, format_traceparent
+
+# Agents SDK side of MAPS_TRACE_FILE tracing (see maps/tracing.py).
+# The SDK already opens spans for each run, agent turn, LLM response and tool call;
+# JsonlTraceProcessor writes them into the same JSONL file as the MCP servers, and
+# trace_meta() hands the current span to the servers as a traceparent in the MCP
+# request's _meta, so a tool call's server and upstream spans hang under it.
+
+_KINDS = {
+    "agent": "agent",
+    "turn": "turn",
+    "response": "llm",
+    "generation": "llm",
+    "function": "tool",
+    "mcp_tools": "mcp",
+    "handoff": "agent",
+    "guardrail": "agent",
+}
+
+# set by setup_tracing(), after main() has loaded .env
+_trace_file: str | None = None
+
+
+def _trace_hex(trace_id: str) -> str:
+    # "trace_<32 hex>" → W3C trace id
+    return trace_id.removeprefix("trace_")[:32].ljust(32, "0")
+
+
+def _span_hex(span_id: str) -> str:
+    # "span_<24 hex>" → 16 hex chars, enough to stay unique within a trace
+    return span_id.removeprefix("span_")[:16].ljust(16, "0")
+
+
+def _root_hex(trace_id: str) -> str:
+    # the SDK's trace has no span id of its own; top-level spans hang under this one
+    return _trace_hex(trace_id)[:16]
+
+
+def _epoch(value: str | None) -> float | None:
+    return datetime.fromisoformat(value).timestamp() if value else None
+
+
+def _span_name(data: dict) -> str:
+    kind = data.get("type")
+    if kind == "generation":
+        return str(data.get("model") or "generation")
+    if kind == "mcp_tools":
+        return f"list tools {data.get('server') or ''}".rstrip()
+    return str(data.get("name") or kind)
+
+
+class JsonlTraceProcessor(TracingProcessor):
+    """
+    Writes the SDK's spans (minus prompts and tool payloads) to MAPS_TRACE_FILE.
+    """
+
+    def __init__(self, tracer: Tracer):
+        self.tracer = tracer
+        self._trace_starts: dict[str, float] = {}
+
+    def on_trace_start(self, trace: Trace) -> None:
+        self._trace_starts[trace.trace_id] = datetime.now().timestamp()
+
+    def on_trace_end(self, trace: Trace) -> None:
+        start = self._trace_starts.pop(trace.trace_id, None)
+        if start is None:
+            return
+        self.tracer.write(
+            {
+                "trace_id": _trace_hex(trace.trace_id),
+                "span_id": _root_hex(trace.trace_id),
+                "parent_id": None,
+                "name": trace.name,
+                "kind": "run",
+                "service": self.tracer.service,
+                "start": round(start, 6),
+                "duration_ms": round((datetime.now().timestamp() - start) * 1000, 3),
+                "status": "ok",
+                "attrs": {},
+            }
+        )
+
+    def on_span_start(self, span: Span) -> None:
+        pass
+
+    def on_span_end(self, span: Span) -> None:
+        data = span.span_data.export()
+        kind = data.get("type")
+        start, end = _epoch(span.started_at), _epoch(span.ended_at)
+        if start is None or end is None:
+            return
+        attrs = {}
+        if kind == "response" and data.get("usage"):
+            attrs["usage"] = data["usage"]
+        elif kind == "function" and data.get("mcp_data"):
+            attrs["mcp"] = data["mcp_data"]
+        self.tracer.write(
+            {
+                "trace_id": _trace_hex(span.trace_id),
+                "span_id": _span_hex(span.span_id),
+                "parent_id": _span_hex(span.parent_id) if span.parent_id else _root_hex(span.trace_id),
+                "name": _span_name(data),
+                "kind": _KINDS.get(kind, kind),
+                "service": self.tracer.service,
+                "start": round(start, 6),
+                "duration_ms": round((end - start) * 1000, 3),
+                "status": "error" if span.error else "ok",
+                "attrs": {**attrs, "error": span.error["message"]} if span.error else attrs,
+            }
+        )
+
+    def shutdown(self) -> None:
+        self.tracer.close()
+
+    def force_flush(self) -> None:
+        pass
+
+
+def trace_meta(context=None) -> dict | None:
+    """
+    tool_meta_resolver for MCPServerStdio: sends the open tool-call span as the
+    parent of the server's spans.
+    """
+    if _trace_file is None:
+        return None
+    span = get_current_span()
+    if span is not None:
+        return {"traceparent": format_traceparent(SpanContext(_trace_hex(span.trace_id), _span_hex(span.span_id)))}
+    trace = get_current_trace()
+    if trace is not None:
+        return {"traceparent": format_traceparent(SpanContext(_trace_hex(trace.trace_id), _root_hex(trace.trace_id)))}
+    return None
+
+
+def setup_tracing() -> JsonlTraceProcessor | None:
+    """
+    Registers the JSONL processor when MAPS_TRACE_FILE is set (no-op otherwise).
+    """
+    global _trace_file
+    path = os.environ.get("MAPS_TRACE_FILE", "").strip()
+    if not path:
+        return None
+    _trace_file = os.path.abspath(path)
+    processor = JsonlTraceProcessor(Tracer("agent", _trace_file))
+    add_trace_processor(processor)
+    return processor
+
+
+def server_env() -> dict:
+    """
+    Env for the stdio servers, on top of the few safe variables they inherit from this
+    process: every map-server setting (ROUTING_BACKEND, OSRM_BASE, GEOCODER_BACKEND, ...,
+    see maps/config.py) from the shell or .env, and the same trace file.
+    """
+    env = server_config_env()
+    if _trace_file:
+        env["MAPS_TRACE_FILE"] = _trace_file
+    return env
@@ -0,0 +1,126 @@
+# benchmarks/bench_extend_matrix.py
+#
+# A comparison that keeps growing: start with an all-to-all matrix of --start points,
+# then add --add points per step, --steps times. Each step is answered two ways against
+# the local fake OSRM:
+#   recompute  distance_matrix again with every point (what the agent did before)
+#   extend     extend_matrix on a handle: only the new rows and columns
+# and the script reports /table requests, cells the upstream computed and wall time,
+# then checks that both ways end with the same matrix.
+#
+#   python -m benchmarks.bench_extend_matrix --start 20 --add 1 --steps 10 --latency-ms 20
+#   python -m benchmarks.bench_extend_matrix --start 150 --add 5 --steps 5 --check
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+
+import numpy as np
+
+from benchmarks.fake_upstreams import FakeUpstream, make_osrm_app
+from maps import routing_server
+from maps.http_clients import aclose_clients
+
+# every /table request and the cells it asked for
+_counts = {"requests": 0, "cells": 0}
+_table_tile = routing_server._table_tile
+
+
+async def _counting_tile(profile, src_points, dst_points, annotations, same_points):
+    _counts["requests"] += 1
+    _counts["cells"] += len(src_points) * (len(src_points) if same_points else len(dst_points))
+    return await _table_tile(profile, src_points, dst_points, annotations, same_points)
+
+
+def _random_points(n: int, seed: int) -> list[list[float]]:
+    rng = random.Random(seed)
+    return [[33.80 + rng.random() * 0.15, 35.45 + rng.random() * 0.10] for _ in range(n)]
+
+
+async def _timed(tool, arguments: dict) -> tuple[dict, dict]:
+    before = dict(_counts)
+    t0 = time.perf_counter()
+    result = await tool({**arguments, "max_bytes": 0})
+    elapsed = time.perf_counter() - t0
+    payload = json.loads(result[0].text)
+    if "error" in payload:
+        raise RuntimeError(payload["error"])
+    cost = {key: _counts[key] - before[key] for key in _counts}
+    cost["seconds"] = elapsed
+    return payload, cost
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--start", type=int, default=20, help="points in the first matrix")
+    parser.add_argument("--add", type=int, default=1, help="points added per step")
+    parser.add_argument("--steps", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--annotations", default="distance,duration")
+    parser.add_argument("--check", action="store_true", help="exit 1 unless extend matches and is cheaper")
+    args = parser.parse_args()
+
+    routing_server._table_tile = _counting_tile
+    points = _random_points(args.start + args.add * args.steps, seed=0)
+
+    async with FakeUpstream(make_osrm_app(latency_ms=args.latency_ms)) as osrm_url:
+        routing_server.OSRM_POOL.set_endpoints(osrm_url)
+        routing_server.OSRM_SCHEDULER.set_rate(0)
+
+        first, _ = await _timed(
+            routing_server._tool_distance_matrix,
+            {"coordinates": points[: args.start], "annotations": args.annotations, "handle": True},
+        )
+        handle = first["handle"]
+
+        print(
+            f"start {args.start} points, +{args.add} per step, table limit "
+            f"{routing_server.OSRM_TABLE_MAX_COORDS} coords, upstream latency {args.latency_ms} ms"
+        )
+        print(f"{'points':>7}  {'':10} {'requests':>8} {'cells':>9} {'ms':>9}")
+        totals = {"recompute": {"cells": 0, "seconds": 0.0}, "extend": {"cells": 0, "seconds": 0.0}}
+        recomputed = extended = None
+        for step in range(1, args.steps + 1):
+            n = args.start + step * args.add
+            recomputed, full = await _timed(
+                routing_server._tool_distance_matrix,
+                {"coordinates": points[:n], "annotations": args.annotations},
+            )
+            extended, grown = await _timed(
+                routing_server._tool_extend_matrix,
+                {"handle": handle, "coordinates": points[n - args.add : n]},
+            )
+            for label, cost in (("recompute", full), ("extend", grown)):
+                totals[label]["cells"] += cost["cells"]
+                totals[label]["seconds"] += cost["seconds"]
+                print(f"{n:>7}  {label:10} {cost['requests']:>8} {cost['cells']:>9} {cost['seconds'] * 1000:9.1f}")
+
+        print(
+            f"\ntotal cells: recompute {totals['recompute']['cells']}, extend {totals['extend']['cells']} "
+            f"({totals['extend']['cells'] / totals['recompute']['cells']:.1%})"
+        )
+        print(
+            f"total time:  recompute {totals['recompute']['seconds']:.2f} s, "
+            f"extend {totals['extend']['seconds']:.2f} s"
+        )
+
+        same = all(
+            np.allclose(
+                np.array(recomputed[key], dtype=float), np.array(extended[key], dtype=float), equal_nan=True
+            )
+            for key in ("durations", "distances")
+            if recomputed[key] is not None
+        )
+        cheaper = totals["extend"]["cells"] < totals["recompute"]["cells"]
+        print(f"{'ok  ' if same else 'FAIL'} extended matrix matches the recomputed one")
+        print(f"{'ok  ' if cheaper else 'FAIL'} extending computes fewer cells")
+        await aclose_clients()
+        if args.check and not (same and cheaper):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,95 @@
+# benchmarks/bench_http_pool.py
+#
+# Before/after comparison for the pooled upstream clients:
+#   before → a brand new httpx.AsyncClient per call (the old _nominatim_get/_osrm_get)
+#   after  → the shared keep-alive client from maps.http_clients
+# Both hit a local stand-in upstream, so the numbers only reflect client overhead.
+#
+#   python -m benchmarks.bench_http_pool --calls 300
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+from benchmarks.fake_upstreams import FakeUpstream, make_nominatim_app, make_osrm_app
+from maps import geo_server, routing_server
+from maps.http_clients import aclose_clients
+
+
+async def _old_nominatim_get(path: str, params: dict) -> dict | list:
+    # copy of the pre-pooling helper: new client (and connection) every call
+    headers = {"User-Agent": geo_server.USER_AGENT}
+    async with httpx.AsyncClient(timeout=15.0, headers=headers) as client:
+        resp = await client.get(f"{geo_server.NOMINATIM_BASE}{path}", params=params)
+        resp.raise_for_status()
+        return resp.json()
+
+
+async def _old_osrm_get(path: str, params: dict | None = None) -> dict:
+    async with httpx.AsyncClient(timeout=20.0) as client:
+        resp = await client.get(f"{routing_server.OSRM_BASE}{path}", params=params)
+        resp.raise_for_status()
+        return resp.json()
+
+
+def _summary(samples: list[float]) -> str:
+    ms = sorted(s * 1000 for s in samples)
+    p95 = ms[int(len(ms) * 0.95) - 1]
+    return (
+        f"mean {statistics.fmean(ms):7.2f} ms   p50 {statistics.median(ms):7.2f} ms   "
+        f"p95 {p95:7.2f} ms"
+    )
+
+
+async def _time_calls(fn, calls: int) -> list[float]:
+    samples = []
+    for _ in range(calls):
+        t0 = time.perf_counter()
+        await fn()
+        samples.append(time.perf_counter() - t0)
+    return samples
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=200)
+    args = parser.parse_args()
+
+    async with FakeUpstream(make_nominatim_app()) as nominatim_url, FakeUpstream(
+        make_osrm_app()
+    ) as osrm_url:
+        geo_server.NOMINATIM_BASE = nominatim_url
+        routing_server.OSRM_BASE = osrm_url
+        geo_server.NOMINATIM_POOL.set_endpoints(nominatim_url)
+        routing_server.OSRM_POOL.set_endpoints(osrm_url)
+        # the fake upstreams have no rate limit, so don't throttle ourselves
+        geo_server.NOMINATIM_SCHEDULER.set_rate(0)
+        routing_server.OSRM_SCHEDULER.set_rate(0)
+
+        search = ("/search", {"q": "American University of Beirut", "format": "jsonv2", "limit": 3})
+        route = ("/route/v1/driving/35.48,33.901;35.4884,33.8209", {"overview": "false"})
+
+        cases = [
+            ("nominatim /search", lambda: _old_nominatim_get(*search), lambda: geo_server._nominatim_get(*search)),
+            ("osrm /route", lambda: _old_osrm_get(*route), lambda: routing_server._osrm_get(*route)),
+        ]
+        for label, before, after in cases:
+            # one warm-up call each so imports / first connection are not counted
+            await before()
+            await after()
+            before_samples = await _time_calls(before, args.calls)
+            after_samples = await _time_calls(after, args.calls)
+            speedup = statistics.fmean(before_samples) / statistics.fmean(after_samples)
+            print(f"=== {label} ({args.calls} sequential calls) ===")
+            print(f"  before (client per call): {_summary(before_samples)}")
+            print(f"  after  (pooled client)  : {_summary(after_samples)}")
+            print(f"  speedup: {speedup:.1f}x\n")
+
+        await aclose_clients()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
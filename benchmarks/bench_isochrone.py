@@ -0,0 +1,70 @@
+# benchmarks/bench_isochrone.py
+#
+# isochrone against the local fake OSRM, whose travel times are straight-line distance
+# at FAKE_SPEED_MPS, so every band should come out as a disc of radius t * speed.
+# For each refinement level it compares the adaptive grid with evaluating the same
+# lattice uniformly: points evaluated, /table tiles sent, wall time and area error.
+#
+#   python -m benchmarks.bench_isochrone --levels 0 1 2 3 --latency-ms 20
+
+import argparse
+import asyncio
+import json
+import math
+import time
+
+from benchmarks.fake_upstreams import FAKE_SPEED_MPS, FakeUpstream, make_osrm_app
+from maps import routing_server
+from maps.http_clients import aclose_clients
+
+MINUTES = [5, 10, 15]
+
+
+async def _run(arguments: dict) -> tuple[dict, int, float]:
+    before = routing_server.OSRM_SCHEDULER.submitted
+    t0 = time.perf_counter()
+    # whole result (no paging), the polygons are measured below
+    result = await routing_server._tool_isochrone({**arguments, "max_bytes": 0})
+    elapsed = time.perf_counter() - t0
+    return json.loads(result[0].text), routing_server.OSRM_SCHEDULER.submitted - before, elapsed
+
+
+def _area_error(payload: dict) -> float:
+    worst = 0.0
+    for band in payload["bands"]:
+        expected = math.pi * (band["minutes"] * 60 * FAKE_SPEED_MPS) ** 2 / 1e6
+        worst = max(worst, abs(band["area_km2"] - expected) / expected)
+    return worst * 100
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--levels", type=int, nargs="+", default=[0, 1, 2, 3])
+    parser.add_argument("--resolution", type=int, default=12)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    args = parser.parse_args()
+
+    async with FakeUpstream(make_osrm_app(latency_ms=args.latency_ms)) as osrm_url:
+        routing_server.OSRM_POOL.set_endpoints(osrm_url)
+        routing_server.OSRM_SCHEDULER.set_rate(0)
+        routing_server.ISOCHRONE_MAX_POINTS = 1_000_000
+        print(f"bands {MINUTES} min, coarse grid {args.resolution}x{args.resolution}, latency {args.latency_ms} ms\n")
+
+        for levels in args.levels:
+            base = {"lat": 33.89, "lon": 35.50, "minutes": MINUTES}
+            adaptive, tiles, elapsed = await _run({**base, "resolution": args.resolution, "refine": levels})
+            # same final spacing, every lattice point evaluated
+            fine = (args.resolution - 1) * 2**levels + 1
+            uniform, u_tiles, u_elapsed = await _run({**base, "resolution": fine, "refine": 0})
+            print(
+                f"refine {levels}: adaptive {adaptive['points_evaluated']:>5} pts {tiles:>4} tiles "
+                f"{elapsed * 1000:7.1f} ms err {_area_error(adaptive):4.1f}%   |   uniform "
+                f"{uniform['points_evaluated']:>5} pts {u_tiles:>4} tiles {u_elapsed * 1000:7.1f} ms "
+                f"err {_area_error(uniform):4.1f}%"
+            )
+
+        await aclose_clients()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,120 @@
+# benchmarks/bench_local_geocoder.py
+#
+# Offline geocoder benchmark. Generates synthetic places spread over a few countries
+# (plus a handful of known landmarks), builds the index and times:
+#   - memory-mapped load
+#   - geocode queries with and without a country filter, exact and prefix
+#   - search_poi around a city
+#
+#   python -m benchmarks.bench_local_geocoder --places 200000 --queries 500
+# or with a real place list:
+#   python -m benchmarks.bench_local_geocoder --source places.csv
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from maps.local_geocoder import LocalGeocoder, _read_csv, _read_osm, build_index
+
+_WORDS = (
+    "cedar olive mount river sea sun star green blue old new saint garden tower "
+    "port hill valley bridge market palace square"
+).split()
+_TYPES = ["cafe", "restaurant", "school", "pharmacy", "bank", "museum", "hotel"]
+_COUNTRIES = ["lb", "sy", "jo", "cy", "fr"]
+
+_LANDMARKS = [
+    {"name": "Beirut", "lat": 33.8938, "lon": 35.5018, "country": "lb", "importance": 0.8, "class": "place", "type": "city"},
+    {"name": "American University of Beirut", "lat": 33.9002, "lon": 35.4800, "country": "lb", "importance": 0.6, "class": "amenity", "type": "university"},
+    {"name": "Byblos", "lat": 34.1230, "lon": 35.6519, "country": "lb", "importance": 0.6, "class": "place", "type": "town"},
+    {"name": "Paris", "lat": 48.8566, "lon": 2.3522, "country": "fr", "importance": 0.9, "class": "place", "type": "city"},
+]
+
+
+def synthetic_places(n: int, seed: int = 0) -> list[dict]:
+    rng = random.Random(seed)
+    places = [dict(p, display_name=p["name"], city="") for p in _LANDMARKS]
+    for i in range(n):
+        name = f"{' '.join(rng.sample(_WORDS, 2)).title()} {i}"
+        places.append(
+            {
+                "name": name,
+                "display_name": name,
+                "lat": 33.8 + rng.random() * 0.4,
+                "lon": 35.4 + rng.random() * 0.4,
+                "country": rng.choice(_COUNTRIES),
+                "importance": rng.random() * 0.5,
+                "class": "amenity",
+                "type": rng.choice(_TYPES),
+                "city": "",
+            }
+        )
+    return places
+
+
+def _time_each(fn, items) -> list[float]:
+    samples = []
+    for item in items:
+        t0 = time.perf_counter()
+        fn(*item)
+        samples.append(time.perf_counter() - t0)
+    return samples
+
+
+def _fmt(samples: list[float]) -> str:
+    us = sorted(s * 1e6 for s in samples)
+    return f"p50 {statistics.median(us):9.1f} us   p95 {us[int(len(us) * 0.95) - 1]:9.1f} us"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--source", help="real .csv/.osm place source instead of synthetic places")
+    parser.add_argument("--places", type=int, default=200_000)
+    parser.add_argument("--queries", type=int, default=300)
+    args = parser.parse_args()
+
+    if args.source is None:
+        places = synthetic_places(args.places)
+    elif args.source.endswith(".csv"):
+        places = _read_csv(args.source, "")
+    else:
+        places = _read_osm(args.source, "")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        out = os.path.join(tmp, "geocoder")
+        t0 = time.perf_counter()
+        build_index(places, out, verbose=False)
+        build_s = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        geocoder = LocalGeocoder.load(out)
+        load_ms = (time.perf_counter() - t0) * 1000
+        print(f"index: {geocoder.meta['records']} places, {geocoder.meta['tokens']} tokens")
+        print(f"build {build_s:.1f} s, memory-mapped load {load_ms:.1f} ms\n")
+
+        if args.source is None:
+            top = geocoder.search("american university of beirut", limit=1)
+            assert top and top[0]["display_name"] == "American University of Beirut", top
+            assert geocoder.search("paris", country_code="lb") == []
+            assert geocoder.search("beir", country_code="lb")[0]["display_name"] == "Beirut"
+
+        rng = random.Random(1)
+        names = [places[rng.randrange(len(places))]["name"] for _ in range(args.queries)]
+        full = [(name, None, 3) for name in names]
+        filtered = [(name, rng.choice(_COUNTRIES), 3) for name in names]
+        prefix = [(name.rsplit(" ", 1)[0][:-2], None, 3) for name in names]
+
+        print("=== geocode_place ===")
+        print(f"  exact name          : {_fmt(_time_each(geocoder.search, full))}")
+        print(f"  exact + country     : {_fmt(_time_each(geocoder.search, filtered))}")
+        print(f"  prefix (truncated)  : {_fmt(_time_each(geocoder.search, prefix))}")
+        print("=== search_poi ===")
+        pois = [(rng.choice(_TYPES), "Beirut", 5) for _ in range(args.queries)]
+        print(f"  <type> near Beirut  : {_fmt(_time_each(geocoder.search_poi, pois))}")
+
+
+if __name__ == "__main__":
+    main()
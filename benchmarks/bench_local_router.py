@@ -0,0 +1,165 @@
+# benchmarks/bench_local_router.py
+#
+# Offline routing engine benchmark. Generates a synthetic OSM city (a perturbed street
+# grid with a few one-way streets and faster avenues), builds it with and without the
+# contraction hierarchy, checks CH answers against A*, and times:
+#   - point-to-point queries (CH vs A*)
+#   - one-to-many / many-to-many tables
+#   - batched road snapping (segment grid vs. brute force over every segment)
+#
+#   python -m benchmarks.bench_local_router --grid 120 --queries 500
+# or with a real extract:
+#   python -m benchmarks.bench_local_router --extract beirut.osm
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from maps.local_router import LocalRouter, build_graph, read_osm
+from maps.road_index import M_PER_DEG, RoadIndex
+
+
+def write_synthetic_osm(path: str, size: int, seed: int = 0) -> None:
+    """
+    size x size street grid around Beirut, ~100 m blocks, as OSM XML.
+    """
+    rng = random.Random(seed)
+    step = 0.0009
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>', '<osm version="0.6">']
+
+    def node_id(r: int, c: int) -> int:
+        return r * size + c + 1
+
+    for r in range(size):
+        for c in range(size):
+            lat = 33.85 + r * step + rng.uniform(-0.0002, 0.0002)
+            lon = 35.45 + c * step + rng.uniform(-0.0002, 0.0002)
+            lines.append(f'<node id="{node_id(r, c)}" lat="{lat:.7f}" lon="{lon:.7f}"/>')
+
+    way_id = 1
+    for horizontal in (True, False):
+        for k in range(size):
+            refs = [node_id(k, c) if horizontal else node_id(c, k) for c in range(size)]
+            highway = "primary" if k % 10 == 0 else "residential"
+            tags = {"highway": highway, "name": f"{'Street' if horizontal else 'Avenue'} {k}"}
+            if k % 7 == 3:
+                tags["oneway"] = "yes"
+            lines.append(f'<way id="{way_id}">')
+            lines.extend(f'<nd ref="{ref}"/>' for ref in refs)
+            lines.extend(f'<tag k="{key}" v="{value}"/>' for key, value in tags.items())
+            lines.append("</way>")
+            way_id += 1
+    lines.append("</osm>")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines))
+
+
+def _random_points(router: LocalRouter, n: int, seed: int) -> list[list[float]]:
+    rng = random.Random(seed)
+    lat0, lon0, lat1, lon1 = router.meta["bbox"]
+    return [[rng.uniform(lat0, lat1), rng.uniform(lon0, lon1)] for _ in range(n)]
+
+
+def _time_each(fn, items) -> list[float]:
+    samples = []
+    for item in items:
+        t0 = time.perf_counter()
+        fn(*item)
+        samples.append(time.perf_counter() - t0)
+    return samples
+
+
+def _fmt(samples: list[float]) -> str:
+    us = sorted(s * 1e6 for s in samples)
+    return f"p50 {statistics.median(us):9.1f} us   p95 {us[int(len(us) * 0.95) - 1]:9.1f} us"
+
+
+def _brute_force_snap(index: RoadIndex, lat: float, lon: float) -> float:
+    a, b = np.asarray(index.seg_a), np.asarray(index.seg_b)
+    kx = np.cos(np.radians(lat)) * M_PER_DEG
+    ax = (index.node_lon[a] - lon) * kx
+    ay = (index.node_lat[a] - lat) * M_PER_DEG
+    dx = (index.node_lon[b] - lon) * kx - ax
+    dy = (index.node_lat[b] - lat) * M_PER_DEG - ay
+    t = np.clip(-(ax * dx + ay * dy) / np.maximum(dx * dx + dy * dy, 1e-12), 0, 1)
+    return float(np.hypot(ax + t * dx, ay + t * dy).min())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--extract", help="real .osm/.osm.pbf extract instead of the synthetic grid")
+    parser.add_argument("--grid", type=int, default=100, help="synthetic grid size (grid x grid nodes)")
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--table", type=int, nargs="+", default=[10, 50, 100])
+    parser.add_argument("--snap", type=int, nargs="+", default=[1, 1000, 10000])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        extract = args.extract
+        if extract is None:
+            extract = os.path.join(tmp, "synthetic.osm")
+            write_synthetic_osm(extract, args.grid)
+        nodes, ways = read_osm(extract)
+
+        t0 = time.perf_counter()
+        build_graph(nodes, ways, "driving", os.path.join(tmp, "ch"), ch=True, verbose=False)
+        ch_build = time.perf_counter() - t0
+        build_graph(nodes, ways, "driving", os.path.join(tmp, "plain"), ch=False, verbose=False)
+
+        t0 = time.perf_counter()
+        ch = LocalRouter.load(os.path.join(tmp, "ch"))
+        plain = LocalRouter.load(os.path.join(tmp, "plain"))
+        load_ms = (time.perf_counter() - t0) * 1000
+        print(f"graph: {ch.meta['nodes']} nodes, {ch.meta['edges']} edges")
+        print(f"CH build {ch_build:.1f} s, memory-mapped load of both graphs {load_ms:.1f} ms\n")
+
+        starts = _random_points(ch, args.queries, seed=1)
+        ends = _random_points(ch, args.queries, seed=2)
+        pairs = [(*a, *b) for a, b in zip(starts, ends)]
+
+        # correctness: CH must agree with A* on every pair
+        for p in pairs:
+            a, b = ch.route(*p), plain.route(*p)
+            assert abs(a["duration"] - b["duration"]) < 1e-3 * max(b["duration"], 1), (p, a, b)
+        print(f"CH matches A* on {len(pairs)} random pairs")
+
+        # raw search time (snapping excluded) for point-to-point
+        snapped = [(ch.nearest_node(*a)[0], ch.nearest_node(*b)[0]) for a, b in zip(starts, ends)]
+        print("=== point-to-point (search only) ===")
+        print(f"  CH : {_fmt(_time_each(ch._ch_query, snapped))}")
+        print(f"  A* : {_fmt(_time_each(plain._astar, snapped))}")
+        print("=== point-to-point route() incl. snapping, no geometry ===")
+        print(f"  CH : {_fmt(_time_each(ch.route, pairs))}")
+
+        print("=== tables ===")
+        for n in args.table:
+            pts = _random_points(ch, n, seed=n)
+            t0 = time.perf_counter()
+            ch_d, _, _, _ = ch.table(pts, pts)
+            t_ch = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            plain_d, _, _, _ = plain.table(pts[:1], pts)
+            t_one = time.perf_counter() - t0
+            assert np.allclose(ch_d[:1], plain_d, rtol=1e-3, equal_nan=True)
+            print(f"  {n:>4}x{n:<4} CH buckets {t_ch * 1000:8.1f} ms   1x{n} Dijkstra {t_one * 1000:7.1f} ms")
+
+        print("=== snap_points (segment grid) ===")
+        roads = RoadIndex.load(os.path.join(tmp, "ch"))
+        for n in args.snap:
+            pts = np.asarray(_random_points(ch, n, seed=n))
+            t0 = time.perf_counter()
+            snapped = roads.snap(pts[:, 0], pts[:, 1])
+            elapsed = time.perf_counter() - t0
+            for i in range(min(n, 50)):
+                expected = _brute_force_snap(roads, *pts[i])
+                assert abs(snapped["distance_m"][i] - expected) < 1e-6, (pts[i], snapped["distance_m"][i], expected)
+            print(f"  {n:>6} points {elapsed * 1000:8.1f} ms   ({elapsed / n * 1e6:6.1f} us/point, matches brute force)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+# benchmarks/bench_match_trace.py
+#
+# match_trace against the local fake OSRM (which rejects /match calls above
+# --max-matching-size like the real one). For each trace length it reports how many
+# chunks were sent, wall time per fan-out and output size, and checks that the stitched
+# distance equals the sum over the trace (no leg lost or counted twice in the overlaps).
+#
+#   python -m benchmarks.bench_match_trace --points 1000 10000 86400 --latency-ms 20
+
+import argparse
+import asyncio
+import json
+import math
+import time
+
+from benchmarks.fake_upstreams import FakeUpstream, make_osrm_app
+from maps import routing_server
+from maps.geo_utils import haversine_m
+from maps.http_clients import aclose_clients
+
+
+def _synthetic_trace(n: int) -> list[list[float]]:
+    # 1 Hz drive meandering north out of Beirut, ~10 m between fixes
+    return [
+        [33.85 + i * 0.00009, 35.45 + 0.002 * math.sin(i / 60), 1_700_000_000 + i]
+        for i in range(n)
+    ]
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--points", type=int, nargs="+", default=[1000, 10_000, 86_400])
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--fan-out", type=int, nargs="+", default=[1, 4, 8])
+    args = parser.parse_args()
+
+    async with FakeUpstream(make_osrm_app(latency_ms=args.latency_ms)) as osrm_url:
+        routing_server.OSRM_POOL.set_endpoints(osrm_url)
+        routing_server.OSRM_SCHEDULER.set_rate(0)
+        print(
+            f"chunk size {routing_server.OSRM_MATCH_MAX_COORDS}, overlap {routing_server.MATCH_CHUNK_OVERLAP}, "
+            f"upstream latency {args.latency_ms} ms\n"
+        )
+
+        for n in args.points:
+            trace = _synthetic_trace(n)
+            expected = sum(haversine_m(*a[:2], *b[:2]) for a, b in zip(trace, trace[1:]))
+            for fan_out in args.fan_out:
+                routing_server.MATCH_MAX_CONCURRENCY = fan_out
+                t0 = time.perf_counter()
+                result = await routing_server._tool_match_trace({"points": trace, "max_bytes": 0})
+                elapsed = time.perf_counter() - t0
+                payload = json.loads(result[0].text)
+                assert payload["matched"] == n and len(payload["matchings"]) == 1, payload["unmatched_indices"][:10]
+                assert abs(payload["distance_m"] - expected) < 1.0, (payload["distance_m"], expected)
+                print(
+                    f"{n:>7} points  fan-out {fan_out:>2}  chunks {payload['chunks']:>5}  "
+                    f"{elapsed * 1000:9.1f} ms  {len(result[0].text) / 1e3:8.1f} kB"
+                )
+
+        await aclose_clients()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
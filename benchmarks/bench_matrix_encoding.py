@@ -0,0 +1,74 @@
+# benchmarks/bench_matrix_encoding.py
+#
+# Assembly + serialization cost of a big matrix result, no network involved:
+#   old → nested Python lists stitched cell by cell, json.dumps(indent=2)
+#   new → numpy array stitched block by block, then json / float32 / uint32 output
+# Reports time and peak Python memory (tracemalloc) for each path.
+#
+#   python -m benchmarks.bench_matrix_encoding --size 1000 --block 50
+
+import argparse
+import json
+import random
+import time
+import tracemalloc
+
+import numpy as np
+
+from maps.encoding import encode_matrix
+
+
+def _tiles(n: int, block: int) -> list[tuple[range, range, list]]:
+    rng = random.Random(0)
+    tiles = []
+    for i in range(0, n, block):
+        for j in range(0, n, block):
+            rows, cols = range(i, min(i + block, n)), range(j, min(j + block, n))
+            # what resp.json() hands us for one /table tile
+            tiles.append((rows, cols, [[rng.random() * 3600 for _ in cols] for _ in rows]))
+    return tiles
+
+
+def _old_path(n: int, tiles: list) -> str:
+    matrix = [[None] * n for _ in range(n)]
+    for rows, cols, block in tiles:
+        for r, i in enumerate(rows):
+            matrix[i][cols.start : cols.stop] = block[r]
+    return json.dumps({"durations": matrix}, indent=2)
+
+
+def _new_path(n: int, tiles: list, encoding: str) -> str:
+    matrix = np.full((n, n), np.nan)
+    for rows, cols, block in tiles:
+        matrix[rows.start : rows.stop, cols.start : cols.stop] = np.array(block, dtype=float)
+    payload = {"durations": encode_matrix(matrix, encoding)}
+    if encoding == "json":
+        return json.dumps(payload, indent=2)
+    return json.dumps(payload, separators=(",", ":"))
+
+
+def _measure(label: str, fn) -> None:
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    text = fn()
+    elapsed = time.perf_counter() - t0
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:>28}: {elapsed * 1000:8.1f} ms   peak {peak / 1e6:7.1f} MB   output {len(text) / 1e6:6.2f} MB")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=1000)
+    parser.add_argument("--block", type=int, default=50)
+    args = parser.parse_args()
+
+    tiles = _tiles(args.size, args.block)
+    print(f"=== {args.size}x{args.size} matrix from {len(tiles)} tiles ===")
+    _measure("old: lists + indent=2", lambda: _old_path(args.size, tiles))
+    for encoding in ("json", "float32", "uint32"):
+        _measure(f"new: array → {encoding}", lambda: _new_path(args.size, tiles, encoding))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# benchmarks/bench_matrix_tiling.py
+#
+# Scaling benchmark for the tiled distance_matrix against the local fake OSRM.
+# For each size it reports how many /table tiles were sent, wall time and output size,
+# and spot-checks a few stitched cells against a direct computation.
+#
+#   python -m benchmarks.bench_matrix_tiling --sizes 50 200 500 1000 --latency-ms 20
+#   python -m benchmarks.bench_matrix_tiling --sizes 1000 --fan-out 8 --encodings json float32 uint32
+
+import argparse
+import asyncio
+import base64
+import json
+import random
+import time
+
+import numpy as np
+
+from benchmarks.fake_upstreams import FAKE_SPEED_MPS, FakeUpstream, make_osrm_app
+from maps import routing_server
+from maps.geo_utils import haversine_m
+from maps.http_clients import aclose_clients
+
+
+def _random_points(n: int, seed: int) -> list[list[float]]:
+    rng = random.Random(seed)
+    return [[33.80 + rng.random() * 0.15, 35.45 + rng.random() * 0.10] for _ in range(n)]
+
+
+def _decode(durations) -> np.ndarray:
+    if isinstance(durations, list):
+        return np.array(durations, dtype=float)
+    dtype = "<f4" if durations["dtype"] == "float32" else "<u4"
+    raw = np.frombuffer(base64.b64decode(durations["data"]), dtype=dtype)
+    return raw.reshape(durations["shape"]).astype(float)
+
+
+def _spot_check(sources: list, destinations: list, durations: np.ndarray, samples: int = 20) -> None:
+    rng = random.Random(0)
+    for _ in range(samples):
+        i = rng.randrange(len(sources))
+        j = rng.randrange(len(destinations))
+        expected = haversine_m(*sources[i], *destinations[j]) / FAKE_SPEED_MPS
+        # float32 keeps ~7 digits, uint32 rounds to whole seconds
+        assert abs(durations[i, j] - expected) <= 0.5 + 1e-3 * expected, (i, j, durations[i, j], expected)
+
+
+async def _run_case(label: str, arguments: dict, concurrency: int) -> None:
+    routing_server.MATRIX_MAX_CONCURRENCY = concurrency
+    before = routing_server.OSRM_SCHEDULER.submitted
+    t0 = time.perf_counter()
+    # whole matrix in one response (no paging), it is spot-checked below
+    result = await routing_server._tool_distance_matrix({**arguments, "max_bytes": 0})
+    elapsed = time.perf_counter() - t0
+    tiles = routing_server.OSRM_SCHEDULER.submitted - before
+
+    payload = json.loads(result[0].text)
+    sources = arguments.get("sources") or arguments["coordinates"]
+    destinations = arguments.get("destinations") or arguments["coordinates"]
+    _spot_check(sources, destinations, _decode(payload["durations"]))
+
+    encoding = arguments.get("encoding", "json")
+    print(
+        f"{label:>14}  {encoding:>7}  fan-out {concurrency:>2}  tiles {tiles:>4}  "
+        f"{elapsed * 1000:9.1f} ms  {len(result[0].text) / 1e6:7.2f} MB"
+    )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 200, 500, 1000])
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--fan-out", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--encodings", nargs="+", default=["json"])
+    args = parser.parse_args()
+
+    async with FakeUpstream(make_osrm_app(latency_ms=args.latency_ms)) as osrm_url:
+        routing_server.OSRM_POOL.set_endpoints(osrm_url)
+        routing_server.OSRM_SCHEDULER.set_rate(0)
+
+        print(f"table limit {routing_server.OSRM_TABLE_MAX_COORDS} coords, upstream latency {args.latency_ms} ms\n")
+        for encoding in args.encodings:
+            for n in args.sizes:
+                points = _random_points(n, seed=n)
+                for fan_out in args.fan_out:
+                    await _run_case(f"{n}x{n}", {"coordinates": points, "encoding": encoding}, fan_out)
+
+            # asymmetric: many depots to a few drop-offs and the other way around
+            depots = _random_points(1000, seed=1)
+            drops = _random_points(20, seed=2)
+            for fan_out in args.fan_out:
+                await _run_case(
+                    "1000x20", {"sources": depots, "destinations": drops, "encoding": encoding}, fan_out
+                )
+                await _run_case(
+                    "20x1000", {"sources": drops, "destinations": depots, "encoding": encoding}, fan_out
+                )
+
+        await aclose_clients()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,108 @@
+# benchmarks/bench_offload.py
+#
+# Does one big distance_matrix stall everybody else? A probe calls a cheap tool
+# (cached geocode_place) every few ms through the in-process MCP handlers, while
+# one large all-to-all distance_matrix is fetched, built and serialized. The probe
+# latencies during that call are compared with the idle probe latency, for:
+#   inline   everything on the event loop (MAPS_OFFLOAD_WORKERS=0)
+#   offload  matrix conversion + serialization in the worker pool, row by row
+# each with the json module and with orjson (when installed). The fake OSRM runs in
+# its own process (python -m benchmarks.fake_upstreams), so only our own work
+# competes with the probe.
+#
+#   python -m benchmarks.bench_offload --size 1000
+#   python -m benchmarks.bench_offload --size 600 --max-bytes 32000   (paged result)
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks.bench_servers import InprocTarget, _fake_upstreams
+from maps import offload
+
+MODES = {
+    "inline json": (0, False),
+    "inline orjson": (0, True),
+    "offload json": (2, False),
+    "offload orjson": (2, True),
+}
+
+
+def _points(n: int) -> list[list[float]]:
+    # spread over greater Beirut, deterministic
+    return [[33.80 + (i * 37 % 101) * 0.002, 35.45 + (i * 53 % 103) * 0.002] for i in range(n)]
+
+
+async def _probe(target: InprocTarget, stop: asyncio.Event, interval: float) -> list[float]:
+    # timed from when the probe was due, like a client sending a request then:
+    # a blocked loop delays the wake-up as well as the call itself
+    latencies = []
+    due = time.perf_counter()
+    while not stop.is_set():
+        await asyncio.sleep(max(due - time.perf_counter(), 0))
+        await target.call("geo_server", "geocode_place", {"query": "AUB"})
+        end = time.perf_counter()
+        latencies.append((end - due) * 1000)
+        due = end + interval
+    return latencies
+
+
+async def _run(target: InprocTarget, arguments: dict | None, interval: float, idle_s: float) -> dict:
+    stop = asyncio.Event()
+    probe = asyncio.create_task(_probe(target, stop, interval))
+    t0 = time.perf_counter()
+    size = 0
+    if arguments is None:
+        await asyncio.sleep(idle_s)
+    else:
+        result = await target.call("routing_server", "distance_matrix", arguments)
+        size = len(result.content[0].text.encode())
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    latencies = sorted(await probe)
+    q = statistics.quantiles(latencies, n=100, method="inclusive") if len(latencies) > 1 else latencies * 99
+    return {"seconds": elapsed, "bytes": size, "probes": len(latencies), "p50": q[49], "p99": q[98], "max": latencies[-1]}
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=1000, help="points of the all-to-all matrix")
+    parser.add_argument("--max-bytes", type=int, default=0, help="response budget (0 = whole matrix in one response)")
+    parser.add_argument("--interval-ms", type=float, default=5.0, help="pause between probe calls")
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    args = parser.parse_args()
+
+    fakes = argparse.Namespace(latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, rate_limit=0.0, burst=10.0)
+    with tempfile.TemporaryDirectory() as cache:
+        os.environ["MAPS_CACHE_DIR"] = cache
+        async with _fake_upstreams(fakes) as (nominatim_url, osrm_url):
+            async with InprocTarget(nominatim_url, osrm_url, server_rate=0) as target:
+                arguments = {"coordinates": _points(args.size), "max_bytes": args.max_bytes}
+                # warm up: probe query cached, numpy imported, HTTP connections open
+                await target.call("geo_server", "geocode_place", {"query": "AUB"})
+                await target.call("routing_server", "distance_matrix", {**arguments, "coordinates": _points(20)})
+                interval = args.interval_ms / 1000
+
+                print(f"{args.size}x{args.size} distance_matrix, max_bytes {args.max_bytes}, probe every {args.interval_ms} ms")
+                print(f"{'mode':<16} {'matrix s':>9} {'MB':>6} {'probes':>7} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+                idle = await _run(target, None, interval, idle_s=2.0)
+                print(f"{'idle':<16} {'':>9} {'':>6} {idle['probes']:>7} {idle['p50']:8.2f} {idle['p99']:8.2f} {idle['max']:8.2f}")
+                for mode in args.modes:
+                    workers, fast = MODES[mode]
+                    if fast and offload.orjson is None:
+                        print(f"{mode:<16} skipped (orjson not installed)")
+                        continue
+                    offload.OFFLOAD_WORKERS = workers
+                    offload.FAST_JSON = offload.orjson if fast else None
+                    r = await _run(target, arguments, interval, 0)
+                    print(
+                        f"{mode:<16} {r['seconds']:9.2f} {r['bytes'] / 1e6:6.1f} {r['probes']:>7} "
+                        f"{r['p50']:8.2f} {r['p99']:8.2f} {r['max']:8.2f}"
+                    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
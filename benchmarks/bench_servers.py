@@ -0,0 +1,431 @@
+# benchmarks/bench_servers.py
+#
+# Throughput/latency suite for both MCP servers against the local fake upstreams
+# (configurable latency, jitter, 503 rate and 429 rate limit, see fake_upstreams.Faults).
+# The fakes run in their own process so they don't compete with the servers under test
+# for this process's event loop.
+# Every tool scenario runs at increasing concurrency through
+#   inproc → the servers' registered tools/call handlers in this process (schema
+#            validation + call_tool + result conversion, no transport)
+#   stdio  → `python -m maps.geo_server` / `maps.routing_server` subprocesses driven
+#            by an MCP client session, the same path the agent uses
+# and reports p50/p95/p99 latency, calls/s, tool errors, memory and the upstream
+# requests it caused. Arguments never repeat, so the numbers are for cache misses.
+# Results are written as JSON; --baseline compares against an earlier run and flags
+# regressions.
+#
+#   python -m benchmarks.bench_servers --concurrency 1 4 16 --calls 100 --latency-ms 20
+#   python -m benchmarks.bench_servers --mode stdio --tools route_between distance_matrix \
+#       --error-rate 0.02 --out after.json --baseline before.json --fail-on-regression
+
+import argparse
+import asyncio
+import contextlib
+import datetime
+import importlib
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+import httpx
+import mcp.types as types
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+
+from benchmarks.fake_upstreams import add_fault_args
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+
+
+def _grid_point(i: int) -> tuple[float, float]:
+    # distinct ~110 m cells around Beirut, so geohash/route caches never hit
+    return 33.80 + (i % 500) * 0.001, 35.40 + (i // 500 % 500) * 0.001
+
+
+def _points(i: int, n: int) -> list[list[float]]:
+    return [list(_grid_point(i * n + k)) for k in range(n)]
+
+
+# (server module, tool, arguments for call number i)
+SCENARIOS = [
+    ("geo_server", "geocode_place", lambda i: {"query": f"Bench street {i}", "limit": 3}),
+    ("geo_server", "reverse_geocode", lambda i: {"lat": _grid_point(i)[0], "lon": _grid_point(i)[1], "zoom": 18}),
+    ("geo_server", "search_poi", lambda i: {"query": "cafe", "city": f"Bench town {i}", "limit": 5}),
+    ("geo_server", "batch_geocode", lambda i: {"queries": [f"Batch {i} street {k}" for k in range(20)]}),
+    (
+        "routing_server",
+        "route_between",
+        lambda i: dict(zip(("start_lat", "start_lon", "end_lat", "end_lon"), _points(i, 2)[0] + _points(i, 2)[1])),
+    ),
+    ("routing_server", "nearest_road", lambda i: dict(zip(("lat", "lon"), _grid_point(i)))),
+    ("routing_server", "distance_matrix", lambda i: {"coordinates": _points(i, 25)}),
+    ("routing_server", "route_many", lambda i: {"pairs": [a + b for a, b in zip(_points(i, 20), _points(i + 1, 20))]}),
+    ("routing_server", "match_trace", lambda i: {"points": _points(i, 250)}),
+    (
+        "routing_server",
+        "isochrone",
+        lambda i: {"lat": _grid_point(i)[0], "lon": _grid_point(i)[1], "minutes": [5, 10], "resolution": 8, "refine": 1},
+    ),
+]
+
+
+def _proc_status(pid: int) -> dict[str, float]:
+    """
+    VmRSS / VmHWM of a process in MB (Linux /proc; empty elsewhere).
+    """
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            return {
+                key: int(value.split()[0]) / 1024
+                for key, value in (line.split(":", 1) for line in f)
+                if key in ("VmRSS", "VmHWM")
+            }
+    except OSError:
+        return {}
+
+
+def _reset_peak_rss(pid: int) -> None:
+    # writing 5 to clear_refs resets VmHWM (Linux >= 4.0), so the peak is per run
+    with contextlib.suppress(OSError):
+        with open(f"/proc/{pid}/clear_refs", "w") as f:
+            f.write("5")
+
+
+def _children(pid: int) -> set[int]:
+    children: set[int] = set()
+    with contextlib.suppress(OSError):
+        for task in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{task}/children") as f:
+                children.update(int(c) for c in f.read().split())
+    return children
+
+
+def _error_kind(message: str) -> str:
+    # group errors by kind: first line, request URLs blanked out
+    return re.sub(r"'https?://[^']*'", "<url>", message.splitlines()[0] if message else "")[:160]
+
+
+def _error_of(result: types.CallToolResult) -> str | None:
+    """
+    The tool error of one call, if any: isError (schema validation) or {"error": ...}.
+    """
+    text = result.content[0].text if result.content else ""
+    if result.isError:
+        return text or "isError"
+    if text.startswith("{") and '"error"' in text[:20]:
+        with contextlib.suppress(ValueError):
+            return str(json.loads(text).get("error"))
+    return None
+
+
+class InprocTarget:
+    """
+    Calls the tools/call request handler registered on each server's `app`.
+    """
+
+    def __init__(self, nominatim_url: str, osrm_url: str, server_rate: float):
+        # imported here so MAPS_CACHE_DIR is already set when the caches open their files
+        geo_server = importlib.import_module("maps.geo_server")
+        routing_server = importlib.import_module("maps.routing_server")
+        self._handlers = {
+            "geo_server": geo_server.app.request_handlers[types.CallToolRequest],
+            "routing_server": routing_server.app.request_handlers[types.CallToolRequest],
+        }
+        geo_server.NOMINATIM_POOL.set_endpoints(nominatim_url)
+        routing_server.OSRM_POOL.set_endpoints(osrm_url)
+        geo_server.NOMINATIM_SCHEDULER.set_rate(server_rate)
+        routing_server.OSRM_SCHEDULER.set_rate(server_rate)
+
+    async def __aenter__(self) -> "InprocTarget":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        from maps.http_clients import aclose_clients
+
+        await aclose_clients()
+
+    async def call(self, server: str, tool: str, arguments: dict) -> types.CallToolResult:
+        request = types.CallToolRequest(
+            method="tools/call", params=types.CallToolRequestParams(name=tool, arguments=arguments)
+        )
+        return (await self._handlers[server](request)).root
+
+    def pid(self, server: str) -> int:
+        return os.getpid()
+
+
+class StdioTarget:
+    """
+    One stdio subprocess + ClientSession per server, like the agent's MCPServerStdio.
+    """
+
+    def __init__(self, nominatim_url: str, osrm_url: str, server_rate: float):
+        self._env = {
+            **os.environ,
+            "NOMINATIM_BASE": nominatim_url,
+            "OSRM_BASE": osrm_url,
+            "NOMINATIM_RATE": str(server_rate),
+            "OSRM_RATE": str(server_rate),
+            "PYTHONPATH": REPO_ROOT,
+        }
+        self._stack = contextlib.AsyncExitStack()
+        self._sessions: dict[str, ClientSession] = {}
+        self._pids: dict[str, int] = {}
+
+    async def __aenter__(self) -> "StdioTarget":
+        for server in ("geo_server", "routing_server"):
+            before = _children(os.getpid())
+            params = StdioServerParameters(
+                command=sys.executable, args=["-m", f"maps.{server}"], env=self._env, cwd=REPO_ROOT
+            )
+            read, write = await self._stack.enter_async_context(stdio_client(params))
+            session = await self._stack.enter_async_context(ClientSession(read, write))
+            await session.initialize()
+            self._sessions[server] = session
+            new = _children(os.getpid()) - before
+            if new:
+                self._pids[server] = max(new)
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self._stack.aclose()
+
+    async def call(self, server: str, tool: str, arguments: dict) -> types.CallToolResult:
+        return await self._sessions[server].call_tool(tool, arguments)
+
+    def pid(self, server: str) -> int | None:
+        return self._pids.get(server)
+
+
+def _percentiles(samples: list[float]) -> dict[str, float]:
+    ms = [s * 1000 for s in samples]
+    if len(ms) < 2:
+        value = round(ms[0], 3) if ms else None
+        return {"p50_ms": value, "p95_ms": value, "p99_ms": value, "mean_ms": value, "max_ms": value}
+    q = statistics.quantiles(ms, n=100, method="inclusive")
+    return {
+        "p50_ms": round(q[49], 3),
+        "p95_ms": round(q[94], 3),
+        "p99_ms": round(q[98], 3),
+        "mean_ms": round(statistics.fmean(ms), 3),
+        "max_ms": round(max(ms), 3),
+    }
+
+
+async def _run_level(target, server: str, tool: str, make_args, calls: int, concurrency: int, first: int) -> dict:
+    latencies: list[float] = []
+    errors: Counter = Counter()
+    indices = iter(range(first, first + calls))
+
+    async def worker() -> None:
+        # workers share one iterator, so exactly `calls` calls run with `concurrency` in flight
+        for i in indices:
+            arguments = make_args(i)
+            t0 = time.perf_counter()
+            try:
+                error = _error_of(await target.call(server, tool, arguments))
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            latencies.append(time.perf_counter() - t0)
+            if error:
+                errors[_error_kind(error)] += 1
+
+    pid = target.pid(server)
+    if pid:
+        _reset_peak_rss(pid)
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - t0
+    memory = _proc_status(pid) if pid else {}
+    return {
+        "calls": calls,
+        "errors": sum(errors.values()),
+        "error_samples": dict(errors.most_common(3)),
+        **_percentiles(latencies),
+        "throughput_rps": round(calls / wall, 2),
+        "wall_s": round(wall, 3),
+        "rss_mb": round(memory["VmRSS"], 1) if "VmRSS" in memory else None,
+        "peak_rss_mb": round(memory["VmHWM"], 1) if "VmHWM" in memory else None,
+    }
+
+
+@contextlib.asynccontextmanager
+async def _fake_upstreams(args: argparse.Namespace):
+    """
+    `python -m benchmarks.fake_upstreams` on free ports → (nominatim_url, osrm_url).
+    """
+    fault_args = [
+        f"--{name.replace('_', '-')}={getattr(args, name)}"
+        for name in ("latency_ms", "jitter_ms", "error_rate", "rate_limit", "burst")
+    ]
+    proc = await asyncio.create_subprocess_exec(
+        sys.executable,
+        "-m",
+        "benchmarks.fake_upstreams",
+        "--nominatim-port=0",
+        "--osrm-port=0",
+        *fault_args,
+        cwd=REPO_ROOT,
+        env={**os.environ, "PYTHONPATH": REPO_ROOT},
+        stdout=asyncio.subprocess.PIPE,
+    )
+    try:
+        urls = {}
+        while len(urls) < 2:
+            line = await asyncio.wait_for(proc.stdout.readline(), timeout=30)
+            if not line:
+                raise RuntimeError("fake upstreams exited during startup")
+            key, _, value = line.decode().strip().partition("=")
+            urls[key] = value
+        yield urls["NOMINATIM_BASE"], urls["OSRM_BASE"]
+    finally:
+        proc.terminate()
+        await proc.wait()
+
+
+def _git_commit() -> str | None:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, timeout=10
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def _compare(results: list[dict], baseline_path: str, threshold_pct: float) -> int:
+    """
+    Print p95 / throughput changes against a previous results file; returns the
+    number of (mode, tool, concurrency) rows that got worse by more than threshold_pct.
+    """
+    with open(baseline_path) as f:
+        baseline = {(r["mode"], r["tool"], r["concurrency"]): r for r in json.load(f)["results"]}
+    regressions = 0
+    print(f"\n=== vs {baseline_path} (threshold {threshold_pct:g}%) ===")
+    for r in results:
+        old = baseline.get((r["mode"], r["tool"], r["concurrency"]))
+        if old is None or not old.get("p95_ms") or not r.get("p95_ms"):
+            continue
+        p95 = 100 * (r["p95_ms"] / old["p95_ms"] - 1)
+        rps = 100 * (r["throughput_rps"] / old["throughput_rps"] - 1)
+        worse = p95 > threshold_pct or rps < -threshold_pct or r["errors"] > old["errors"]
+        regressions += worse
+        print(
+            f"{r['mode']:<6} {r['tool']:<16} c={r['concurrency']:<3}  p95 {old['p95_ms']:8.1f} → {r['p95_ms']:8.1f} ms "
+            f"({p95:+6.1f}%)  rps {old['throughput_rps']:8.1f} → {r['throughput_rps']:8.1f} ({rps:+6.1f}%)"
+            f"{'  REGRESSION' if worse else ''}"
+        )
+    return regressions
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mode", nargs="+", choices=["inproc", "stdio"], default=["inproc", "stdio"])
+    parser.add_argument("--tools", nargs="+", help="subset of tool names (default: all scenarios)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--calls", type=int, default=100, help="calls per tool and concurrency level")
+    parser.add_argument(
+        "--server-rate", type=float, default=0.0, help="the servers' own NOMINATIM_RATE/OSRM_RATE (0 = unthrottled)"
+    )
+    add_fault_args(parser)
+    parser.add_argument("--out", help="results file (default benchmarks/results/servers-<timestamp>.json)")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    parser.add_argument("--threshold-pct", type=float, default=10.0)
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+
+    scenarios = [s for s in SCENARIOS if not args.tools or s[1] in args.tools]
+    if not scenarios:
+        parser.error(f"no scenario matches {args.tools}; known: {[s[1] for s in SCENARIOS]}")
+
+    # fresh on-disk caches for this run (the servers read this at import / startup)
+    os.environ["MAPS_CACHE_DIR"] = tempfile.mkdtemp(prefix="bench_servers_")
+
+    targets = {"inproc": InprocTarget, "stdio": StdioTarget}
+
+    results = []
+    async with _fake_upstreams(args) as (nominatim_url, osrm_url), httpx.AsyncClient() as stats_client:
+        upstreams = {"geo_server": nominatim_url, "routing_server": osrm_url}
+
+        async def upstream_counts(server: str) -> dict:
+            return (await stats_client.get(f"{upstreams[server]}/_faults")).json()
+
+        print(
+            f"upstream latency {args.latency_ms} ms (+{args.jitter_ms} jitter), error rate {args.error_rate}, "
+            f"rate limit {args.rate_limit or 'none'}; {args.calls} calls per level\n"
+        )
+        print(
+            f"{'mode':<6} {'tool':<16} {'conc':>4} {'err':>4} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+            f"{'calls/s':>8} {'rss MB':>7}  upstream req/503/429"
+        )
+        # call numbers keep growing across levels and modes so no call repeats an earlier one
+        next_index = 1
+        for mode in args.mode:
+            async with targets[mode](nominatim_url, osrm_url, args.server_rate) as target:
+                for server, tool, make_args in scenarios:
+                    # warm-up: first connection, lazy imports, schema cache
+                    await target.call(server, tool, make_args(10**7))
+                    for concurrency in args.concurrency:
+                        before = await upstream_counts(server)
+                        row = await _run_level(target, server, tool, make_args, args.calls, concurrency, next_index)
+                        next_index += args.calls
+                        after = await upstream_counts(server)
+                        upstream = {k: after[k] - before[k] for k in before}
+                        results.append(
+                            {
+                                "mode": mode,
+                                "server": server,
+                                "tool": tool,
+                                "concurrency": concurrency,
+                                **row,
+                                "upstream": upstream,
+                            }
+                        )
+                        print(
+                            f"{mode:<6} {tool:<16} {concurrency:>4} {row['errors']:>4} {row['p50_ms']:8.1f} "
+                            f"{row['p95_ms']:8.1f} {row['p99_ms']:8.1f} {row['throughput_rps']:8.1f} "
+                            f"{row['rss_mb'] if row['rss_mb'] is not None else '-':>7}  "
+                            f"{upstream['requests']}/{upstream['errors']}/{upstream['throttled']}"
+                        )
+                        for message, count in row["error_samples"].items():
+                            print(f"{'':>12}{count} x {message}")
+
+    out = args.out or os.path.join(
+        RESULTS_DIR, f"servers-{datetime.datetime.now(datetime.timezone.utc):%Y%m%d-%H%M%S}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(
+            {
+                "meta": {
+                    "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+                    "commit": _git_commit(),
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "args": {k: v for k, v in vars(args).items() if k not in ("out", "baseline")},
+                },
+                "results": results,
+            },
+            f,
+            indent=2,
+        )
+    print(f"\nresults → {out}")
+
+    if args.baseline:
+        regressions = _compare(results, args.baseline, args.threshold_pct)
+        print(f"{regressions} regression(s)")
+        if regressions and args.fail_on_regression:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,94 @@
+# benchmarks/bench_startup.py
+#
+# Cold start of the MCP servers the way the agent starts them: spawn over stdio,
+# initialize, list_tools. Compares the two separate servers (started one after the
+# other, like agent/main_agent.py does) with the combined maps.map_server, and reports
+# time to the first list_tools answer, tool count, process count and RSS after it.
+# --eager repeats each setup with numpy and the offline engines imported up front,
+# which is what every server paid at startup before those imports were deferred.
+#
+#   python -m benchmarks.bench_startup --runs 7
+#   python -m benchmarks.bench_startup --runs 7 --eager
+
+import argparse
+import asyncio
+import contextlib
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+
+from benchmarks.bench_servers import REPO_ROOT, _children, _proc_status
+
+SETUPS = {
+    "separate": ["maps.geo_server", "maps.routing_server"],
+    "combined": ["maps.map_server"],
+}
+
+# what the servers imported at module load before it was made lazy
+EAGER_IMPORTS = "import numpy, maps.local_geocoder, maps.local_router, maps.road_index, maps.isochrone, maps.trip_solver"
+
+
+def _server_args(module: str, eager: bool) -> list[str]:
+    if not eager:
+        return ["-m", module]
+    return ["-c", f"{EAGER_IMPORTS}; import runpy; runpy.run_module('{module}', run_name='__main__')"]
+
+
+async def _start(modules: list[str], eager: bool, env: dict) -> dict:
+    """
+    One cold start of every server in `modules` (sequentially) → timings and memory.
+    """
+    async with contextlib.AsyncExitStack() as stack:
+        t0 = time.perf_counter()
+        tools = 0
+        pids = []
+        for module in modules:
+            before = _children(os.getpid())
+            params = StdioServerParameters(
+                command=sys.executable, args=_server_args(module, eager), env=env, cwd=REPO_ROOT
+            )
+            read, write = await stack.enter_async_context(stdio_client(params))
+            session = await stack.enter_async_context(ClientSession(read, write))
+            await session.initialize()
+            tools += len((await session.list_tools()).tools)
+            pids.extend(_children(os.getpid()) - before)
+        elapsed = time.perf_counter() - t0
+        rss = sum(_proc_status(pid).get("VmRSS", 0.0) for pid in pids)
+    return {"seconds": elapsed, "tools": tools, "processes": len(pids), "rss_mb": rss}
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--setups", nargs="+", choices=sorted(SETUPS), default=list(SETUPS))
+    parser.add_argument("--eager", action="store_true", help="also time each setup with the deferred imports preloaded")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as cache:
+        # throwaway cache dir so the servers don't open (or create) the real cache files
+        env = {**os.environ, "MAPS_CACHE_DIR": cache, "PYTHONPATH": REPO_ROOT}
+        # one untimed start so every .pyc exists and the page cache is warm
+        await _start(SETUPS["separate"] + SETUPS["combined"], False, env)
+
+        variants = [(name, False) for name in args.setups]
+        if args.eager:
+            variants += [(name, True) for name in args.setups]
+        print(f"{args.runs} cold starts each, time until every server has answered list_tools\n")
+        print(f"{'setup':<18} {'median ms':>10} {'min ms':>8} {'tools':>6} {'procs':>6} {'RSS MB':>8}")
+        for name, eager in variants:
+            runs = [await _start(SETUPS[name], eager, env) for _ in range(args.runs)]
+            seconds = [r["seconds"] * 1000 for r in runs]
+            label = f"{name}{' (eager)' if eager else ''}"
+            print(
+                f"{label:<18} {statistics.median(seconds):10.1f} {min(seconds):8.1f} {runs[0]['tools']:>6} "
+                f"{runs[0]['processes']:>6} {statistics.median(r['rss_mb'] for r in runs):8.1f}"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,61 @@
+# benchmarks/bench_trip_solver.py
+#
+# optimize_trip's solver on its own (no upstream): random stops in a ~10 km square with
+# an asymmetric "one-way streets" factor on top of straight-line distances.
+# Reports nearest-neighbor seed vs final cost and CPU time per size, and checks small
+# instances against brute force.
+#
+#   python -m benchmarks.bench_trip_solver --sizes 12 50 100 200 300 --budget 1.0
+
+import argparse
+import itertools
+import time
+
+import numpy as np
+
+from maps.trip_solver import path_cost, solve_trip
+
+
+def random_costs(n: int, seed: int, asymmetry: float = 0.2) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    points = rng.random((n, 2)) * 10_000
+    cost = np.hypot(*(points[:, None, :] - points[None, :, :]).transpose(2, 0, 1))
+    return cost * (1 + asymmetry * rng.random((n, n)))
+
+
+def _brute_force_gap(trials: int = 50, n: int = 8) -> float:
+    worst = 1.0
+    for seed in range(trials):
+        cost = random_costs(n, seed)
+        solved = solve_trip(cost, start=0, round_trip=True)["cost"]
+        best = min(path_cost(cost, (0, *perm, 0)) for perm in itertools.permutations(range(1, n)))
+        worst = max(worst, solved / best)
+    return worst
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[12, 50, 100, 200, 300])
+    parser.add_argument("--budget", type=float, default=1.0, help="solver time budget (s)")
+    args = parser.parse_args()
+
+    print(f"8-stop round trips vs brute force: worst ratio {_brute_force_gap():.3f}\n")
+    for n in args.sizes:
+        cost = random_costs(n, seed=n)
+        for label, kwargs in (
+            ("round trip", {"start": 0, "round_trip": True}),
+            ("open path ", {"start": 0, "end": None, "round_trip": False}),
+        ):
+            cpu0 = time.process_time()
+            solution = solve_trip(cost, max_seconds=args.budget, **kwargs)
+            cpu = time.process_time() - cpu0
+            gain = 100 * (1 - solution["cost"] / solution["seed_cost"])
+            print(
+                f"{n:>4} stops  {label}  seed {solution['seed_cost']:10.0f}  final {solution['cost']:10.0f}  "
+                f"(-{gain:4.1f}%)  moves {solution['moves']:>5}  wall {solution['seconds'] * 1000:7.1f} ms  "
+                f"cpu {cpu * 1000:7.1f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+# benchmarks/bench_upstream_pool.py
+#
+# maps.upstream_pool.EndpointPool against several fake OSRM instances that misbehave
+# in controlled ways (fake_upstreams.Faults). Each scenario runs the same request
+# stream through the pool and through a baseline (hedging off, or only the first
+# endpoint, i.e. the old single OSRM_BASE), then prints latency percentiles, errors
+# the caller saw, hedges / retries and how the requests were spread:
+#   tail       3 equal endpoints, 3% of answers stall 300 ms → hedging vs not
+#   slow       first endpoint 8x slower than the other two → latency-aware choice
+#   flaky      first endpoint answers 30% 503 → retries on another endpoint
+#   outage     first endpoint down (503) for the middle third of the run → circuit
+#              breaker opens, traffic moves, the endpoint is probed back in
+#   throttled  first endpoint rate limited (429 + Retry-After) → cooled down, not failed
+# --check exits 1 if the pool doesn't beat its baseline where it should.
+#
+#   python -m benchmarks.bench_upstream_pool --requests 600 --concurrency 8
+#   python -m benchmarks.bench_upstream_pool --scenarios outage --check
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+
+from benchmarks.fake_upstreams import Faults, FakeUpstream, make_osrm_app
+from maps import upstream_pool
+from maps.http_clients import aclose_clients
+from maps.upstream_pool import EndpointPool
+
+PATH = "/route/v1/driving/35.48,33.901;35.4884,33.8209"
+LATENCY_MS = 20.0
+
+
+def _faults(scenario: str) -> list[Faults]:
+    base = dict(latency_ms=LATENCY_MS, jitter_ms=4.0)
+    if scenario == "tail":
+        return [Faults(**base, stall_rate=0.03, stall_ms=300.0, seed=i) for i in range(3)]
+    if scenario == "slow":
+        return [Faults(latency_ms=LATENCY_MS * 8, jitter_ms=4.0, seed=0)] + [Faults(**base, seed=i) for i in (1, 2)]
+    if scenario == "flaky":
+        return [Faults(**base, error_rate=0.3, seed=0)] + [Faults(**base, seed=i) for i in (1, 2)]
+    if scenario == "throttled":
+        return [Faults(**base, rate_limit=50.0, burst=5.0, seed=0)] + [Faults(**base, seed=i) for i in (1, 2)]
+    # outage: starts healthy, taken down / brought back by _drive
+    return [Faults(**base, seed=i) for i in range(3)]
+
+
+async def _drive(pool: EndpointPool, requests: int, concurrency: int, faults: list[Faults], outage: bool) -> dict:
+    latencies: list[float] = []
+    errors = 0
+    issued = 0
+
+    async def worker() -> None:
+        nonlocal errors, issued
+        while issued < requests:
+            issued += 1
+            if outage and issued == requests // 3:
+                faults[0].update(down=True)
+            if outage and issued == 2 * requests // 3:
+                faults[0].update(down=False)
+            t0 = time.perf_counter()
+            try:
+                resp = await pool.get(PATH, params={"overview": "false"})
+                if resp.status_code != 200:
+                    errors += 1
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - t0)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    ms = sorted(s * 1000 for s in latencies)
+    q = statistics.quantiles(ms, n=100, method="inclusive")
+    stats = pool.stats()
+    return {
+        "p50": q[49],
+        "p95": q[94],
+        "p99": q[98],
+        "errors": errors,
+        "hedged": stats["hedged"],
+        "retried": stats["retried"],
+        "share": [e["requests"] for e in stats["endpoints"]],
+        "opened": [e["circuit_opened"] for e in stats["endpoints"]],
+    }
+
+
+async def _scenario(name: str, args: argparse.Namespace) -> tuple[dict, dict]:
+    results = []
+    # baseline first, then the pool, each against fresh instances with the same seeds
+    for variant in ("baseline", "pool"):
+        faults = _faults(name)
+        servers = [FakeUpstream(make_osrm_app(faults=f)) for f in faults]
+        urls = [await s.__aenter__() for s in servers]
+        try:
+            if variant == "baseline" and name == "tail":
+                pool = EndpointPool("osrm", urls, timeout=5.0, retries=0, hedge_quantile=0)
+            elif variant == "baseline":
+                # the old single OSRM_BASE: first endpoint only, no retries
+                pool = EndpointPool("osrm", urls[:1], timeout=5.0, retries=0, hedge_quantile=0)
+            else:
+                pool = EndpointPool("osrm", urls, timeout=5.0)
+            results.append(await _drive(pool, args.requests, args.concurrency, faults, name == "outage"))
+        finally:
+            for server in servers:
+                await server.__aexit__(None, None, None)
+    return results[0], results[1]
+
+
+def _line(label: str, r: dict) -> str:
+    return (
+        f"  {label:<9} p50 {r['p50']:7.1f}  p95 {r['p95']:7.1f}  p99 {r['p99']:7.1f} ms  errors {r['errors']:>4}  "
+        f"hedged {r['hedged']:>3}  retried {r['retried']:>3}  per endpoint {r['share']}  circuit opened {r['opened']}"
+    )
+
+
+def _checks(name: str, baseline: dict, pool: dict, requests: int) -> list[tuple[str, bool]]:
+    if name == "tail":
+        return [("hedging lowers p99", pool["p99"] < baseline["p99"] * 0.7)]
+    if name == "slow":
+        return [
+            ("most traffic avoids the slow endpoint", pool["share"][0] < 0.2 * sum(pool["share"])),
+            ("p50 near the fast endpoints", pool["p50"] < baseline["p50"] * 0.5),
+        ]
+    if name == "flaky":
+        return [("retries hide the 503s", pool["errors"] < max(baseline["errors"] * 0.05, 1))]
+    if name == "outage":
+        return [
+            ("callers see almost no errors", pool["errors"] <= requests * 0.01),
+            ("circuit opened on the dead endpoint", pool["opened"][0] >= 1),
+        ]
+    return [("429s don't reach callers", pool["errors"] <= requests * 0.01)]
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    scenarios = ["tail", "slow", "flaky", "outage", "throttled"]
+    parser.add_argument("--scenarios", nargs="+", choices=scenarios, default=scenarios)
+    parser.add_argument("--requests", type=int, default=600)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--check", action="store_true", help="exit 1 when a check fails")
+    args = parser.parse_args()
+
+    # short breaker cooldown so the outage scenario also shows the endpoint coming back
+    upstream_pool.CIRCUIT_COOLDOWN = 0.5
+    print(f"{args.requests} requests per run, concurrency {args.concurrency}, base latency {LATENCY_MS} ms")
+    failed = 0
+    for name in args.scenarios:
+        baseline, pool = await _scenario(name, args)
+        print(f"\n{name}")
+        print(_line("baseline", baseline))
+        print(_line("pool", pool))
+        for label, ok in _checks(name, baseline, pool, args.requests):
+            failed += not ok
+            print(f"  {'ok  ' if ok else 'FAIL'} {label}")
+    await aclose_clients()
+    if args.check and failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
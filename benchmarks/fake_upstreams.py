@@ -0,0 +1,410 @@
+# benchmarks/fake_upstreams.py
+#
+# Local stand-ins for Nominatim and OSRM so the map servers can be benchmarked
+# without hitting the public services. Answers are deterministic and cheap to
+# compute (straight-line distances), the point is to measure *our* overhead.
+# A `Faults` object adds latency (with jitter), occasional long stalls, random 5xx
+# answers, a rate limit that answers 429 + Retry-After, or a full outage, like the
+# real services under load. Several instances of one fake make an endpoint pool
+# whose members misbehave differently (benchmarks/bench_upstream_pool.py).
+#
+# Run them standalone (e.g. to point the agent at them, port 0 = any free port):
+#   python -m benchmarks.fake_upstreams --nominatim-port 8081 --osrm-port 5000 --latency-ms 20
+# GET /_faults on either one returns its request / 503 / 429 counters; POST /_faults
+# with a JSON object of knobs (e.g. {"down": true}) changes them while it runs.
+
+import argparse
+import asyncio
+import hashlib
+import math
+import random
+import time
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, Response
+from starlette.routing import Route
+
+from maps.encoding import encode_polyline
+from maps.geo_utils import haversine_m
+
+# rough average speed used to turn straight-line meters into seconds
+FAKE_SPEED_MPS = 12.0
+
+
+def _fake_point(text: str) -> tuple[float, float]:
+    # hash the query into a stable point around Beirut
+    digest = hashlib.sha1(text.encode("utf-8")).digest()
+    lat = 33.85 + digest[0] / 255 * 0.1
+    lon = 35.45 + digest[1] / 255 * 0.1
+    return lat, lon
+
+
+def _parse_coords(coord_str: str) -> list[tuple[float, float]]:
+    # OSRM style "lon,lat;lon,lat" → [(lat, lon), ...]
+    points = []
+    for pair in coord_str.split(";"):
+        lon, lat = pair.split(",")
+        points.append((float(lat), float(lon)))
+    return points
+
+
+def _parse_index_list(value: str | None, n: int) -> list[int]:
+    if value in (None, "", "all"):
+        return list(range(n))
+    return [int(i) for i in value.split(";")]
+
+
+class Faults:
+    """
+    Misbehavior shared by all endpoints of one fake upstream.
+
+    latency_ms (+ up to jitter_ms extra, uniform) before every answer; stall_rate is
+    the share of requests that take stall_ms longer (tail latency); error_rate is
+    the share of requests answered with a 503; rate_limit (requests/s, token bucket
+    with `burst`) turns the excess into 429s with Retry-After; down answers every
+    request with an immediate 503. 0 / False turns a knob off.
+    """
+
+    KNOBS = ("latency_ms", "jitter_ms", "stall_rate", "stall_ms", "error_rate", "rate_limit", "down")
+
+    def __init__(
+        self,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        error_rate: float = 0.0,
+        rate_limit: float = 0.0,
+        burst: float = 1.0,
+        seed: int = 0,
+        stall_rate: float = 0.0,
+        stall_ms: float = 0.0,
+        down: bool = False,
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.stall_rate = stall_rate
+        self.stall_ms = stall_ms
+        self.down = down
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.burst = max(burst, 1.0)
+        self._rng = random.Random(seed)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self.counts = {"requests": 0, "errors": 0, "throttled": 0, "stalled": 0}
+
+    def _take_token(self) -> float:
+        """
+        0 if the request may go through, otherwise seconds until the next token.
+        """
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate_limit)
+        self._updated = now
+        if self._tokens >= 1.0:
+            self._tokens -= 1.0
+            return 0.0
+        return (1.0 - self._tokens) / self.rate_limit
+
+    async def __call__(self) -> Response | None:
+        """
+        Apply the configured faults; a response means "answer with this instead".
+        """
+        self.counts["requests"] += 1
+        if self.down:
+            self.counts["errors"] += 1
+            return PlainTextResponse("Service Unavailable", status_code=503)
+        if self.rate_limit:
+            wait = self._take_token()
+            if wait:
+                self.counts["throttled"] += 1
+                # Retry-After is whole seconds over HTTP
+                return PlainTextResponse(
+                    "Too Many Requests", status_code=429, headers={"Retry-After": str(math.ceil(wait))}
+                )
+        delay = self.latency_ms + (self._rng.random() * self.jitter_ms if self.jitter_ms else 0.0)
+        if self.stall_rate and self._rng.random() < self.stall_rate:
+            self.counts["stalled"] += 1
+            delay += self.stall_ms
+        if delay:
+            await asyncio.sleep(delay / 1000)
+        if self.error_rate and self._rng.random() < self.error_rate:
+            self.counts["errors"] += 1
+            return PlainTextResponse("Service Unavailable", status_code=503)
+        return None
+
+    def update(self, **knobs) -> None:
+        for key, value in knobs.items():
+            if key not in self.KNOBS:
+                raise ValueError(f"Unknown fault knob '{key}'")
+            setattr(self, key, value)
+
+    async def endpoint(self, request: Request) -> JSONResponse:
+        # /_faults: counters for whoever drives the load (not subject to faults itself);
+        # POST changes knobs on the fly, e.g. to take one instance of a pool down
+        if request.method == "POST":
+            try:
+                self.update(**(await request.json()))
+            except (ValueError, TypeError) as e:
+                return JSONResponse({"error": str(e)}, status_code=400)
+        return JSONResponse(self.counts)
+
+
+def make_nominatim_app(latency_ms: float = 0.0, faults: Faults | None = None) -> Starlette:
+    """
+    Fake Nominatim with /search and /reverse in jsonv2 shape.
+    `faults` replaces the plain `latency_ms`; it is kept on app.state.faults.
+    """
+    faults = faults or Faults(latency_ms=latency_ms)
+
+    async def search(request: Request) -> Response:
+        if (rejected := await faults()) is not None:
+            return rejected
+        query = request.query_params.get("q", "")
+        limit = int(request.query_params.get("limit", 10))
+        items = []
+        for i in range(limit):
+            lat, lon = _fake_point(f"{query}#{i}")
+            items.append(
+                {
+                    "display_name": f"{query} ({i})",
+                    "lat": f"{lat:.7f}",
+                    "lon": f"{lon:.7f}",
+                    "type": "fake",
+                    "class": "place",
+                    "importance": 0.5,
+                }
+            )
+        return JSONResponse(items)
+
+    async def reverse(request: Request) -> Response:
+        if (rejected := await faults()) is not None:
+            return rejected
+        lat = float(request.query_params["lat"])
+        lon = float(request.query_params["lon"])
+        return JSONResponse(
+            {
+                "lat": f"{lat:.7f}",
+                "lon": f"{lon:.7f}",
+                "display_name": f"Fake street near {lat:.4f}, {lon:.4f}",
+                "address": {"road": "Fake street", "city": "Beirut", "country_code": "lb"},
+            }
+        )
+
+    app = Starlette(
+        routes=[
+            Route("/search", search),
+            Route("/reverse", reverse),
+            Route("/_faults", faults.endpoint, methods=["GET", "POST"]),
+        ]
+    )
+    app.state.faults = faults
+    return app
+
+
+def make_osrm_app(
+    latency_ms: float = 0.0, max_matching_size: int = 100, faults: Faults | None = None
+) -> Starlette:
+    """
+    Fake OSRM with /route, /nearest, /table (including sources/destinations) and /match.
+    `faults` replaces the plain `latency_ms`; it is kept on app.state.faults.
+    """
+    faults = faults or Faults(latency_ms=latency_ms)
+
+    async def route(request: Request) -> Response:
+        if (rejected := await faults()) is not None:
+            return rejected
+        points = _parse_coords(request.path_params["coords"])
+        legs = []
+        for (lat1, lon1), (lat2, lon2) in zip(points, points[1:]):
+            dist = haversine_m(lat1, lon1, lat2, lon2)
+            legs.append({"distance": dist, "duration": dist / FAKE_SPEED_MPS, "steps": [], "summary": ""})
+        distance = sum(leg["distance"] for leg in legs)
+        geometry = None
+        if request.query_params.get("overview", "simplified") != "false":
+            # like OSRM: encoded polyline unless geojson is asked for
+            if request.query_params.get("geometries", "polyline") == "geojson":
+                geometry = {"type": "LineString", "coordinates": [[lon, lat] for lat, lon in points]}
+            else:
+                geometry = encode_polyline(points)
+        return JSONResponse(
+            {
+                "code": "Ok",
+                "routes": [
+                    {
+                        "distance": distance,
+                        "duration": distance / FAKE_SPEED_MPS,
+                        "legs": legs,
+                        "geometry": geometry,
+                    }
+                ],
+            }
+        )
+
+    async def nearest(request: Request) -> Response:
+        if (rejected := await faults()) is not None:
+            return rejected
+        (lat, lon), = _parse_coords(request.path_params["coords"])
+        # "snap" to a 0.001 degree grid so there is a small non-zero distance
+        snapped = (round(lat, 3), round(lon, 3))
+        return JSONResponse(
+            {
+                "code": "Ok",
+                "waypoints": [
+                    {
+                        "location": [snapped[1], snapped[0]],
+                        "distance": haversine_m(lat, lon, *snapped),
+                        "name": "Fake street",
+                    }
+                ],
+            }
+        )
+
+    async def table(request: Request) -> Response:
+        if (rejected := await faults()) is not None:
+            return rejected
+        points = _parse_coords(request.path_params["coords"])
+        sources = _parse_index_list(request.query_params.get("sources"), len(points))
+        destinations = _parse_index_list(request.query_params.get("destinations"), len(points))
+        annotations = request.query_params.get("annotations", "duration").split(",")
+
+        distances = [
+            [haversine_m(*points[s], *points[d]) for d in destinations] for s in sources
+        ]
+        body = {
+            "code": "Ok",
+            "sources": [{"location": [points[s][1], points[s][0]]} for s in sources],
+            "destinations": [{"location": [points[d][1], points[d][0]]} for d in destinations],
+        }
+        if "duration" in annotations:
+            body["durations"] = [[d / FAKE_SPEED_MPS for d in row] for row in distances]
+        if "distance" in annotations:
+            body["distances"] = distances
+        return JSONResponse(body)
+
+    async def match(request: Request) -> Response:
+        if (rejected := await faults()) is not None:
+            return rejected
+        points = _parse_coords(request.path_params["coords"])
+        if len(points) > max_matching_size:
+            # same status/code as osrm-routed with --max-matching-size
+            return JSONResponse({"code": "TooBig", "message": "Too many trace coordinates"}, status_code=400)
+        precision = 6 if request.query_params.get("geometries") == "polyline6" else 5
+        legs = []
+        for a, b in zip(points, points[1:]):
+            dist = haversine_m(*a, *b)
+            legs.append(
+                {
+                    "distance": dist,
+                    "duration": dist / FAKE_SPEED_MPS,
+                    "steps": [{"geometry": encode_polyline([a, b], precision=precision)}],
+                }
+            )
+        distance = sum(leg["distance"] for leg in legs)
+        return JSONResponse(
+            {
+                "code": "Ok",
+                "tracepoints": [
+                    {"location": [lon, lat], "matchings_index": 0, "waypoint_index": i, "name": "Fake street"}
+                    for i, (lat, lon) in enumerate(points)
+                ],
+                "matchings": [
+                    {"confidence": 0.9, "distance": distance, "duration": distance / FAKE_SPEED_MPS, "legs": legs}
+                ],
+            }
+        )
+
+    app = Starlette(
+        routes=[
+            Route("/route/v1/{profile}/{coords:path}", route),
+            Route("/match/v1/{profile}/{coords:path}", match),
+            Route("/nearest/v1/{profile}/{coords:path}", nearest),
+            Route("/table/v1/{profile}/{coords:path}", table),
+            Route("/_faults", faults.endpoint, methods=["GET", "POST"]),
+        ]
+    )
+    app.state.faults = faults
+    return app
+
+
+class FakeUpstream:
+    """
+    Runs a Starlette app with uvicorn inside the current event loop.
+
+        async with FakeUpstream(make_osrm_app()) as base_url:
+            ...
+    """
+
+    def __init__(self, app: Starlette, host: str = "127.0.0.1", port: int = 0):
+        self.app = app
+        self.host = host
+        self.port = port
+        self._server: uvicorn.Server | None = None
+        self._task: asyncio.Task | None = None
+
+    async def __aenter__(self) -> str:
+        config = uvicorn.Config(
+            self.app,
+            host=self.host,
+            port=self.port,
+            log_level="warning",
+            lifespan="off",
+        )
+        self._server = uvicorn.Server(config)
+        self._task = asyncio.create_task(self._server.serve())
+        while not self._server.started:
+            await asyncio.sleep(0.01)
+        port = self._server.servers[0].sockets[0].getsockname()[1]
+        return f"http://{self.host}:{port}"
+
+    async def __aexit__(self, *exc) -> None:
+        assert self._server is not None and self._task is not None
+        self._server.should_exit = True
+        await self._task
+
+
+def add_fault_args(parser: argparse.ArgumentParser) -> None:
+    """
+    --latency-ms / --jitter-ms / --stall-* / --error-rate / --rate-limit / --burst, shared by the
+    standalone runner and the benchmark suite.
+    """
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="fixed upstream latency")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="extra uniform random latency")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="share of requests that stall")
+    parser.add_argument("--stall-ms", type=float, default=0.0, help="extra latency of a stalled request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 503")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="requests/s before 429s (0 = none)")
+    parser.add_argument("--burst", type=float, default=10.0, help="rate limit burst size")
+
+
+def faults_from_args(args: argparse.Namespace, seed: int = 0) -> Faults:
+    return Faults(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        stall_rate=args.stall_rate,
+        stall_ms=args.stall_ms,
+        error_rate=args.error_rate,
+        rate_limit=args.rate_limit,
+        burst=args.burst,
+        seed=seed,
+    )
+
+
+async def _serve(args: argparse.Namespace) -> None:
+    nominatim = FakeUpstream(make_nominatim_app(faults=faults_from_args(args, seed=1)), port=args.nominatim_port)
+    osrm = FakeUpstream(make_osrm_app(faults=faults_from_args(args, seed=2)), port=args.osrm_port)
+    async with nominatim as nominatim_url, osrm as osrm_url:
+        print(f"NOMINATIM_BASE={nominatim_url}", flush=True)
+        print(f"OSRM_BASE={osrm_url}", flush=True)
+        await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nominatim-port", type=int, default=8081)
+    parser.add_argument("--osrm-port", type=int, default=5000)
+    add_fault_args(parser)
+    try:
+        asyncio.run(_serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
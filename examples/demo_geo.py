@@ -3,6 +3,8 @@
 import asyncio
 import json
 
+from maps.http_clients import aclose_clients
+
 # importing the internal tool helpers directly from the geo server
 from maps.geo_server import (
     _tool_geocode_place,
@@ -47,6 +49,9 @@ async def main() -> None:
     print(json.dumps(json.loads(poi_result[0].text), indent=2, ensure_ascii=False))
     print("\n" + "=" * 60 + "\n")
 
+    # the servers keep one pooled client open, so close it before exiting
+    await aclose_clients()
+
 
 if __name__ == "__main__":
     # just run all three calls in sequence to sanity–check the geo server logic
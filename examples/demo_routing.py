@@ -3,6 +3,7 @@
 import asyncio
 import json
 
+from maps.http_clients import aclose_clients
 from maps.routing_server import (
     _tool_route_between,
     _tool_nearest_road,
@@ -57,6 +58,9 @@ async def main() -> None:
     print(json.dumps(json.loads(matrix_result[0].text), indent=2))
     print("\n" + "=" * 60 + "\n")
 
+    # the servers keep one pooled client open, so close it before exiting
+    await aclose_clients()
+
 
 if __name__ == "__main__":
     # quick and dirty test for the routing server helpers
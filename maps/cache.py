@@ -0,0 +1,166 @@
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Any
+
+# Small two-tier cache used by the map servers:
+#   1) in-memory OrderedDict (LRU or FIFO eviction) → warm hits never leave the process
+#   2) optional SQLite file → entries survive a server restart
+# Values must be JSON-serializable (they are stored as text on disk).
+
+_MISSING = object()
+
+EVICTION_POLICIES = {"lru", "fifo"}
+
+
+class TTLCache:
+    """
+    Key/value cache with a TTL, a bounded memory tier and an optional disk tier.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_size: int = 1024,
+        ttl: float = 24 * 3600,
+        path: str | None = None,
+        eviction: str = "lru",
+        max_disk_size: int = 100_000,
+    ):
+        if eviction not in EVICTION_POLICIES:
+            raise ValueError(f"Unknown eviction policy '{eviction}' (use one of {sorted(EVICTION_POLICIES)})")
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self.eviction = eviction
+        self.max_disk_size = max_disk_size
+        self.path = path
+
+        # key -> (expires_at, value)
+        self._memory: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._db: sqlite3.Connection | None = None
+
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.evictions = 0
+        self._disk_writes = 0
+
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " accessed_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed_at)")
+            # drop whatever expired while the server was down
+            self._db.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+
+    def get(self, key: str, default: Any = None) -> Any:
+        now = time.time()
+        entry = self._memory.get(key, _MISSING)
+        if entry is not _MISSING:
+            expires_at, value = entry
+            if expires_at > now:
+                if self.eviction == "lru":
+                    self._memory.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._memory[key]
+
+        if self._db is not None:
+            row = self._db.execute(
+                "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                raw, expires_at = row
+                if expires_at > now:
+                    if self.eviction == "lru":
+                        self._db.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+                    value = json.loads(raw)
+                    # promote to the memory tier (keeping the original expiry)
+                    self._remember(key, expires_at, value)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return value
+                self._db.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+        self.misses += 1
+        return default
+
+    def peek(self, key: str, default: Any = None) -> Any:
+        """
+        Memory-tier lookup that doesn't touch the counters or the LRU order.
+        """
+        entry = self._memory.get(key, _MISSING)
+        if entry is not _MISSING and entry[0] > time.time():
+            return entry[1]
+        return default
+
+    def set(self, key: str, value: Any, ttl: float | None = None) -> None:
+        now = time.time()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        self._remember(key, expires_at, value)
+
+        if self._db is not None:
+            self._db.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), expires_at, now),
+            )
+            self._disk_writes += 1
+            if self._disk_writes % 256 == 0:
+                # counting rows is not free, so only trim every few hundred writes
+                self._trim_disk()
+
+    def _remember(self, key: str, expires_at: float, value: Any) -> None:
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            # oldest entry is at the front for both LRU and FIFO
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def _trim_disk(self) -> None:
+        (count,) = self._db.execute("SELECT COUNT(*) FROM cache").fetchone()
+        extra = count - self.max_disk_size
+        if extra > 0:
+            self._db.execute(
+                "DELETE FROM cache WHERE key IN ("
+                " SELECT key FROM cache ORDER BY accessed_at ASC LIMIT ?)",
+                (extra,),
+            )
+            self.evictions += extra
+
+    def clear(self) -> None:
+        self._memory.clear()
+        if self._db is not None:
+            self._db.execute("DELETE FROM cache")
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "name": self.name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "disk_hits": self.disk_hits,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "memory_size": len(self._memory),
+            "max_size": self.max_size,
+            "ttl_s": self.ttl,
+            "eviction": self.eviction,
+            "persistent": self._db is not None,
+        }
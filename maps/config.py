@@ -0,0 +1,73 @@
+import os
+
+# Tiny helpers for reading server settings from the environment
+# (works with the same .env file the agent already loads).
+
+
+def env_str(name: str, default: str | None) -> str | None:
+    value = os.environ.get(name)
+    return value if value is not None else default
+
+
+def env_float(name: str, default: float) -> float:
+    value = os.environ.get(name)
+    return float(value) if value not in (None, "") else default
+
+
+def env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    return int(value) if value not in (None, "") else default
+
+
+def env_flag(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in {"1", "true", "yes", "on"}
+
+
+# name prefixes of the server settings read with the helpers above. Servers the agent
+# spawns over stdio only inherit a few safe variables (HOME, PATH, ...), so these are
+# passed on explicitly (agent/tracing.py server_env); secrets like OPENAI_API_KEY aren't
+SERVER_ENV_PREFIXES = (
+    "MAPS_",
+    "MAP_",
+    "GEO_",
+    "GEOCODER_",
+    "NOMINATIM_",
+    "REVERSE_CACHE_",
+    "BATCH_GEOCODE_",
+    "ROUTING_",
+    "ROUTE_",
+    "OSRM_",
+    "LOCAL_",
+    "MATCH_",
+    "MATRIX_",
+    "SNAP_",
+    "ISOCHRONE_",
+    "TRIP_",
+    "METRICS_",
+)
+# proxy / CA settings httpx picks up from the environment
+SERVER_ENV_NAMES = ("HTTP_PROXY", "HTTPS_PROXY", "ALL_PROXY", "NO_PROXY", "SSL_CERT_FILE", "SSL_CERT_DIR")
+
+
+def server_config_env(environ: dict | None = None) -> dict[str, str]:
+    """
+    The map-server settings (and proxy variables) from `environ` (default os.environ,
+    which includes a loaded .env).
+    """
+    environ = os.environ if environ is None else environ
+    return {
+        name: value
+        for name, value in environ.items()
+        if name.startswith(SERVER_ENV_PREFIXES) or name.upper() in SERVER_ENV_NAMES
+    }
+
+
+def cache_dir() -> str:
+    """
+    Folder for on-disk caches (override with MAPS_CACHE_DIR).
+    """
+    default = os.path.join(os.path.expanduser("~"), ".cache", "fakih_tools")
+    return env_str("MAPS_CACHE_DIR", default)
@@ -0,0 +1,114 @@
+import base64
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    # only the matrix encoders need numpy; imported there so the polyline helpers stay light
+    import numpy as np
+
+# Compact encodings for big tool results:
+#   - matrices → base64 of a row-major little-endian float32 / uint32 buffer + shape header
+#   - line geometry → Google encoded polyline (what OSRM itself uses)
+
+MATRIX_ENCODINGS = {"json", "float32", "uint32"}
+
+# uint32 has no NaN, so unreachable cells (OSRM null) become this value
+UINT32_NODATA = 0xFFFFFFFF
+
+
+def matrix_to_json(matrix: "np.ndarray") -> list:
+    """
+    Nested lists for the plain JSON output (NaN → null like OSRM).
+    """
+    import numpy as np
+
+    # row by row, so in a worker thread the event loop gets the GIL between rows (maps/offload.py)
+    rows = [row.tolist() for row in matrix]
+    for i in np.flatnonzero(np.isnan(matrix).any(axis=1)):
+        rows[i] = [None if v != v else v for v in rows[i]]
+    return rows
+
+
+def pack_matrix(matrix: "np.ndarray", dtype: str) -> dict:
+    """
+    Pack a 2-D float matrix into a base64 buffer with a small header.
+
+    Decode with e.g. numpy:
+        np.frombuffer(base64.b64decode(m["data"]), dtype="<f4").reshape(m["shape"])
+    """
+    import numpy as np
+
+    if dtype == "float32":
+        buffer = matrix.astype("<f4", copy=False)
+        nodata = "NaN"
+    elif dtype == "uint32":
+        buffer = np.where(np.isnan(matrix), UINT32_NODATA, np.rint(matrix)).astype("<u4")
+        nodata = UINT32_NODATA
+    else:
+        raise ValueError(f"Unknown matrix encoding '{dtype}'")
+
+    return {
+        "dtype": dtype,
+        "shape": list(matrix.shape),
+        "order": "row-major",
+        "byteorder": "little",
+        "nodata": nodata,
+        "data": base64.b64encode(np.ascontiguousarray(buffer).tobytes()).decode("ascii"),
+    }
+
+
+def encode_matrix(matrix: "np.ndarray | None", encoding: str) -> list | dict | None:
+    if matrix is None:
+        return None
+    if encoding == "json":
+        return matrix_to_json(matrix)
+    return pack_matrix(matrix, encoding)
+
+
+def _encode_value(value: int, out: list[str]) -> None:
+    value = ~(value << 1) if value < 0 else value << 1
+    while value >= 0x20:
+        out.append(chr((0x20 | (value & 0x1F)) + 63))
+        value >>= 5
+    out.append(chr(value + 63))
+
+
+def encode_polyline(points, precision: int = 5) -> str:
+    """
+    Encode [(lat, lon), ...] as a Google polyline string.
+    """
+    factor = 10**precision
+    out: list[str] = []
+    prev_lat = prev_lon = 0
+    for lat, lon in points:
+        ilat = int(round(lat * factor))
+        ilon = int(round(lon * factor))
+        _encode_value(ilat - prev_lat, out)
+        _encode_value(ilon - prev_lon, out)
+        prev_lat, prev_lon = ilat, ilon
+    return "".join(out)
+
+
+def decode_polyline(encoded: str, precision: int = 5) -> list[tuple[float, float]]:
+    """
+    Decode a Google polyline string into [(lat, lon), ...].
+    """
+    factor = 10**precision
+    points = []
+    index = lat = lon = 0
+    length = len(encoded)
+    while index < length:
+        deltas = []
+        for _ in range(2):
+            shift = result = 0
+            while True:
+                b = ord(encoded[index]) - 63
+                index += 1
+                result |= (b & 0x1F) << shift
+                shift += 5
+                if b < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += deltas[0]
+        lon += deltas[1]
+        points.append((lat / factor, lon / factor))
+    return points
@@ -1,19 +1,110 @@
 import asyncio
 import json
-from typing import List
+import os
+import time
+from typing import TYPE_CHECKING, List
 
-import httpx
 from mcp.server import Server, NotificationOptions
 from mcp.server.models import InitializationOptions
-from mcp.server.stdio import stdio_server
 import mcp.types as types
 
+from maps.cache import TTLCache
+from maps.config import cache_dir, env_float, env_int, env_str
+from maps.geo_utils import geohash_encode, haversine_m, zoom_to_geohash_precision
+from maps.http_clients import aclose_clients
+from maps.metrics import Metrics, MetricsExporter
+from maps.offload import loads
+from maps.output import next_page, render, with_output_options
+from maps.scheduler import UpstreamScheduler, request_key, retry_after_seconds
+from maps.tracing import Tracer
+from maps.transport import serve
+from maps.upstream_pool import EndpointPool
+
+if TYPE_CHECKING:
+    # numpy-backed; imported on first offline lookup (see maps/map_server.py)
+    from maps.local_geocoder import LocalGeocoder
+
 # basic MCP server for all the geo-related tools
 app = Server("geo-server")
 
 # just putting a custom user agent so Nominatim doesn't get angry
 USER_AGENT = "eece503p-fakih-tools/1.0 (contact: tmf14@mail.aub.edu)"
 
+# upstream settings (env vars so I can point the server at a local Nominatim)
+# NOMINATIM_BASE may list several comma-separated instances (see maps/upstream_pool.py)
+NOMINATIM_BASE = env_str("NOMINATIM_BASE", "https://nominatim.openstreetmap.org")
+NOMINATIM_TIMEOUT = env_float("NOMINATIM_TIMEOUT", 15.0)
+
+# every Nominatim request goes through this queue (public instance allows ~1 req/s)
+NOMINATIM_SCHEDULER = UpstreamScheduler(
+    "nominatim",
+    rate=env_float("NOMINATIM_RATE", 1.0),
+    burst=env_float("NOMINATIM_BURST", 1.0),
+    max_queue=env_int("NOMINATIM_MAX_QUEUE", 64),
+    deadline=env_float("NOMINATIM_QUEUE_DEADLINE", 30.0),
+)
+
+# latency-aware failover, hedging and circuit breaking across those instances;
+# retries and hedges take their tokens from NOMINATIM_SCHEDULER too, so the
+# public instance's usage policy holds for every request we send
+NOMINATIM_POOL = EndpointPool(
+    "nominatim",
+    NOMINATIM_BASE,
+    timeout=NOMINATIM_TIMEOUT,
+    headers={"User-Agent": USER_AGENT},
+    retries=env_int("NOMINATIM_RETRIES", 1),
+    hedge_quantile=env_float("NOMINATIM_HEDGE_QUANTILE", 0.95),
+    limiter=NOMINATIM_SCHEDULER,
+)
+
+# "nominatim" (HTTP) or "local" (offline index built with `python -m maps.local_geocoder build`)
+# only geocode_place / search_poi have a local implementation, reverse_geocode stays on Nominatim
+GEOCODER_BACKEND = env_str("GEOCODER_BACKEND", "nominatim")
+LOCAL_GEOCODER_DIR = env_str("LOCAL_GEOCODER_DIR", "geocoder")
+
+# batch_geocode: distinct queries in flight at once (the scheduler still enforces the rate)
+BATCH_GEOCODE_CONCURRENCY = env_int("BATCH_GEOCODE_CONCURRENCY", 4)
+
+# forward geocoding cache (memory LRU + SQLite file so it survives restarts)
+# GEO_CACHE_PATH="" turns the disk tier off
+GEO_CACHE = TTLCache(
+    "geocode",
+    max_size=env_int("GEO_CACHE_MAX_SIZE", 2048),
+    ttl=env_float("GEO_CACHE_TTL", 7 * 24 * 3600),
+    path=env_str("GEO_CACHE_PATH", os.path.join(cache_dir(), "geocode.sqlite")) or None,
+    eviction=env_str("GEO_CACHE_EVICTION", "lru"),
+    max_disk_size=env_int("GEO_CACHE_DISK_MAX_SIZE", 100_000),
+)
+
+# reverse geocoding cache, bucketed by geohash cell (cell size follows `zoom`)
+# so a few meters of GPS jitter still hits the same entry
+REVERSE_CACHE = TTLCache(
+    "reverse_geocode",
+    max_size=env_int("REVERSE_CACHE_MAX_SIZE", 8192),
+    ttl=env_float("REVERSE_CACHE_TTL", 7 * 24 * 3600),
+    path=env_str("REVERSE_CACHE_PATH", os.path.join(cache_dir(), "reverse.sqlite")) or None,
+    eviction=env_str("REVERSE_CACHE_EVICTION", "lru"),
+    max_disk_size=env_int("REVERSE_CACHE_DISK_MAX_SIZE", 200_000),
+)
+# optional extra guard: only reuse a cached address if the point that produced it
+# is within this many meters of the new point (0 = anything in the cell is fine)
+REVERSE_CACHE_MAX_ERROR_M = env_float("REVERSE_CACHE_MAX_ERROR_M", 0.0)
+
+# per-tool call/latency/size metrics (server_stats tool), optionally exported in the
+# Prometheus format on GEO_METRICS_PORT (GET /metrics) and/or to GEO_METRICS_FILE
+METRICS = Metrics("geo-server")
+METRICS.track(NOMINATIM_SCHEDULER, NOMINATIM_POOL, GEO_CACHE, REVERSE_CACHE)
+METRICS_PORT = env_int("GEO_METRICS_PORT", 0)
+METRICS_FILE = env_str("GEO_METRICS_FILE", "") or None
+METRICS_DUMP_INTERVAL = env_float("METRICS_DUMP_INTERVAL", 15.0)
+
+# serve MCP over HTTP on this port instead of stdio (0 = stdio), see maps/transport.py
+HTTP_PORT = env_int("GEO_HTTP_PORT", 0)
+HTTP_HOST = env_str("MAPS_HTTP_HOST", "127.0.0.1")
+
+# spans for tool calls and upstream requests, appended to MAPS_TRACE_FILE (off when unset)
+TRACER = Tracer("geo-server")
+
 
 @app.list_tools()
 async def list_tools() -> List[types.Tool]:
@@ -21,7 +112,7 @@ async def list_tools() -> List[types.Tool]:
     Advertise the tools provided by this map server.
     (the agent will call this to know what it can do)
     """
-    return [
+    tools = [
         types.Tool(
             name="geocode_place",
             description=(
@@ -48,6 +139,34 @@ async def list_tools() -> List[types.Tool]:
                 },
             },
         ),
+        types.Tool(
+            name="batch_geocode",
+            description=(
+                "Geocode a list of places/addresses in one call. Duplicates are looked up once; "
+                "results come back in input order with a status per item (ok, not_found, error)."
+            ),
+            inputSchema={
+                "type": "object",
+                "required": ["queries"],
+                "properties": {
+                    "queries": {
+                        "type": "array",
+                        "description": "Places or addresses to geocode.",
+                        "items": {"type": "string"},
+                        "minItems": 1,
+                    },
+                    "country_code": {
+                        "type": "string",
+                        "description": "Optional 2-letter country code applied to every query, e.g. 'lb'.",
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "description": "Max number of results per query.",
+                        "default": 1,
+                    },
+                },
+            },
+        ),
         types.Tool(
             name="reverse_geocode",
             description="Convert (lat, lon) into a human-readable address using Nominatim.",
@@ -94,21 +213,135 @@ async def list_tools() -> List[types.Tool]:
                 },
             },
         ),
+        types.Tool(
+            name="server_stats",
+            description=(
+                "Operational stats of this server: per-tool calls, errors, latency split into "
+                "upstream (Nominatim) and local time, response sizes, cache hit ratios and queue state."
+            ),
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "format": {
+                        "type": "string",
+                        "enum": ["json", "prometheus"],
+                        "description": "'json' (default) summary or the Prometheus text format.",
+                        "default": "json",
+                    },
+                },
+            },
+        ),
     ]
+    # every tool also takes fields / max_bytes / cursor (maps/output.py)
+    return with_output_options(tools)
 
 
-async def _nominatim_get(path: str, params: dict) -> dict | list:
+async def _nominatim_get(
+    path: str, params: dict, priority: str = "interactive"
+) -> dict | list:
     """
     Small helper around the Nominatim HTTP GET.
     Just keeps the request logic in one place.
     """
-    base_url = "https://nominatim.openstreetmap.org"
-    headers = {"User-Agent": USER_AGENT}
 
-    async with httpx.AsyncClient(timeout=15.0, headers=headers) as client:
-        resp = await client.get(f"{base_url}{path}", params=params)
-        resp.raise_for_status()
-        return resp.json()
+    queued_at = time.perf_counter()
+    # fetch() runs in the scheduler's dispatcher task, so hand it the caller's span
+    parent = TRACER.current()
+
+    async def fetch() -> dict | list:
+        # pooled keep-alive clients per instance, best instance first (hedged / retried)
+        with (
+            METRICS.upstream_request("nominatim", path, queued_at) as request,
+            TRACER.span(f"nominatim {path}", kind="upstream", parent=parent) as span,
+        ):
+            headers = None
+            if span is not None:
+                span.set("wait_ms", round((time.perf_counter() - queued_at) * 1000, 3))
+                headers = span.headers()
+            resp = await NOMINATIM_POOL.get(path, params=params, headers=headers)
+            request.status = resp.status_code
+            if span is not None:
+                span.set("status", resp.status_code)
+                span.set("endpoint", f"{resp.request.url.scheme}://{resp.request.url.netloc.decode()}")
+            if resp.status_code == 429:
+                # Nominatim is throttling us → hold the whole queue back for a bit
+                NOMINATIM_SCHEDULER.pause(retry_after_seconds(resp.headers))
+            resp.raise_for_status()
+            # orjson when installed (maps/offload.py)
+            return loads(resp.content)
+
+    # rate limited + identical in-flight requests share one HTTP call
+    with METRICS.upstream_wait():
+        return await NOMINATIM_SCHEDULER.submit(request_key(path, params), fetch, priority=priority)
+
+
+_local_geocoder_instance: "LocalGeocoder | None" = None
+
+
+def _local_geocoder() -> "LocalGeocoder":
+    """
+    Memory-mapped place index, loaded on first use.
+    """
+    global _local_geocoder_instance
+    if _local_geocoder_instance is None:
+        if not os.path.exists(os.path.join(LOCAL_GEOCODER_DIR, "meta.json")):
+            raise ValueError(
+                f"No local geocoder index in '{LOCAL_GEOCODER_DIR}' "
+                f"(build it with: python -m maps.local_geocoder build <places.csv|extract.osm> "
+                f"--out {LOCAL_GEOCODER_DIR})"
+            )
+        from maps.local_geocoder import LocalGeocoder
+
+        _local_geocoder_instance = LocalGeocoder.load(LOCAL_GEOCODER_DIR)
+    return _local_geocoder_instance
+
+
+def _normalize_query(text: str) -> str:
+    # "  American University of BEIRUT " and "american university of beirut" are the same lookup
+    return " ".join(text.casefold().split())
+
+
+def _cache_key(*parts) -> str:
+    return json.dumps(parts, ensure_ascii=False)
+
+
+async def _geocode(
+    query: str, country_code: str | None, limit: int, priority: str = "interactive"
+) -> list[dict]:
+    """
+    Cached forward geocoding shared by geocode_place and batch_geocode.
+    """
+    key = _cache_key(
+        "geocode", GEOCODER_BACKEND, _normalize_query(query), (country_code or "").lower(), limit
+    )
+    results = GEO_CACHE.get(key)
+    if results is None:
+        if GEOCODER_BACKEND == "local":
+            data = _local_geocoder().search(query, country_code=country_code, limit=limit)
+        else:
+            params = {
+                "q": query,
+                "format": "jsonv2",
+                "limit": limit,
+            }
+            if country_code:
+                params["countrycodes"] = country_code
+
+            data = await _nominatim_get("/search", params, priority=priority)
+
+        # trimming down the response to just the fields I care about
+        results = [
+            {
+                "display_name": item.get("display_name"),
+                "lat": item.get("lat"),
+                "lon": item.get("lon"),
+                "type": item.get("type"),
+                "class": item.get("class"),
+            }
+            for item in data
+        ]
+        GEO_CACHE.set(key, results)
+    return results
 
 
 async def _tool_geocode_place(arguments: dict) -> list[types.TextContent]:
@@ -118,41 +351,50 @@ async def _tool_geocode_place(arguments: dict) -> list[types.TextContent]:
     country_code = arguments.get("country_code")
     limit = arguments.get("limit", 3)
 
-    params = {
-        "q": query,
-        "format": "jsonv2",
-        "limit": limit,
-    }
-    if country_code:
-        params["countrycodes"] = country_code
-
-    data = await _nominatim_get("/search", params)
-
-    # trimming down the response to just the fields I care about
-    results = [
-        {
-            "display_name": item.get("display_name"),
-            "lat": item.get("lat"),
-            "lon": item.get("lon"),
-            "type": item.get("type"),
-            "class": item.get("class"),
-        }
-        for item in data
-    ]
+    results = await _geocode(query, country_code, limit)
 
-    return [
-        types.TextContent(
-            type="text",
-            text=json.dumps(
-                {
-                    "query": query,
-                    "results": results,
-                },
-                indent=2,
-                ensure_ascii=False,
-            ),
-        )
-    ]
+    return await render({"query": query, "results": results}, arguments, page=("results",))
+
+
+async def _tool_batch_geocode(arguments: dict) -> list[types.TextContent]:
+    # a whole address list in one call (e.g. a delivery manifest)
+    queries = arguments["queries"]
+    country_code = arguments.get("country_code")
+    limit = arguments.get("limit", 1)
+
+    # "Hamra St, Beirut" and " hamra st,  beirut" are looked up once
+    unique: dict[str, str] = {}
+    for query in queries:
+        if isinstance(query, str) and query.strip():
+            unique.setdefault(_normalize_query(query), query)
+
+    semaphore = asyncio.Semaphore(max(BATCH_GEOCODE_CONCURRENCY, 1))
+
+    async def lookup(query: str) -> dict:
+        async with semaphore:
+            try:
+                # batch lane: interactive geocode_place calls still go first
+                results = await _geocode(query, country_code, limit, priority="batch")
+            except Exception as e:
+                # one bad address must not sink the other 199
+                return {"status": "error", "error": f"{type(e).__name__}: {e}"}
+        if not results:
+            return {"status": "not_found", "results": []}
+        return {"status": "ok", "results": results}
+
+    answers = dict(zip(unique, await asyncio.gather(*(lookup(q) for q in unique.values()))))
+
+    items = []
+    for query in queries:
+        if not isinstance(query, str) or not query.strip():
+            items.append({"query": query, "status": "error", "error": "empty query"})
+        else:
+            items.append({"query": query, **answers[_normalize_query(query)]})
+
+    summary = {status: sum(item["status"] == status for item in items) for status in ("ok", "not_found", "error")}
+    return await render(
+        {"count": len(items), "unique": len(unique), **summary, "items": items}, arguments, page=("items",)
+    )
 
 
 async def _tool_reverse_geocode(arguments: dict) -> list[types.TextContent]:
@@ -161,28 +403,34 @@ async def _tool_reverse_geocode(arguments: dict) -> list[types.TextContent]:
     lon = arguments["lon"]
     zoom = arguments.get("zoom", 18)
 
-    params = {
-        "lat": lat,
-        "lon": lon,
-        "format": "jsonv2",
-        "zoom": zoom,
-    }
+    cell = geohash_encode(lat, lon, zoom_to_geohash_precision(zoom))
+    key = _cache_key("reverse", zoom, cell)
+    cached = REVERSE_CACHE.get(key)
+    if cached is not None and (
+        REVERSE_CACHE_MAX_ERROR_M <= 0
+        or haversine_m(lat, lon, *cached["point"]) <= REVERSE_CACHE_MAX_ERROR_M
+    ):
+        result = cached["result"]
+    else:
+        params = {
+            "lat": lat,
+            "lon": lon,
+            "format": "jsonv2",
+            "zoom": zoom,
+        }
 
-    data = await _nominatim_get("/reverse", params)
+        data = await _nominatim_get("/reverse", params)
 
-    result = {
-        "lat": data.get("lat"),
-        "lon": data.get("lon"),
-        "display_name": data.get("display_name"),
-        "address": data.get("address"),
-    }
+        result = {
+            "lat": data.get("lat"),
+            "lon": data.get("lon"),
+            "display_name": data.get("display_name"),
+            "address": data.get("address"),
+        }
+        # remember which point produced this answer (for the max error check)
+        REVERSE_CACHE.set(key, {"point": [lat, lon], "result": result})
 
-    return [
-        types.TextContent(
-            type="text",
-            text=json.dumps(result, indent=2, ensure_ascii=False),
-        )
-    ]
+    return await render(result, arguments)
 
 
 async def _tool_search_poi(arguments: dict) -> list[types.TextContent]:
@@ -191,81 +439,105 @@ async def _tool_search_poi(arguments: dict) -> list[types.TextContent]:
     city = arguments["city"]
     limit = arguments.get("limit", 5)
 
-    params = {
-        "q": f"{query}, {city}",
-        "format": "jsonv2",
-        "limit": limit,
-    }
-
-    data = await _nominatim_get("/search", params)
-
-    results = [
-        {
-            "name": item.get("display_name"),
-            "lat": item.get("lat"),
-            "lon": item.get("lon"),
-            "type": item.get("type"),
-            "class": item.get("class"),
-        }
-        for item in data
-    ]
+    key = _cache_key(
+        "poi", GEOCODER_BACKEND, _normalize_query(query), _normalize_query(city), limit
+    )
+    results = GEO_CACHE.get(key)
+    if results is None:
+        if GEOCODER_BACKEND == "local":
+            data = _local_geocoder().search_poi(query, city, limit=limit)
+        else:
+            params = {
+                "q": f"{query}, {city}",
+                "format": "jsonv2",
+                "limit": limit,
+            }
+
+            data = await _nominatim_get("/search", params)
+
+        results = [
+            {
+                "name": item.get("display_name"),
+                "lat": item.get("lat"),
+                "lon": item.get("lon"),
+                "type": item.get("type"),
+                "class": item.get("class"),
+            }
+            for item in data
+        ]
+        GEO_CACHE.set(key, results)
+
+    return await render({"query": query, "city": city, "results": results}, arguments, page=("results",))
 
+
+async def _tool_server_stats(arguments: dict) -> list[types.TextContent]:
+    fmt = arguments.get("format", "json")
+    if fmt == "prometheus":
+        return [types.TextContent(type="text", text=METRICS.prometheus())]
+    if fmt != "json":
+        raise ValueError(f"Unknown format '{fmt}', expected json or prometheus")
     return [
         types.TextContent(
             type="text",
-            text=json.dumps(
-                {
-                    "query": query,
-                    "city": city,
-                    "results": results,
-                },
-                indent=2,
-                ensure_ascii=False,
-            ),
+            text=json.dumps(METRICS.snapshot(), indent=2),
         )
     ]
 
 
+# tool name → handler (call_tool dispatches through this)
+TOOL_HANDLERS = {
+    "geocode_place": _tool_geocode_place,
+    "batch_geocode": _tool_batch_geocode,
+    "reverse_geocode": _tool_reverse_geocode,
+    "search_poi": _tool_search_poi,
+    "server_stats": _tool_server_stats,
+}
+
+
 @app.call_tool()
 async def call_tool(name: str, arguments: dict) -> list[types.TextContent]:
     """
     Main entry point for MCP tool calls.
     (the server will route calls here based on the tool name)
     """
-    try:
-        if name == "geocode_place":
-            return await _tool_geocode_place(arguments)
-        if name == "reverse_geocode":
-            return await _tool_reverse_geocode(arguments)
-        if name == "search_poi":
-            return await _tool_search_poi(arguments)
-
-        # fallback in case I typo the tool name somewhere
-        return [
-            types.TextContent(
-                type="text",
-                text=json.dumps({"error": f"Unknown tool '{name}'"}, indent=2),
-            )
-        ]
-    except Exception as e:
-        # basic error handling so at least the agent sees something readable
-        return [
-            types.TextContent(
-                type="text",
-                text=json.dumps({"error": str(e)}, indent=2),
-            )
-        ]
+    handler = TOOL_HANDLERS.get(name)
+    # unknown names share one metrics entry so a typo can't add new series
+    with METRICS.tool_call(name if handler else "unknown") as call, TRACER.tool_span(app, name) as span:
+        try:
+            if handler is None:
+                # fallback in case I typo the tool name somewhere
+                raise ValueError(f"Unknown tool '{name}'")
+            if arguments.get("cursor"):
+                # a later page of a big result: served from the stored result, the tool doesn't run
+                result = await next_page(arguments)
+            else:
+                result = await handler(arguments)
+        except Exception as e:
+            # basic error handling so at least the agent sees something readable
+            call.failed(e)
+            if span is not None:
+                span.fail(e)
+            result = [
+                types.TextContent(
+                    type="text",
+                    text=json.dumps({"error": str(e)}, indent=2),
+                )
+            ]
+        call.responded(result)
+    return result
 
 
 async def main() -> None:
     """
     Run this MCP server over stdio.
     The Agents SDK will spawn this as a subprocess with `python -m maps.geo_server`.
+    With GEO_HTTP_PORT set it serves MCP over HTTP instead, for many agents at once.
     """
-    async with stdio_server() as (read_stream, write_stream):
-        await app.run(
-            read_stream,
-            write_stream,
+    exporter = MetricsExporter(METRICS, port=METRICS_PORT, path=METRICS_FILE, interval=METRICS_DUMP_INTERVAL)
+    try:
+        await exporter.start()
+        await serve(
+            app,
             InitializationOptions(
                 server_name="geo-server",
                 server_version="0.1.0",
@@ -274,7 +546,16 @@ async def main() -> None:
                     experimental_capabilities={},
                 ),
             ),
+            http_port=HTTP_PORT,
+            http_host=HTTP_HOST,
         )
+    finally:
+        # close the pooled upstream connections and the cache file on shutdown
+        # (and write the final metrics file)
+        await exporter.aclose()
+        await aclose_clients()
+        GEO_CACHE.close()
+        REVERSE_CACHE.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,97 @@
+import math
+
+# Small geometry helpers shared by the map servers (plain Python, no deps).
+
+EARTH_RADIUS_M = 6371008.8
+
+_GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """
+    Great-circle distance between two points, in meters.
+    """
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+def geohash_encode(lat: float, lon: float, precision: int) -> str:
+    """
+    Standard base32 geohash of (lat, lon) with `precision` characters.
+    """
+    lat_lo, lat_hi = -90.0, 90.0
+    lon_lo, lon_hi = -180.0, 180.0
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True  # geohash interleaves lon, lat, lon, ...
+    while len(chars) < precision:
+        if even:
+            mid = (lon_lo + lon_hi) / 2
+            if lon >= mid:
+                bits = (bits << 1) | 1
+                lon_lo = mid
+            else:
+                bits <<= 1
+                lon_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                bits = (bits << 1) | 1
+                lat_lo = mid
+            else:
+                bits <<= 1
+                lat_hi = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(chars)
+
+
+# Nominatim reverse zoom → geohash length. The cell should be about the size of
+# the thing Nominatim returns at that zoom (building, street, suburb, city, ...).
+#   precision 8 ≈ 38 m x 19 m, 7 ≈ 153 m, 6 ≈ 1.2 km, 5 ≈ 4.9 km, 4 ≈ 39 km,
+#   3 ≈ 156 km, 2 ≈ 1250 km
+_ZOOM_TO_PRECISION = {
+    18: 8,
+    17: 7,
+    16: 7,
+    15: 6,
+    14: 6,
+    13: 5,
+    12: 5,
+    11: 4,
+    10: 4,
+    9: 4,
+    8: 4,
+    7: 3,
+    6: 3,
+    5: 3,
+    4: 2,
+    3: 2,
+}
+
+
+def zoom_to_geohash_precision(zoom: int) -> int:
+    zoom = max(3, min(18, int(zoom)))
+    return _ZOOM_TO_PRECISION[zoom]
+
+
+def parse_point(text: str) -> tuple[float, float] | None:
+    """
+    "lat,lon" text → (lat, lon), or None if it isn't a valid point.
+    """
+    parts = text.split(",")
+    if len(parts) != 2:
+        return None
+    try:
+        lat, lon = float(parts[0]), float(parts[1])
+    except ValueError:
+        return None
+    return (lat, lon) if -90 <= lat <= 90 and -180 <= lon <= 180 else None
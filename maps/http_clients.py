@@ -0,0 +1,62 @@
+import importlib.util
+
+import httpx
+
+from maps.config import env_flag, env_float, env_int
+
+# Shared, long-lived HTTP clients for the map servers.
+# Each upstream (Nominatim, OSRM, ...) gets exactly one AsyncClient for the whole
+# life of the server process, so connections are kept alive and reused instead of
+# paying a new TCP+TLS handshake on every tool call.
+
+
+# pool knobs (same for every upstream, override through the environment)
+MAX_CONNECTIONS = env_int("MAPS_HTTP_MAX_CONNECTIONS", 20)
+MAX_KEEPALIVE_CONNECTIONS = env_int("MAPS_HTTP_MAX_KEEPALIVE", 10)
+KEEPALIVE_EXPIRY = env_float("MAPS_HTTP_KEEPALIVE_EXPIRY", 30.0)
+CONNECT_TIMEOUT = env_float("MAPS_HTTP_CONNECT_TIMEOUT", 5.0)
+HTTP2 = env_flag("MAPS_HTTP2", True)
+
+_clients: dict[str, httpx.AsyncClient] = {}
+
+
+def _http2_available() -> bool:
+    # HTTP/2 needs the optional `h2` package (pip install "httpx[http2]")
+    return HTTP2 and importlib.util.find_spec("h2") is not None
+
+
+def get_client(
+    name: str,
+    base_url: str,
+    timeout: float,
+    headers: dict | None = None,
+) -> httpx.AsyncClient:
+    """
+    Return the shared client for one upstream, creating it on first use.
+    `name` is just the registry key (e.g. "nominatim", "osrm").
+    """
+    client = _clients.get(name)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=httpx.Timeout(timeout, connect=min(CONNECT_TIMEOUT, timeout)),
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=KEEPALIVE_EXPIRY,
+            ),
+            http2=_http2_available(),
+        )
+        _clients[name] = client
+    return client
+
+
+async def aclose_clients() -> None:
+    """
+    Close every shared client (called once when a server shuts down).
+    """
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        await client.aclose()
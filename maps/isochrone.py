@@ -0,0 +1,268 @@
+import math
+
+import numpy as np
+
+from maps.road_index import M_PER_DEG
+
+# Grid sampling + contouring for the isochrone tool.
+#
+# Points live on a square lattice around the origin at the finest resolution,
+# (resolution - 1) * 2**levels + 1 points per side, but only some get a travel time:
+#   1. the coarse grid (every 2**levels-th point)
+#   2. per refinement level: midpoints of the cells whose corner times straddle one of
+#      the band thresholds (the rest of the area is clearly inside or outside)
+# Lattice points that were never evaluated are filled by interpolating the corners of
+# the smallest evaluated cell around them; those cells are uniform, so no contour can
+# appear there. Contours come from marching squares on the filled lattice.
+
+# travel times beyond the last band (and unreachable points) are clamped to this factor
+# of the largest threshold so interpolation stays finite
+_OUTSIDE_FACTOR = 4.0
+
+# unordered edge pairs per marching-squares case (corner bits: a=1 bottom-left,
+# b=2 bottom-right, c=4 top-right, d=8 top-left); saddles 5 and 10 are resolved separately
+_CASE_EDGES = {
+    1: [("L", "B")], 14: [("L", "B")],
+    2: [("B", "R")], 13: [("B", "R")],
+    3: [("L", "R")], 12: [("L", "R")],
+    4: [("R", "T")], 11: [("R", "T")],
+    6: [("B", "T")], 9: [("B", "T")],
+    7: [("L", "T")], 8: [("L", "T")],
+}
+# the corner a segment between two edges cuts off (opposite edges: use corner a)
+_CUT_CORNER = {
+    frozenset("LB"): "a", frozenset("BR"): "b", frozenset("RT"): "c", frozenset("TL"): "d",
+    frozenset("LR"): "a", frozenset("BT"): "a",
+}
+_CORNER_OFFSET = {"a": (0, 0), "b": (0, 1), "c": (1, 1), "d": (1, 0)}
+_EDGE_CORNERS = {"B": ("a", "b"), "R": ("b", "c"), "T": ("d", "c"), "L": ("a", "d")}
+
+
+class IsochroneGrid:
+    """
+    Lattice of sample points around (lat, lon) covering +-radius_m in both directions.
+    """
+
+    def __init__(self, lat: float, lon: float, radius_m: float, resolution: int, levels: int):
+        self.lat, self.lon = lat, lon
+        self.radius_m = radius_m
+        self.levels = levels
+        self.stride = 2**levels
+        self.size = (resolution - 1) * self.stride + 1
+        self.values = np.full((self.size, self.size), np.nan)
+        self.known = np.zeros((self.size, self.size), dtype=bool)
+
+    def to_latlon(self, rows, cols) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Lattice (row, col) → (lat, lon); rows go north, cols go east. Accepts fractions.
+        """
+        scale = 2 * self.radius_m / (self.size - 1)
+        north = np.asarray(rows, dtype=float) * scale - self.radius_m
+        east = np.asarray(cols, dtype=float) * scale - self.radius_m
+        lat = self.lat + north / M_PER_DEG
+        lon = self.lon + east / (M_PER_DEG * math.cos(math.radians(self.lat)))
+        return lat, lon
+
+    def coarse_points(self) -> tuple[np.ndarray, np.ndarray]:
+        idx = np.arange(0, self.size, self.stride)
+        rows, cols = np.meshgrid(idx, idx, indexing="ij")
+        return rows.ravel(), cols.ravel()
+
+    def set_values(self, rows: np.ndarray, cols: np.ndarray, seconds: np.ndarray) -> None:
+        self.values[rows, cols] = seconds
+        self.known[rows, cols] = True
+
+    def _cells(self, stride: int) -> tuple[np.ndarray, np.ndarray]:
+        idx = np.arange(0, self.size - 1, stride)
+        rows, cols = np.meshgrid(idx, idx, indexing="ij")
+        return rows.ravel(), cols.ravel()
+
+    def refine_points(self, stride: int, thresholds: list[float]) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Unevaluated midpoints (edge midpoints + centers) of the stride-sized cells whose
+        four known corners lie on different sides of some threshold.
+        """
+        rows, cols = self._cells(stride)
+        corners = np.stack(
+            [
+                self.values[rows, cols],
+                self.values[rows, cols + stride],
+                self.values[rows + stride, cols + stride],
+                self.values[rows + stride, cols],
+            ]
+        )
+        known = np.stack(
+            [
+                self.known[rows, cols],
+                self.known[rows, cols + stride],
+                self.known[rows + stride, cols + stride],
+                self.known[rows + stride, cols],
+            ]
+        ).all(axis=0)
+        inside = np.stack([np.nan_to_num(corners, nan=np.inf) <= t for t in thresholds])  # (bands, 4, cells)
+        straddles = (inside.any(axis=1) & ~inside.all(axis=1)).any(axis=0) & known
+        rows, cols = rows[straddles], cols[straddles]
+
+        half = stride // 2
+        offsets = [(0, half), (half, 0), (half, half), (half, stride), (stride, half)]
+        new_rows = np.concatenate([rows + dr for dr, _ in offsets])
+        new_cols = np.concatenate([cols + dc for _, dc in offsets])
+        if len(new_rows) == 0:
+            return new_rows, new_cols
+        flat = np.unique(new_rows * self.size + new_cols)
+        new_rows, new_cols = np.divmod(flat, self.size)
+        fresh = ~self.known[new_rows, new_cols]
+        return new_rows[fresh], new_cols[fresh]
+
+    def filled(self, thresholds: list[float]) -> np.ndarray:
+        """
+        Every lattice point with a value: evaluated points as they are (unreachable/too far
+        clamped), the rest interpolated from the corners of the enclosing evaluated cell.
+        """
+        cap = max(thresholds) * _OUTSIDE_FACTOR
+        grid = np.where(self.known, np.minimum(np.nan_to_num(self.values, nan=cap), cap), np.nan)
+        stride = self.stride
+        while stride >= 2:
+            rows, cols = self._cells(stride)
+            half = stride // 2
+            a = grid[rows, cols]
+            b = grid[rows, cols + stride]
+            c = grid[rows + stride, cols + stride]
+            d = grid[rows + stride, cols]
+            for (dr, dc), value in (
+                ((0, half), (a + b) / 2),
+                ((half, 0), (a + d) / 2),
+                ((half, stride), (b + c) / 2),
+                ((stride, half), (d + c) / 2),
+                ((half, half), (a + b + c + d) / 4),
+            ):
+                target = (rows + dr, cols + dc)
+                grid[target] = np.where(np.isnan(grid[target]), value, grid[target])
+            stride = half
+        return grid
+
+    def contours(self, grid: np.ndarray, threshold: float) -> list[list[list[tuple[float, float]]]]:
+        """
+        Polygons (outer ring + holes, each a closed list of (lat, lon)) of {value <= threshold}.
+        """
+        outside = max(float(np.nanmax(grid)), threshold) + 1.0
+        padded = np.pad(grid, 1, constant_values=outside)
+        rings = _marching_squares(padded, threshold)
+
+        polygons: list[list[list[tuple[float, float]]]] = []
+        holes = []
+        for ring in rings:
+            # lattice coordinates of the padded grid → unpadded
+            ring = [(r - 1, c - 1) for r, c in ring]
+            (holes if _signed_area(ring) < 0 else polygons).append([ring])
+        for hole in holes:
+            for polygon in polygons:
+                if _point_in_ring(hole[0][0], polygon[0]):
+                    polygon.append(hole[0])
+                    break
+
+        out = []
+        for polygon in polygons:
+            converted = []
+            for ring in polygon:
+                lat, lon = self.to_latlon([p[0] for p in ring], [p[1] for p in ring])
+                converted.append(list(zip(lat.tolist(), lon.tolist())))
+            out.append(converted)
+        return out
+
+    def area_km2(self, polygons: list) -> float:
+        """
+        Area of contour polygons (outer rings minus holes) in km².
+        """
+        kx = M_PER_DEG * math.cos(math.radians(self.lat))
+        total = 0.0
+        for polygon in polygons:
+            for ring in polygon:
+                xy = [((lon - self.lon) * kx, (lat - self.lat) * M_PER_DEG) for lat, lon in ring]
+                # rings are CCW (positive) and holes CW (negative), so a plain sum works
+                total += _signed_area(xy, xy_order=True)
+        return total / 1e6
+
+
+def _signed_area(ring, xy_order: bool = False) -> float:
+    """
+    Shoelace area; points are (row=y, col=x) unless xy_order. CCW → positive.
+    """
+    area = 0.0
+    for (p0, p1), (q0, q1) in zip(ring, ring[1:] + ring[:1]):
+        x0, y0, x1, y1 = (p0, p1, q0, q1) if xy_order else (p1, p0, q1, q0)
+        area += x0 * y1 - x1 * y0
+    return area / 2
+
+
+def _point_in_ring(point, ring) -> bool:
+    y, x = point
+    inside = False
+    for (y0, x0), (y1, x1) in zip(ring, ring[1:] + ring[:1]):
+        if (y0 > y) != (y1 > y) and x < x0 + (y - y0) * (x1 - x0) / (y1 - y0):
+            inside = not inside
+    return inside
+
+
+def _marching_squares(grid: np.ndarray, threshold: float) -> list[list[tuple[float, float]]]:
+    """
+    Closed rings (lattice coordinates) around {grid <= threshold}, CCW around inside
+    areas (CW around holes). The grid border must be outside.
+    """
+    inside = grid <= threshold
+    case = (
+        inside[:-1, :-1] * 1
+        + inside[:-1, 1:] * 2
+        + inside[1:, 1:] * 4
+        + inside[1:, :-1] * 8
+    )
+    boundary_rows, boundary_cols = np.nonzero((case != 0) & (case != 15))
+
+    def corner(i: int, j: int, name: str) -> tuple[int, int]:
+        dr, dc = _CORNER_OFFSET[name]
+        return i + dr, j + dc
+
+    def edge_point(i: int, j: int, edge: str, t: float | None = None) -> tuple[float, float]:
+        # t=None → where the threshold crosses the edge (linear interpolation)
+        p, q = (corner(i, j, name) for name in _EDGE_CORNERS[edge])
+        if t is None:
+            v0, v1 = grid[p], grid[q]
+            t = 0.5 if v1 == v0 else (threshold - v0) / (v1 - v0)
+        return p[0] + t * (q[0] - p[0]), p[1] + t * (q[1] - p[1])
+
+    def edge_id(i: int, j: int, edge: str) -> tuple:
+        return {"B": ("h", i, j), "T": ("h", i + 1, j), "L": ("v", i, j), "R": ("v", i, j + 1)}[edge]
+
+    # start edge → (end edge, start point), oriented so the inside is on the left
+    links: dict[tuple, tuple] = {}
+    for i, j in zip(boundary_rows.tolist(), boundary_cols.tolist()):
+        k = int(case[i, j])
+        if k in (5, 10):
+            center_inside = grid[i : i + 2, j : j + 2].mean() <= threshold
+            if (k == 5) == center_inside:
+                pairs = [("B", "R"), ("T", "L")]
+            else:
+                pairs = [("L", "B"), ("R", "T")]
+        else:
+            pairs = _CASE_EDGES[k]
+        for e0, e1 in pairs:
+            # orientation from the edge midpoints: the interpolated points coincide
+            # (and the cross product is 0) when a corner sits exactly on the threshold
+            m0, m1 = edge_point(i, j, e0, 0.5), edge_point(i, j, e1, 0.5)
+            cut = corner(i, j, _CUT_CORNER[frozenset(e0 + e1)])
+            # cross > 0 → the cut-off corner is left of m0→m1
+            cross = (m1[1] - m0[1]) * (cut[0] - m0[0]) - (m1[0] - m0[0]) * (cut[1] - m0[1])
+            if (cross > 0) != bool(inside[cut]):
+                e0, e1 = e1, e0
+            links[edge_id(i, j, e0)] = (edge_id(i, j, e1), edge_point(i, j, e0))
+
+    rings = []
+    while links:
+        start, (nxt, point) = links.popitem()
+        ring = [point]
+        while nxt != start and nxt in links:
+            nxt, point = links.pop(nxt)
+            ring.append(point)
+        if len(ring) >= 3:
+            rings.append(ring + [ring[0]])
+    return rings
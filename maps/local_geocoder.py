@@ -0,0 +1,431 @@
+import argparse
+import bisect
+import csv
+import json
+import math
+import os
+import re
+import time
+import unicodedata
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+from maps.geo_utils import haversine_m
+
+# Offline geocoding backend for geocode_place / search_poi.
+#
+# Build step (once per extract):
+#     python -m maps.local_geocoder build places.csv --out geocoder/
+#     python -m maps.local_geocoder build beirut.osm --out geocoder/ --country lb
+# writes a compact index of .npy files + a names blob:
+#   - records sorted by (country, importance desc) → a country filter is just a doc id
+#     range, found with a binary search instead of a scan
+#   - a sorted token vocabulary with postings lists (normalized-token inverted index),
+#     binary-searchable for exact and prefix matches
+# At runtime LocalGeocoder memory-maps everything, so startup costs almost nothing.
+#
+# CSV columns: name, lat, lon and optionally country_code, importance, class, type,
+# display_name, city.
+
+_TOKEN_RE = re.compile(r"[^\W_]+", re.UNICODE)
+
+# OSM keys that say what a named feature is, in order of preference
+_CLASS_KEYS = ("place", "amenity", "shop", "tourism", "leisure", "aeroway", "office", "historic", "building", "highway")
+
+# rough importance for place types (Nominatim-like, 0..1)
+_PLACE_IMPORTANCE = {
+    "country": 0.9,
+    "state": 0.8,
+    "city": 0.75,
+    "town": 0.6,
+    "suburb": 0.5,
+    "village": 0.45,
+    "neighbourhood": 0.4,
+    "quarter": 0.4,
+    "hamlet": 0.3,
+}
+
+# ranking weights: how much of the query matched, how much of the name matched, importance
+_W_RECALL = 0.6
+_W_PRECISION = 0.25
+_W_IMPORTANCE = 0.15
+# prefix matches ("beir" → "beirut") count a bit less than exact tokens
+_PREFIX_CREDIT = 0.8
+# cap on vocabulary entries a single prefix may expand to
+_MAX_PREFIX_EXPANSION = 64
+
+
+def normalize_tokens(text: str) -> list[str]:
+    """
+    Lowercase, strip accents, split on anything that isn't a letter or digit.
+    """
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return _TOKEN_RE.findall(text)
+
+
+# ---------------------------------------------------------------------------
+# reading sources
+# ---------------------------------------------------------------------------
+
+
+def _read_csv(path: str, default_country: str) -> list[dict]:
+    places = []
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            name = (row.get("name") or "").strip()
+            if not name:
+                continue
+            places.append(
+                {
+                    "name": name,
+                    "display_name": row.get("display_name") or name,
+                    "lat": float(row["lat"]),
+                    "lon": float(row["lon"]),
+                    "country": (row.get("country_code") or default_country).lower(),
+                    "importance": float(row.get("importance") or 0.2),
+                    "class": row.get("class") or "place",
+                    "type": row.get("type") or "yes",
+                    "city": row.get("city") or "",
+                }
+            )
+    return places
+
+
+def _read_osm(path: str, default_country: str) -> list[dict]:
+    """
+    Named nodes and ways from an OSM XML extract (ways are placed at their centroid).
+    """
+    coords: dict[int, tuple[float, float]] = {}
+    places = []
+
+    def add(tags: dict, lat: float, lon: float) -> None:
+        name = tags.get("name")
+        if not name:
+            return
+        cls = next((k for k in _CLASS_KEYS if k in tags), None)
+        if cls is None:
+            return
+        kind = tags[cls]
+        importance = _PLACE_IMPORTANCE.get(kind, 0.2) if cls == "place" else 0.2
+        if "wikipedia" in tags or "wikidata" in tags:
+            importance += 0.1
+        city = tags.get("addr:city", "")
+        places.append(
+            {
+                "name": name,
+                "display_name": f"{name}, {city}" if city else name,
+                "lat": lat,
+                "lon": lon,
+                "country": (tags.get("addr:country") or default_country).lower(),
+                "importance": min(importance, 1.0),
+                "class": cls,
+                "type": kind,
+                "city": city,
+            }
+        )
+
+    for _event, elem in ET.iterparse(path, events=("end",)):
+        if elem.tag == "node":
+            lat, lon = float(elem.get("lat")), float(elem.get("lon"))
+            coords[int(elem.get("id"))] = (lat, lon)
+            tags = {t.get("k"): t.get("v") for t in elem.iter("tag")}
+            if tags:
+                add(tags, lat, lon)
+            elem.clear()
+        elif elem.tag == "way":
+            tags = {t.get("k"): t.get("v") for t in elem.iter("tag")}
+            if tags.get("name"):
+                pts = [coords[int(nd.get("ref"))] for nd in elem.iter("nd") if int(nd.get("ref")) in coords]
+                if pts:
+                    add(tags, sum(p[0] for p in pts) / len(pts), sum(p[1] for p in pts) / len(pts))
+            elem.clear()
+        elif elem.tag == "relation":
+            elem.clear()
+    return places
+
+
+# ---------------------------------------------------------------------------
+# building
+# ---------------------------------------------------------------------------
+
+
+def build_index(places: list[dict], out_dir: str, verbose: bool = True) -> dict:
+    t0 = time.perf_counter()
+    if not places:
+        raise ValueError("No named places to index")
+
+    # country first, then most important first → country filter = contiguous id range
+    places = sorted(places, key=lambda p: (p["country"], -p["importance"], p["name"]))
+    n = len(places)
+
+    countries: dict[str, list[int]] = {}
+    for i, p in enumerate(places):
+        span = countries.setdefault(p["country"], [i, i + 1])
+        span[1] = i + 1
+
+    classes = sorted({p["class"] for p in places})
+    types = sorted({p["type"] for p in places})
+    class_id = {c: i for i, c in enumerate(classes)}
+    type_id = {t: i for i, t in enumerate(types)}
+
+    postings: dict[str, list[int]] = {}
+    ntok = np.zeros(n, dtype=np.uint8)
+    for doc, p in enumerate(places):
+        name_tokens = normalize_tokens(p["name"])
+        ntok[doc] = min(len(set(name_tokens)), 255)
+        # the name is what gets matched; class/type/city make "cafe" or "hamra" findable too
+        extra = normalize_tokens(f"{p['type']} {p['city']}")
+        for token in set(name_tokens) | set(extra):
+            postings.setdefault(token, []).append(doc)
+
+    vocab = sorted(postings)
+    tok_bytes = [t.encode("utf-8") for t in vocab]
+    tok_off = np.zeros(len(vocab) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in tok_bytes], out=tok_off[1:])
+    post_off = np.zeros(len(vocab) + 1, dtype=np.int64)
+    np.cumsum([len(postings[t]) for t in vocab], out=post_off[1:])
+    # docs were visited in order, so every postings list is already sorted
+    flat_postings = np.fromiter((d for t in vocab for d in postings[t]), dtype=np.int32, count=int(post_off[-1]))
+
+    names = [p["display_name"].encode("utf-8") for p in places]
+    name_off = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in names], out=name_off[1:])
+
+    os.makedirs(out_dir, exist_ok=True)
+    arrays = {
+        "rec_lat": np.array([p["lat"] for p in places], dtype=np.float64),
+        "rec_lon": np.array([p["lon"] for p in places], dtype=np.float64),
+        "rec_importance": np.array([p["importance"] for p in places], dtype=np.float32),
+        "rec_class": np.array([class_id[p["class"]] for p in places], dtype=np.uint16),
+        "rec_type": np.array([type_id[p["type"]] for p in places], dtype=np.uint16),
+        "rec_ntok": ntok,
+        "name_off": name_off,
+        "tok_off": tok_off,
+        "post_off": post_off,
+        "postings": flat_postings,
+    }
+    for name, arr in arrays.items():
+        np.save(os.path.join(out_dir, f"{name}.npy"), arr)
+    with open(os.path.join(out_dir, "names.bin"), "wb") as f:
+        f.write(b"".join(names))
+    with open(os.path.join(out_dir, "tokens.bin"), "wb") as f:
+        f.write(b"".join(tok_bytes))
+
+    meta = {
+        "records": n,
+        "tokens": len(vocab),
+        "countries": countries,
+        "classes": classes,
+        "types": types,
+        "build_seconds": round(time.perf_counter() - t0, 2),
+    }
+    with open(os.path.join(out_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    if verbose:
+        print(f"indexed {n} places, {len(vocab)} tokens in {meta['build_seconds']}s → {out_dir}")
+    return meta
+
+
+# ---------------------------------------------------------------------------
+# querying
+# ---------------------------------------------------------------------------
+
+
+class _Vocab:
+    """
+    Sorted token list living in a memory-mapped blob; supports bisect.
+    """
+
+    def __init__(self, blob: np.memmap, offsets: np.ndarray):
+        self._blob = blob
+        self._off = memoryview(offsets)
+        self._n = len(offsets) - 1
+
+    def __len__(self) -> int:
+        return self._n
+
+    def __getitem__(self, i: int) -> str:
+        return bytes(self._blob[self._off[i] : self._off[i + 1]]).decode("utf-8")
+
+
+class LocalGeocoder:
+    """
+    Memory-mapped place index (see `build_index`). Results mimic Nominatim jsonv2 items.
+    """
+
+    def __init__(self, index_dir: str):
+        with open(os.path.join(index_dir, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+
+        def load(name: str) -> np.ndarray:
+            return np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode="r")
+
+        self.lat = load("rec_lat")
+        self.lon = load("rec_lon")
+        self.importance = load("rec_importance")
+        self.rec_class = load("rec_class")
+        self.rec_type = load("rec_type")
+        self.ntok = load("rec_ntok")
+        self.name_off = load("name_off")
+        self.post_off = load("post_off")
+        self.postings = load("postings")
+        self.names = np.memmap(os.path.join(index_dir, "names.bin"), dtype=np.uint8, mode="r")
+        self.vocab = _Vocab(
+            np.memmap(os.path.join(index_dir, "tokens.bin"), dtype=np.uint8, mode="r"),
+            load("tok_off"),
+        )
+        self.countries = self.meta["countries"]
+        self.classes = self.meta["classes"]
+        self.types = self.meta["types"]
+
+    @classmethod
+    def load(cls, index_dir: str) -> "LocalGeocoder":
+        return cls(index_dir)
+
+    def _postings(self, i: int) -> np.ndarray:
+        return self.postings[self.post_off[i] : self.post_off[i + 1]]
+
+    def _token_docs(self, token: str, allow_prefix: bool) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Docs containing `token` (credit 1.0), plus docs with a token starting with it
+        (credit _PREFIX_CREDIT) when allowed.
+        """
+        i = bisect.bisect_left(self.vocab, token)
+        exact = i < len(self.vocab) and self.vocab[i] == token
+        parts, credits = [], []
+        if exact:
+            docs = self._postings(i)
+            parts.append(docs)
+            credits.append(np.ones(len(docs)))
+            i += 1
+        if allow_prefix:
+            expanded = 0
+            while i < len(self.vocab) and expanded < _MAX_PREFIX_EXPANSION and self.vocab[i].startswith(token):
+                docs = self._postings(i)
+                parts.append(docs)
+                credits.append(np.full(len(docs), _PREFIX_CREDIT))
+                i += 1
+                expanded += 1
+        if not parts:
+            return np.empty(0, dtype=np.int32), np.empty(0)
+        docs = np.concatenate(parts)
+        credit = np.concatenate(credits)
+        # a doc may match several expansions → keep its best credit
+        order = np.lexsort((-credit, docs))
+        docs, credit = docs[order], credit[order]
+        first = np.ones(len(docs), dtype=bool)
+        first[1:] = docs[1:] != docs[:-1]
+        return docs[first], credit[first]
+
+    def _rank(self, query: str, doc_range: tuple[int, int] | None) -> tuple[np.ndarray, np.ndarray]:
+        tokens = list(dict.fromkeys(normalize_tokens(query)))
+        if not tokens:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        all_docs, all_credit = [], []
+        for k, token in enumerate(tokens):
+            # the last token may still be being typed, and short tokens explode → prefix only there
+            docs, credit = self._token_docs(token, allow_prefix=k == len(tokens) - 1 and len(token) >= 3)
+            if doc_range is not None:
+                lo, hi = np.searchsorted(docs, doc_range)
+                docs, credit = docs[lo:hi], credit[lo:hi]
+            all_docs.append(docs)
+            all_credit.append(credit)
+
+        docs = np.concatenate(all_docs).astype(np.int64)
+        if len(docs) == 0:
+            return docs, np.empty(0)
+        credit = np.concatenate(all_credit)
+        unique, inverse = np.unique(docs, return_inverse=True)
+        matched = np.bincount(inverse, weights=credit)
+
+        recall = matched / len(tokens)
+        precision = np.minimum(matched / np.maximum(self.ntok[unique], 1), 1.0)
+        score = _W_RECALL * recall + _W_PRECISION * precision + _W_IMPORTANCE * self.importance[unique]
+        # at least half the query must match, otherwise "of" alone would return half the index
+        keep = recall >= 0.5
+        return unique[keep], score[keep]
+
+    def _item(self, doc: int, score: float | None = None) -> dict:
+        name = bytes(self.names[self.name_off[doc] : self.name_off[doc + 1]]).decode("utf-8")
+        item = {
+            "place_id": int(doc),
+            "display_name": name,
+            "lat": f"{float(self.lat[doc]):.7f}",
+            "lon": f"{float(self.lon[doc]):.7f}",
+            "class": self.classes[int(self.rec_class[doc])],
+            "type": self.types[int(self.rec_type[doc])],
+            "importance": float(self.importance[doc]),
+        }
+        if score is not None:
+            item["score"] = round(float(score), 4)
+        return item
+
+    def search(self, query: str, country_code: str | None = None, limit: int = 3) -> list[dict]:
+        """
+        Forward geocoding, best matches first.
+        """
+        doc_range = None
+        if country_code:
+            span = self.countries.get(country_code.lower())
+            if span is None:
+                return []
+            doc_range = tuple(span)
+        docs, scores = self._rank(query, doc_range)
+        top = np.argsort(-scores, kind="stable")[:limit]
+        return [self._item(int(docs[i]), scores[i]) for i in top]
+
+    def search_poi(self, query: str, city: str, limit: int = 5, radius_m: float = 15_000) -> list[dict]:
+        """
+        POIs matching `query` within `radius_m` of the best match for `city`.
+        """
+        centers = [c for c in self.search(city, limit=5) if c["class"] == "place"] or self.search(city, limit=1)
+        if not centers:
+            return []
+        c_lat, c_lon = float(centers[0]["lat"]), float(centers[0]["lon"])
+
+        docs, scores = self._rank(query, None)
+        if len(docs) == 0:
+            return []
+        # cheap bounding box first, exact distance only for what survives
+        dlat = radius_m / 111_320
+        dlon = dlat / max(math.cos(math.radians(c_lat)), 0.01)
+        lat = self.lat[docs]
+        lon = self.lon[docs]
+        box = (np.abs(lat - c_lat) <= dlat) & (np.abs(lon - c_lon) <= dlon)
+        docs, scores = docs[box], scores[box]
+        results = []
+        for i in np.argsort(-scores, kind="stable"):
+            doc = int(docs[i])
+            if haversine_m(c_lat, c_lon, float(self.lat[doc]), float(self.lon[doc])) <= radius_m:
+                results.append(self._item(doc, scores[i]))
+                if len(results) >= limit:
+                    break
+        return results
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build the offline geocoding index.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="index a .csv place list or an .osm XML extract")
+    build.add_argument("source", help="places .csv or .osm file")
+    build.add_argument("--out", required=True, help="output folder")
+    build.add_argument("--country", default="", help="country code for rows/features without one")
+    args = parser.parse_args()
+
+    if args.source.endswith(".csv"):
+        places = _read_csv(args.source, args.country)
+    else:
+        places = _read_osm(args.source, args.country)
+    build_index(places, args.out)
+
+
+if __name__ == "__main__":
+    main()
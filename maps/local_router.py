@@ -0,0 +1,812 @@
+import argparse
+import heapq
+import json
+import math
+import os
+import time
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+from maps.encoding import encode_polyline
+from maps.geo_utils import EARTH_RADIUS_M, haversine_m
+from maps.road_index import build_segment_index
+
+# Offline routing backend for route_between / distance_matrix.
+#
+# Build step (once per OSM extract and profile):
+#     python -m maps.local_router build beirut.osm --out graphs/ --profiles driving walking
+# writes graphs/<profile>/*.npy: the road graph as CSR arrays plus a contraction
+# hierarchy (CH), a node grid for snapping and a road segment grid for nearest_road
+# (see maps/road_index.py). At runtime LocalRouter.load() memory-maps
+# those files, so startup is instant and the OS page cache is shared between processes.
+#
+# Queries: bidirectional CH search for point-to-point (A* when built with --no-ch),
+# CH bucket search (or plain Dijkstra) for one-to-many / many-to-many matrices.
+# Edge weights are travel times in seconds; distances (meters) ride along.
+
+# km/h per highway type, driving profile (maxspeed tags override these)
+DRIVING_SPEEDS = {
+    "motorway": 90,
+    "motorway_link": 45,
+    "trunk": 80,
+    "trunk_link": 40,
+    "primary": 65,
+    "primary_link": 30,
+    "secondary": 55,
+    "secondary_link": 25,
+    "tertiary": 40,
+    "tertiary_link": 20,
+    "unclassified": 25,
+    "residential": 25,
+    "living_street": 10,
+    "service": 15,
+    "road": 20,
+}
+_NO_FOOT_OR_BIKE = {"motorway", "motorway_link", "trunk", "trunk_link"}
+_FOOT_ONLY = {"footway", "pedestrian", "steps", "path", "track", "cycleway", "bridleway"}
+
+PROFILES = ("driving", "walking", "cycling")
+WALKING_SPEED = 5.0
+CYCLING_SPEED = 15.0
+
+GRID_CELL_DEG = 0.005  # ≈ 500 m cells for nearest-node lookups
+
+
+# ---------------------------------------------------------------------------
+# reading OSM extracts
+# ---------------------------------------------------------------------------
+
+
+def _read_osm_xml(path: str):
+    """
+    Stream an .osm XML file → (node coords dict, list of (node refs, tags) ways).
+    """
+    nodes: dict[int, tuple[float, float]] = {}
+    ways = []
+    for _event, elem in ET.iterparse(path, events=("end",)):
+        if elem.tag == "node":
+            nodes[int(elem.get("id"))] = (float(elem.get("lat")), float(elem.get("lon")))
+            elem.clear()
+        elif elem.tag == "way":
+            tags = {t.get("k"): t.get("v") for t in elem.iter("tag")}
+            if "highway" in tags:
+                ways.append(([int(nd.get("ref")) for nd in elem.iter("nd")], tags))
+            elem.clear()
+        elif elem.tag == "relation":
+            elem.clear()
+    return nodes, ways
+
+
+def _read_osm_pbf(path: str):
+    """
+    Same as _read_osm_xml for .osm.pbf extracts (needs `pip install osmium`).
+    """
+    try:
+        import osmium
+    except ImportError as e:
+        raise RuntimeError("Reading .pbf extracts needs the 'osmium' package (pip install osmium)") from e
+
+    nodes: dict[int, tuple[float, float]] = {}
+    ways = []
+
+    class Handler(osmium.SimpleHandler):
+        def node(self, n):
+            nodes[n.id] = (n.location.lat, n.location.lon)
+
+        def way(self, w):
+            tags = {t.k: t.v for t in w.tags}
+            if "highway" in tags:
+                ways.append(([nd.ref for nd in w.nodes], tags))
+
+    Handler().apply_file(path)
+    return nodes, ways
+
+
+def read_osm(path: str):
+    if path.endswith(".pbf"):
+        return _read_osm_pbf(path)
+    return _read_osm_xml(path)
+
+
+# ---------------------------------------------------------------------------
+# profile rules
+# ---------------------------------------------------------------------------
+
+
+def _parse_maxspeed(value: str | None) -> float | None:
+    if not value:
+        return None
+    value = value.strip().lower()
+    try:
+        if value.endswith("mph"):
+            return float(value[:-3]) * 1.609
+        return float(value.split()[0])
+    except ValueError:
+        return None
+
+
+def way_rule(tags: dict, profile: str) -> tuple[float, bool, bool] | None:
+    """
+    (speed km/h, forward allowed, backward allowed) for a way, or None if not routable.
+    """
+    highway = tags.get("highway")
+    if tags.get("area") == "yes" or tags.get("access") in ("no", "private"):
+        return None
+
+    # None = untagged: roundabouts and motorways are then one-way by implication
+    oneway = tags.get("oneway")
+    implied_oneway = tags.get("junction") == "roundabout" or highway in ("motorway",)
+
+    if profile == "driving":
+        if highway not in DRIVING_SPEEDS:
+            return None
+        if tags.get("motor_vehicle") == "no" or tags.get("motorcar") == "no":
+            return None
+        speed = _parse_maxspeed(tags.get("maxspeed")) or DRIVING_SPEEDS[highway]
+        # real traffic rarely hits the limit
+        speed = min(speed, DRIVING_SPEEDS[highway] * 1.2)
+    elif profile == "walking":
+        if highway in _NO_FOOT_OR_BIKE or (highway not in DRIVING_SPEEDS and highway not in _FOOT_ONLY):
+            return None
+        if tags.get("foot") == "no":
+            return None
+        return WALKING_SPEED, True, True
+    elif profile == "cycling":
+        if highway in _NO_FOOT_OR_BIKE or (highway not in DRIVING_SPEEDS and highway not in _FOOT_ONLY):
+            return None
+        if tags.get("bicycle") == "no":
+            return None
+        speed = CYCLING_SPEED
+        if tags.get("oneway:bicycle") == "no":
+            return speed, True, True
+    else:
+        raise ValueError(f"Unknown profile '{profile}'")
+
+    if oneway in ("yes", "true", "1") or (implied_oneway and oneway is None):
+        return speed, True, False
+    if oneway == "-1":
+        return speed, False, True
+    return speed, True, True
+
+
+# ---------------------------------------------------------------------------
+# building
+# ---------------------------------------------------------------------------
+
+
+def _largest_component(n: int, us: list[int], vs: list[int]) -> np.ndarray:
+    """
+    Boolean mask of the largest weakly connected component (union-find).
+    """
+    parent = list(range(n))
+
+    def find(a: int) -> int:
+        while parent[a] != a:
+            parent[a] = parent[parent[a]]
+            a = parent[a]
+        return a
+
+    for u, v in zip(us, vs):
+        ru, rv = find(u), find(v)
+        if ru != rv:
+            parent[ru] = rv
+    roots = np.array([find(i) for i in range(n)])
+    values, counts = np.unique(roots, return_counts=True)
+    return roots == values[np.argmax(counts)]
+
+
+def _to_csr(n: int, us, vs, columns: dict) -> dict:
+    """
+    Sort edges by source and build CSR arrays: offsets + one array per column.
+    """
+    us = np.asarray(us, dtype=np.int64)
+    order = np.argsort(us, kind="stable")
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.add.at(offsets, us + 1, 1)
+    np.cumsum(offsets, out=offsets)
+    csr = {"offsets": offsets, "targets": np.asarray(vs, dtype=np.int32)[order]}
+    for name, (values, dtype) in columns.items():
+        csr[name] = np.asarray(values, dtype=dtype)[order]
+    return csr
+
+
+def _contract(n: int, us, vs, ws, ds, settle_limit: int = 200, log_every: int = 0):
+    """
+    Contraction hierarchy preprocessing.
+    Returns (rank, upward forward edges, upward backward edges); each edge list is
+    (tail, head, weight, dist, mid) where mid is the contracted middle node of a
+    shortcut (-1 for an original edge).
+    """
+    out: list[dict] = [dict() for _ in range(n)]
+    inc: list[dict] = [dict() for _ in range(n)]
+    for u, v, w, d in zip(us, vs, ws, ds):
+        if u == v:
+            continue
+        old = out[u].get(v)
+        if old is None or w < old[0]:
+            out[u][v] = (w, d, -1)
+            inc[v][u] = (w, d, -1)
+
+    contracted = [False] * n
+    deleted_neighbors = [0] * n
+    level = [0] * n
+    rank = [0] * n
+
+    def witnesses(u: int, skip: int, max_cost: float, limit: int) -> dict:
+        # bounded Dijkstra from u that avoids the node being contracted
+        dist = {u: 0.0}
+        heap = [(0.0, u)]
+        settled = 0
+        while heap:
+            d, a = heapq.heappop(heap)
+            if d > dist[a]:
+                continue
+            if d > max_cost or settled >= limit:
+                break
+            settled += 1
+            for b, (w, _dd, _m) in out[a].items():
+                if b == skip:
+                    continue
+                nd = d + w
+                if nd < dist.get(b, math.inf):
+                    dist[b] = nd
+                    heapq.heappush(heap, (nd, b))
+        return dist
+
+    def shortcuts_for(v: int, limit: int) -> list:
+        found = []
+        outs = out[v]
+        if not outs:
+            return found
+        max_out = max(w for w, _d, _m in outs.values())
+        for u, (w1, d1, _m1) in inc[v].items():
+            dist = witnesses(u, v, w1 + max_out, limit)
+            for x, (w2, d2, _m2) in outs.items():
+                if x == u:
+                    continue
+                if dist.get(x, math.inf) > w1 + w2:
+                    found.append((u, x, w1 + w2, d1 + d2))
+        return found
+
+    def priority(v: int) -> float:
+        shortcuts = len(shortcuts_for(v, 50))
+        edge_diff = shortcuts - len(out[v]) - len(inc[v])
+        return 2 * edge_diff + deleted_neighbors[v] + level[v]
+
+    heap = [(priority(v), v) for v in range(n)]
+    heapq.heapify(heap)
+    next_rank = 0
+    while heap:
+        _p, v = heapq.heappop(heap)
+        if contracted[v]:
+            continue
+        # lazy update: re-evaluate, and put it back if it is no longer the best
+        p = priority(v)
+        if heap and p > heap[0][0]:
+            heapq.heappush(heap, (p, v))
+            continue
+
+        for u, x, w, d in shortcuts_for(v, settle_limit):
+            old = out[u].get(x)
+            if old is None or w < old[0]:
+                out[u][x] = (w, d, v)
+                inc[x][u] = (w, d, v)
+
+        # detach v from the remaining graph; out[v] / inc[v] now only point to
+        # higher-ranked nodes, which is exactly the upward graph for v
+        for u in inc[v]:
+            out[u].pop(v, None)
+            deleted_neighbors[u] += 1
+            level[u] = max(level[u], level[v] + 1)
+        for x in out[v]:
+            inc[x].pop(v, None)
+            deleted_neighbors[x] += 1
+            level[x] = max(level[x], level[v] + 1)
+
+        contracted[v] = True
+        rank[v] = next_rank
+        next_rank += 1
+        if log_every and next_rank % log_every == 0:
+            print(f"  contracted {next_rank}/{n}")
+
+    fwd = [(v, x, w, d, m) for v in range(n) for x, (w, d, m) in out[v].items()]
+    # backward upward edges are stored under the lower node: (low, high) means high→low
+    bwd = [(v, u, w, d, m) for v in range(n) for u, (w, d, m) in inc[v].items()]
+    return rank, fwd, bwd
+
+
+def build_graph(
+    nodes: dict,
+    ways: list,
+    profile: str,
+    out_dir: str,
+    ch: bool = True,
+    verbose: bool = True,
+) -> dict:
+    """
+    Turn OSM nodes/ways into the on-disk arrays used by LocalRouter.
+    """
+    t0 = time.perf_counter()
+    index: dict[int, int] = {}
+    us, vs, ws, ds = [], [], [], []
+    # undirected road segments + way names for the segment index
+    seg_a, seg_b, seg_name = [], [], []
+    names: dict[str, int] = {}
+    max_speed = 1.0
+
+    for refs, tags in ways:
+        rule = way_rule(tags, profile)
+        if rule is None:
+            continue
+        speed_kmh, forward, backward = rule
+        speed = speed_kmh / 3.6
+        max_speed = max(max_speed, speed)
+        label = tags.get("name") or tags.get("ref")
+        name_id = names.setdefault(label, len(names)) if label else -1
+        refs = [r for r in refs if r in nodes]
+        for a, b in zip(refs, refs[1:]):
+            ia = index.setdefault(a, len(index))
+            ib = index.setdefault(b, len(index))
+            seg_a.append(ia)
+            seg_b.append(ib)
+            seg_name.append(name_id)
+            dist = haversine_m(*nodes[a], *nodes[b])
+            if forward:
+                us.append(ia)
+                vs.append(ib)
+                ws.append(dist / speed)
+                ds.append(dist)
+            if backward:
+                us.append(ib)
+                vs.append(ia)
+                ws.append(dist / speed)
+                ds.append(dist)
+
+    if not index:
+        raise ValueError(f"No routable ways for profile '{profile}' in this extract")
+
+    n = len(index)
+    lat = np.empty(n)
+    lon = np.empty(n)
+    for osm_id, i in index.items():
+        lat[i], lon[i] = nodes[osm_id]
+
+    # keep the biggest connected piece so we never snap to an unreachable island
+    keep = _largest_component(n, us, vs)
+    remap = np.full(n, -1, dtype=np.int64)
+    remap[keep] = np.arange(int(keep.sum()))
+    edge_keep = keep[np.asarray(us)] & keep[np.asarray(vs)]
+    us = remap[np.asarray(us)[edge_keep]].tolist()
+    vs = remap[np.asarray(vs)[edge_keep]].tolist()
+    ws = np.asarray(ws)[edge_keep].tolist()
+    ds = np.asarray(ds)[edge_keep].tolist()
+    lat, lon = lat[keep], lon[keep]
+    seg_a, seg_b = np.asarray(seg_a), np.asarray(seg_b)
+    seg_keep = keep[seg_a] & keep[seg_b] & (seg_a != seg_b)
+    seg_a, seg_b = remap[seg_a[seg_keep]], remap[seg_b[seg_keep]]
+    seg_name = np.asarray(seg_name)[seg_keep]
+    n = len(lat)
+    if verbose:
+        print(f"[{profile}] {n} nodes, {len(us)} edges after filtering")
+
+    os.makedirs(out_dir, exist_ok=True)
+    arrays = {"node_lat": lat, "node_lon": lon}
+
+    out_csr = _to_csr(n, us, vs, {"weights": (ws, np.float32), "dists": (ds, np.float32)})
+    arrays.update({f"out_{k}": v for k, v in out_csr.items()})
+
+    if ch:
+        if verbose:
+            print(f"[{profile}] building contraction hierarchy ...")
+        rank, fwd, bwd = _contract(n, us, vs, ws, ds, log_every=10_000 if verbose else 0)
+        arrays["rank"] = np.asarray(rank, dtype=np.int32)
+        for name, edges in (("fwd", fwd), ("bwd", bwd)):
+            tails = [e[0] for e in edges]
+            heads = [e[1] for e in edges]
+            csr = _to_csr(
+                n,
+                tails,
+                heads,
+                {
+                    "weights": ([e[2] for e in edges], np.float32),
+                    "dists": ([e[3] for e in edges], np.float32),
+                    "mids": ([e[4] for e in edges], np.int32),
+                },
+            )
+            arrays.update({f"{name}_{k}": v for k, v in csr.items()})
+
+    # grid for nearest node: nodes sorted by cell key, plus where each cell starts
+    lat0, lon0 = float(lat.min()), float(lon.min())
+    cols = int((lon.max() - lon0) / GRID_CELL_DEG) + 1
+    cell = ((lat - lat0) // GRID_CELL_DEG).astype(np.int64) * cols + ((lon - lon0) // GRID_CELL_DEG).astype(np.int64)
+    order = np.argsort(cell, kind="stable")
+    keys, starts = np.unique(cell[order], return_index=True)
+    arrays["grid_order"] = order.astype(np.int32)
+    arrays["grid_keys"] = keys.astype(np.int64)
+    arrays["grid_starts"] = np.append(starts, n).astype(np.int64)
+
+    for name, arr in arrays.items():
+        np.save(os.path.join(out_dir, f"{name}.npy"), arr)
+    roads = build_segment_index(lat, lon, seg_a, seg_b, seg_name, list(names), out_dir)
+
+    meta = {
+        "profile": profile,
+        "nodes": n,
+        "edges": len(us),
+        "ch": ch,
+        "max_speed_mps": max_speed,
+        "grid": {"lat0": lat0, "lon0": lon0, "cell_deg": GRID_CELL_DEG, "cols": cols},
+        "bbox": [float(lat.min()), float(lon.min()), float(lat.max()), float(lon.max())],
+        "roads": roads,
+        "build_seconds": round(time.perf_counter() - t0, 2),
+    }
+    with open(os.path.join(out_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    if verbose:
+        print(f"[{profile}] done in {meta['build_seconds']}s → {out_dir}")
+    return meta
+
+
+# ---------------------------------------------------------------------------
+# querying
+# ---------------------------------------------------------------------------
+
+
+class _CSR:
+    """
+    One adjacency structure. Hot loops index memoryviews (plain Python numbers,
+    much cheaper than numpy scalars) that sit on top of the memory-mapped arrays.
+    """
+
+    def __init__(self, graph_dir: str, prefix: str, with_mids: bool):
+        def view(name: str):
+            return memoryview(np.load(os.path.join(graph_dir, f"{prefix}_{name}.npy"), mmap_mode="r"))
+
+        self.offsets = view("offsets")
+        self.targets = view("targets")
+        self.weights = view("weights")
+        self.dists = view("dists")
+        self.mids = view("mids") if with_mids else None
+
+    def find(self, a: int, b: int) -> int:
+        # index of edge a→b (adjacency lists are short, a scan is fine)
+        targets = self.targets
+        for e in range(self.offsets[a], self.offsets[a + 1]):
+            if targets[e] == b:
+                return e
+        raise KeyError((a, b))
+
+
+class NoRouteError(RuntimeError):
+    """Raised when two snapped points are not connected in the local graph."""
+
+
+class LocalRouter:
+    """
+    Memory-mapped road graph for one profile (see `build_graph`).
+    """
+
+    def __init__(self, graph_dir: str):
+        with open(os.path.join(graph_dir, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.profile = self.meta["profile"]
+
+        def load(name: str) -> np.ndarray:
+            return np.load(os.path.join(graph_dir, f"{name}.npy"), mmap_mode="r")
+
+        self.lat = load("node_lat")
+        self.lon = load("node_lon")
+        self._lat_view = memoryview(self.lat)
+        self._lon_view = memoryview(self.lon)
+        self.out = _CSR(graph_dir, "out", with_mids=False)
+        self.has_ch = bool(self.meta["ch"])
+        if self.has_ch:
+            self.rank = memoryview(load("rank"))
+            self.fwd = _CSR(graph_dir, "fwd", with_mids=True)
+            self.bwd = _CSR(graph_dir, "bwd", with_mids=True)
+
+        self.grid_order = load("grid_order")
+        self.grid_keys = load("grid_keys")
+        self.grid_starts = load("grid_starts")
+        grid = self.meta["grid"]
+        self._lat0, self._lon0 = grid["lat0"], grid["lon0"]
+        self._cell, self._cols = grid["cell_deg"], grid["cols"]
+        self._max_speed = self.meta["max_speed_mps"]
+
+    @classmethod
+    def load(cls, graph_dir: str) -> "LocalRouter":
+        return cls(graph_dir)
+
+    # -- snapping ----------------------------------------------------------
+
+    def nearest_node(self, lat: float, lon: float, max_rings: int = 20) -> tuple[int, float]:
+        """
+        Closest graph node to (lat, lon) → (node id, distance in meters).
+        """
+        row = int((lat - self._lat0) // self._cell)
+        col = int((lon - self._lon0) // self._cell)
+        for ring in range(max_rings + 1):
+            candidates = self._ring_candidates(row, col, ring)
+            if candidates:
+                # one extra ring so a closer node just across the cell border is not missed
+                ids = np.concatenate(candidates + self._ring_candidates(row, col, ring + 1))
+                d = self._distances(lat, lon, ids)
+                best = int(np.argmin(d))
+                return int(ids[best]), float(d[best])
+        raise NoRouteError(f"No road within reach of ({lat}, {lon}) in the local graph")
+
+    def _ring_candidates(self, row: int, col: int, ring: int) -> list:
+        keys = [
+            (row + dr) * self._cols + (col + dc)
+            for dr in range(-ring, ring + 1)
+            for dc in range(-ring, ring + 1)
+            if max(abs(dr), abs(dc)) == ring and 0 <= col + dc < self._cols
+        ]
+        pos = np.searchsorted(self.grid_keys, keys)
+        return [
+            self.grid_order[self.grid_starts[p] : self.grid_starts[p + 1]]
+            for p, key in zip(pos, keys)
+            if p < len(self.grid_keys) and self.grid_keys[p] == key
+        ]
+
+    def _distances(self, lat: float, lon: float, ids: np.ndarray) -> np.ndarray:
+        # vectorized haversine from one point to many nodes
+        p1 = math.radians(lat)
+        p2 = np.radians(self.lat[ids])
+        dl = np.radians(self.lon[ids] - lon)
+        a = np.sin((p2 - p1) / 2) ** 2 + math.cos(p1) * np.cos(p2) * np.sin(dl / 2) ** 2
+        return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+    # -- point to point ----------------------------------------------------
+
+    def _ch_query(self, s: int, t: int) -> tuple[float, float, list[int]]:
+        """
+        Bidirectional upward search. Returns (seconds, meters, node path).
+        """
+        if s == t:
+            return 0.0, 0.0, [s]
+        dist = ({s: 0.0}, {t: 0.0})
+        pred = ({s: -1}, {t: -1})
+        heaps = ([(0.0, s)], [(0.0, t)])
+        graphs = (self.fwd, self.bwd)
+        best, meet = math.inf, -1
+
+        while heaps[0] or heaps[1]:
+            top_f = heaps[0][0][0] if heaps[0] else math.inf
+            top_b = heaps[1][0][0] if heaps[1] else math.inf
+            if min(top_f, top_b) >= best:
+                break
+            side = 0 if top_f <= top_b else 1
+            d, u = heapq.heappop(heaps[side])
+            if d > dist[side][u]:
+                continue
+            other = dist[1 - side].get(u)
+            if other is not None and d + other < best:
+                best, meet = d + other, u
+            g = graphs[side]
+            my_dist, my_pred, heap = dist[side], pred[side], heaps[side]
+            targets, weights = g.targets, g.weights
+            for e in range(g.offsets[u], g.offsets[u + 1]):
+                v = targets[e]
+                nd = d + weights[e]
+                if nd < my_dist.get(v, math.inf):
+                    my_dist[v] = nd
+                    my_pred[v] = u
+                    heapq.heappush(heap, (nd, v))
+
+        if meet < 0:
+            raise NoRouteError("Start and end are not connected in the local graph")
+
+        # up-path s → meet, then meet → t (backward preds point towards t)
+        up = []
+        u = meet
+        while u != -1:
+            up.append(u)
+            u = pred[0][u]
+        up.reverse()
+        down = []
+        u = pred[1][meet]
+        while u != -1:
+            down.append(u)
+            u = pred[1][u]
+        hops = up + down
+
+        path = [hops[0]]
+        meters = 0.0
+        for a, b in zip(hops, hops[1:]):
+            meters += self._unpack(a, b, path)
+        return best, meters, path
+
+    def _unpack(self, a: int, b: int, path: list[int]) -> float:
+        # expand shortcut a→b into original edges, appending nodes after a; returns meters
+        meters = 0.0
+        stack = [(a, b)]
+        while stack:
+            x, y = stack.pop()
+            if self.rank[x] < self.rank[y]:
+                g, e = self.fwd, self.fwd.find(x, y)
+            else:
+                g, e = self.bwd, self.bwd.find(y, x)
+            mid = g.mids[e]
+            if mid < 0:
+                path.append(y)
+                meters += g.dists[e]
+            else:
+                # second half goes on the stack first so the first half is expanded first
+                stack.append((mid, y))
+                stack.append((x, mid))
+        return meters
+
+    def _astar(self, s: int, t: int) -> tuple[float, float, list[int]]:
+        lat_v, lon_v = self._lat_view, self._lon_view
+        t_lat, t_lon = lat_v[t], lon_v[t]
+        inv_speed = 1.0 / self._max_speed
+
+        def h(v: int) -> float:
+            return haversine_m(lat_v[v], lon_v[v], t_lat, t_lon) * inv_speed
+
+        g = self.out
+        offsets, targets, weights = g.offsets, g.targets, g.weights
+        dist = {s: 0.0}
+        pred = {s: (-1, -1)}  # node → (previous node, edge used)
+        heap = [(h(s), s)]
+        closed = set()
+        while heap:
+            _f, u = heapq.heappop(heap)
+            if u in closed:
+                continue
+            if u == t:
+                break
+            closed.add(u)
+            d = dist[u]
+            for e in range(offsets[u], offsets[u + 1]):
+                v = targets[e]
+                nd = d + weights[e]
+                if nd < dist.get(v, math.inf):
+                    dist[v] = nd
+                    pred[v] = (u, e)
+                    heapq.heappush(heap, (nd + h(v), v))
+        if t not in dist:
+            raise NoRouteError("Start and end are not connected in the local graph")
+        path = []
+        meters = 0.0
+        u = t
+        while u != -1:
+            path.append(u)
+            u, e = pred[u]
+            if e >= 0:
+                meters += g.dists[e]
+        path.reverse()
+        return dist[t], meters, path
+
+    def route(
+        self, start_lat: float, start_lon: float, end_lat: float, end_lon: float, geometry: bool = False
+    ) -> dict:
+        """
+        OSRM-shaped route dict (distance, duration, legs, geometry as polyline5).
+        """
+        s, _ = self.nearest_node(start_lat, start_lon)
+        t, _ = self.nearest_node(end_lat, end_lon)
+        duration, distance, path = self._ch_query(s, t) if self.has_ch else self._astar(s, t)
+        return {
+            "distance": distance,
+            "duration": duration,
+            "legs": [{"distance": distance, "duration": duration, "summary": "", "steps": []}],
+            "geometry": (
+                encode_polyline(zip(self.lat[path].tolist(), self.lon[path].tolist())) if geometry else None
+            ),
+        }
+
+    # -- matrices ----------------------------------------------------------
+
+    def _upward(self, g: _CSR, s: int) -> dict:
+        # full upward search space of s: node → (seconds, meters)
+        best = {s: (0.0, 0.0)}
+        heap = [(0.0, 0.0, s)]
+        offsets, targets, weights, dists = g.offsets, g.targets, g.weights, g.dists
+        while heap:
+            d, m, u = heapq.heappop(heap)
+            if d > best[u][0]:
+                continue
+            for e in range(offsets[u], offsets[u + 1]):
+                v = targets[e]
+                nd = d + weights[e]
+                old = best.get(v)
+                if old is None or nd < old[0]:
+                    best[v] = (nd, m + dists[e])
+                    heapq.heappush(heap, (nd, m + dists[e], v))
+        return best
+
+    def _dijkstra_to(self, s: int, targets_left: set) -> dict:
+        # plain one-to-many Dijkstra that stops once every target is settled
+        g = self.out
+        offsets, targets, weights, dists = g.offsets, g.targets, g.weights, g.dists
+        best = {s: (0.0, 0.0)}
+        settled = {}
+        heap = [(0.0, 0.0, s)]
+        remaining = set(targets_left)
+        while heap and remaining:
+            d, m, u = heapq.heappop(heap)
+            if u in settled:
+                continue
+            settled[u] = (d, m)
+            remaining.discard(u)
+            for e in range(offsets[u], offsets[u + 1]):
+                v = targets[e]
+                nd = d + weights[e]
+                old = best.get(v)
+                if old is None or nd < old[0]:
+                    best[v] = (nd, m + dists[e])
+                    heapq.heappush(heap, (nd, m + dists[e], v))
+        return settled
+
+    def table(self, sources: list, destinations: list) -> tuple[np.ndarray, np.ndarray, list, list]:
+        """
+        Many-to-many durations/distances for [lat, lon] lists.
+        Returns (durations, distances, source snaps, destination snaps) with NaN for no route;
+        a snap is (node id, snap distance in meters).
+        """
+        src_snaps = [self.nearest_node(lat, lon) for lat, lon in sources]
+        dst_snaps = [self.nearest_node(lat, lon) for lat, lon in destinations]
+        durations = np.full((len(sources), len(destinations)), np.nan)
+        distances = np.full((len(sources), len(destinations)), np.nan)
+
+        if self.has_ch:
+            # bucket many-to-many: backward searches fill buckets, forward searches scan them
+            buckets: dict[int, list] = {}
+            for j, (t, _) in enumerate(dst_snaps):
+                for v, (d, m) in self._upward(self.bwd, t).items():
+                    buckets.setdefault(v, []).append((j, d, m))
+            for i, (s, _) in enumerate(src_snaps):
+                row_d = durations[i]
+                row_m = distances[i]
+                best = [math.inf] * len(destinations)
+                best_m = [math.nan] * len(destinations)
+                for v, (d, m) in self._upward(self.fwd, s).items():
+                    for j, d2, m2 in buckets.get(v, ()):
+                        if d + d2 < best[j]:
+                            best[j] = d + d2
+                            best_m[j] = m + m2
+                row_d[:] = [b if b < math.inf else math.nan for b in best]
+                row_m[:] = best_m
+        else:
+            wanted = {t for t, _ in dst_snaps}
+            for i, (s, _) in enumerate(src_snaps):
+                settled = self._dijkstra_to(s, wanted)
+                for j, (t, _) in enumerate(dst_snaps):
+                    hit = settled.get(t)
+                    if hit is not None:
+                        durations[i, j], distances[i, j] = hit
+
+        return durations, distances, src_snaps, dst_snaps
+
+    def waypoint(self, snap: tuple[int, float]) -> dict:
+        node, distance = snap
+        return {"location": [float(self.lon[node]), float(self.lat[node])], "distance": distance, "name": ""}
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build local routing graphs from an OSM extract.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="preprocess an .osm / .osm.pbf extract")
+    build.add_argument("extract", help="path to .osm (XML) or .osm.pbf file")
+    build.add_argument("--out", required=True, help="output folder (one subfolder per profile)")
+    build.add_argument("--profiles", nargs="+", default=["driving"], choices=PROFILES)
+    build.add_argument("--no-ch", action="store_true", help="skip the contraction hierarchy (A* only)")
+    args = parser.parse_args()
+
+    print(f"reading {args.extract} ...")
+    nodes, ways = read_osm(args.extract)
+    print(f"{len(nodes)} nodes, {len(ways)} highway ways")
+    for profile in args.profiles:
+        build_graph(nodes, ways, profile, os.path.join(args.out, profile), ch=not args.no_ch)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,362 @@
+import asyncio
+import json
+from typing import List
+
+from mcp.server import Server, NotificationOptions
+from mcp.server.models import InitializationOptions
+import mcp.types as types
+
+from maps import geo_server, routing_server
+from maps.config import env_float, env_int, env_str
+from maps.encoding import MATRIX_ENCODINGS
+from maps.geo_utils import parse_point
+from maps.http_clients import aclose_clients
+from maps.metrics import Metrics, MetricsExporter, prometheus_text
+from maps.output import next_page, render, with_output_options
+from maps.tracing import Tracer
+from maps.transport import serve
+
+# All geo + routing tools behind one MCP server, in one process.
+#
+# The agent normally spawns geo_server and routing_server separately, and each one
+# pays for its own interpreter and the whole mcp/pydantic import stack (most of the
+# cold start) before it can answer list_tools. This server imports both tool modules
+# and dispatches to their call_tool, so the tools, caches, schedulers, metrics and
+# tracing behave exactly as in the separate servers. The pooled HTTP clients in
+# maps.http_clients are per process, so here they're shared by both.
+# numpy and the offline engines are only imported when a tool first needs them.
+#
+# Having both in one process also allows composite tools that chain them without
+# the LLM in between: route_between_places / matrix_between_places geocode the
+# names concurrently (through geo_server's cache and Nominatim queue) and feed the
+# coordinates straight into the route / matrix code, one tool call instead of 3+.
+#
+#   python -m maps.map_server        (what the agent spawns with MAPS_SINGLE_SERVER=1)
+
+app = Server("map-server")
+
+# the composite tools' own metrics / spans; the geo and routing tools keep theirs
+METRICS = Metrics("map-server")
+TRACER = Tracer("map-server")
+
+# one exposition for all registries (series keep their server="geo-server"/"routing-server" label)
+METRICS_PORT = env_int("MAP_METRICS_PORT", 0)
+METRICS_FILE = env_str("MAP_METRICS_FILE", "") or None
+METRICS_DUMP_INTERVAL = env_float("METRICS_DUMP_INTERVAL", 15.0)
+
+# serve MCP over HTTP on this port instead of stdio (0 = stdio), see maps/transport.py
+HTTP_PORT = env_int("MAP_HTTP_PORT", 0)
+HTTP_HOST = env_str("MAPS_HTTP_HOST", "127.0.0.1")
+
+_SERVERS = (geo_server, routing_server)
+
+_PLACE = {
+    "type": "string",
+    "description": "Place name or address (e.g. 'American University of Beirut'), or 'lat,lon'.",
+}
+_PLACES = {"type": "array", "items": {"type": "string"}, "minItems": 1}
+_COMMON = {
+    "country_code": {
+        "type": "string",
+        "description": "Optional 2-letter country code to restrict geocoding, e.g. 'lb'.",
+    },
+    "profile": {
+        "type": "string",
+        "description": "Travel mode: driving, walking, cycling.",
+        "default": "driving",
+    },
+}
+
+
+@app.list_tools()
+async def list_tools() -> List[types.Tool]:
+    """
+    Tools of both servers; their two server_stats tools are merged into one.
+    """
+    tools = []
+    for server in _SERVERS:
+        tools.extend(tool for tool in await server.list_tools() if tool.name != "server_stats")
+    tools.append(
+        types.Tool(
+            name="route_between_places",
+            description=(
+                "Route between two places given by name: geocodes both (best match) and routes "
+                "with OSRM in one call. Returns distance (meters), duration (seconds) and the "
+                "resolved coordinates. Prefer this over geocode_place + route_between."
+            ),
+            inputSchema={
+                "type": "object",
+                "required": ["origin", "destination"],
+                "properties": {
+                    "origin": _PLACE,
+                    "destination": _PLACE,
+                    **_COMMON,
+                    "overview": {
+                        "type": "string",
+                        "description": "Route overview: 'full' (adds an encoded polyline) or 'false'.",
+                        "default": "false",
+                    },
+                },
+            },
+        )
+    )
+    tools.append(
+        types.Tool(
+            name="matrix_between_places",
+            description=(
+                "Distance/time matrix between places given by name: geocodes them (best match) "
+                "and runs the OSRM table in one call. Pass `places` for all-to-all, or `sources` + "
+                "`destinations`. Returns the matrices and the resolved coordinates."
+            ),
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "places": {**_PLACES, "description": "Places for an all-to-all matrix.", "minItems": 2},
+                    "sources": {**_PLACES, "description": "Origin places (rows), with `destinations`."},
+                    "destinations": {**_PLACES, "description": "Destination places (columns), with `sources`."},
+                    **_COMMON,
+                    "annotations": {
+                        "type": "string",
+                        "description": "duration, distance, or 'distance,duration'.",
+                        "default": "duration",
+                    },
+                    "encoding": {
+                        "type": "string",
+                        "enum": ["json", "float32", "uint32"],
+                        "description": "'json' (default, nested lists) or a packed matrix, as in distance_matrix.",
+                        "default": "json",
+                    },
+                    "handle": {
+                        "type": "boolean",
+                        "description": (
+                            "Keep the matrix and return a `handle`: extend_matrix adds more points "
+                            "(by coordinates) without recomputing it."
+                        ),
+                        "default": False,
+                    },
+                },
+            },
+        )
+    )
+    tools.append(
+        types.Tool(
+            name="server_stats",
+            description=(
+                "Operational stats of the geo and routing tools: per-tool calls, errors, latency "
+                "split into upstream (Nominatim/OSRM) and local time, response sizes, cache hit "
+                "ratios and queue state."
+            ),
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "format": {
+                        "type": "string",
+                        "enum": ["json", "prometheus"],
+                        "description": "'json' (default) summary or the Prometheus text format.",
+                        "default": "json",
+                    },
+                },
+            },
+        )
+    )
+    # the composite tools take fields / max_bytes / cursor too (maps/output.py)
+    return with_output_options(tools)
+
+
+async def _resolve(places: list[str], country_code: str | None) -> dict[str, dict]:
+    """
+    Geocode distinct place names concurrently → {normalized name: resolved place}.
+    Raises ValueError naming every place that has no match.
+    """
+    unique: dict[str, str] = {}
+    for place in places:
+        if not isinstance(place, str) or not place.strip():
+            raise ValueError("Place names must be non-empty strings.")
+        unique.setdefault(geo_server._normalize_query(place), place)
+
+    semaphore = asyncio.Semaphore(max(geo_server.BATCH_GEOCODE_CONCURRENCY, 1))
+
+    async def lookup(place: str) -> dict | None:
+        # "33.9,35.48" is already a point, no need to ask Nominatim
+        point = parse_point(place)
+        if point is not None:
+            return {"query": place, "lat": point[0], "lon": point[1]}
+        async with semaphore:
+            results = await geo_server._geocode(place, country_code, 1)
+        if not results:
+            return None
+        best = results[0]
+        return {
+            "query": place,
+            "name": best["display_name"],
+            "lat": float(best["lat"]),
+            "lon": float(best["lon"]),
+        }
+
+    resolved = dict(zip(unique, await asyncio.gather(*(lookup(p) for p in unique.values()))))
+    missing = [unique[key] for key, found in resolved.items() if found is None]
+    if missing:
+        raise ValueError(f"No geocoding match for: {', '.join(repr(p) for p in missing)}")
+    return resolved
+
+
+async def _tool_route_between_places(arguments: dict) -> list[types.TextContent]:
+    origin = arguments["origin"]
+    destination = arguments["destination"]
+    profile = arguments.get("profile", "driving")
+    overview = arguments.get("overview", "false")
+
+    places = await _resolve([origin, destination], arguments.get("country_code"))
+    start = places[geo_server._normalize_query(origin)]
+    end = places[geo_server._normalize_query(destination)]
+    # without geometry this is the same cache entry route_between uses
+    encoding = "json" if overview == "false" else "polyline"
+    route = await routing_server._route(start["lat"], start["lon"], end["lat"], end["lon"], profile, overview, encoding)
+
+    result = {
+        "origin": start,
+        "destination": end,
+        "profile": profile,
+        "distance_m": routing_server._round(route["distance_m"]),
+        "duration_s": routing_server._round(route["duration_s"]),
+    }
+    if overview != "false" and route["geometry"]:
+        result["geometry"] = route["geometry"]
+        result["geometry_encoding"] = "polyline5"
+    return await render(result, arguments)
+
+
+async def _tool_matrix_between_places(arguments: dict) -> list[types.TextContent]:
+    profile = arguments.get("profile", "driving")
+    annotations = arguments.get("annotations", "duration")
+    encoding = arguments.get("encoding", "json")
+    if encoding not in MATRIX_ENCODINGS:
+        raise ValueError(f"Unknown encoding '{encoding}' (use one of {sorted(MATRIX_ENCODINGS)})")
+
+    if arguments.get("sources") and arguments.get("destinations"):
+        source_names = arguments["sources"]
+        destination_names = arguments["destinations"]
+        symmetric = False
+    elif arguments.get("places"):
+        source_names = destination_names = arguments["places"]
+        symmetric = True
+    else:
+        raise ValueError("Provide 'places', or both 'sources' and 'destinations'.")
+
+    places = await _resolve(source_names + ([] if symmetric else destination_names), arguments.get("country_code"))
+    sources = [places[geo_server._normalize_query(name)] for name in source_names]
+    destinations = sources if symmetric else [places[geo_server._normalize_query(n)] for n in destination_names]
+
+    source_points = [[p["lat"], p["lon"]] for p in sources]
+    destination_points = [[p["lat"], p["lon"]] for p in destinations]
+    matrices = await routing_server._matrix(profile, source_points, destination_points, annotations, symmetric)
+    durations, distances, _, _ = matrices
+
+    durations, distances = await routing_server._encode_matrices(durations, distances, encoding)
+
+    result = {"profile": profile}
+    if arguments.get("handle"):
+        result["handle"] = routing_server._keep_matrix(
+            profile, annotations, source_points, destination_points, symmetric, matrices
+        )
+    result["sources"] = sources
+    if not symmetric:
+        result["destinations"] = destinations
+    result["durations"] = durations
+    result["distances"] = distances
+    return await render(result, arguments, page=("sources", "durations", "distances"))
+
+
+# tools that only exist in the combined server
+TOOL_HANDLERS = {
+    "route_between_places": _tool_route_between_places,
+    "matrix_between_places": _tool_matrix_between_places,
+}
+
+
+def _tool_server_stats(arguments: dict) -> list[types.TextContent]:
+    registries = tuple(server.METRICS for server in _SERVERS) + (METRICS,)
+    fmt = arguments.get("format", "json")
+    if fmt == "prometheus":
+        return [types.TextContent(type="text", text=prometheus_text(*registries))]
+    if fmt != "json":
+        raise ValueError(f"Unknown format '{fmt}', expected json or prometheus")
+    return [
+        types.TextContent(
+            type="text",
+            text=json.dumps({"servers": [m.snapshot() for m in registries]}, indent=2),
+        )
+    ]
+
+
+@app.call_tool()
+async def call_tool(name: str, arguments: dict) -> list[types.TextContent]:
+    """
+    Runs the composite tools here and hands every other call to the server module
+    that owns the tool (its call_tool does the metrics, tracing and error reporting).
+    """
+    if name == "server_stats":
+        try:
+            return _tool_server_stats(arguments)
+        except Exception as e:
+            return [types.TextContent(type="text", text=json.dumps({"error": str(e)}, indent=2))]
+    if name in TOOL_HANDLERS:
+        with METRICS.tool_call(name) as call, TRACER.tool_span(app, name) as span:
+            try:
+                if arguments.get("cursor"):
+                    result = await next_page(arguments)
+                else:
+                    result = await TOOL_HANDLERS[name](arguments)
+            except Exception as e:
+                call.failed(e)
+                if span is not None:
+                    span.fail(e)
+                result = [types.TextContent(type="text", text=json.dumps({"error": str(e)}, indent=2))]
+            call.responded(result)
+        return result
+    for server in _SERVERS:
+        if name in server.TOOL_HANDLERS:
+            return await server.call_tool(name, arguments)
+    # unknown name → geo_server reports it (and counts it under "unknown")
+    return await geo_server.call_tool(name, arguments)
+
+
+async def main() -> None:
+    """
+    Run the combined MCP server over stdio.
+    The agent spawns this with `python -m maps.map_server` when MAPS_SINGLE_SERVER=1
+    (or connects to a running one at MAP_SERVER_URL); by default it uses the two servers.
+    With MAP_HTTP_PORT set it serves MCP over HTTP instead, for many agents at once.
+    """
+    exporter = MetricsExporter(
+        (geo_server.METRICS, routing_server.METRICS, METRICS),
+        port=METRICS_PORT,
+        path=METRICS_FILE,
+        interval=METRICS_DUMP_INTERVAL,
+    )
+    try:
+        await exporter.start()
+        await serve(
+            app,
+            InitializationOptions(
+                server_name="map-server",
+                server_version="0.1.0",
+                capabilities=app.get_capabilities(
+                    notification_options=NotificationOptions(),
+                    experimental_capabilities={},
+                ),
+            ),
+            http_port=HTTP_PORT,
+            http_host=HTTP_HOST,
+        )
+    finally:
+        # same shutdown as the two separate servers, done once
+        await exporter.aclose()
+        await aclose_clients()
+        geo_server.GEO_CACHE.close()
+        geo_server.REVERSE_CACHE.close()
+        routing_server.ROUTE_CACHE.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
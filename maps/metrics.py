@@ -0,0 +1,474 @@
+import asyncio
+import bisect
+import contextlib
+import contextvars
+import os
+import time
+from collections import Counter
+
+# In-process instrumentation for the map servers.
+#
+# Per tool: call count, errors by exception type, latency split into
+#   upstream → wall time during which the call had at least one upstream request
+#              queued or in flight (concurrent tiles/chunks are not double counted)
+#   local    → everything else (validation, our own compute, JSON serialization)
+# and response size. Per upstream endpoint: requests by status, HTTP latency and time
+# spent waiting in the scheduler queue. Caches and schedulers report their own
+# counters when a snapshot is taken.
+# Histograms use fixed buckets, so recording is a bisect + a few adds and percentiles
+# are estimates (linear inside the bucket, like Prometheus' histogram_quantile).
+
+LATENCY_BUCKETS_S = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+SIZE_BUCKETS_BYTES = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram (upper bounds, plus an implicit +Inf bucket).
+    """
+
+    __slots__ = ("bounds", "counts", "count", "sum", "max")
+
+    def __init__(self, bounds: tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                if i == len(self.bounds):
+                    return self.max
+                lower = self.bounds[i - 1] if i else 0.0
+                upper = min(self.bounds[i], self.max)
+                return lower + (upper - lower) * max(rank - seen, 0) / n
+            seen += n
+        return self.max
+
+    def summary(self, scale: float = 1.0, digits: int = 1) -> dict:
+        """
+        count / mean / p50 / p95 / p99 / max, values multiplied by `scale` (e.g. s → ms).
+        """
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean": round(self.sum / self.count * scale, digits),
+            "p50": round(self.quantile(0.50) * scale, digits),
+            "p95": round(self.quantile(0.95) * scale, digits),
+            "p99": round(self.quantile(0.99) * scale, digits),
+            "max": round(self.max * scale, digits),
+        }
+
+
+class _ToolStats:
+    __slots__ = ("calls", "errors", "latency", "upstream", "local", "response_bytes")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors: Counter = Counter()
+        self.latency = Histogram(LATENCY_BUCKETS_S)
+        self.upstream = Histogram(LATENCY_BUCKETS_S)
+        self.local = Histogram(LATENCY_BUCKETS_S)
+        self.response_bytes = Histogram(SIZE_BUCKETS_BYTES)
+
+
+class _UpstreamStats:
+    __slots__ = ("statuses", "latency", "queue_wait")
+
+    def __init__(self):
+        self.statuses: Counter = Counter()
+        self.latency = Histogram(LATENCY_BUCKETS_S)
+        self.queue_wait = Histogram(LATENCY_BUCKETS_S)
+
+
+class ToolCall:
+    """
+    Bookkeeping for one tool call; shared with every task the call spawns.
+    """
+
+    __slots__ = ("started", "upstream_s", "error", "response_bytes", "_waiting", "_busy_since")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.upstream_s = 0.0
+        self.error: str | None = None
+        self.response_bytes = 0
+        self._waiting = 0
+        self._busy_since = 0.0
+
+    def failed(self, exc: BaseException) -> None:
+        self.error = type(exc).__name__
+
+    def responded(self, contents: list) -> None:
+        self.response_bytes = sum(len(getattr(c, "text", "") or "") for c in contents)
+
+    def _upstream_started(self) -> None:
+        if not self._waiting:
+            self._busy_since = time.perf_counter()
+        self._waiting += 1
+
+    def _upstream_finished(self) -> None:
+        self._waiting -= 1
+        if not self._waiting:
+            self.upstream_s += time.perf_counter() - self._busy_since
+
+
+class _Request:
+    __slots__ = ("status",)
+
+    def __init__(self):
+        self.status: int | str | None = None
+
+
+_current_call: contextvars.ContextVar[ToolCall | None] = contextvars.ContextVar("maps_tool_call", default=None)
+
+
+class Metrics:
+    """
+    Metrics registry of one server process.
+    """
+
+    def __init__(self, server: str):
+        self.server = server
+        self.started_at = time.time()
+        self.tools: dict[str, _ToolStats] = {}
+        self.upstreams: dict[tuple[str, str], _UpstreamStats] = {}
+        self._caches: list = []
+        self._schedulers: list = []
+        self._pools: list = []
+
+    def track(self, *objects) -> None:
+        """
+        Caches / schedulers / endpoint pools whose stats() go into every snapshot.
+        """
+        for obj in objects:
+            if hasattr(obj, "submit"):
+                self._schedulers.append(obj)
+            elif hasattr(obj, "endpoints"):
+                self._pools.append(obj)
+            else:
+                self._caches.append(obj)
+
+    @contextlib.contextmanager
+    def tool_call(self, name: str):
+        call = ToolCall()
+        token = _current_call.set(call)
+        try:
+            yield call
+        finally:
+            _current_call.reset(token)
+            total = time.perf_counter() - call.started
+            stats = self.tools.get(name)
+            if stats is None:
+                stats = self.tools[name] = _ToolStats()
+            stats.calls += 1
+            if call.error:
+                stats.errors[call.error] += 1
+            stats.latency.observe(total)
+            stats.upstream.observe(call.upstream_s)
+            stats.local.observe(max(total - call.upstream_s, 0.0))
+            stats.response_bytes.observe(call.response_bytes)
+
+    @contextlib.contextmanager
+    def upstream_wait(self):
+        """
+        Around an awaited upstream call (queue wait + HTTP), counted as the current
+        tool call's upstream time.
+        """
+        call = _current_call.get()
+        if call is None:
+            yield
+            return
+        call._upstream_started()
+        try:
+            yield
+        finally:
+            call._upstream_finished()
+
+    @contextlib.contextmanager
+    def upstream_request(self, upstream: str, endpoint: str, queued_at: float | None = None):
+        """
+        Around one HTTP request; set `.status` on the yielded object (exceptions are
+        recorded by type name).
+        """
+        request = _Request()
+        started = time.perf_counter()
+        try:
+            yield request
+        except BaseException as e:
+            if request.status is None:
+                request.status = type(e).__name__
+            raise
+        finally:
+            stats = self.upstreams.get((upstream, endpoint))
+            if stats is None:
+                stats = self.upstreams[(upstream, endpoint)] = _UpstreamStats()
+            stats.statuses[str(request.status)] += 1
+            stats.latency.observe(time.perf_counter() - started)
+            if queued_at is not None:
+                stats.queue_wait.observe(started - queued_at)
+
+    def snapshot(self) -> dict:
+        tools = {}
+        for name, stats in sorted(self.tools.items()):
+            tools[name] = {
+                "calls": stats.calls,
+                "errors": dict(stats.errors),
+                "latency_ms": stats.latency.summary(1000),
+                "upstream_ms": stats.upstream.summary(1000),
+                "local_ms": stats.local.summary(1000),
+                "response_bytes": {
+                    **stats.response_bytes.summary(digits=0),
+                    "total": int(stats.response_bytes.sum),
+                },
+            }
+        upstreams = {}
+        for (upstream, endpoint), stats in sorted(self.upstreams.items()):
+            upstreams[f"{upstream} {endpoint}"] = {
+                "requests": sum(stats.statuses.values()),
+                "status": dict(stats.statuses),
+                "latency_ms": stats.latency.summary(1000),
+                "queue_wait_ms": stats.queue_wait.summary(1000),
+            }
+        return {
+            "server": self.server,
+            "uptime_s": round(time.time() - self.started_at, 1),
+            "tools": tools,
+            "upstreams": upstreams,
+            "caches": {c.name: c.stats() for c in self._caches},
+            "schedulers": {s.name: s.stats() for s in self._schedulers},
+            "endpoint_pools": {p.name: p.stats() for p in self._pools},
+        }
+
+    def prometheus(self) -> str:
+        """
+        Everything in the Prometheus text exposition format (version 0.0.4).
+        """
+        return prometheus_text(self)
+
+
+def prometheus_text(*registries: Metrics) -> str:
+    """
+    Several registries (e.g. both servers in maps.map_server) in one exposition;
+    each metric family is written once, with a sample per registry.
+    """
+    out: list[str] = []
+
+    def header(name: str, kind: str, help_text: str) -> None:
+        out.append(f"# HELP {name} {help_text}")
+        out.append(f"# TYPE {name} {kind}")
+
+    def sample(name: str, labels: dict, value: float) -> None:
+        out.append(f"{name}{_labels(labels)} {_number(value)}")
+
+    def histogram(name: str, labels: dict, h: Histogram) -> None:
+        cumulative = 0
+        for bound, n in zip(h.bounds, h.counts):
+            cumulative += n
+            sample(f"{name}_bucket", {**labels, "le": _number(bound)}, cumulative)
+        sample(f"{name}_bucket", {**labels, "le": "+Inf"}, h.count)
+        sample(f"{name}_sum", labels, h.sum)
+        sample(f"{name}_count", labels, h.count)
+
+    header("maps_uptime_seconds", "gauge", "Seconds since the server started.")
+    for m in registries:
+        sample("maps_uptime_seconds", {"server": m.server}, time.time() - m.started_at)
+
+    header("maps_tool_calls_total", "counter", "Tool calls.")
+    for m in registries:
+        for tool, stats in sorted(m.tools.items()):
+            sample("maps_tool_calls_total", {"server": m.server, "tool": tool}, stats.calls)
+    header("maps_tool_errors_total", "counter", "Failed tool calls by exception type.")
+    for m in registries:
+        for tool, stats in sorted(m.tools.items()):
+            for error, n in sorted(stats.errors.items()):
+                sample("maps_tool_errors_total", {"server": m.server, "tool": tool, "type": error}, n)
+    for metric, attr, help_text in (
+        ("maps_tool_duration_seconds", "latency", "Tool call latency."),
+        ("maps_tool_upstream_seconds", "upstream", "Part of the tool latency spent waiting on upstreams."),
+        ("maps_tool_local_seconds", "local", "Part of the tool latency spent in the server itself."),
+        ("maps_tool_response_bytes", "response_bytes", "Size of the tool response text."),
+    ):
+        header(metric, "histogram", help_text)
+        for m in registries:
+            for tool, stats in sorted(m.tools.items()):
+                histogram(metric, {"server": m.server, "tool": tool}, getattr(stats, attr))
+
+    header("maps_upstream_requests_total", "counter", "Upstream HTTP requests by status (or exception type).")
+    for m in registries:
+        for (upstream, endpoint), stats in sorted(m.upstreams.items()):
+            for status, n in sorted(stats.statuses.items()):
+                labels = {"server": m.server, "upstream": upstream, "endpoint": endpoint, "status": status}
+                sample("maps_upstream_requests_total", labels, n)
+    for metric, attr, help_text in (
+        ("maps_upstream_request_seconds", "latency", "Upstream HTTP request latency."),
+        ("maps_upstream_queue_wait_seconds", "queue_wait", "Time spent in the scheduler queue before sending."),
+    ):
+        header(metric, "histogram", help_text)
+        for m in registries:
+            for (upstream, endpoint), stats in sorted(m.upstreams.items()):
+                labels = {"server": m.server, "upstream": upstream, "endpoint": endpoint}
+                histogram(metric, labels, getattr(stats, attr))
+
+    cache_stats = [(m.server, c.stats()) for m in registries for c in m._caches]
+    for key, kind, help_text in (
+        ("hits", "counter", "Cache hits (memory or disk)."),
+        ("misses", "counter", "Cache misses."),
+        ("disk_hits", "counter", "Cache hits served by the disk tier."),
+        ("evictions", "counter", "Entries evicted from the cache."),
+        ("memory_size", "gauge", "Entries in the memory tier."),
+    ):
+        name = f"maps_cache_{key}" + ("_total" if kind == "counter" else "")
+        header(name, kind, help_text)
+        for server, stats in cache_stats:
+            sample(name, {"server": server, "cache": stats["name"]}, stats[key])
+
+    scheduler_stats = [(m.server, s.stats()) for m in registries for s in m._schedulers]
+    for key, kind, help_text in (
+        ("queued", "gauge", "Requests waiting in the upstream queue."),
+        ("running", "gauge", "Upstream requests in flight."),
+        ("submitted", "counter", "Requests submitted to the scheduler."),
+        ("coalesced", "counter", "Requests that joined an identical in-flight request."),
+        ("rejected", "counter", "Requests rejected because the queue was full."),
+        ("expired", "counter", "Requests that timed out in the queue."),
+    ):
+        name = f"maps_scheduler_{key}" + ("_total" if kind == "counter" else "")
+        header(name, kind, help_text)
+        for server, stats in scheduler_stats:
+            sample(name, {"server": server, "upstream": stats["name"]}, stats[key])
+
+    pool_stats = [(m.server, p.stats()) for m in registries for p in m._pools]
+    for key, kind, help_text in (
+        ("hedged", "counter", "Requests that were also sent to a second endpoint."),
+        ("retried", "counter", "Retried upstream attempts."),
+    ):
+        name = f"maps_upstream_{key}_total"
+        header(name, kind, help_text)
+        for server, stats in pool_stats:
+            sample(name, {"server": server, "upstream": stats["name"]}, stats[key])
+    for key, name, kind, help_text, scale in (
+        ("requests", "maps_endpoint_requests_total", "counter", "Requests sent to one endpoint of a pool.", 1),
+        ("errors", "maps_endpoint_errors_total", "counter", "Failed requests (transport error or 5xx).", 1),
+        ("hedge_wins", "maps_endpoint_hedge_wins_total", "counter", "Hedged requests it answered first.", 1),
+        ("circuit_opened", "maps_endpoint_circuit_opened_total", "counter", "Times its circuit breaker opened.", 1),
+        ("ewma_ms", "maps_endpoint_latency_ewma_seconds", "gauge", "EWMA latency of the endpoint.", 0.001),
+        ("error_rate", "maps_endpoint_error_rate", "gauge", "EWMA error rate of the endpoint.", 1),
+    ):
+        header(name, kind, help_text)
+        for server, stats in pool_stats:
+            for endpoint in stats["endpoints"]:
+                if endpoint[key] is not None:
+                    labels = {"server": server, "upstream": stats["name"], "endpoint": endpoint["url"]}
+                    sample(name, labels, endpoint[key] * scale)
+    header("maps_endpoint_up", "gauge", "1 while the endpoint's circuit breaker lets requests through.")
+    for server, stats in pool_stats:
+        for endpoint in stats["endpoints"]:
+            labels = {"server": server, "upstream": stats["name"], "endpoint": endpoint["url"]}
+            sample("maps_endpoint_up", labels, 0 if endpoint["state"] == "open" else 1)
+
+    return "\n".join(out) + "\n"
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+class MetricsExporter:
+    """
+    Optional Prometheus outputs for one Metrics registry (or several, in one exposition):
+      port → tiny HTTP endpoint answering GET /metrics
+      path → text file rewritten every `interval` seconds and on shutdown
+             (e.g. for node_exporter's textfile collector)
+    """
+
+    def __init__(
+        self,
+        metrics: Metrics | tuple[Metrics, ...],
+        port: int = 0,
+        path: str | None = None,
+        interval: float = 15.0,
+        host: str = "127.0.0.1",
+    ):
+        self.registries = metrics if isinstance(metrics, tuple) else (metrics,)
+        self.port = port
+        self.path = path
+        self.interval = interval
+        self.host = host
+        self._server: asyncio.AbstractServer | None = None
+        self._dumper: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        if self.port:
+            self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        if self.path:
+            self._dumper = asyncio.create_task(self._dump_loop())
+
+    async def aclose(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._dumper is not None:
+            self._dumper.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._dumper
+            self.dump()
+
+    def dump(self) -> None:
+        # write + rename so a scraper never reads a half-written file
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            f.write(prometheus_text(*self.registries))
+        os.replace(tmp, self.path)
+
+    async def _dump_loop(self) -> None:
+        while True:
+            self.dump()
+            await asyncio.sleep(self.interval)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            # skip the headers, nothing in them matters here
+            while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+                status, body = "200 OK", prometheus_text(*self.registries).encode()
+            else:
+                status, body = "404 Not Found", b"only GET /metrics is served here\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+                + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
@@ -0,0 +1,125 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import functools
+import json
+
+from maps.config import env_int, env_str
+
+try:
+    import orjson
+except ImportError:  # optional, `pip install orjson`
+    orjson = None
+
+# Keeping big responses from stalling the event loop that serves every MCP request.
+# A 1000x1000 matrix takes ~70 ms to turn into nested lists and ~1.2 s to json.dumps;
+# meanwhile every other tool call (and the stdio/HTTP transport) waits.
+#   - codec: orjson when installed (MAPS_JSON_CODEC=auto|orjson|json), about 10x
+#     faster than the json module both for upstream bodies and for our results
+#   - results with at least MAPS_OFFLOAD_MIN_ITEMS values are built and serialized
+#     in a small worker pool (MAPS_OFFLOAD_WORKERS threads, 0 = never offload)
+#   - big values are encoded one row at a time: json and orjson keep the GIL for a
+#     whole call, so one giant dumps() in a thread would still freeze the loop,
+#     while row-sized calls let it run in between
+# Upstream bodies stay parsed inline: an OSRM table tile is a few ms with json,
+# well under one with orjson, and one C call can't be split up anyway.
+
+JSON_CODECS = {"auto", "orjson", "json"}
+JSON_CODEC = env_str("MAPS_JSON_CODEC", "auto")
+if JSON_CODEC not in JSON_CODECS:
+    raise ValueError(f"Unknown MAPS_JSON_CODEC '{JSON_CODEC}' (use one of {sorted(JSON_CODECS)})")
+if JSON_CODEC == "orjson" and orjson is None:
+    raise RuntimeError("MAPS_JSON_CODEC=orjson needs the 'orjson' package (pip install orjson)")
+# None → the json module
+FAST_JSON = orjson if JSON_CODEC != "json" else None
+
+OFFLOAD_MIN_ITEMS = env_int("MAPS_OFFLOAD_MIN_ITEMS", 20_000)
+OFFLOAD_WORKERS = env_int("MAPS_OFFLOAD_WORKERS", 2)
+
+_pool: concurrent.futures.ThreadPoolExecutor | None = None
+
+
+def loads(data: bytes | str):
+    if FAST_JSON is not None:
+        return FAST_JSON.loads(data)
+    return json.loads(data)
+
+
+def dumps(value) -> str:
+    """
+    Compact JSON text (non-ASCII kept as is).
+    """
+    if FAST_JSON is not None:
+        try:
+            return FAST_JSON.dumps(value, option=FAST_JSON.OPT_NON_STR_KEYS | FAST_JSON.OPT_SERIALIZE_NUMPY).decode()
+        except TypeError:
+            pass  # something only the json module handles (ints over 64 bits, ...)
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+
+def _write(value, parts: list[str]) -> None:
+    if isinstance(value, dict) and value:
+        parts.append("{")
+        for i, (key, item) in enumerate(value.items()):
+            parts.append("," if i else "")
+            parts.append(dumps(key if isinstance(key, str) else str(key)))
+            parts.append(":")
+            _write(item, parts)
+        parts.append("}")
+    elif isinstance(value, list) and value and isinstance(value[0], (list, dict)):
+        parts.append("[")
+        for i, item in enumerate(value):
+            parts.append("," if i else "")
+            _write(item, parts)
+        parts.append("]")
+    else:
+        # scalar, or a list of scalars (a matrix row): one encoder call
+        parts.append(dumps(value))
+
+
+def dumps_rows(value) -> str:
+    """
+    Same text as dumps(), written one dict member / list item at a time down to
+    lists of scalars, so no single encoder call runs long.
+    """
+    parts: list[str] = []
+    _write(value, parts)
+    return "".join(parts)
+
+
+def weight(value, limit: int) -> int:
+    """
+    Number of scalar values in `value`, counted only up to about `limit`.
+    """
+    if isinstance(value, dict):
+        items = value.values()
+    elif isinstance(value, list):
+        if not value or not isinstance(value[0], (list, dict)):
+            return len(value)
+        items = value
+    else:
+        return 1
+    total = 0
+    for item in items:
+        total += weight(item, limit - total)
+        if total >= limit:
+            break
+    return total
+
+
+def is_heavy(value) -> bool:
+    return OFFLOAD_MIN_ITEMS > 0 and weight(value, OFFLOAD_MIN_ITEMS) >= OFFLOAD_MIN_ITEMS
+
+
+async def offload(fn, *args, items: int):
+    """
+    fn(*args) in the worker pool when it handles at least OFFLOAD_MIN_ITEMS
+    values, else right here. Context variables (metrics, tracing) carry over.
+    """
+    global _pool
+    if OFFLOAD_WORKERS <= 0 or OFFLOAD_MIN_ITEMS <= 0 or items < OFFLOAD_MIN_ITEMS:
+        return fn(*args)
+    if _pool is None:
+        _pool = concurrent.futures.ThreadPoolExecutor(OFFLOAD_WORKERS, thread_name_prefix="maps-offload")
+    call = functools.partial(contextvars.copy_context().run, fn, *args)
+    return await asyncio.get_running_loop().run_in_executor(_pool, call)
@@ -0,0 +1,263 @@
+import json
+import secrets
+
+import mcp.types as types
+
+from maps.cache import TTLCache
+from maps.config import env_flag, env_float, env_int
+from maps.offload import OFFLOAD_MIN_ITEMS, dumps, dumps_rows, is_heavy, offload, weight
+
+# Shared output layer for the map tools. Every tool builds a plain dict and hands
+# it to render(), which applies the caller's output options:
+#   - fields: keep only these (dotted) paths, e.g. ["distance_m", "results.lat"]
+#   - compact JSON (MAPS_OUTPUT_PRETTY=1 brings back indent=2)
+#   - max_bytes: response budget (default MAPS_OUTPUT_MAX_BYTES, 0 = no limit,
+#     which is also the default: budgets are opt-in). A result over budget is cut into pages along the tool's row-like lists
+#     (results, rows, legs, ...). The full result stays in memory for
+#     MAPS_PAGE_TTL seconds and `next_cursor` returns the next page without
+#     running the tool again. Whatever still doesn't fit (one huge geometry, a
+#     tool without rows) is trimmed deterministically, largest member first:
+#     lists keep a prefix and strings are dropped. Each cut is listed under
+#     "omitted", so the result never looks complete when it isn't. Packed matrices
+#     (encoding float32/uint32) are always sent whole: a cut buffer is useless.
+#     The budget counts the compact form, also when MAPS_OUTPUT_PRETTY is set.
+# Big results are projected, paged and serialized off the event loop (maps/offload.py).
+# Bigger results bloat stdio traffic and every later LLM turn that carries them in context.
+
+OUTPUT_MAX_BYTES = env_int("MAPS_OUTPUT_MAX_BYTES", 0)
+OUTPUT_PRETTY = env_flag("MAPS_OUTPUT_PRETTY", False)
+
+# full results behind a next_cursor
+PAGES = TTLCache("pages", max_size=env_int("MAPS_PAGE_MAX_RESULTS", 16), ttl=env_float("MAPS_PAGE_TTL", 600.0))
+
+OUTPUT_PROPERTIES = {
+    "fields": {
+        "type": "array",
+        "items": {"type": "string"},
+        "description": (
+            "Only return these fields. Dotted paths reach into nested objects and lists, "
+            "e.g. ['distance_m', 'duration_s'] or ['results.lat', 'results.lon']."
+        ),
+    },
+    "max_bytes": {
+        "type": "integer",
+        "description": (
+            f"Response size budget in bytes (default {OUTPUT_MAX_BYTES}, 0 = no limit). Larger results "
+            "come in pages: call again with the same arguments plus `cursor` = page.next_cursor. "
+            "Packed matrices (float32/uint32) are always returned whole."
+        ),
+    },
+    "cursor": {
+        "type": "string",
+        "description": "page.next_cursor from the previous call, to get the next page.",
+    },
+}
+
+
+def with_output_options(tools: list[types.Tool]) -> list[types.Tool]:
+    """
+    Add the fields / max_bytes / cursor arguments to every tool but server_stats.
+    """
+    for tool in tools:
+        if tool.name != "server_stats":
+            tool.inputSchema.setdefault("properties", {}).update(OUTPUT_PROPERTIES)
+    return tools
+
+
+def _dumps(value) -> str:
+    # compact; big values one row at a time so a worker thread doesn't hog the GIL
+    return dumps_rows(value) if is_heavy(value) else dumps(value)
+
+
+def _size(value) -> int:
+    return len(_dumps(value).encode())
+
+
+def _format(value, compact: str | None = None) -> str:
+    if OUTPUT_PRETTY:
+        return json.dumps(value, indent=2, ensure_ascii=False)
+    return compact if compact is not None else _dumps(value)
+
+
+def project(result: dict, fields: list[str]) -> dict:
+    """
+    Copy of `result` with only the given dotted paths; a path through a list
+    applies to each of its items.
+    """
+    tree: dict = {}
+    for field in fields:
+        # tree of wanted keys; None = keep this whole value
+        node = tree
+        *parents, leaf = field.split(".")
+        for part in parents:
+            if node.get(part, {}) is None:
+                break  # a shorter path already keeps all of it
+            node = node.setdefault(part, {})
+        else:
+            node[leaf] = None
+
+    unknown = sorted(set(tree) - set(result))
+    if unknown:
+        raise ValueError(f"Unknown field(s) {unknown}; available: {list(result)}")
+
+    def apply(value, node):
+        if node is None:
+            return value
+        if isinstance(value, list):
+            return [apply(item, node) for item in value]
+        if isinstance(value, dict):
+            return {key: apply(item, node[key]) for key, item in value.items() if key in node}
+        return value
+
+    return apply(result, tree)
+
+
+def _trim(container, path: str, omitted: list) -> bool:
+    """
+    Shrink the largest member of `container` one step (copy-on-write, so cached
+    results aren't touched). False when there is nothing left to cut.
+    """
+    items = container.items() if isinstance(container, dict) else enumerate(container)
+    candidates = [
+        (_size(value), key, value)
+        for key, value in items
+        if isinstance(value, (str, list, dict)) and not (path == "" and key in ("page", "omitted"))
+    ]
+    if not candidates:
+        return False
+    size, key, value = max(candidates, key=lambda c: c[0])
+    where = f"{path}.{key}" if path else str(key)
+
+    if isinstance(value, list) and len(value) > 1:
+        container[key] = value[: len(value) // 2]
+        entry = next((e for e in omitted if e["field"] == where), None)
+        if entry is None:
+            omitted.append({"field": where, "kept": len(value) // 2, "total": len(value)})
+        else:
+            entry["kept"] = len(value) // 2
+        return True
+    if isinstance(value, (list, dict)) and value:
+        copy = list(value) if isinstance(value, list) else dict(value)
+        container[key] = copy
+        if _trim(copy, where, omitted):
+            return True
+    if value is None or size <= 4:
+        return False
+    container[key] = None
+    omitted.append({"field": where, "bytes": size})
+    return True
+
+
+def _shrink(body: dict, budget: int) -> dict:
+    body = dict(body)
+    omitted: list = []
+    body["omitted"] = omitted
+    while _size(body) > budget and _trim(body, "", omitted):
+        pass
+    if not omitted:
+        del body["omitted"]
+    return body
+
+
+def _packed(value) -> bool:
+    # a base64 matrix from maps.encoding.pack_matrix
+    return isinstance(value, dict) and "dtype" in value and "data" in value
+
+
+def _row_sizes(result: dict, keys: list[str]) -> dict[str, list[int]]:
+    return {key: [_size(row) for row in result[key]] for key in keys}
+
+
+def _page(result: dict, keys: list[str], sizes: dict, offset: int, budget: float, token: str) -> dict:
+    total = max(len(result[key]) for key in keys)
+    if offset >= total:
+        raise ValueError(f"Cursor offset {offset} is past the end of the result ({total} rows)")
+
+    def build(count: int) -> dict:
+        body = {key: value[offset : offset + count] if key in keys else value for key, value in result.items()}
+        end = min(offset + count, total)
+        body["page"] = {
+            "offset": offset,
+            "count": end - offset,
+            "total": total,
+            "next_cursor": f"{token}.{end}" if end < total else None,
+        }
+        return body
+
+    # as many rows as fit (at least one), from the precomputed row sizes
+    used = _size(build(0))
+    count = 0
+    while offset + count < total:
+        i = offset + count
+        # the row itself plus a comma in every list after the first row
+        row = sum(sizes[key][i] + (count > 0) for key in keys if i < len(sizes[key]))
+        if count and used + row > budget:
+            break
+        used += row
+        count += 1
+    body = build(count)
+    # the page header's numbers can be a few digits longer than in the estimate
+    while count > 1 and _size(body) > budget:
+        count -= 1
+        body = build(count)
+    return body if _size(body) <= budget else _shrink(body, budget)
+
+
+def _budget(arguments: dict) -> int:
+    budget = arguments.get("max_bytes")
+    return OUTPUT_MAX_BYTES if budget is None else max(int(budget), 0)
+
+
+def _render(result: dict, arguments: dict, page: tuple[str, ...]) -> tuple[str, tuple | None]:
+    """
+    (text, page entry to store or None); runs in the worker pool for big results.
+    """
+    fields = arguments.get("fields")
+    if fields:
+        result = project(result, fields)
+    budget = _budget(arguments)
+    if not budget or any(_packed(result.get(key)) for key in page):
+        # packed matrices can't be split by rows, and a cut buffer can't be decoded
+        return _format(result), None
+    # every value takes at least a byte: past that there's no need to encode it all first
+    if weight(result, budget) < budget:
+        text = _dumps(result)
+        if len(text.encode()) <= budget:
+            return _format(result, text), None
+
+    keys = [key for key in page if isinstance(result.get(key), list) and result[key]]
+    if keys and max(len(result[key]) for key in keys) > 1:
+        token = secrets.token_hex(8)
+        stored = {"result": result, "keys": keys, "sizes": _row_sizes(result, keys)}
+        return _format(_page(result, keys, stored["sizes"], 0, budget, token)), (token, stored)
+    return _format(_shrink(result, budget)), None
+
+
+async def render(result: dict, arguments: dict, page: tuple[str, ...] = ()) -> list[types.TextContent]:
+    """
+    Tool result → TextContent, with the caller's `fields` / `max_bytes` applied.
+    `page` names the result's parallel row lists (e.g. ("sources", "durations",
+    "distances")) that may be split into pages when it is over budget.
+    """
+    text, stored = await offload(_render, result, arguments, page, items=weight(result, OFFLOAD_MIN_ITEMS))
+    if stored is not None:
+        PAGES.set(*stored)
+    return [types.TextContent(type="text", text=text)]
+
+
+async def next_page(arguments: dict) -> list[types.TextContent]:
+    """
+    The page a `cursor` points at, from the stored result (the tool doesn't run again).
+    """
+    token, _, offset = str(arguments["cursor"]).partition(".")
+    stored = PAGES.get(token)
+    if stored is None or not offset.isdigit():
+        raise ValueError("Unknown or expired cursor; call the tool again without `cursor`.")
+    budget = _budget(arguments) or float("inf")
+
+    def page_text() -> str:
+        body = _page(stored["result"], stored["keys"], stored["sizes"], int(offset), budget, token)
+        return _format(body)
+
+    text = await offload(page_text, items=weight(stored["result"], OFFLOAD_MIN_ITEMS))
+    return [types.TextContent(type="text", text=text)]
@@ -0,0 +1,218 @@
+import json
+import math
+import os
+
+import numpy as np
+
+# Road segment index for nearest_road / snap_points on the local backend.
+#
+# Written by maps.local_router.build_graph next to the graph arrays:
+#   seg_a, seg_b      segment end nodes (indices into node_lat / node_lon)
+#   seg_name          index into road_names.json (-1 = unnamed)
+#   seg_cell_keys     sorted grid cell keys, seg_cell_starts where each cell's run begins,
+#   seg_cell_ids      segment ids per cell (a segment is listed in every cell its bbox touches)
+# Snapping gathers the candidate segments of the cells around each point and computes
+# point-to-segment distances for all (point, candidate) pairs at once with numpy.
+
+SEGMENT_CELL_DEG = 0.002  # ≈ 200 m cells
+M_PER_DEG = 111_320.0
+# points snapped per vectorized pass (bounds the size of the candidate pair arrays)
+SNAP_CHUNK = 2048
+
+
+def build_segment_index(
+    lat: np.ndarray,
+    lon: np.ndarray,
+    seg_a: np.ndarray,
+    seg_b: np.ndarray,
+    seg_name: np.ndarray,
+    names: list[str],
+    out_dir: str,
+) -> dict:
+    """
+    Save the segment arrays + grid into `out_dir`; returns the grid description for meta.json.
+    """
+    lat0, lon0 = float(lat.min()), float(lon.min())
+    rows = int((lat.max() - lat0) / SEGMENT_CELL_DEG) + 1
+    cols = int((lon.max() - lon0) / SEGMENT_CELL_DEG) + 1
+
+    def cell(values: np.ndarray, origin: float) -> np.ndarray:
+        return ((values - origin) // SEGMENT_CELL_DEG).astype(np.int64)
+
+    r_a, r_b = cell(lat[seg_a], lat0), cell(lat[seg_b], lat0)
+    c_a, c_b = cell(lon[seg_a], lon0), cell(lon[seg_b], lon0)
+    r0, r1 = np.minimum(r_a, r_b), np.maximum(r_a, r_b)
+    c0, c1 = np.minimum(c_a, c_b), np.maximum(c_a, c_b)
+    n_rows, n_cols = r1 - r0 + 1, c1 - c0 + 1
+    counts = n_rows * n_cols
+
+    # expand every segment into the cells of its bbox: (segment, k) → (row, col)
+    seg = np.repeat(np.arange(len(seg_a), dtype=np.int64), counts)
+    k = np.arange(len(seg)) - np.repeat(np.cumsum(counts) - counts, counts)
+    row = r0[seg] + k // n_cols[seg]
+    col = c0[seg] + k % n_cols[seg]
+    keys = row * cols + col
+
+    order = np.argsort(keys, kind="stable")
+    cell_keys, starts = np.unique(keys[order], return_index=True)
+
+    arrays = {
+        "seg_a": seg_a.astype(np.int32),
+        "seg_b": seg_b.astype(np.int32),
+        "seg_name": seg_name.astype(np.int32),
+        "seg_cell_keys": cell_keys,
+        "seg_cell_starts": np.append(starts, len(keys)).astype(np.int64),
+        "seg_cell_ids": seg[order].astype(np.int32),
+    }
+    for name, arr in arrays.items():
+        np.save(os.path.join(out_dir, f"{name}.npy"), arr)
+    with open(os.path.join(out_dir, "road_names.json"), "w", encoding="utf-8") as f:
+        json.dump(names, f, ensure_ascii=False)
+
+    return {
+        "segments": len(seg_a),
+        "grid": {"lat0": lat0, "lon0": lon0, "cell_deg": SEGMENT_CELL_DEG, "rows": rows, "cols": cols},
+    }
+
+
+class RoadIndex:
+    """
+    Memory-mapped segment grid of one graph folder (see `build_segment_index`).
+    """
+
+    def __init__(self, graph_dir: str):
+        with open(os.path.join(graph_dir, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if "roads" not in meta:
+            raise ValueError(
+                f"Graph in '{graph_dir}' has no road segment index; rebuild it with "
+                f"python -m maps.local_router build"
+            )
+        grid = meta["roads"]["grid"]
+        self.lat0, self.lon0 = grid["lat0"], grid["lon0"]
+        self.cell_deg = grid["cell_deg"]
+        self.rows, self.cols = grid["rows"], grid["cols"]
+        # a ring of cells is at least this many meters wide in every direction
+        lat_max = max(abs(meta["bbox"][0]), abs(meta["bbox"][2]))
+        self.cell_m = self.cell_deg * M_PER_DEG * math.cos(math.radians(lat_max))
+
+        def load(name: str) -> np.ndarray:
+            return np.load(os.path.join(graph_dir, f"{name}.npy"), mmap_mode="r")
+
+        self.node_lat = load("node_lat")
+        self.node_lon = load("node_lon")
+        self.seg_a = load("seg_a")
+        self.seg_b = load("seg_b")
+        self.seg_name = load("seg_name")
+        self.cell_keys = load("seg_cell_keys")
+        self.cell_starts = load("seg_cell_starts")
+        self.cell_ids = load("seg_cell_ids")
+        with open(os.path.join(graph_dir, "road_names.json"), encoding="utf-8") as f:
+            self.names: list[str] = json.load(f)
+
+    @classmethod
+    def load(cls, graph_dir: str) -> "RoadIndex":
+        return cls(graph_dir)
+
+    def name(self, name_id: int) -> str:
+        return self.names[name_id] if name_id >= 0 else ""
+
+    def _candidates(self, rows: np.ndarray, cols: np.ndarray, ring: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        (point position, segment id) pairs for every cell at Chebyshev distance <= ring.
+        """
+        offsets = np.arange(-ring, ring + 1)
+        dr, dc = np.meshgrid(offsets, offsets, indexing="ij")
+        r = rows[:, None] + dr.ravel()
+        c = cols[:, None] + dc.ravel()
+        point = np.broadcast_to(np.arange(len(rows))[:, None], r.shape)
+        valid = (r >= 0) & (r < self.rows) & (c >= 0) & (c < self.cols)
+        keys = (r * self.cols + c)[valid]
+        point = point[valid]
+
+        pos = np.searchsorted(self.cell_keys, keys)
+        pos = np.minimum(pos, len(self.cell_keys) - 1)
+        found = self.cell_keys[pos] == keys
+        pos, point = pos[found], point[found]
+        start = self.cell_starts[pos]
+        lengths = self.cell_starts[pos + 1] - start
+
+        # concatenated aranges start[i]..start[i]+lengths[i]
+        total = int(lengths.sum())
+        seg_pos = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths) + np.repeat(start, lengths)
+        return np.repeat(point, lengths), self.cell_ids[seg_pos]
+
+    def _project(self, lat: np.ndarray, lon: np.ndarray, point: np.ndarray, seg: np.ndarray):
+        """
+        Distance (m) and clamped position t along each candidate segment, in a local
+        equirectangular frame centered on the point.
+        """
+        plat, plon = lat[point], lon[point]
+        a, b = self.seg_a[seg], self.seg_b[seg]
+        kx = (np.cos(np.radians(lat)) * M_PER_DEG)[point]
+        ax = (self.node_lon[a] - plon) * kx
+        ay = (self.node_lat[a] - plat) * M_PER_DEG
+        dx = (self.node_lon[b] - plon) * kx - ax
+        dy = (self.node_lat[b] - plat) * M_PER_DEG - ay
+        length2 = dx * dx + dy * dy
+        with np.errstate(invalid="ignore", divide="ignore"):
+            t = np.where(length2 > 0, -(ax * dx + ay * dy) / length2, 0.0)
+        t = np.clip(t, 0.0, 1.0)
+        return np.hypot(ax + t * dx, ay + t * dy), t
+
+    def snap(self, lats, lons, max_distance_m: float = 5000.0) -> dict:
+        """
+        Nearest road segment for every point.
+
+        Returns arrays: lat, lon (snapped), distance_m and name_id; points with no road
+        within `max_distance_m` get NaN / -1.
+        """
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        n = len(lats)
+        out = {
+            "lat": np.full(n, np.nan),
+            "lon": np.full(n, np.nan),
+            "distance_m": np.full(n, np.nan),
+            "name_id": np.full(n, -1, dtype=np.int64),
+        }
+        max_ring = max(1, math.ceil(max_distance_m / self.cell_m))
+        for lo in range(0, n, SNAP_CHUNK):
+            self._snap_chunk(lats, lons, np.arange(lo, min(lo + SNAP_CHUNK, n)), max_ring, max_distance_m, out)
+        return out
+
+    def _snap_chunk(self, lats, lons, todo: np.ndarray, max_ring: int, max_distance_m: float, out: dict) -> None:
+        rows = ((lats[todo] - self.lat0) // self.cell_deg).astype(np.int64)
+        cols = ((lons[todo] - self.lon0) // self.cell_deg).astype(np.int64)
+        # points farther than max_ring cells outside the grid can't have a match
+        near = (rows >= -max_ring) & (rows < self.rows + max_ring) & (cols >= -max_ring) & (cols < self.cols + max_ring)
+        todo, rows, cols = todo[near], rows[near], cols[near]
+        ring = 1
+        while len(todo) and ring <= max_ring:
+            point, seg = self._candidates(rows, cols, ring)
+            done = np.zeros(len(todo), dtype=bool)
+            if len(point):
+                dist, t = self._project(lats[todo], lons[todo], point, seg)
+                # pairs come grouped by point → per-group minimum, then the first pair hitting it
+                starts = np.flatnonzero(np.r_[True, point[1:] != point[:-1]])
+                best = np.minimum.reduceat(dist, starts)
+                hit = np.flatnonzero(dist == np.repeat(best, np.diff(np.r_[starts, len(point)])))
+                _, first = np.unique(point[hit], return_index=True)
+                pick = hit[first]
+                point, seg, dist, t = point[pick], seg[pick], dist[pick], t[pick]
+
+                # anything within `ring` cells is guaranteed to be in the searched area;
+                # a farther best hit might still lose to a segment in the next ring
+                sure = (dist <= ring * self.cell_m) | (ring == max_ring)
+                sure &= dist <= max_distance_m
+                point, seg, dist, t = point[sure], seg[sure], dist[sure], t[sure]
+                idx = todo[point]
+                a, b = self.seg_a[seg], self.seg_b[seg]
+                out["lat"][idx] = self.node_lat[a] + t * (self.node_lat[b] - self.node_lat[a])
+                out["lon"][idx] = self.node_lon[a] + t * (self.node_lon[b] - self.node_lon[a])
+                out["distance_m"][idx] = dist
+                out["name_id"][idx] = self.seg_name[seg]
+                done[point] = True
+            todo, rows, cols = todo[~done], rows[~done], cols[~done]
+            # doubling keeps far-away points from costing one pass per ring
+            ring = min(ring * 2, max_ring) if ring < max_ring else ring + 1
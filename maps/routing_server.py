@@ -1,24 +1,150 @@
 import asyncio
 import json
-from typing import List
+import os
+import secrets
+import time
+from typing import TYPE_CHECKING, List
 
 import httpx
 from mcp.server import Server, NotificationOptions
 from mcp.server.models import InitializationOptions
-from mcp.server.stdio import stdio_server
 import mcp.types as types
 
+from maps.cache import TTLCache
+from maps.config import env_float, env_int, env_str
+from maps.encoding import MATRIX_ENCODINGS, decode_polyline, encode_matrix, encode_polyline
+from maps.http_clients import aclose_clients
+from maps.metrics import Metrics, MetricsExporter
+from maps.offload import loads, offload
+from maps.output import next_page, render, with_output_options
+from maps.scheduler import UpstreamScheduler, request_key, retry_after_seconds
+from maps.tracing import Tracer
+from maps.transport import serve
+from maps.upstream_pool import EndpointPool
+
+if TYPE_CHECKING:
+    # numpy and the offline engines are imported on first use, so the server answers
+    # list_tools without paying for them (see maps/map_server.py)
+    import numpy as np
+
+    from maps.local_router import LocalRouter
+    from maps.road_index import RoadIndex
+
 # MCP server for routing-related tools (OSRM wrapper)
 app = Server("routing-server")
 
-# public OSRM instance (good enough for the assignment)
-OSRM_BASE = "https://router.project-osrm.org"
+# public OSRM instance (good enough for the assignment); OSRM_BASE may list several
+# comma-separated instances (see maps/upstream_pool.py)
+OSRM_BASE = env_str("OSRM_BASE", "https://router.project-osrm.org")
+OSRM_TIMEOUT = env_float("OSRM_TIMEOUT", 20.0)
+
+# rate limit / dedupe / queue for OSRM calls (raise OSRM_RATE for a self-hosted OSRM)
+OSRM_SCHEDULER = UpstreamScheduler(
+    "osrm",
+    rate=env_float("OSRM_RATE", 1.0),
+    burst=env_float("OSRM_BURST", 5.0),
+    max_queue=env_int("OSRM_MAX_QUEUE", 256),
+    deadline=env_float("OSRM_QUEUE_DEADLINE", 30.0),
+)
+
+# latency-aware failover, hedging and circuit breaking across those instances;
+# retries and hedges take their tokens from OSRM_SCHEDULER too
+OSRM_POOL = EndpointPool(
+    "osrm",
+    OSRM_BASE,
+    timeout=OSRM_TIMEOUT,
+    retries=env_int("OSRM_RETRIES", 2),
+    hedge_quantile=env_float("OSRM_HEDGE_QUANTILE", 0.95),
+    limiter=OSRM_SCHEDULER,
+)
+
+# "osrm" (HTTP) or "local" (offline graphs built with `python -m maps.local_router build`)
+ROUTING_BACKEND = env_str("ROUTING_BACKEND", "osrm")
+# one subfolder per profile: <LOCAL_GRAPH_DIR>/driving, <LOCAL_GRAPH_DIR>/walking, ...
+LOCAL_GRAPH_DIR = env_str("LOCAL_GRAPH_DIR", "graphs")
+
+# OSRM's --max-table-size (100 on the public server): max coordinates per /table call
+OSRM_TABLE_MAX_COORDS = env_int("OSRM_TABLE_MAX_COORDS", 100)
+# how many /table tiles of one big matrix may be in flight at the same time
+MATRIX_MAX_CONCURRENCY = env_int("MATRIX_MAX_CONCURRENCY", 4)
+
+# route_many: default / max number of pairs routed at the same time
+ROUTE_MANY_CONCURRENCY = env_int("ROUTE_MANY_CONCURRENCY", 4)
+ROUTE_MANY_MAX_CONCURRENCY = env_int("ROUTE_MANY_MAX_CONCURRENCY", 16)
+# profiles where A→B costs the same as B→A (no one-way rules), so reversed pairs are reused
+SYMMETRIC_PROFILES = {"walking"}
+
+# optimize_trip: CPU time budget for improving the stop order
+TRIP_MAX_SECONDS = env_float("TRIP_MAX_SECONDS", 1.0)
+
+# isochrone: sample grid size (points per side before refinement), refinement levels,
+# and a cap on evaluated points per call
+ISOCHRONE_RESOLUTION = env_int("ISOCHRONE_RESOLUTION", 12)
+ISOCHRONE_LEVELS = env_int("ISOCHRONE_LEVELS", 2)
+ISOCHRONE_MAX_POINTS = env_int("ISOCHRONE_MAX_POINTS", 5000)
+# grid points farther than this from a road count as unreachable (sea, parks, ...)
+ISOCHRONE_MAX_SNAP_M = env_float("ISOCHRONE_MAX_SNAP_M", 500.0)
+# generous top speed per profile (km/h): sets how far out the grid has to reach
+ISOCHRONE_SPEEDS_KMH = {"driving": 80.0, "cycling": 20.0, "walking": 6.0}
+
+# match_trace: OSRM's --max-matching-size (100 on the public server) caps points per /match
+# call, so long traces go out in chunks that overlap by MATCH_CHUNK_OVERLAP points
+OSRM_MATCH_MAX_COORDS = env_int("OSRM_MATCH_MAX_COORDS", 100)
+MATCH_CHUNK_OVERLAP = env_int("MATCH_CHUNK_OVERLAP", 10)
+MATCH_MAX_CONCURRENCY = env_int("MATCH_MAX_CONCURRENCY", 4)
+
+# snap_points: points farther than this from any road come back as null
+SNAP_MAX_DISTANCE_M = env_float("SNAP_MAX_DISTANCE_M", 5000.0)
+# snap_points on the OSRM backend = one /nearest per distinct point, this many at a time
+SNAP_MAX_CONCURRENCY = env_int("SNAP_MAX_CONCURRENCY", 4)
+
+# route cache: start/end are rounded to ROUTE_CACHE_PRECISION decimals
+# (4 ≈ 11 m) so "the same trip again" hits even if the coordinates wobble a bit
+ROUTE_CACHE_PRECISION = env_int("ROUTE_CACHE_PRECISION", 4)
+ROUTE_CACHE = TTLCache(
+    "route",
+    max_size=env_int("ROUTE_CACHE_MAX_SIZE", 4096),
+    ttl=env_float("ROUTE_CACHE_TTL", 6 * 3600),
+    # memory only unless a file is given
+    path=env_str("ROUTE_CACHE_PATH", "") or None,
+    eviction=env_str("ROUTE_CACHE_EVICTION", "lru"),
+)
+# duration/distance cells from distance_matrix, reused by route_between (overview=false)
+MATRIX_CELL_CACHE = TTLCache(
+    "matrix_cells",
+    max_size=env_int("MATRIX_CELL_CACHE_MAX_SIZE", 100_000),
+    ttl=env_float("ROUTE_CACHE_TTL", 6 * 3600),
+)
+# matrices bigger than this are not copied cell by cell into the cache
+MATRIX_CELL_CACHE_MAX_CELLS = env_int("MATRIX_CELL_CACHE_MAX_CELLS", 10_000)
+# matrices kept behind a handle (distance_matrix with handle=true) for extend_matrix;
+# a handle unused for MATRIX_HANDLE_TTL seconds, or pushed out by newer ones, is dropped
+MATRIX_HANDLES = TTLCache(
+    "matrix_handles",
+    max_size=env_int("MATRIX_HANDLE_MAX", 32),
+    ttl=env_float("MATRIX_HANDLE_TTL", 1800.0),
+)
+
+# per-tool call/latency/size metrics (server_stats tool), optionally exported in the
+# Prometheus format on ROUTING_METRICS_PORT (GET /metrics) and/or to ROUTING_METRICS_FILE
+METRICS = Metrics("routing-server")
+METRICS.track(OSRM_SCHEDULER, OSRM_POOL, ROUTE_CACHE, MATRIX_CELL_CACHE, MATRIX_HANDLES)
+METRICS_PORT = env_int("ROUTING_METRICS_PORT", 0)
+METRICS_FILE = env_str("ROUTING_METRICS_FILE", "") or None
+METRICS_DUMP_INTERVAL = env_float("METRICS_DUMP_INTERVAL", 15.0)
+
+# serve MCP over HTTP on this port instead of stdio (0 = stdio), see maps/transport.py
+HTTP_PORT = env_int("ROUTING_HTTP_PORT", 0)
+HTTP_HOST = env_str("MAPS_HTTP_HOST", "127.0.0.1")
+
+# spans for tool calls and upstream requests, appended to MAPS_TRACE_FILE (off when unset)
+TRACER = Tracer("routing-server")
 
 
 @app.list_tools()
 async def list_tools() -> List[types.Tool]:
     # advertises all the routing tools this server supports
-    return [
+    tools = [
         types.Tool(
             name="route_between",
             description=(
@@ -43,6 +169,54 @@ async def list_tools() -> List[types.Tool]:
                         "description": "Route overview: 'full' or 'false'.",
                         "default": "false",
                     },
+                    "encoding": {
+                        "type": "string",
+                        "enum": ["json", "polyline"],
+                        "description": (
+                            "'json' (default) or 'polyline': geometry as an encoded polyline "
+                            "(precision 5) and compact JSON output."
+                        ),
+                        "default": "json",
+                    },
+                },
+            },
+        ),
+        types.Tool(
+            name="route_many",
+            description=(
+                "Route a list of specific origin/destination pairs in one call (cheaper than a full "
+                "matrix when only some pairs matter). Returns one compact row per pair."
+            ),
+            inputSchema={
+                "type": "object",
+                "required": ["pairs"],
+                "properties": {
+                    "pairs": {
+                        "type": "array",
+                        "description": "List of [start_lat, start_lon, end_lat, end_lon].",
+                        "items": {
+                            "type": "array",
+                            "items": {"type": "number"},
+                            "minItems": 4,
+                            "maxItems": 4,
+                        },
+                        "minItems": 1,
+                    },
+                    "profile": {
+                        "type": "string",
+                        "description": "Travel mode: driving, walking, cycling.",
+                        "default": "driving",
+                    },
+                    "geometry": {
+                        "type": "boolean",
+                        "description": "Include each route's geometry as an encoded polyline (precision 5).",
+                        "default": False,
+                    },
+                    "fan_out": {
+                        "type": "integer",
+                        "description": "How many pairs to route at the same time.",
+                        "default": ROUTE_MANY_CONCURRENCY,
+                    },
                 },
             },
         ),
@@ -63,16 +237,196 @@ async def list_tools() -> List[types.Tool]:
                 },
             },
         ),
+        types.Tool(
+            name="snap_points",
+            description=(
+                "Snap many coordinates (e.g. a GPS trace) to the nearest road in one call. "
+                "Returns snapped [lat, lon], distance to the input and road name per point."
+            ),
+            inputSchema={
+                "type": "object",
+                "required": ["points"],
+                "properties": {
+                    "points": {
+                        "type": "array",
+                        "description": "List of [lat, lon] pairs.",
+                        "items": {
+                            "type": "array",
+                            "items": {"type": "number"},
+                            "minItems": 2,
+                            "maxItems": 2,
+                        },
+                        "minItems": 1,
+                    },
+                    "profile": {
+                        "type": "string",
+                        "description": "Travel mode: driving, walking, cycling.",
+                        "default": "driving",
+                    },
+                    "max_distance_m": {
+                        "type": "number",
+                        "description": "Points farther than this from any road get null.",
+                        "default": SNAP_MAX_DISTANCE_M,
+                    },
+                },
+            },
+        ),
+        types.Tool(
+            name="optimize_trip",
+            description=(
+                "Find a good visiting order for many stops (e.g. 'visit these 12 cafes'). "
+                "Fetches the travel-time matrix itself and returns the order plus total time/distance."
+            ),
+            inputSchema={
+                "type": "object",
+                "required": ["stops"],
+                "properties": {
+                    "stops": {
+                        "type": "array",
+                        "description": "List of [lat, lon] pairs to visit.",
+                        "items": {
+                            "type": "array",
+                            "items": {"type": "number"},
+                            "minItems": 2,
+                            "maxItems": 2,
+                        },
+                        "minItems": 2,
+                    },
+                    "profile": {
+                        "type": "string",
+                        "description": "Travel mode: driving, walking, cycling.",
+                        "default": "driving",
+                    },
+                    "round_trip": {
+                        "type": "boolean",
+                        "description": "Return to the start stop at the end.",
+                        "default": True,
+                    },
+                    "start": {
+                        "type": ["integer", "null"],
+                        "description": "Index of the first stop (null = let the optimizer choose, open trips only).",
+                        "default": 0,
+                    },
+                    "end": {
+                        "type": ["integer", "null"],
+                        "description": "Index of the last stop for open trips (null = any).",
+                        "default": None,
+                    },
+                    "objective": {
+                        "type": "string",
+                        "enum": ["duration", "distance"],
+                        "description": "What to minimize.",
+                        "default": "duration",
+                    },
+                },
+            },
+        ),
+        types.Tool(
+            name="isochrone",
+            description=(
+                "Areas reachable from a location within given travel times (e.g. 5/10/15 minutes). "
+                "Returns one set of polygons per time band."
+            ),
+            inputSchema={
+                "type": "object",
+                "required": ["lat", "lon"],
+                "properties": {
+                    "lat": {"type": "number", "description": "Origin latitude."},
+                    "lon": {"type": "number", "description": "Origin longitude."},
+                    "profile": {
+                        "type": "string",
+                        "description": "Travel mode: driving, walking, cycling.",
+                        "default": "driving",
+                    },
+                    "minutes": {
+                        "type": "array",
+                        "description": "Time bands in minutes.",
+                        "items": {"type": "number", "exclusiveMinimum": 0},
+                        "minItems": 1,
+                        "default": [5, 10, 15],
+                    },
+                    "resolution": {
+                        "type": "integer",
+                        "description": "Coarse sample grid points per side (refined near band edges).",
+                        "default": ISOCHRONE_RESOLUTION,
+                    },
+                    "refine": {
+                        "type": "integer",
+                        "description": "Refinement levels near band edges (each halves the grid spacing there).",
+                        "default": ISOCHRONE_LEVELS,
+                    },
+                    "encoding": {
+                        "type": "string",
+                        "enum": ["json", "polyline"],
+                        "description": "Rings as [lat, lon] lists ('json', default) or encoded polylines.",
+                        "default": "json",
+                    },
+                },
+            },
+        ),
+        types.Tool(
+            name="match_trace",
+            description=(
+                "Map-match a recorded GPS trace (any length) to the road network using OSRM Match. "
+                "Returns the matched stretches with distance, duration and an encoded polyline geometry."
+            ),
+            inputSchema={
+                "type": "object",
+                "required": ["points"],
+                "properties": {
+                    "points": {
+                        "type": "array",
+                        "description": (
+                            "Trace in recording order: [lat, lon] or [lat, lon, unix_timestamp] items "
+                            "(timestamps are used when every point has one)."
+                        ),
+                        "items": {
+                            "type": "array",
+                            "items": {"type": "number"},
+                            "minItems": 2,
+                            "maxItems": 3,
+                        },
+                        "minItems": 2,
+                    },
+                    "profile": {
+                        "type": "string",
+                        "description": "Travel mode: driving, walking, cycling.",
+                        "default": "driving",
+                    },
+                    "radius_m": {
+                        "type": "number",
+                        "description": "Optional GPS accuracy in meters (search radius per point).",
+                    },
+                    "encoding": {
+                        "type": "string",
+                        "enum": ["polyline", "polyline6", "json"],
+                        "description": (
+                            "'polyline' (default, precision 5), 'polyline6', or 'json' for "
+                            "[lat, lon] lists."
+                        ),
+                        "default": "polyline",
+                    },
+                    "legs": {
+                        "type": "boolean",
+                        "description": "Also return [from_index, to_index, distance_m, duration_s] per leg.",
+                        "default": False,
+                    },
+                },
+            },
+        ),
         types.Tool(
             name="distance_matrix",
-            description="Compute distance/time matrix between coordinates using OSRM Table API.",
+            description=(
+                "Compute distance/time matrix between coordinates using OSRM Table API. "
+                "Pass `coordinates` for an all-to-all matrix, or `sources` + `destinations` "
+                "for a sources x destinations matrix. Large matrices are split into tiles automatically."
+            ),
             inputSchema={
                 "type": "object",
-                "required": ["coordinates"],
                 "properties": {
                     "coordinates": {
                         "type": "array",
-                        "description": "List of [lat, lon] pairs.",
+                        "description": "List of [lat, lon] pairs (all-to-all matrix).",
                         "items": {
                             "type": "array",
                             "items": {"type": "number"},
@@ -81,6 +435,28 @@ async def list_tools() -> List[types.Tool]:
                         },
                         "minItems": 2,
                     },
+                    "sources": {
+                        "type": "array",
+                        "description": "Origin [lat, lon] pairs (rows). Use together with `destinations`.",
+                        "items": {
+                            "type": "array",
+                            "items": {"type": "number"},
+                            "minItems": 2,
+                            "maxItems": 2,
+                        },
+                        "minItems": 1,
+                    },
+                    "destinations": {
+                        "type": "array",
+                        "description": "Destination [lat, lon] pairs (columns). Use together with `sources`.",
+                        "items": {
+                            "type": "array",
+                            "items": {"type": "number"},
+                            "minItems": 2,
+                            "maxItems": 2,
+                        },
+                        "minItems": 1,
+                    },
                     "profile": {
                         "type": "string",
                         "description": "Travel mode: driving, walking, cycling.",
@@ -91,25 +467,291 @@ async def list_tools() -> List[types.Tool]:
                         "description": "duration, distance, or 'distance,duration'.",
                         "default": "duration",
                     },
+                    "encoding": {
+                        "type": "string",
+                        "enum": ["json", "float32", "uint32"],
+                        "description": (
+                            "'json' (default, nested lists) or a packed matrix: base64 of a "
+                            "row-major little-endian float32 or uint32 buffer with a shape header "
+                            "(uint32 rounds to whole seconds/meters, 4294967295 = no route)."
+                        ),
+                        "default": "json",
+                    },
+                    "handle": {
+                        "type": "boolean",
+                        "description": (
+                            "Keep the matrix on the server and return a `handle`, so extend_matrix "
+                            "can add points later without recomputing it."
+                        ),
+                        "default": False,
+                    },
+                },
+            },
+        ),
+        types.Tool(
+            name="extend_matrix",
+            description=(
+                "Add points to a matrix kept by distance_matrix (handle=true): only the new rows "
+                "and columns are computed, and the whole updated matrix is returned. Pass "
+                "`coordinates` to add points to an all-to-all matrix, or `sources` and/or "
+                "`destinations` to add rows and/or columns."
+            ),
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "handle": {
+                        "type": "string",
+                        "description": "`handle` returned by distance_matrix or an earlier extend_matrix.",
+                    },
+                    "coordinates": {
+                        "type": "array",
+                        "description": "New [lat, lon] pairs for an all-to-all matrix.",
+                        "items": {
+                            "type": "array",
+                            "items": {"type": "number"},
+                            "minItems": 2,
+                            "maxItems": 2,
+                        },
+                        "minItems": 1,
+                    },
+                    "sources": {
+                        "type": "array",
+                        "description": "New origin [lat, lon] pairs (rows).",
+                        "items": {
+                            "type": "array",
+                            "items": {"type": "number"},
+                            "minItems": 2,
+                            "maxItems": 2,
+                        },
+                    },
+                    "destinations": {
+                        "type": "array",
+                        "description": "New destination [lat, lon] pairs (columns).",
+                        "items": {
+                            "type": "array",
+                            "items": {"type": "number"},
+                            "minItems": 2,
+                            "maxItems": 2,
+                        },
+                    },
+                    "encoding": {
+                        "type": "string",
+                        "enum": ["json", "float32", "uint32"],
+                        "description": "'json' (default, nested lists) or a packed matrix, as in distance_matrix.",
+                        "default": "json",
+                    },
+                },
+                "required": ["handle"],
+            },
+        ),
+        types.Tool(
+            name="server_stats",
+            description=(
+                "Operational stats of this server: per-tool calls, errors, latency split into "
+                "upstream (OSRM) and local time, response sizes, cache hit ratios and queue state."
+            ),
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "format": {
+                        "type": "string",
+                        "enum": ["json", "prometheus"],
+                        "description": "'json' (default) summary or the Prometheus text format.",
+                        "default": "json",
+                    },
                 },
             },
         ),
     ]
+    # every tool also takes fields / max_bytes / cursor (maps/output.py)
+    return with_output_options(tools)
 
 
-async def _osrm_get(path: str, params: dict | None = None) -> dict:
+async def _osrm_get(
+    path: str, params: dict | None = None, priority: str = "interactive"
+) -> dict:
     """
     Small helper to call OSRM and handle the basic error case.
     """
-    async with httpx.AsyncClient(timeout=20.0) as client:
-        resp = await client.get(f"{OSRM_BASE}{path}", params=params)
-        resp.raise_for_status()
-        data = resp.json()
+
+    queued_at = time.perf_counter()
+    # fetch() runs in the scheduler's dispatcher task, so hand it the caller's span
+    parent = TRACER.current()
+    # "/route/v1/driving/..." → "/route"
+    service = "/" + path.split("/")[1]
+
+    async def fetch() -> dict:
+        # pooled keep-alive clients per instance, best instance first (hedged / retried)
+        with (
+            METRICS.upstream_request("osrm", service, queued_at) as request,
+            TRACER.span(f"osrm {service}", kind="upstream", parent=parent) as span,
+        ):
+            headers = None
+            if span is not None:
+                span.set("wait_ms", round((time.perf_counter() - queued_at) * 1000, 3))
+                headers = span.headers()
+            resp = await OSRM_POOL.get(path, params=params, headers=headers)
+            request.status = resp.status_code
+            if span is not None:
+                span.set("status", resp.status_code)
+                span.set("endpoint", f"{resp.request.url.scheme}://{resp.request.url.netloc.decode()}")
+            if resp.status_code == 429:
+                OSRM_SCHEDULER.pause(retry_after_seconds(resp.headers))
+            resp.raise_for_status()
+            # orjson when installed (maps/offload.py)
+            data = loads(resp.content)
         if data.get("code") != "Ok":
             # if OSRM is unhappy, just raise and let the tool wrapper catch it
             raise RuntimeError(f"OSRM error: {data.get('message')}")
         return data
 
+    with METRICS.upstream_wait():
+        return await OSRM_SCHEDULER.submit(request_key(path, params), fetch, priority=priority)
+
+
+_local_routers: dict[str, "LocalRouter"] = {}
+_road_indexes: dict[str, "RoadIndex"] = {}
+
+
+def _graph_dir(profile: str) -> str:
+    graph_dir = os.path.join(LOCAL_GRAPH_DIR, profile)
+    if not os.path.exists(os.path.join(graph_dir, "meta.json")):
+        raise ValueError(
+            f"No local graph for profile '{profile}' in '{LOCAL_GRAPH_DIR}' "
+            f"(build it with: python -m maps.local_router build <extract.osm> --out {LOCAL_GRAPH_DIR} "
+            f"--profiles {profile})"
+        )
+    return graph_dir
+
+
+def _local_router(profile: str) -> "LocalRouter":
+    """
+    Memory-mapped graph for a profile, loaded on first use.
+    """
+    router = _local_routers.get(profile)
+    if router is None:
+        from maps.local_router import LocalRouter
+
+        router = _local_routers[profile] = LocalRouter.load(_graph_dir(profile))
+    return router
+
+
+def _road_index(profile: str) -> "RoadIndex":
+    """
+    Memory-mapped road segment grid for a profile, loaded on first use.
+    """
+    index = _road_indexes.get(profile)
+    if index is None:
+        from maps.road_index import RoadIndex
+
+        index = _road_indexes[profile] = RoadIndex.load(_graph_dir(profile))
+    return index
+
+
+def _snap(lat: float, lon: float) -> str:
+    # quantized "lat,lon" used inside cache keys
+    p = ROUTE_CACHE_PRECISION
+    return f"{lat:.{p}f},{lon:.{p}f}"
+
+
+def _cell_key(profile: str, src: str, dst: str) -> str:
+    # per backend, like the route cache: OSRM and the offline engine don't give the same cells
+    return f"{ROUTING_BACKEND}|{profile}|{src}|{dst}"
+
+
+def _remember_matrix_cells(
+    profile: str,
+    sources: list,
+    destinations: list,
+    durations: "np.ndarray | None",
+    distances: "np.ndarray | None",
+) -> None:
+    """
+    Copy the cells of a (small enough) matrix into MATRIX_CELL_CACHE.
+    """
+    if len(sources) * len(destinations) > MATRIX_CELL_CACHE_MAX_CELLS:
+        return
+    dur_rows = durations.tolist() if durations is not None else None
+    dist_rows = distances.tolist() if distances is not None else None
+    dst_keys = [_snap(lat, lon) for lat, lon in destinations]
+    for i, (lat, lon) in enumerate(sources):
+        src_key = _snap(lat, lon)
+        for j, dst_key in enumerate(dst_keys):
+            duration = dur_rows[i][j] if dur_rows is not None else None
+            distance = dist_rows[i][j] if dist_rows is not None else None
+            # NaN (no route) is stored as unknown
+            duration = None if duration is None or duration != duration else duration
+            distance = None if distance is None or distance != distance else distance
+            if duration is None and distance is None:
+                continue
+            key = _cell_key(profile, src_key, dst_key)
+            old = MATRIX_CELL_CACHE.peek(key)
+            if old is not None:
+                # a durations-only matrix shouldn't wipe a distance we already know
+                duration = duration if duration is not None else old[0]
+                distance = distance if distance is not None else old[1]
+            MATRIX_CELL_CACHE.set(key, [duration, distance])
+
+
+async def _route(
+    start_lat: float,
+    start_lon: float,
+    end_lat: float,
+    end_lon: float,
+    profile: str = "driving",
+    overview: str = "false",
+    encoding: str = "json",
+    priority: str = "interactive",
+) -> dict:
+    """
+    One cached route (shared by route_between and route_many).
+    """
+    # OSRM expects lon,lat;lon,lat (so I flip the order)
+    coord_str = f"{start_lon},{start_lat};{end_lon},{end_lat}"
+    path = f"/route/v1/{profile}/{coord_str}"
+
+    params = {"overview": overview}
+    if encoding == "polyline":
+        params["geometries"] = "polyline"
+
+    start_key = _snap(start_lat, start_lon)
+    end_key = _snap(end_lat, end_lon)
+    key = (
+        f"route|{ROUTING_BACKEND}|{profile}|{overview}|{params.get('geometries', 'default')}"
+        f"|{start_key}|{end_key}"
+    )
+    result = ROUTE_CACHE.get(key)
+
+    if result is None and overview == "false":
+        # no geometry wanted → a matrix cell with both numbers is as good as a route
+        cell = MATRIX_CELL_CACHE.get(_cell_key(profile, start_key, end_key))
+        if cell is not None and cell[0] is not None and cell[1] is not None:
+            result = {
+                "distance_m": cell[1],
+                "duration_s": cell[0],
+                "legs": None,
+                "geometry": None,
+                "from_matrix": True,
+            }
+
+    if result is None:
+        if ROUTING_BACKEND == "local":
+            route = _local_router(profile).route(
+                start_lat, start_lon, end_lat, end_lon, geometry=overview != "false"
+            )
+        else:
+            data = await _osrm_get(path, params=params, priority=priority)
+            route = data["routes"][0]
+
+        result = {
+            "distance_m": route.get("distance"),
+            "duration_s": route.get("duration"),
+            "legs": route.get("legs"),
+            "geometry": route.get("geometry"),
+        }
+        ROUTE_CACHE.set(key, result)
+    return result
+
 
 async def _tool_route_between(arguments: dict) -> list[types.TextContent]:
     # unpack the arguments passed from the agent
@@ -119,27 +761,85 @@ async def _tool_route_between(arguments: dict) -> list[types.TextContent]:
     end_lon = arguments["end_lon"]
     profile = arguments.get("profile", "driving")
     overview = arguments.get("overview", "false")
+    encoding = arguments.get("encoding", "json")
 
-    # OSRM expects lon,lat;lon,lat (so I flip the order)
-    coord_str = f"{start_lon},{start_lat};{end_lon},{end_lat}"
-    path = f"/route/v1/{profile}/{coord_str}"
+    result = await _route(start_lat, start_lon, end_lat, end_lon, profile, overview, encoding)
+
+    if encoding == "polyline":
+        result = {**result, "geometry_encoding": "polyline5"}
+    return await render(result, arguments)
+
+
+async def _tool_route_many(arguments: dict) -> list[types.TextContent]:
+    # many specific O/D pairs, e.g. a fleet's planned trips
+    pairs = arguments["pairs"]
+    profile = arguments.get("profile", "driving")
+    with_geometry = arguments.get("geometry", False)
+    fan_out = min(max(int(arguments.get("fan_out", ROUTE_MANY_CONCURRENCY)), 1), ROUTE_MANY_MAX_CONCURRENCY)
+    symmetric = profile in SYMMETRIC_PROFILES
+
+    # identical pairs (and reversed ones when the profile is symmetric) are routed once
+    unique: dict[tuple, int] = {}
+    refs: list[tuple[int, bool] | None] = []
+    for pair in pairs:
+        if len(pair) != 4:
+            refs.append(None)
+            continue
+        key = tuple(pair)
+        flipped = (pair[2], pair[3], pair[0], pair[1])
+        reverse = symmetric and flipped < key
+        if reverse:
+            key = flipped
+        refs.append((unique.setdefault(key, len(unique)), reverse))
+
+    semaphore = asyncio.Semaphore(fan_out)
 
-    data = await _osrm_get(path, params={"overview": overview})
+    async def run(key: tuple) -> dict | str:
+        async with semaphore:
+            try:
+                return await _route(
+                    *key,
+                    profile=profile,
+                    overview="full" if with_geometry else "false",
+                    encoding="polyline" if with_geometry else "json",
+                    priority="batch",
+                )
+            except Exception as e:
+                # a pair without a route shouldn't cost the other rows
+                return f"{type(e).__name__}: {e}"
+
+    routes = await asyncio.gather(*(run(key) for key in unique))
+
+    rows: list[list | None] = []
+    errors = []
+    for index, ref in enumerate(refs):
+        route = "expected [start_lat, start_lon, end_lat, end_lon]" if ref is None else routes[ref[0]]
+        if isinstance(route, str):
+            rows.append(None)
+            errors.append([index, route])
+            continue
+        row = [_round(route["distance_m"]), _round(route["duration_s"])]
+        if with_geometry:
+            geometry = route["geometry"]
+            if ref[1] and geometry:
+                geometry = encode_polyline(decode_polyline(geometry)[::-1])
+            row.append(geometry)
+        rows.append(row)
 
-    route = data["routes"][0]
     result = {
-        "distance_m": route.get("distance"),
-        "duration_s": route.get("duration"),
-        "legs": route.get("legs"),
-        "geometry": route.get("geometry"),
+        "count": len(pairs),
+        "unique": len(unique),
+        "columns": ["distance_m", "duration_s"] + (["geometry"] if with_geometry else []),
+        "rows": rows,
+        "errors": errors,
     }
+    if with_geometry:
+        result["geometry_encoding"] = "polyline5"
+    return await render(result, arguments, page=("rows",))
 
-    return [
-        types.TextContent(
-            type="text",
-            text=json.dumps(result, indent=2),
-        )
-    ]
+
+def _round(value: float | None, digits: int = 1) -> float | None:
+    return None if value is None else round(value, digits)
 
 
 async def _tool_nearest_road(arguments: dict) -> list[types.TextContent]:
@@ -148,95 +848,765 @@ async def _tool_nearest_road(arguments: dict) -> list[types.TextContent]:
     lon = arguments["lon"]
     profile = arguments.get("profile", "driving")
 
-    path = f"/nearest/v1/{profile}/{lon},{lat}"
-    data = await _osrm_get(path, params={"number": 1})
+    if ROUTING_BACKEND == "local":
+        import numpy as np
+
+        index = _road_index(profile)
+        snap = index.snap([lat], [lon], max_distance_m=SNAP_MAX_DISTANCE_M)
+        if np.isnan(snap["distance_m"][0]):
+            raise ValueError(f"No road within {SNAP_MAX_DISTANCE_M:.0f} m of ({lat}, {lon})")
+        result = {
+            "snapped_location": {
+                "lon": round(float(snap["lon"][0]), 6),
+                "lat": round(float(snap["lat"][0]), 6),
+            },
+            "distance_to_input_m": round(float(snap["distance_m"][0]), 1),
+            "road_name": index.name(int(snap["name_id"][0])),
+        }
+    else:
+        path = f"/nearest/v1/{profile}/{lon},{lat}"
+        data = await _osrm_get(path, params={"number": 1})
+
+        waypoint = data["waypoints"][0]
+        result = {
+            "snapped_location": {
+                "lon": waypoint["location"][0],
+                "lat": waypoint["location"][1],
+            },
+            "distance_to_input_m": waypoint.get("distance"),
+            "road_name": waypoint.get("name"),
+        }
+
+    return await render(result, arguments)
+
+
+async def _osrm_snap(profile: str, points: list, max_distance_m: float) -> list:
+    """
+    snap_points without a local index: one /nearest per distinct point (batch lane).
+    """
+    semaphore = asyncio.Semaphore(max(1, SNAP_MAX_CONCURRENCY))
+
+    async def nearest(lat: float, lon: float) -> list | None:
+        async with semaphore:
+            try:
+                data = await _osrm_get(
+                    f"/nearest/v1/{profile}/{lon},{lat}", params={"number": 1}, priority="batch"
+                )
+            except httpx.HTTPStatusError as e:
+                # OSRM answers NoSegment (nothing to snap to) with a 400, like /match
+                if e.response.status_code != 400:
+                    raise
+                return None
+            except RuntimeError:
+                # a 200 with a non-Ok code → this point just has no match
+                return None
+        waypoint = data["waypoints"][0]
+        if waypoint.get("distance", 0) > max_distance_m:
+            return None
+        return [waypoint["location"][1], waypoint["location"][0], waypoint.get("distance"), waypoint.get("name")]
+
+    distinct = list(dict.fromkeys((lat, lon) for lat, lon in points))
+    snapped = dict(zip(distinct, await asyncio.gather(*(nearest(*p) for p in distinct))))
+    return [snapped[(lat, lon)] for lat, lon in points]
+
+
+async def _tool_snap_points(arguments: dict) -> list[types.TextContent]:
+    # batched nearest_road, e.g. a whole GPS trace in one go
+    points = arguments["points"]
+    profile = arguments.get("profile", "driving")
+    max_distance_m = arguments.get("max_distance_m", SNAP_MAX_DISTANCE_M)
+
+    if ROUTING_BACKEND == "local":
+        import numpy as np
+
+        index = _road_index(profile)
+        coords = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        snap = await asyncio.to_thread(index.snap, coords[:, 0], coords[:, 1], max_distance_m)
+        rows = [
+            None if dist != dist else [round(lat, 6), round(lon, 6), round(dist, 1), index.name(name_id)]
+            for lat, lon, dist, name_id in zip(
+                snap["lat"].tolist(), snap["lon"].tolist(), snap["distance_m"].tolist(), snap["name_id"].tolist()
+            )
+        ]
+    else:
+        rows = await _osrm_snap(profile, points, max_distance_m)
 
-    waypoint = data["waypoints"][0]
+    # column layout keeps big traces small; null = no road within max_distance_m
     result = {
-        "snapped_location": {
-            "lon": waypoint["location"][0],
-            "lat": waypoint["location"][1],
-        },
-        "distance_to_input_m": waypoint.get("distance"),
-        "road_name": waypoint.get("name"),
+        "count": len(rows),
+        "unmatched": sum(row is None for row in rows),
+        "snapped": [None if row is None else row[:2] for row in rows],
+        "distance_to_input_m": [None if row is None else row[2] for row in rows],
+        "road_name": [None if row is None else row[3] for row in rows],
     }
+    return await render(result, arguments, page=("snapped", "distance_to_input_m", "road_name"))
+
+
+def _coord_str(points: list) -> str:
+    # OSRM expects lon,lat;lon,lat;... so I transform [lat, lon] → "lon,lat"
+    return ";".join(f"{lon},{lat}" for lat, lon in points)
+
+
+def _plan_table_tiles(
+    n_src: int, n_dst: int, max_coords: int
+) -> list[tuple[range, range]]:
+    """
+    Split an n_src x n_dst matrix into (source rows, destination cols) blocks so that
+    every /table request carries at most `max_coords` coordinates.
+    """
+    if n_src + n_dst <= max_coords:
+        return [(range(n_src), range(n_dst))]
+
+    half = max(max_coords // 2, 1)
+    if n_src <= half:
+        src_block, dst_block = n_src, max_coords - n_src
+    elif n_dst <= half:
+        src_block, dst_block = max_coords - n_dst, n_dst
+    else:
+        src_block, dst_block = half, max_coords - half
 
     return [
-        types.TextContent(
-            type="text",
-            text=json.dumps(result, indent=2),
-        )
+        (range(i, min(i + src_block, n_src)), range(j, min(j + dst_block, n_dst)))
+        for i in range(0, n_src, src_block)
+        for j in range(0, n_dst, dst_block)
     ]
 
 
+async def _table_tile(
+    profile: str,
+    src_points: list,
+    dst_points: list,
+    annotations: str,
+    same_points: bool,
+) -> dict:
+    """
+    One /table request for a block of sources x destinations.
+    """
+    params = {"annotations": annotations}
+    if same_points:
+        # diagonal block of a symmetric matrix → send the points once
+        coords = src_points
+    else:
+        coords = src_points + dst_points
+        params["sources"] = ";".join(str(i) for i in range(len(src_points)))
+        params["destinations"] = ";".join(
+            str(i) for i in range(len(src_points), len(coords))
+        )
+    return await _osrm_get(f"/table/v1/{profile}/{_coord_str(coords)}", params=params)
+
+
+async def _osrm_matrix(
+    profile: str, sources: list, destinations: list, annotations: str, symmetric: bool
+) -> tuple:
+    """
+    Tiled OSRM /table calls stitched into (durations, distances, source waypoints,
+    destination waypoints); matrices are float arrays with NaN for "no route".
+    """
+    import numpy as np
+
+    n_src, n_dst = len(sources), len(destinations)
+    if symmetric and n_src <= OSRM_TABLE_MAX_COORDS:
+        # small all-to-all matrix: one request with every point, as before
+        tiles = [(range(n_src), range(n_dst))]
+    else:
+        tiles = _plan_table_tiles(n_src, n_dst, OSRM_TABLE_MAX_COORDS)
+
+    semaphore = asyncio.Semaphore(max(MATRIX_MAX_CONCURRENCY, 1))
+
+    async def run_tile(rows: range, cols: range) -> dict:
+        async with semaphore:
+            return await _table_tile(
+                profile,
+                [sources[i] for i in rows],
+                [destinations[j] for j in cols],
+                annotations,
+                same_points=symmetric and rows == cols,
+            )
+
+    responses = await asyncio.gather(*(run_tile(rows, cols) for rows, cols in tiles))
+
+    # stitch the blocks into one n_src x n_dst array (NaN = no route, OSRM's null)
+    durations = np.full((n_src, n_dst), np.nan) if "duration" in annotations else None
+    distances = np.full((n_src, n_dst), np.nan) if "distance" in annotations else None
+    source_waypoints = [None] * n_src
+    destination_waypoints = [None] * n_dst
+
+    for (rows, cols), data in zip(tiles, responses):
+        for block, full in ((data.get("durations"), durations), (data.get("distances"), distances)):
+            if block is None or full is None:
+                continue
+            # dtype=float turns OSRM's nulls into NaN
+            full[rows.start : rows.stop, cols.start : cols.stop] = np.array(block, dtype=float)
+        for r, i in enumerate(rows):
+            source_waypoints[i] = data["sources"][r]
+        for c, j in enumerate(cols):
+            destination_waypoints[j] = data["destinations"][c]
+
+    return durations, distances, source_waypoints, destination_waypoints
+
+
+async def _local_matrix(profile: str, sources: list, destinations: list, annotations: str) -> tuple:
+    """
+    Same result as _osrm_matrix, computed by the offline engine.
+    """
+    router = _local_router(profile)
+    # CH bucket search is pure CPU work → keep it off the event loop
+    durations, distances, src_snaps, dst_snaps = await asyncio.to_thread(
+        router.table, sources, destinations
+    )
+    return (
+        durations if "duration" in annotations else None,
+        distances if "distance" in annotations else None,
+        [router.waypoint(snap) for snap in src_snaps],
+        [router.waypoint(snap) for snap in dst_snaps],
+    )
+
+
+async def _matrix(
+    profile: str,
+    sources: list,
+    destinations: list,
+    annotations: str,
+    symmetric: bool,
+    remember: bool = True,
+) -> tuple:
+    """
+    (durations, distances, source waypoints, destination waypoints) from whichever
+    backend is configured; small results also feed the route_between cell cache.
+    """
+    if ROUTING_BACKEND == "local":
+        matrices = await _local_matrix(profile, sources, destinations, annotations)
+    else:
+        matrices = await _osrm_matrix(profile, sources, destinations, annotations, symmetric)
+    if remember:
+        _remember_matrix_cells(profile, sources, destinations, matrices[0], matrices[1])
+    return matrices
+
+
+def _encode_both(durations, distances, encoding: str) -> tuple:
+    return encode_matrix(durations, encoding), encode_matrix(distances, encoding)
+
+
+async def _encode_matrices(durations, distances, encoding: str) -> tuple:
+    """
+    Both matrices in the output encoding; big ones are converted in the worker pool.
+    """
+    matrix = durations if durations is not None else distances
+    cells = 0 if matrix is None else matrix.size
+    return await offload(_encode_both, durations, distances, encoding, items=cells)
+
+
 async def _tool_distance_matrix(arguments: dict) -> list[types.TextContent]:
-    coordinates = arguments["coordinates"]
+    coordinates = arguments.get("coordinates")
     profile = arguments.get("profile", "driving")
     annotations = arguments.get("annotations", "duration")
+    encoding = arguments.get("encoding", "json")
+    if encoding not in MATRIX_ENCODINGS:
+        raise ValueError(f"Unknown encoding '{encoding}' (use one of {sorted(MATRIX_ENCODINGS)})")
 
-    # OSRM expects lon,lat;lon,lat;... so I transform [lat, lon] → "lon,lat"
-    pairs = [f"{lon},{lat}" for lat, lon in coordinates]
-    coord_str = ";".join(pairs)
+    if arguments.get("sources") and arguments.get("destinations"):
+        sources = arguments["sources"]
+        destinations = arguments["destinations"]
+        symmetric = False
+    elif coordinates:
+        sources = destinations = coordinates
+        symmetric = True
+    else:
+        raise ValueError("Provide 'coordinates', or both 'sources' and 'destinations'.")
 
-    path = f"/table/v1/{profile}/{coord_str}"
-    params = {"annotations": annotations}
+    matrices = await _matrix(profile, sources, destinations, annotations, symmetric)
+    handle = None
+    if arguments.get("handle"):
+        handle = _keep_matrix(profile, annotations, sources, destinations, symmetric, matrices)
+    return await _render_matrix(matrices, encoding, arguments, handle)
+
+
+async def _render_matrix(
+    matrices: tuple, encoding: str, arguments: dict, handle: str | None
+) -> list[types.TextContent]:
+    durations, distances, source_waypoints, destination_waypoints = matrices
+    durations, distances = await _encode_matrices(durations, distances, encoding)
+
+    result = {"handle": handle} if handle else {}
+    result.update(
+        sources=source_waypoints,
+        destinations=destination_waypoints,
+        durations=durations,
+        distances=distances,
+    )
+    # json matrices page by source rows; packed ones are always sent whole
+    return await render(result, arguments, page=("sources", "durations", "distances"))
+
+
+def _keep_matrix(
+    profile: str, annotations: str, sources: list, destinations: list, symmetric: bool, matrices: tuple
+) -> str:
+    """
+    Store a matrix in MATRIX_HANDLES for extend_matrix; returns its handle.
+    """
+    durations, distances, source_waypoints, destination_waypoints = matrices
+    handle = secrets.token_hex(8)
+    MATRIX_HANDLES.set(
+        handle,
+        {
+            "profile": profile,
+            "annotations": annotations,
+            # all-to-all: sources and destinations are the same points and grow together
+            "symmetric": symmetric,
+            "sources": list(sources),
+            "destinations": list(destinations),
+            "durations": durations,
+            "distances": distances,
+            "source_waypoints": source_waypoints,
+            "destination_waypoints": destination_waypoints,
+            # one extension at a time per handle
+            "lock": asyncio.Lock(),
+        },
+    )
+    return handle
+
+
+async def _extend_matrix(entry: dict, new_sources: list, new_destinations: list) -> tuple:
+    """
+    The stored matrix with rows for `new_sources` and columns for `new_destinations`.
+    Only the new strips are queried (through /table sources/destinations): new
+    sources x all destinations, and old sources x new destinations. Adding k points
+    to an n-point all-to-all matrix costs k * (2n + k) cells instead of (n + k)^2.
+    """
+    import numpy as np
+
+    profile, annotations = entry["profile"], entry["annotations"]
+    n_src, n_dst = len(entry["sources"]), len(entry["destinations"])
+    sources = entry["sources"] + new_sources
+    destinations = entry["destinations"] + new_destinations
+
+    async def strip(src: list, dst: list) -> tuple | None:
+        if not src or not dst:
+            return None
+        return await _matrix(profile, src, dst, annotations, symmetric=False)
+
+    rows, cols = await asyncio.gather(
+        strip(new_sources, destinations),
+        strip(entry["sources"], new_destinations),
+    )
+
+    def grow(old, index: int):
+        if old is None:
+            return None
+        full = np.full((len(sources), len(destinations)), np.nan)
+        full[:n_src, :n_dst] = old
+        if rows is not None:
+            full[n_src:, :] = rows[index]
+        if cols is not None:
+            full[:n_src, n_dst:] = cols[index]
+        return full
+
+    return (
+        grow(entry["durations"], 0),
+        grow(entry["distances"], 1),
+        entry["source_waypoints"] + (rows[2] if rows is not None else []),
+        entry["destination_waypoints"] + (cols[3] if cols is not None else []),
+    )
+
+
+async def _tool_extend_matrix(arguments: dict) -> list[types.TextContent]:
+    handle = str(arguments.get("handle") or "")
+    encoding = arguments.get("encoding", "json")
+    if encoding not in MATRIX_ENCODINGS:
+        raise ValueError(f"Unknown encoding '{encoding}' (use one of {sorted(MATRIX_ENCODINGS)})")
+    entry = MATRIX_HANDLES.get(handle) if handle else None
+    if entry is None:
+        raise ValueError("Unknown or expired matrix handle; call distance_matrix with handle=true again.")
+
+    coordinates = arguments.get("coordinates")
+    if coordinates:
+        if arguments.get("sources") or arguments.get("destinations"):
+            raise ValueError("Pass either 'coordinates', or 'sources' and/or 'destinations', not both.")
+        if not entry["symmetric"]:
+            raise ValueError(
+                "This matrix has separate sources and destinations; extend it with 'sources' and/or 'destinations'."
+            )
+        new_sources = new_destinations = list(coordinates)
+    else:
+        new_sources = list(arguments.get("sources") or [])
+        new_destinations = list(arguments.get("destinations") or [])
+        if not new_sources and not new_destinations:
+            raise ValueError("Provide new 'coordinates', or 'sources' and/or 'destinations'.")
+
+    async with entry["lock"]:
+        matrices = await _extend_matrix(entry, new_sources, new_destinations)
+        durations, distances, source_waypoints, destination_waypoints = matrices
+        entry.update(
+            symmetric=entry["symmetric"] and bool(coordinates),
+            sources=entry["sources"] + new_sources,
+            destinations=entry["destinations"] + new_destinations,
+            durations=durations,
+            distances=distances,
+            source_waypoints=source_waypoints,
+            destination_waypoints=destination_waypoints,
+        )
+        # set again so the TTL counts from the last use
+        MATRIX_HANDLES.set(handle, entry)
+    return await _render_matrix(matrices, encoding, arguments, handle)
+
+
+async def _tool_optimize_trip(arguments: dict) -> list[types.TextContent]:
+    # visiting order for a set of stops, solved here instead of by the LLM
+    import numpy as np
+
+    from maps.trip_solver import solve_trip
+
+    stops = arguments["stops"]
+    profile = arguments.get("profile", "driving")
+    round_trip = arguments.get("round_trip", True)
+    start = arguments.get("start", 0)
+    end = arguments.get("end")
+    objective = arguments.get("objective", "duration")
+    if objective not in ("duration", "distance"):
+        raise ValueError(f"Unknown objective '{objective}', expected duration or distance")
+
+    durations, distances, _, _ = await _matrix(profile, stops, stops, "duration,distance", symmetric=True)
+    cost = durations if objective == "duration" else distances
+    # up to TRIP_MAX_SECONDS of numpy work → off the event loop
+    solution = await asyncio.to_thread(
+        solve_trip, cost, start=start, end=end, round_trip=round_trip, max_seconds=TRIP_MAX_SECONDS
+    )
+    order = solution["order"]
+
+    legs = []
+    unreachable = 0
+    for a, b in zip(order, order[1:]):
+        duration, distance = durations[a, b], distances[a, b]
+        if np.isnan(duration) or np.isnan(distance):
+            unreachable += 1
+        legs.append([a, b, _round(_finite(duration)), _round(_finite(distance))])
+
+    result = {
+        "order": order,
+        "objective": objective,
+        "round_trip": round_trip,
+        "total_duration_s": _round(float(np.nansum(durations[order[:-1], order[1:]]))),
+        "total_distance_m": _round(float(np.nansum(distances[order[:-1], order[1:]]))),
+        # how much the 2-opt / Or-opt passes gained over the nearest-neighbor order
+        "improvement_pct": _round(
+            100 * (1 - solution["cost"] / solution["seed_cost"]) if solution["seed_cost"] else 0.0
+        ),
+        "unreachable_legs": unreachable,
+        "columns": ["from", "to", "duration_s", "distance_m"],
+        "legs": legs,
+    }
+    return await render(result, arguments, page=("legs",))
+
+
+def _finite(value: float) -> float | None:
+    return None if value != value else float(value)
+
+
+async def _tool_isochrone(arguments: dict) -> list[types.TextContent]:
+    # reachable areas: sample a grid with one-to-many tables, refine near the band edges
+    import numpy as np
+
+    from maps.isochrone import IsochroneGrid
+
+    lat = arguments["lat"]
+    lon = arguments["lon"]
+    profile = arguments.get("profile", "driving")
+    minutes = sorted(set(arguments.get("minutes", [5, 10, 15])))
+    resolution = min(max(int(arguments.get("resolution", ISOCHRONE_RESOLUTION)), 3), 64)
+    levels = min(max(int(arguments.get("refine", ISOCHRONE_LEVELS)), 0), 5)
+    encoding = arguments.get("encoding", "json")
+    if encoding not in ("json", "polyline"):
+        raise ValueError(f"Unknown encoding '{encoding}', expected json or polyline")
+    if not minutes or minutes[0] <= 0:
+        raise ValueError("'minutes' needs at least one positive value")
+
+    thresholds = [m * 60 for m in minutes]
+    speed = ISOCHRONE_SPEEDS_KMH.get(profile, ISOCHRONE_SPEEDS_KMH["driving"]) / 3.6
+    grid = IsochroneGrid(lat, lon, thresholds[-1] * speed, resolution, levels)
+    evaluated = 0
+
+    async def evaluate(rows: np.ndarray, cols: np.ndarray) -> None:
+        nonlocal evaluated
+        lats, lons = grid.to_latlon(rows, cols)
+        points = [[a, b] for a, b in zip(lats.tolist(), lons.tolist())]
+        durations, _, _, waypoints = await _matrix(
+            profile, [[lat, lon]], points, "duration", symmetric=False, remember=False
+        )
+        seconds = durations[0].copy()
+        # a point that only snaps to a far-away road isn't really reachable
+        snap = np.array([(w or {}).get("distance") or 0.0 for w in waypoints])
+        seconds[snap > ISOCHRONE_MAX_SNAP_M] = np.nan
+        grid.set_values(rows, cols, seconds)
+        evaluated += len(rows)
+
+    await evaluate(*grid.coarse_points())
+    truncated = False
+    stride = grid.stride
+    while stride >= 2:
+        rows, cols = grid.refine_points(stride, thresholds)
+        if evaluated + len(rows) > ISOCHRONE_MAX_POINTS:
+            truncated = True
+            break
+        if len(rows):
+            await evaluate(rows, cols)
+        stride //= 2
+
+    filled = grid.filled(thresholds)
+    bands = []
+    for m, threshold in zip(minutes, thresholds):
+        polygons = grid.contours(filled, threshold)
+        if encoding == "polyline":
+            geometry = [[encode_polyline(ring) for ring in polygon] for polygon in polygons]
+        else:
+            geometry = [[[[round(a, 5), round(b, 5)] for a, b in ring] for ring in polygon] for polygon in polygons]
+        bands.append({"minutes": m, "area_km2": round(grid.area_km2(polygons), 2), "polygons": geometry})
+
+    result = {
+        "origin": [lat, lon],
+        "profile": profile,
+        "radius_m": round(grid.radius_m),
+        "points_evaluated": evaluated,
+        "grid_points": grid.size**2,
+        # refinement stopped early because of ISOCHRONE_MAX_POINTS
+        "truncated": truncated,
+        "geometry_encoding": "polyline5" if encoding == "polyline" else None,
+        "bands": bands,
+    }
+    return await render(result, arguments, page=("bands",))
+
+
+def _plan_match_chunks(n: int, size: int, overlap: int) -> list[range]:
+    """
+    Split n trace points into windows of at most `size` points; consecutive windows
+    share `overlap` points so every leg is matched with some context on both sides.
+    """
+    if n <= size:
+        return [range(n)]
+    overlap = min(max(overlap, 1), size // 2)
+    chunks = []
+    start = 0
+    while True:
+        end = min(start + size, n)
+        chunks.append(range(start, end))
+        if end == n:
+            return chunks
+        start += size - overlap
+
+
+async def _match_chunk(profile: str, points: list, radius_m: float | None) -> dict | None:
+    """
+    One /match request; None when OSRM can't match this stretch at all.
+    """
+    params = {"geometries": "polyline6", "overview": "false", "steps": "true", "gaps": "split"}
+    if all(len(p) > 2 for p in points):
+        params["timestamps"] = ";".join(str(int(p[2])) for p in points)
+    if radius_m:
+        params["radiuses"] = ";".join([f"{radius_m:g}"] * len(points))
+    path = f"/match/v1/{profile}/{_coord_str(p[:2] for p in points)}"
+    try:
+        return await _osrm_get(path, params=params)
+    except httpx.HTTPStatusError as e:
+        # OSRM answers NoMatch / NoSegment with a 400
+        if e.response.status_code != 400:
+            raise
+        return None
+    except RuntimeError:
+        return None
+
+
+def _chunk_legs(data: dict, chunk: range) -> dict[int, tuple]:
+    """
+    Legs of one /match response keyed by the global index of their first trace point:
+    start → (end index, distance, duration, confidence, [(lat, lon), ...]).
+    """
+    # (matching, waypoint) → trace index; unmatched tracepoints are null
+    trace_index = {
+        (tp["matchings_index"], tp["waypoint_index"]): chunk.start + offset
+        for offset, tp in enumerate(data["tracepoints"])
+        if tp is not None
+    }
+    legs = {}
+    for m, matching in enumerate(data["matchings"]):
+        for w, leg in enumerate(matching["legs"]):
+            start = trace_index.get((m, w))
+            end = trace_index.get((m, w + 1))
+            if start is None or end is None:
+                continue
+            points: list = []
+            for step in leg.get("steps", []):
+                step_points = decode_polyline(step["geometry"], precision=6)
+                if points and step_points and points[-1] == step_points[0]:
+                    step_points = step_points[1:]
+                points.extend(step_points)
+            legs[start] = (end, leg["distance"], leg["duration"], matching.get("confidence"), points)
+    return legs
+
+
+async def _tool_match_trace(arguments: dict) -> list[types.TextContent]:
+    # whole trace in one tool call: chunk it, match chunks concurrently, stitch
+    points = arguments["points"]
+    profile = arguments.get("profile", "driving")
+    radius_m = arguments.get("radius_m")
+    encoding = arguments.get("encoding", "polyline")
+    include_legs = arguments.get("legs", False)
+
+    if encoding not in ("polyline", "polyline6", "json"):
+        raise ValueError(f"Unknown encoding '{encoding}', expected polyline, polyline6 or json")
+    if ROUTING_BACKEND == "local":
+        raise ValueError("match_trace needs the OSRM backend (ROUTING_BACKEND=osrm)")
+
+    n = len(points)
+    chunks = _plan_match_chunks(n, OSRM_MATCH_MAX_COORDS, MATCH_CHUNK_OVERLAP)
+    semaphore = asyncio.Semaphore(max(MATCH_MAX_CONCURRENCY, 1))
+
+    async def run_chunk(chunk: range) -> dict | None:
+        async with semaphore:
+            return await _match_chunk(profile, points[chunk.start : chunk.stop], radius_m)
 
-    data = await _osrm_get(path, params=params)
+    responses = await asyncio.gather(*(run_chunk(chunk) for chunk in chunks))
+
+    # each chunk owns the legs starting in the middle of its overlaps with its neighbours
+    # (the overlap as _plan_match_chunks clamped it, not MATCH_CHUNK_OVERLAP as configured)
+    def middle(k: int) -> int:
+        # first leg of chunk k + 1's share of its overlap with chunk k
+        return chunks[k + 1].start + (chunks[k].stop - chunks[k + 1].start) // 2
+
+    owned: dict[int, tuple] = {}
+    spare: dict[int, tuple] = {}
+    for k, (chunk, data) in enumerate(zip(chunks, responses)):
+        if data is None:
+            continue
+        lo = 0 if k == 0 else middle(k - 1)
+        hi = n if k == len(chunks) - 1 else middle(k)
+        for start, leg in _chunk_legs(data, chunk).items():
+            (owned if lo <= start < hi else spare)[start] = leg
+    # overlap legs from a neighbour fill in where the owning chunk failed
+    for start, leg in spare.items():
+        owned.setdefault(start, leg)
+
+    # walk the legs in trace order; a missing leg (unmatched points, failed chunk) starts a new stretch
+    matchings: list[dict] = []
+    leg_rows = []
+    matched: set[int] = set()
+    confidence = None
+    current = None
+    for start in sorted(owned):
+        if current is not None and start < current["to_index"]:
+            # a neighbour chunk already bridged past this point
+            continue
+        end, distance, duration, leg_confidence, leg_points = owned[start]
+        if current is None or current["to_index"] != start:
+            current = {"from_index": start, "to_index": start, "distance_m": 0.0, "duration_s": 0.0, "points": []}
+            matchings.append(current)
+        current["to_index"] = end
+        current["distance_m"] += distance
+        current["duration_s"] += duration
+        if current["points"] and leg_points and current["points"][-1] == leg_points[0]:
+            leg_points = leg_points[1:]
+        current["points"].extend(leg_points)
+        matched.update((start, end))
+        if leg_confidence is not None:
+            confidence = leg_confidence if confidence is None else min(confidence, leg_confidence)
+        if include_legs:
+            leg_rows.append([start, end, round(distance, 1), round(duration, 1)])
+
+    for stretch in matchings:
+        stretch["distance_m"] = round(stretch["distance_m"], 1)
+        stretch["duration_s"] = round(stretch["duration_s"], 1)
+        stretch_points = stretch.pop("points")
+        if encoding == "json":
+            stretch["geometry"] = [[round(lat, 6), round(lon, 6)] for lat, lon in stretch_points]
+        else:
+            stretch["geometry"] = encode_polyline(stretch_points, precision=6 if encoding == "polyline6" else 5)
 
     result = {
-        "sources": data.get("sources"),
-        "destinations": data.get("destinations"),
-        "durations": data.get("durations"),
-        "distances": data.get("distances"),
+        "count": n,
+        "chunks": len(chunks),
+        "matched": len(matched),
+        "unmatched_indices": [i for i in range(n) if i not in matched],
+        "distance_m": round(sum(m["distance_m"] for m in matchings), 1),
+        "duration_s": round(sum(m["duration_s"] for m in matchings), 1),
+        "confidence": confidence,
+        "geometry_encoding": {"polyline": "polyline5", "polyline6": "polyline6", "json": None}[encoding],
+        "matchings": matchings,
     }
+    if include_legs:
+        result["legs"] = leg_rows
+    return await render(result, arguments, page=("matchings",))
 
+
+async def _tool_server_stats(arguments: dict) -> list[types.TextContent]:
+    fmt = arguments.get("format", "json")
+    if fmt == "prometheus":
+        return [types.TextContent(type="text", text=METRICS.prometheus())]
+    if fmt != "json":
+        raise ValueError(f"Unknown format '{fmt}', expected json or prometheus")
     return [
         types.TextContent(
             type="text",
-            text=json.dumps(result, indent=2),
+            text=json.dumps(METRICS.snapshot(), indent=2),
         )
     ]
 
 
+# tool name → handler (call_tool dispatches through this)
+TOOL_HANDLERS = {
+    "route_between": _tool_route_between,
+    "route_many": _tool_route_many,
+    "nearest_road": _tool_nearest_road,
+    "snap_points": _tool_snap_points,
+    "optimize_trip": _tool_optimize_trip,
+    "isochrone": _tool_isochrone,
+    "match_trace": _tool_match_trace,
+    "distance_matrix": _tool_distance_matrix,
+    "extend_matrix": _tool_extend_matrix,
+    "server_stats": _tool_server_stats,
+}
+
+
 @app.call_tool()
 async def call_tool(name: str, arguments: dict) -> list[types.TextContent]:
     """
     Main MCP entry point: routes the call to the right helper based on tool name.
     """
-    try:
-        if name == "route_between":
-            return await _tool_route_between(arguments)
-        if name == "nearest_road":
-            return await _tool_nearest_road(arguments)
-        if name == "distance_matrix":
-            return await _tool_distance_matrix(arguments)
-
-        # guard in case of typos / unknown tool name
-        return [
-            types.TextContent(
-                type="text",
-                text=json.dumps({"error": f"Unknown tool '{name}'"}, indent=2),
-            )
-        ]
-    except Exception as e:
-        # very simple error reporting back to the agent
-        return [
-            types.TextContent(
-                type="text",
-                text=json.dumps({"error": str(e)}, indent=2),
-            )
-        ]
+    handler = TOOL_HANDLERS.get(name)
+    # unknown names share one metrics entry so a typo can't add new series
+    with METRICS.tool_call(name if handler else "unknown") as call, TRACER.tool_span(app, name) as span:
+        try:
+            if handler is None:
+                # guard in case of typos / unknown tool name
+                raise ValueError(f"Unknown tool '{name}'")
+            if arguments.get("cursor"):
+                # a later page of a big result: served from the stored result, the tool doesn't run
+                result = await next_page(arguments)
+            else:
+                result = await handler(arguments)
+        except Exception as e:
+            # very simple error reporting back to the agent
+            call.failed(e)
+            if span is not None:
+                span.fail(e)
+            result = [
+                types.TextContent(
+                    type="text",
+                    text=json.dumps({"error": str(e)}, indent=2),
+                )
+            ]
+        call.responded(result)
+    return result
 
 
 async def main() -> None:
     """
     Run this routing MCP server over stdio.
     The Agents SDK spawns this with `python -m maps.routing_server`.
+    With ROUTING_HTTP_PORT set it serves MCP over HTTP instead, for many agents at once.
     """
-    async with stdio_server() as (read_stream, write_stream):
-        await app.run(
-            read_stream,
-            write_stream,
+    exporter = MetricsExporter(METRICS, port=METRICS_PORT, path=METRICS_FILE, interval=METRICS_DUMP_INTERVAL)
+    try:
+        await exporter.start()
+        await serve(
+            app,
             InitializationOptions(
                 server_name="routing-server",
                 server_version="0.1.0",
@@ -245,7 +1615,15 @@ async def main() -> None:
                     experimental_capabilities={},
                 ),
             ),
+            http_port=HTTP_PORT,
+            http_host=HTTP_HOST,
         )
+    finally:
+        # close the pooled OSRM connections (and the route cache file) on shutdown
+        # (and write the final metrics file)
+        await exporter.aclose()
+        await aclose_clients()
+        ROUTE_CACHE.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,285 @@
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Any, Awaitable, Callable, Hashable
+
+# Every upstream HTTP call goes through one UpstreamScheduler per upstream:
+#   - token bucket → we stay under the provider's rate limit instead of eating 429s
+#   - single-flight → identical requests already in flight share one future
+#   - bounded queue with a deadline → overload fails fast with a clear error
+#   - priority lanes → interactive tool calls jump ahead of batch work
+
+PRIORITIES = {
+    "interactive": 0,
+    "batch": 1,
+}
+
+
+class SchedulerFull(RuntimeError):
+    """Raised when the upstream queue is already at its limit."""
+
+
+class QueueDeadlineExceeded(TimeoutError):
+    """Raised when a request waited in the queue longer than its deadline."""
+
+
+class TokenBucket:
+    """
+    Classic token bucket. rate <= 0 means "no limit".
+    """
+
+    def __init__(self, rate: float, burst: float = 1.0):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        # set by pause(), e.g. after a 429 with Retry-After
+        self.not_before = 0.0
+
+    def _refill(self, now: float) -> None:
+        # nothing accrues before `updated` (it is in the future while paused)
+        if now <= self.updated:
+            return
+        if self.rate > 0:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self) -> float:
+        """
+        Seconds until a token is available (0 if one is available right now).
+        """
+        now = time.monotonic()
+        if now < self.not_before:
+            return self.not_before - now
+        if self.rate <= 0:
+            return 0.0
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        if self.rate > 0:
+            self._refill(time.monotonic())
+            self.tokens -= 1
+
+    def pause(self, seconds: float) -> None:
+        self.not_before = max(self.not_before, time.monotonic() + seconds)
+        self.tokens = 0.0
+        # no refill during the pause: the bucket starts empty when it ends
+        self.updated = self.not_before
+
+
+class _Entry:
+    __slots__ = ("factory", "future", "timer", "started")
+
+    def __init__(self, factory: Callable[[], Awaitable[Any]], future: asyncio.Future):
+        self.factory = factory
+        self.future = future
+        self.timer: asyncio.TimerHandle | None = None
+        self.started = False
+
+
+class UpstreamScheduler:
+    """
+    Rate-limited, deduplicating request queue for one upstream.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rate: float,
+        burst: float = 1.0,
+        max_queue: int = 100,
+        deadline: float = 30.0,
+        max_concurrency: int = 0,
+    ):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.max_queue = max_queue
+        self.deadline = deadline
+        self.max_concurrency = max_concurrency
+
+        self._heap: list[tuple[int, int, _Entry]] = []
+        self._seq = itertools.count()
+        self._queued = 0
+        self._running = 0
+        self._inflight: dict[Hashable, asyncio.Future] = {}
+        self._dispatcher: asyncio.Task | None = None
+        self._tasks: set[asyncio.Task] = set()
+        self._slot_freed: asyncio.Event | None = None
+
+        # counters (handy when checking whether we are throttling ourselves)
+        self.submitted = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self.expired = 0
+        # retries / hedges sent by the endpoint pool inside one queued request
+        self.extra = 0
+
+    def set_rate(self, rate: float, burst: float | None = None) -> None:
+        self.bucket = TokenBucket(rate, self.bucket.burst if burst is None else burst)
+
+    def pause(self, seconds: float) -> None:
+        """
+        Stop sending for a while (the upstream told us to back off).
+        """
+        self.bucket.pause(seconds)
+
+    def try_take(self) -> bool:
+        """
+        Take a token for an extra request sent outside the queue (a hedge) if one
+        is free right now; False when sending it would exceed the rate.
+        """
+        if self.bucket.wait_time() > 0:
+            return False
+        self.bucket.take()
+        self.extra += 1
+        return True
+
+    async def take(self) -> None:
+        """
+        Wait for a token for an extra request sent outside the queue (a retry).
+        """
+        while (wait := self.bucket.wait_time()) > 0:
+            await asyncio.sleep(wait)
+        self.bucket.take()
+        self.extra += 1
+
+    async def submit(
+        self,
+        key: Hashable | None,
+        factory: Callable[[], Awaitable[Any]],
+        priority: str = "interactive",
+        deadline: float | None = None,
+    ) -> Any:
+        """
+        Queue `factory()` and wait for its result.
+        Requests with the same non-None `key` that are queued or running share one call.
+        """
+        self.submitted += 1
+        if key is not None and key in self._inflight:
+            self.coalesced += 1
+            return await asyncio.shield(self._inflight[key])
+
+        if self._queued >= self.max_queue:
+            self.rejected += 1
+            raise SchedulerFull(
+                f"{self.name}: upstream queue is full ({self.max_queue} waiting requests)"
+            )
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        # mark exceptions as retrieved even if every waiter went away
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        entry = _Entry(factory, future)
+
+        if key is not None:
+            self._inflight[key] = future
+            future.add_done_callback(lambda _f: self._inflight.pop(key, None))
+
+        wait_limit = self.deadline if deadline is None else deadline
+        if wait_limit and wait_limit > 0:
+            entry.timer = loop.call_later(wait_limit, self._expire, entry, wait_limit)
+
+        heapq.heappush(self._heap, (PRIORITIES.get(priority, 0), next(self._seq), entry))
+        self._queued += 1
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+        return await asyncio.shield(future)
+
+    def _expire(self, entry: _Entry, waited: float) -> None:
+        if entry.started or entry.future.done():
+            return
+        self._queued -= 1
+        self.expired += 1
+        entry.future.set_exception(
+            QueueDeadlineExceeded(f"{self.name}: request waited more than {waited:.1f}s in the queue")
+        )
+
+    async def _dispatch(self) -> None:
+        while self._heap:
+            if self.max_concurrency and self._running >= self.max_concurrency:
+                self._slot_freed = asyncio.Event()
+                await self._slot_freed.wait()
+                continue
+
+            wait = self.bucket.wait_time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+
+            # pop the best entry that is still waiting (expired ones are already failed)
+            entry = None
+            while self._heap:
+                _prio, _seq, candidate = heapq.heappop(self._heap)
+                if not candidate.future.done():
+                    entry = candidate
+                    break
+            if entry is None:
+                break
+
+            self.bucket.take()
+            self._queued -= 1
+            entry.started = True
+            if entry.timer is not None:
+                entry.timer.cancel()
+            self._running += 1
+            task = asyncio.create_task(self._run(entry))
+            # keep a reference so the task is not garbage collected mid-flight
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, entry: _Entry) -> None:
+        try:
+            result = await entry.factory()
+        except asyncio.CancelledError:
+            entry.future.cancel()
+            raise
+        except Exception as e:
+            # hand the error to every waiter
+            if not entry.future.done():
+                entry.future.set_exception(e)
+        else:
+            if not entry.future.done():
+                entry.future.set_result(result)
+        finally:
+            self._running -= 1
+            if self._slot_freed is not None:
+                self._slot_freed.set()
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "rate_per_s": self.bucket.rate,
+            "burst": self.bucket.burst,
+            "queued": self._queued,
+            "running": self._running,
+            "in_flight_keys": len(self._inflight),
+            "submitted": self.submitted,
+            "coalesced": self.coalesced,
+            "rejected": self.rejected,
+            "expired": self.expired,
+            "extra": self.extra,
+        }
+
+
+def request_key(path: str, params: dict | None) -> tuple:
+    """
+    Hashable single-flight key for a GET request (path + sorted query params).
+    """
+    items = tuple(sorted((k, str(v)) for k, v in (params or {}).items()))
+    return (path, items)
+
+
+def retry_after_seconds(headers, default: float = 1.0) -> float:
+    """
+    Parse a Retry-After header given in seconds (HTTP dates are rare here, use the default).
+    """
+    value = headers.get("retry-after")
+    try:
+        return max(float(value), 0.0) if value is not None else default
+    except ValueError:
+        return default
@@ -0,0 +1,294 @@
+import argparse
+import contextvars
+import json
+import os
+import secrets
+import sys
+import time
+from typing import NamedTuple
+
+from maps.config import env_str
+
+# Span tracing across the agent, the MCP servers and their upstream HTTP requests.
+#
+# Off unless MAPS_TRACE_FILE is set; then every process (agent, geo-server,
+# routing-server) appends one JSON line per finished span to that file:
+#   {"trace_id", "span_id", "parent_id", "name", "kind", "service", "start" (unix s),
+#    "duration_ms", "status", "attrs"}
+# The trace context travels as a W3C `traceparent`:
+#   agent → server: in the MCP request's _meta (see agent/tracing.py)
+#   server → upstream: as an HTTP header on the Nominatim / OSRM request
+# Summarize a file as per-turn waterfalls with:
+#   python -m maps.tracing trace.jsonl [--last 3] [--trace <id>]
+
+TRACE_FILE = env_str("MAPS_TRACE_FILE", "") or None
+
+
+class SpanContext(NamedTuple):
+    trace_id: str  # 32 hex chars
+    span_id: str  # 16 hex chars
+
+
+_current: contextvars.ContextVar[SpanContext | None] = contextvars.ContextVar("maps_trace_span", default=None)
+
+
+def parse_traceparent(value: str | None) -> SpanContext | None:
+    """
+    "00-<trace id>-<parent span id>-<flags>" → SpanContext (None if malformed).
+    """
+    parts = (value or "").split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    return SpanContext(parts[1], parts[2])
+
+
+def format_traceparent(context: SpanContext) -> str:
+    return f"00-{context.trace_id}-{context.span_id}-01"
+
+
+class Span:
+    """
+    One timed operation; written to the trace file when the `with` block exits.
+    """
+
+    __slots__ = ("tracer", "name", "kind", "context", "parent_id", "start", "attrs", "status", "_t0", "_token")
+
+    def __init__(self, tracer: "Tracer", name: str, kind: str, parent: SpanContext | None, attrs: dict):
+        self.tracer = tracer
+        self.name = name
+        self.kind = kind
+        trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.context = SpanContext(trace_id, secrets.token_hex(8))
+        self.parent_id = parent.span_id if parent else None
+        self.attrs = attrs
+        self.status = "ok"
+
+    def set(self, key: str, value) -> None:
+        self.attrs[key] = value
+
+    def fail(self, exc: BaseException) -> None:
+        self.status = "error"
+        self.attrs["error"] = f"{type(exc).__name__}: {exc}"[:300]
+
+    def headers(self) -> dict:
+        return {"traceparent": format_traceparent(self.context)}
+
+    def __enter__(self) -> "Span":
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+        self._token = _current.set(self.context)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        duration = time.perf_counter() - self._t0
+        _current.reset(self._token)
+        if exc is not None:
+            self.fail(exc)
+        self.tracer.write(
+            {
+                "trace_id": self.context.trace_id,
+                "span_id": self.context.span_id,
+                "parent_id": self.parent_id,
+                "name": self.name,
+                "kind": self.kind,
+                "service": self.tracer.service,
+                "start": round(self.start, 6),
+                "duration_ms": round(duration * 1000, 3),
+                "status": self.status,
+                "attrs": self.attrs,
+            }
+        )
+        return False
+
+
+class _NoSpan:
+    # what Tracer.span returns when tracing is off: `with ... as span` gives None
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+class Tracer:
+    """
+    Span factory + JSONL writer for one process (service).
+    When disabled, span() hands back a shared no-op context manager.
+    """
+
+    def __init__(self, service: str, path: str | None = TRACE_FILE):
+        self.service = service
+        self.path = path
+        self.enabled = bool(path)
+        self._fd: int | None = None
+
+    def span(self, name: str, kind: str = "internal", parent: SpanContext | None = None, **attrs):
+        """
+        `parent` defaults to the span currently open in this task (or starts a new trace).
+        """
+        if not self.enabled:
+            return _NO_SPAN
+        return Span(self, name, kind, parent or _current.get(), attrs)
+
+    def current(self) -> SpanContext | None:
+        """
+        Context of the open span, captured e.g. before handing work to another task.
+        """
+        return _current.get() if self.enabled else None
+
+    def tool_span(self, app, name: str):
+        """
+        Server-side span of one MCP tool call, child of the caller's span when the
+        request carried a traceparent in its _meta.
+        """
+        if not self.enabled:
+            return _NO_SPAN
+        parent = None
+        try:
+            meta = app.request_context.meta
+        except LookupError:
+            # called directly (benchmarks, demos), not through an MCP session
+            meta = None
+        if meta is not None:
+            parent = parse_traceparent(getattr(meta, "traceparent", None))
+        return Span(self, f"tool {name}", "server", parent, {"tool": name})
+
+    def write(self, record: dict) -> None:
+        # one os.write per line on an O_APPEND fd, so several processes can share the file
+        if self._fd is None:
+            self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        os.write(self._fd, (json.dumps(record, separators=(",", ":"), default=str) + "\n").encode())
+
+    def close(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+# ---------------------------------------------------------------------------
+# summarizer
+
+_BAR = "█"
+
+
+def _load(path: str) -> dict[str, list[dict]]:
+    traces: dict[str, list[dict]] = {}
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                record = json.loads(line)
+                traces.setdefault(record["trace_id"], []).append(record)
+    return traces
+
+
+def _union_ms(intervals: list[tuple[float, float]]) -> float:
+    total = 0.0
+    end = float("-inf")
+    for a, b in sorted(intervals):
+        if b <= end:
+            continue
+        total += b - max(a, end)
+        end = b
+    return total
+
+
+def _breakdown(spans: list[dict], children: dict) -> dict[str, float]:
+    """
+    Where the time went: LLM calls, MCP round trips minus server time (transport +
+    SDK), upstream HTTP (overlapping requests counted once per tool call) and the
+    servers' own time. Sums over the trace, so parallel tool calls add up.
+    """
+    out = {"llm": 0.0, "mcp_overhead": 0.0, "upstream": 0.0, "server_local": 0.0}
+    for span in spans:
+        kind = span["kind"]
+        if kind == "llm":
+            out["llm"] += span["duration_ms"]
+        elif kind == "tool":
+            served = [c for c in children.get(span["span_id"], []) if c["kind"] == "server"]
+            if served:
+                out["mcp_overhead"] += max(span["duration_ms"] - sum(c["duration_ms"] for c in served), 0.0)
+        elif kind == "server":
+            upstream = [
+                (c["start"] * 1000, c["start"] * 1000 + c["duration_ms"])
+                for c in children.get(span["span_id"], [])
+                if c["kind"] == "upstream"
+            ]
+            waited = _union_ms(upstream)
+            out["upstream"] += waited
+            out["server_local"] += max(span["duration_ms"] - waited, 0.0)
+    return out
+
+
+def _label(span: dict) -> str:
+    attrs = span.get("attrs") or {}
+    extra = []
+    if "status" in attrs:
+        extra.append(str(attrs["status"]))
+    if attrs.get("wait_ms"):
+        # scheduler queue + rate limit (+ client setup on first use) before sending
+        extra.append(f"waited {attrs['wait_ms']:.1f} ms")
+    if span.get("status") == "error":
+        extra.append(f"ERROR {attrs.get('error', '')}"[:80])
+    return ", ".join(extra)
+
+
+def summarize(path: str, trace_id: str | None = None, last: int = 5, width: int = 40, out=sys.stdout) -> None:
+    traces = _load(path)
+    if trace_id:
+        traces = {k: v for k, v in traces.items() if k.startswith(trace_id)}
+    ordered = sorted(traces.items(), key=lambda kv: min(s["start"] for s in kv[1]))
+    for tid, spans in ordered[-last:] if last else ordered:
+        ids = {s["span_id"] for s in spans}
+        children: dict[str, list[dict]] = {}
+        roots = []
+        for span in sorted(spans, key=lambda s: s["start"]):
+            # spans whose parent isn't in the file (e.g. agent tracing off) become roots
+            if span["parent_id"] in ids:
+                children.setdefault(span["parent_id"], []).append(span)
+            else:
+                roots.append(span)
+        t0 = min(s["start"] for s in spans)
+        t1 = max(s["start"] + s["duration_ms"] / 1000 for s in spans)
+        total_ms = (t1 - t0) * 1000
+        title = roots[0]["name"] if len(roots) == 1 else f"{len(roots)} root spans"
+        print(f"\ntrace {tid}  {title}  {total_ms:.1f} ms  ({len(spans)} spans)", file=out)
+        parts = _breakdown(spans, children)
+        print("  " + "  ".join(f"{k} {v:.1f} ms" for k, v in parts.items()), file=out)
+        print(f"  {'offset ms':>10} {'dur ms':>9}  {'span':<44} {'':<{width}}", file=out)
+
+        def show(span: dict, depth: int) -> None:
+            offset = (span["start"] - t0) * 1000
+            scale = width / total_ms if total_ms else 0
+            lead = int(offset * scale)
+            bar = _BAR * max(1, round(span["duration_ms"] * scale))
+            name = f"{'  ' * depth}{span['kind']} {span['name']}"
+            print(
+                f"  {offset:10.1f} {span['duration_ms']:9.1f}  {name[:44]:<44} "
+                f"|{(' ' * lead + bar)[:width]:<{width}}| {span['service']} {_label(span)}".rstrip(),
+                file=out,
+            )
+            for child in children.get(span["span_id"], []):
+                show(child, depth + 1)
+
+        for root in roots:
+            show(root, 0)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Per-turn latency waterfall from a MAPS_TRACE_FILE.")
+    parser.add_argument("path")
+    parser.add_argument("--trace", help="only traces whose id starts with this")
+    parser.add_argument("--last", type=int, default=5, help="newest N traces (0 = all)")
+    parser.add_argument("--width", type=int, default=40, help="waterfall bar width")
+    args = parser.parse_args()
+    summarize(args.path, trace_id=args.trace, last=args.last, width=args.width)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import contextlib
+import sys
+
+from mcp.server import Server
+from mcp.server.models import InitializationOptions
+from mcp.server.stdio import stdio_server
+
+# How a server is reached:
+#   stdio (default)  → one client, the process that spawned us (agent/main_agent.py)
+#   HTTP (http_port) → long-running server for many agents at once:
+#       POST/GET/DELETE /mcp   MCP streamable HTTP
+#       GET /sse + POST /messages/   the older HTTP+SSE transport, for clients that only speak that
+# Every HTTP session runs in this one process, so the caches, upstream schedulers,
+# pooled HTTP clients and metrics are shared by all connected agents.
+
+
+def _security(host: str):
+    from mcp.server.transport_security import TransportSecuritySettings
+
+    # bound to loopback → refuse other Host/Origin headers (DNS rebinding); when bound
+    # to a real interface the operator decides who can reach the port
+    if host not in ("127.0.0.1", "localhost", "::1"):
+        return None
+    return TransportSecuritySettings(
+        enable_dns_rebinding_protection=True,
+        allowed_hosts=["127.0.0.1:*", "localhost:*", "[::1]:*"],
+        allowed_origins=["http://127.0.0.1:*", "http://localhost:*", "http://[::1]:*"],
+    )
+
+
+def http_app(app: Server, options: InitializationOptions, host: str = "127.0.0.1"):
+    """
+    Starlette app serving `app` over streamable HTTP (/mcp) and SSE (/sse).
+    """
+    # web stack only imported when serving HTTP; stdio servers never load it
+    from mcp.server.sse import SseServerTransport
+    from mcp.server.streamable_http_manager import StreamableHTTPSessionManager
+    from starlette.applications import Starlette
+    from starlette.responses import Response
+    from starlette.routing import Mount, Route
+
+    security = _security(host)
+    sessions = StreamableHTTPSessionManager(app=app, security_settings=security)
+    sse = SseServerTransport("/messages/", security_settings=security)
+
+    class StreamableHTTP:
+        # plain ASGI endpoint, so /mcp isn't redirected to /mcp/
+        async def __call__(self, scope, receive, send) -> None:
+            await sessions.handle_request(scope, receive, send)
+
+    async def handle_sse(request) -> Response:
+        async with sse.connect_sse(request.scope, request.receive, request._send) as (read_stream, write_stream):
+            await app.run(read_stream, write_stream, options)
+        return Response()
+
+    @contextlib.asynccontextmanager
+    async def lifespan(_):
+        async with sessions.run():
+            yield
+
+    return Starlette(
+        routes=[
+            Route("/mcp", endpoint=StreamableHTTP(), methods=["GET", "POST", "DELETE"]),
+            Route("/sse", endpoint=handle_sse, methods=["GET"]),
+            Mount("/messages/", app=sse.handle_post_message),
+        ],
+        lifespan=lifespan,
+    )
+
+
+async def serve(app: Server, options: InitializationOptions, http_port: int = 0, http_host: str = "127.0.0.1") -> None:
+    """
+    Run `app` over stdio, or over HTTP on http_host:http_port when a port is given.
+    Returns when the client disconnects (stdio) or on SIGINT/SIGTERM (HTTP).
+    """
+    if not http_port:
+        async with stdio_server() as (read_stream, write_stream):
+            await app.run(read_stream, write_stream, options)
+        return
+
+    import uvicorn
+
+    class _Server(uvicorn.Server):
+        @contextlib.contextmanager
+        def capture_signals(self):
+            # uvicorn re-raises SIGTERM/SIGINT after its graceful shutdown, which would
+            # kill the process before main()'s cleanup (metrics dump, pools, cache files)
+            with super().capture_signals():
+                try:
+                    yield
+                finally:
+                    self._captured_signals.clear()
+
+    config = uvicorn.Config(http_app(app, options, http_host), host=http_host, port=http_port, log_level="warning")
+    print(
+        f"{options.server_name}: MCP on http://{http_host}:{http_port}/mcp (SSE: /sse)",
+        file=sys.stderr,
+        flush=True,
+    )
+    await _Server(config).serve()
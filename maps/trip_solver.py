@@ -0,0 +1,205 @@
+import time
+
+import numpy as np
+
+# Stop ordering for optimize_trip (a small TSP / shortest Hamiltonian path heuristic).
+#
+# Every variant is solved as a path with fixed endpoints over a cost matrix:
+#   - round trip from s:          s → ... → s
+#   - fixed start and end:        s → ... → e
+#   - open end (or open start):   a zero-cost dummy node takes the free endpoint
+# Seed with nearest neighbor, then improve with 2-opt and Or-opt. Each pass evaluates
+# *all* candidate moves at once as numpy arrays and applies the best one, so the Python
+# loop runs once per improving move, not once per candidate.
+# Once at a local optimum, the rest of the time budget goes into iterated local search:
+# a random double-bridge kick, re-optimize, keep the result if it is better.
+# Matrices may be asymmetric (one-way streets): 2-opt accounts for the reversed segment
+# with prefix sums of forward and backward edge costs along the current path.
+
+_EPS = 1e-9
+# iterated local search gives up after this many kicks in a row without improvement
+ILS_MAX_STALL = 50
+# Or-opt moves segments of up to this many stops
+OR_OPT_MAX_SEGMENT = 3
+
+
+def _prepare(cost: np.ndarray) -> np.ndarray:
+    """
+    NaN (no route) → a cost larger than any real path, so it is only used when unavoidable.
+    """
+    cost = np.array(cost, dtype=np.float64)
+    finite = cost[np.isfinite(cost)]
+    penalty = (finite.max() if finite.size else 1.0) * (len(cost) + 1) + 1.0
+    cost[~np.isfinite(cost)] = penalty
+    np.fill_diagonal(cost, 0.0)
+    return cost
+
+
+def _nearest_neighbor(cost: np.ndarray, first: int, last: int, interior: np.ndarray) -> np.ndarray:
+    free = np.zeros(len(cost), dtype=bool)
+    free[interior] = True
+    path = [first]
+    current = first
+    for _ in range(len(interior)):
+        row = np.where(free, cost[current], np.inf)
+        current = int(np.argmin(row))
+        free[current] = False
+        path.append(current)
+    path.append(last)
+    return np.asarray(path, dtype=np.int64)
+
+
+def _best_two_opt(cost: np.ndarray, path: np.ndarray) -> tuple[float, int, int]:
+    """
+    Best move reversing path[i+1 .. j] (0 <= i, j+1 <= len-1); returns (delta, i, j).
+    """
+    m = len(path)
+    fwd_edges = cost[path[:-1], path[1:]]
+    bwd_edges = cost[path[1:], path[:-1]]
+    fwd = np.concatenate(([0.0], np.cumsum(fwd_edges)))
+    bwd = np.concatenate(([0.0], np.cumsum(bwd_edges)))
+
+    i = np.arange(m - 1)[:, None]
+    j = np.arange(m - 1)[None, :]
+    a, b = path[i], path[np.minimum(i + 1, m - 1)]
+    c, d = path[j], path[np.minimum(j + 1, m - 1)]
+    # edges (a,b) and (c,d) are replaced by (a,c) and (b,d); b..c is traversed backwards
+    inner = (bwd[j] - bwd[np.minimum(i + 1, m - 1)]) - (fwd[j] - fwd[np.minimum(i + 1, m - 1)])
+    delta = cost[a, c] + cost[b, d] - cost[a, b] - cost[c, d] + inner
+    delta = np.where(j > i + 1, delta, np.inf)
+    flat = int(np.argmin(delta))
+    bi, bj = divmod(flat, m - 1)
+    return float(delta[bi, bj]), bi, bj
+
+
+def _best_or_opt(cost: np.ndarray, path: np.ndarray) -> tuple[float, int, int, int]:
+    """
+    Best move taking path[i .. i+L-1] out and putting it between path[k] and path[k+1];
+    returns (delta, i, L, k).
+    """
+    m = len(path)
+    best = (np.inf, 0, 0, 0)
+    for length in range(1, min(OR_OPT_MAX_SEGMENT, m - 3) + 1):
+        i = np.arange(1, m - length)[:, None]  # segment start, never an endpoint
+        k = np.arange(m - 1)[None, :]  # insert after path[k]
+        seg_first, seg_last = path[i], path[i + length - 1]
+        prev, nxt = path[i - 1], path[i + length]
+        removed = cost[prev, seg_first] + cost[seg_last, nxt] - cost[prev, nxt]
+        left, right = path[k], path[k + 1]
+        added = cost[left, seg_first] + cost[seg_last, right] - cost[left, right]
+        delta = added - removed
+        # inserting inside or right next to the segment itself is not a move
+        delta = np.where((k >= i - 1) & (k <= i + length - 1), np.inf, delta)
+        flat = int(np.argmin(delta))
+        r, c = divmod(flat, delta.shape[1])
+        if delta[r, c] < best[0]:
+            best = (float(delta[r, c]), int(i[r, 0]), length, c)
+    return best
+
+
+def _apply_or_opt(path: np.ndarray, i: int, length: int, k: int) -> np.ndarray:
+    segment = path[i : i + length]
+    rest = np.concatenate((path[:i], path[i + length :]))
+    # position of path[k] in `rest`
+    at = k if k < i else k - length
+    return np.concatenate((rest[: at + 1], segment, rest[at + 1 :]))
+
+
+def _local_search(cost: np.ndarray, path: np.ndarray, deadline: float, max_moves: int) -> tuple[np.ndarray, int]:
+    moves = 0
+    while moves < max_moves and time.perf_counter() < deadline:
+        two_delta, i, j = _best_two_opt(cost, path)
+        or_delta, oi, length, k = _best_or_opt(cost, path)
+        if min(two_delta, or_delta) >= -_EPS:
+            break
+        if two_delta <= or_delta:
+            path[i + 1 : j + 1] = path[i + 1 : j + 1][::-1]
+        else:
+            path = _apply_or_opt(path, oi, length, k)
+        moves += 1
+    return path, moves
+
+
+def _double_bridge(path: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """
+    A B C D → A C B D with the cuts inside the interior (endpoints stay put).
+    """
+    p, q, r = np.sort(rng.choice(np.arange(1, len(path) - 1), size=3, replace=False))
+    return np.concatenate((path[:p], path[q:r], path[p:q], path[r:]))
+
+
+def path_cost(cost: np.ndarray, path) -> float:
+    path = np.asarray(path)
+    return float(cost[path[:-1], path[1:]].sum())
+
+
+def solve_trip(
+    cost,
+    start: int | None = 0,
+    end: int | None = None,
+    round_trip: bool = True,
+    max_seconds: float = 1.0,
+    max_moves: int = 100_000,
+) -> dict:
+    """
+    Order stops 0..n-1 of a cost matrix.
+
+    round_trip=True returns to `start` (default 0). Otherwise `start` and/or `end` pin
+    the first/last stop, and a missing one is free. Returns {"order", "cost",
+    "seed_cost", "moves", "seconds"}; "order" lists stop indices in visit order (a round
+    trip repeats the start at the end).
+    """
+    t0 = time.perf_counter()
+    cost = _prepare(cost)
+    n = len(cost)
+    if round_trip:
+        if end is not None and end != (start or 0):
+            raise ValueError("A round trip ends where it starts; drop 'end' or set round_trip to false")
+        start = 0 if start is None else start
+        end = start
+    for label, index in (("start", start), ("end", end)):
+        if index is not None and not 0 <= index < n:
+            raise ValueError(f"'{label}' index {index} is out of range for {n} stops")
+    if start is not None and start == end and not round_trip:
+        raise ValueError("'start' and 'end' are the same stop; use round_trip instead")
+
+    # a dummy node (index n, zero cost to/from everything) stands in for a free endpoint
+    dummy = None
+    if start is None or end is None:
+        dummy = n
+        cost = np.pad(cost, ((0, 1), (0, 1)))
+    first = dummy if start is None else start
+    last = dummy if end is None else end
+
+    interior = np.array([v for v in range(n) if v not in (start, end)], dtype=np.int64)
+    path = _nearest_neighbor(cost, first, last, interior)
+    seed_cost = path_cost(cost, path)
+
+    deadline = t0 + max_seconds
+    moves = 0
+    if len(interior) >= 2:
+        path, moves = _local_search(cost, path, deadline, max_moves)
+    best, best_cost = path, path_cost(cost, path)
+
+    # double-bridge needs 3 distinct cut points inside the interior
+    rng = np.random.default_rng(0)
+    stall = 0
+    while len(interior) >= 4 and stall < ILS_MAX_STALL and moves < max_moves and time.perf_counter() < deadline:
+        candidate, extra = _local_search(cost, _double_bridge(best, rng), deadline, max_moves - moves)
+        moves += extra
+        candidate_cost = path_cost(cost, candidate)
+        if candidate_cost < best_cost - _EPS:
+            best, best_cost, stall = candidate, candidate_cost, 0
+        else:
+            stall += 1
+    path = best
+
+    final_cost = path_cost(cost, path)
+    order = [int(v) for v in path if v != dummy]
+    return {
+        "order": order,
+        "cost": final_cost,
+        "seed_cost": seed_cost,
+        "moves": moves,
+        "seconds": time.perf_counter() - t0,
+    }
@@ -0,0 +1,331 @@
+import asyncio
+import collections
+import random
+import time
+
+import httpx
+
+from maps.config import env_float, env_int
+from maps.http_clients import get_client
+from maps.scheduler import UpstreamScheduler, retry_after_seconds
+
+# Several interchangeable base URLs for one upstream (mirrors / self-hosted
+# instances of Nominatim or OSRM), used like a single one:
+#   - each endpoint keeps an EWMA of its latency and error rate; requests go to
+#     the one with the lowest expected time to a good answer (with a little
+#     random exploration so a recovered endpoint gets noticed again)
+#   - hedging: if the answer takes longer than the pool's recent
+#     HEDGE_QUANTILE latency, the same request also goes to the next best endpoint
+#     and the first good answer wins (the loser is cancelled); hedges are capped
+#     at HEDGE_BUDGET of all requests so a slow pool isn't flooded
+#   - circuit breaker: CIRCUIT_FAILURES consecutive failures (connection error,
+#     timeout, 5xx) take an endpoint out for CIRCUIT_COOLDOWN seconds (jittered,
+#     doubling while it keeps failing); then one probe request decides whether it
+#     comes back. A 429 takes it out for its Retry-After.
+#   - failed attempts are retried on another endpoint right away, or after a
+#     jittered exponential backoff when there is no other one left
+# With a single URL this is the old behaviour plus retries and a breaker.
+# A pool runs inside one queued request of the upstream's scheduler, so with a
+# `limiter` every extra attempt pays its own token: a retry waits for one, a hedge
+# is only sent if one is free right away. The rate limit holds for the whole pool.
+
+HEDGE_MIN_DELAY = env_float("MAPS_HEDGE_MIN_MS", 50.0) / 1000
+HEDGE_BUDGET = env_float("MAPS_HEDGE_BUDGET", 0.1)
+CIRCUIT_FAILURES = env_int("MAPS_CIRCUIT_FAILURES", 5)
+CIRCUIT_COOLDOWN = env_float("MAPS_CIRCUIT_COOLDOWN", 10.0)
+RETRY_BACKOFF = env_float("MAPS_RETRY_BACKOFF_MS", 100.0) / 1000
+EWMA_ALPHA = 0.2
+# latency samples kept per endpoint for the hedge percentile
+WINDOW = 256
+# no hedging until the pool has this many latency samples
+MIN_SAMPLES = 20
+EXPLORE = 0.02
+
+
+class UpstreamUnavailable(RuntimeError):
+    """Raised when every endpoint of a pool is cut off by its circuit breaker."""
+
+
+class _Endpoint:
+    __slots__ = (
+        "url",
+        "ewma_s",
+        "error_ewma",
+        "window",
+        "inflight",
+        "failures",
+        "open_until",
+        "trips",
+        "opened",
+        "probing",
+        "requests",
+        "errors",
+        "hedges",
+        "hedge_wins",
+    )
+
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.ewma_s: float | None = None
+        self.error_ewma = 0.0
+        self.window: collections.deque[float] = collections.deque(maxlen=WINDOW)
+        self.inflight = 0
+        # circuit breaker: consecutive failures, closed while open_until is in the past
+        self.failures = 0
+        self.open_until = 0.0
+        self.trips = 0
+        self.opened = 0
+        self.probing = False
+        self.requests = 0
+        self.errors = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def state(self, now: float) -> str:
+        if now < self.open_until:
+            return "open"
+        return "half_open" if self.trips else "closed"
+
+    def available(self, now: float) -> bool:
+        # half-open lets exactly one probe through at a time
+        return now >= self.open_until and not (self.trips and self.probing)
+
+    def score(self) -> float:
+        # expected seconds to a good answer; unmeasured endpoints go first
+        if self.ewma_s is None:
+            return 0.0
+        return self.ewma_s * (1 + self.inflight) / max(1.0 - self.error_ewma, 0.05)
+
+    def observe(self, seconds: float, ok: bool) -> None:
+        self.window.append(seconds)
+        self.ewma_s = seconds if self.ewma_s is None else self.ewma_s + EWMA_ALPHA * (seconds - self.ewma_s)
+        self.error_ewma += EWMA_ALPHA * ((0.0 if ok else 1.0) - self.error_ewma)
+
+    def succeeded(self) -> None:
+        self.failures = 0
+        self.trips = 0
+
+    def failed(self, now: float) -> None:
+        self.errors += 1
+        self.failures += 1
+        if self.trips or self.failures >= CIRCUIT_FAILURES:
+            # a failed probe re-opens for twice as long (capped), with jitter so a
+            # pool of servers doesn't probe in lockstep
+            cooldown = min(CIRCUIT_COOLDOWN * 2**self.trips, CIRCUIT_COOLDOWN * 8)
+            self.open_until = now + cooldown * random.uniform(0.8, 1.2)
+            self.trips += 1
+            self.opened += 1
+            self.failures = 0
+
+    def cool_down(self, now: float, seconds: float) -> None:
+        # 429: the endpoint asked us to stay away; not a health failure
+        self.open_until = max(self.open_until, now + seconds)
+
+
+def _quantile(samples, q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+class EndpointPool:
+    """
+    Latency-aware, hedging, circuit-breaking GET client over several base URLs.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        urls: str | list[str],
+        timeout: float,
+        headers: dict | None = None,
+        retries: int = 2,
+        hedge_quantile: float = 0.95,
+        limiter: UpstreamScheduler | None = None,
+    ):
+        self.name = name
+        self.timeout = timeout
+        self.headers = headers
+        self.retries = retries
+        # 0 turns hedging off
+        self.hedge_quantile = hedge_quantile
+        # the scheduler whose token bucket retries and hedges draw from
+        self.limiter = limiter
+        self.requests = 0
+        self.hedged = 0
+        self.retried = 0
+        self.set_endpoints(urls)
+
+    def set_endpoints(self, urls: str | list[str]) -> None:
+        """
+        Replace the endpoints; `urls` is a list or a comma-separated string.
+        """
+        if isinstance(urls, str):
+            urls = urls.split(",")
+        urls = [u.strip() for u in urls if u.strip()]
+        if not urls:
+            raise ValueError(f"{self.name}: no upstream URL configured")
+        self.endpoints = [_Endpoint(u) for u in urls]
+
+    def _pick(self, tried: set, fresh_only: bool = False) -> _Endpoint | None:
+        """
+        Best available endpoint, preferring ones this request hasn't tried yet.
+        """
+        now = time.monotonic()
+        available = [e for e in self.endpoints if e.available(now)]
+        fresh = [e for e in available if e not in tried]
+        candidates = fresh or ([] if fresh_only else available)
+        if not candidates:
+            return None
+        if len(candidates) > 1 and random.random() < EXPLORE:
+            return random.choice(candidates)
+        return min(candidates, key=_Endpoint.score)
+
+    def _hedge_delay(self) -> float | None:
+        if not self.hedge_quantile or len(self.endpoints) < 2:
+            return None
+        # a hedge is extra load: keep them to a small share of all requests
+        if self.hedged >= HEDGE_BUDGET * self.requests:
+            return None
+        # pool-wide: a single endpoint's window is too small to put a stable
+        # percentile on, and a slow endpoint should get hedged more, not less
+        samples = [s for e in self.endpoints for s in e.window]
+        if len(samples) < MIN_SAMPLES:
+            return None
+        return max(_quantile(samples, self.hedge_quantile), HEDGE_MIN_DELAY)
+
+    async def _send(self, endpoint: _Endpoint, path: str, params: dict | None, headers: dict | None) -> httpx.Response:
+        # one pooled keep-alive client per endpoint (maps.http_clients)
+        client = get_client(f"{self.name} {endpoint.url}", endpoint.url, timeout=self.timeout, headers=self.headers)
+        endpoint.requests += 1
+        endpoint.inflight += 1
+        if endpoint.trips:
+            endpoint.probing = True
+        started = time.perf_counter()
+        try:
+            resp = await client.get(path, params=params, headers=headers)
+        except asyncio.CancelledError:
+            # lost a hedge race: what it took so far is still a (lower bound) sample
+            endpoint.observe(time.perf_counter() - started, True)
+            raise
+        except Exception:
+            endpoint.observe(time.perf_counter() - started, False)
+            endpoint.failed(time.monotonic())
+            raise
+        finally:
+            endpoint.inflight -= 1
+            endpoint.probing = False
+        ok = resp.status_code < 500 and resp.status_code != 429
+        endpoint.observe(time.perf_counter() - started, ok)
+        if resp.status_code == 429:
+            endpoint.cool_down(time.monotonic(), retry_after_seconds(resp.headers))
+        elif ok:
+            endpoint.succeeded()
+        else:
+            endpoint.failed(time.monotonic())
+        return resp
+
+    async def get(self, path: str, params: dict | None = None, headers: dict | None = None) -> httpx.Response:
+        """
+        GET `path` from the best endpoint (hedged / retried as described above).
+        Returns the first good response, else the last bad one (5xx / 429), else
+        raises the last transport error.
+        """
+        self.requests += 1
+        tried: set[_Endpoint] = set()
+        pending: dict[asyncio.Task, _Endpoint] = {}
+        hedges: set[asyncio.Task] = set()
+        attempts = 0
+        last_response: httpx.Response | None = None
+        last_error: Exception | None = None
+        hedge_at: float | None = None
+        try:
+            while True:
+                if not pending:
+                    if attempts > self.retries:
+                        break
+                    endpoint = self._pick(tried)
+                    if endpoint is None:
+                        break
+                    if endpoint in tried:
+                        # nowhere else to go: back off (full jitter) before asking it again
+                        await asyncio.sleep(random.uniform(0, RETRY_BACKOFF * 2 ** (attempts - 1)))
+                    if attempts:
+                        if self.limiter is not None:
+                            # the first attempt's token came from the queue, a retry needs its own
+                            await self.limiter.take()
+                        self.retried += 1
+                    attempts += 1
+                    tried.add(endpoint)
+                    pending[asyncio.create_task(self._send(endpoint, path, params, headers))] = endpoint
+                    delay = self._hedge_delay()
+                    hedge_at = None if delay is None else time.monotonic() + delay
+
+                timeout = None if hedge_at is None else max(hedge_at - time.monotonic(), 0.0)
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # slow answer: ask the next best endpoint too, first good answer wins
+                    hedge_at = None
+                    other = self._pick(tried, fresh_only=True)
+                    # a hedge is optional: skip it rather than wait for (or exceed) the rate
+                    if other is not None and (self.limiter is None or self.limiter.try_take()):
+                        self.hedged += 1
+                        other.hedges += 1
+                        tried.add(other)
+                        task = asyncio.create_task(self._send(other, path, params, headers))
+                        pending[task] = other
+                        hedges.add(task)
+                    continue
+
+                for task in done:
+                    endpoint = pending.pop(task)
+                    try:
+                        resp = task.result()
+                    except Exception as e:
+                        last_error = e
+                        continue
+                    if resp.status_code < 500 and resp.status_code != 429:
+                        if task in hedges:
+                            endpoint.hedge_wins += 1
+                        return resp
+                    last_response = resp
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+        if last_response is not None:
+            return last_response
+        if last_error is not None:
+            raise last_error
+        now = time.monotonic()
+        retry_in = min(e.open_until for e in self.endpoints) - now
+        raise UpstreamUnavailable(
+            f"{self.name}: every upstream endpoint is failing (circuit open), retry in {max(retry_in, 0):.0f}s"
+        )
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "name": self.name,
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "retried": self.retried,
+            "endpoints": [
+                {
+                    "url": e.url,
+                    "state": e.state(now),
+                    "ewma_ms": round(e.ewma_s * 1000, 1) if e.ewma_s is not None else None,
+                    "p95_ms": round(_quantile(e.window, 0.95) * 1000, 1) if e.window else None,
+                    "error_rate": round(e.error_ewma, 3),
+                    "inflight": e.inflight,
+                    "requests": e.requests,
+                    "errors": e.errors,
+                    "hedges": e.hedges,
+                    "hedge_wins": e.hedge_wins,
+                    "circuit_opened": e.opened,
+                }
+                for e in self.endpoints
+            ],
+        }
+
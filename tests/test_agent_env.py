@@ -0,0 +1,66 @@
+import pytest
+
+pytest.importorskip("agents")
+
+from agent import main_agent  # noqa: E402
+
+
+def _spawn_env(module: str) -> dict:
+    server = main_agent._mcp_server("test", module, "TEST_UNSET_SERVER_URL")
+    return server.params.env
+
+
+@pytest.fixture(autouse=True)
+def _no_url(monkeypatch):
+    monkeypatch.delenv("TEST_UNSET_SERVER_URL", raising=False)
+
+
+def test_routing_settings_reach_the_routing_server(monkeypatch):
+    monkeypatch.setenv("ROUTING_BACKEND", "local")
+    monkeypatch.setenv("LOCAL_GRAPH_DIR", "/srv/graphs")
+    monkeypatch.setenv("OSRM_BASE", "http://osrm-a:5000,http://osrm-b:5000")
+    monkeypatch.setenv("OSRM_RATE", "0")
+    monkeypatch.setenv("MATCH_CHUNK_OVERLAP", "6")
+    monkeypatch.setenv("MAPS_OUTPUT_MAX_BYTES", "32000")
+    env = _spawn_env("maps.routing_server")
+    assert env["ROUTING_BACKEND"] == "local"
+    assert env["LOCAL_GRAPH_DIR"] == "/srv/graphs"
+    assert env["OSRM_BASE"] == "http://osrm-a:5000,http://osrm-b:5000"
+    assert env["OSRM_RATE"] == "0"
+    assert env["MATCH_CHUNK_OVERLAP"] == "6"
+    assert env["MAPS_OUTPUT_MAX_BYTES"] == "32000"
+
+
+def test_geocoder_settings_reach_the_geo_server(monkeypatch):
+    monkeypatch.setenv("GEOCODER_BACKEND", "local")
+    monkeypatch.setenv("LOCAL_GEOCODER_DIR", "/srv/geocoder")
+    monkeypatch.setenv("NOMINATIM_BASE", "http://nominatim:8080")
+    monkeypatch.setenv("GEO_CACHE_PATH", "/srv/cache/geo.sqlite")
+    env = _spawn_env("maps.geo_server")
+    assert env["GEOCODER_BACKEND"] == "local"
+    assert env["LOCAL_GEOCODER_DIR"] == "/srv/geocoder"
+    assert env["NOMINATIM_BASE"] == "http://nominatim:8080"
+    assert env["GEO_CACHE_PATH"] == "/srv/cache/geo.sqlite"
+
+
+def test_secrets_and_unrelated_variables_stay_behind(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.setenv("SOME_OTHER_TOOL_SETTING", "1")
+    env = _spawn_env("maps.routing_server")
+    assert "OPENAI_API_KEY" not in env
+    assert "SOME_OTHER_TOOL_SETTING" not in env
+
+
+def test_trace_file_is_added(monkeypatch):
+    monkeypatch.setattr("agent.tracing._trace_file", "/tmp/trace.jsonl")
+    monkeypatch.setenv("OSRM_RATE", "2")
+    env = _spawn_env("maps.routing_server")
+    assert env["MAPS_TRACE_FILE"] == "/tmp/trace.jsonl"
+    assert env["OSRM_RATE"] == "2"
+
+
+def test_client_timeout_is_read_when_servers_are_set_up(monkeypatch):
+    # .env is loaded in main(), after the module was imported
+    monkeypatch.setenv("MAPS_CLIENT_TIMEOUT_S", "42")
+    server = main_agent._mcp_server("test", "maps.geo_server", "TEST_UNSET_SERVER_URL")
+    assert server.client_session_timeout_seconds == 42
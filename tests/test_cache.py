@@ -0,0 +1,170 @@
+import asyncio
+import types
+
+import pytest
+
+from maps import cache
+from maps.cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(cache, "time", types.SimpleNamespace(time=fake.time))
+    return fake
+
+
+def test_entries_expire(clock):
+    c = TTLCache("test", ttl=10.0)
+    c.set("a", 1)
+    c.set("b", 2, ttl=30.0)
+    clock.now += 9.9
+    assert c.get("a") == 1
+    clock.now += 0.2
+    assert c.get("a") is None
+    assert c.peek("b") == 2
+    assert c.get("b") == 2
+    clock.now += 30.0
+    assert c.get("b", "gone") == "gone"
+    assert c.stats()["memory_size"] == 0
+
+
+def test_lru_keeps_what_was_read(clock):
+    c = TTLCache("test", max_size=2, eviction="lru")
+    c.set("a", 1)
+    c.set("b", 2)
+    c.get("a")
+    c.set("c", 3)
+    assert c.peek("a") == 1
+    assert c.peek("b") is None
+    assert c.evictions == 1
+
+
+def test_fifo_ignores_reads(clock):
+    c = TTLCache("test", max_size=2, eviction="fifo")
+    c.set("a", 1)
+    c.set("b", 2)
+    c.get("a")
+    c.set("c", 3)
+    assert c.peek("a") is None
+    assert c.peek("b") == 2
+
+
+def test_peek_leaves_counters_and_order_alone(clock):
+    c = TTLCache("test", max_size=2)
+    c.set("a", 1)
+    c.set("b", 2)
+    c.peek("a")
+    c.set("c", 3)
+    assert c.peek("a") is None
+    assert (c.hits, c.misses) == (0, 0)
+
+
+def test_unknown_eviction_policy():
+    with pytest.raises(ValueError, match="eviction"):
+        TTLCache("test", eviction="random")
+
+
+def test_sqlite_tier_survives_a_restart(clock, tmp_path):
+    path = str(tmp_path / "cache" / "test.sqlite")
+    c = TTLCache("test", max_size=1, path=path)
+    c.set("a", {"lat": "33.9", "name": "Beyrouth – بيروت"})
+    c.set("b", [1, 2])
+    c.close()
+
+    again = TTLCache("test", max_size=1, path=path)
+    assert again.get("a") == {"lat": "33.9", "name": "Beyrouth – بيروت"}
+    assert again.disk_hits == 1
+    # promoted to memory: the next hit doesn't touch the disk
+    assert again.get("a") is not None
+    assert again.disk_hits == 1
+    assert again.get("b") == [1, 2]
+    again.close()
+
+
+def test_expired_disk_entries_are_dropped(clock, tmp_path):
+    path = str(tmp_path / "test.sqlite")
+    c = TTLCache("test", ttl=10.0, path=path)
+    c.set("old", 1)
+    c.set("new", 2, ttl=100.0)
+    c.close()
+
+    clock.now += 50.0
+    again = TTLCache("test", path=path)
+    (count,) = again._db.execute("SELECT COUNT(*) FROM cache").fetchone()
+    assert count == 1
+    assert again.get("old") is None
+    assert again.get("new") == 2
+    again.close()
+
+
+def test_disk_tier_is_trimmed_to_its_limit(clock, tmp_path):
+    c = TTLCache("test", max_size=10, path=str(tmp_path / "test.sqlite"), max_disk_size=100)
+    for i in range(256):
+        clock.now += 1
+        c.set(f"k{i}", i)
+    (count,) = c._db.execute("SELECT COUNT(*) FROM cache").fetchone()
+    assert count == 100
+    # the least recently used ones went
+    assert c._db.execute("SELECT 1 FROM cache WHERE key = 'k0'").fetchone() is None
+    assert c._db.execute("SELECT 1 FROM cache WHERE key = 'k255'").fetchone() is not None
+    c.close()
+
+
+def test_clear(clock, tmp_path):
+    c = TTLCache("test", path=str(tmp_path / "test.sqlite"))
+    c.set("a", 1)
+    c.clear()
+    assert c.get("a") is None
+    c.close()
+
+
+@pytest.fixture
+def geo(monkeypatch):
+    geo_server = pytest.importorskip("maps.geo_server")
+    monkeypatch.setattr(geo_server, "GEO_CACHE", TTLCache("test_geocode"))
+    monkeypatch.setattr(geo_server, "GEOCODER_BACKEND", "nominatim")
+    calls = []
+
+    async def nominatim_get(path, params, priority="interactive"):
+        calls.append(params["q"])
+        return [{"display_name": "Nominatim", "lat": "33.9", "lon": "35.5"}]
+
+    class Local:
+        def search(self, query, country_code=None, limit=3):
+            calls.append(f"local {query}")
+            return [{"display_name": "Local", "lat": "33.9", "lon": "35.5"}]
+
+    monkeypatch.setattr(geo_server, "_nominatim_get", nominatim_get)
+    monkeypatch.setattr(geo_server, "_local_geocoder", Local)
+    return geo_server, calls
+
+
+def test_geocode_cache_key_is_normalized(geo):
+    geo_server, calls = geo
+    first = asyncio.run(geo_server._geocode("American University of Beirut", "LB", 1))
+    again = asyncio.run(geo_server._geocode("  american  university of BEIRUT ", "lb", 1))
+    assert first == again
+    assert calls == ["American University of Beirut"]
+    # a different limit or country is another lookup
+    asyncio.run(geo_server._geocode("American University of Beirut", "lb", 3))
+    asyncio.run(geo_server._geocode("American University of Beirut", None, 1))
+    assert len(calls) == 3
+
+
+def test_geocode_cache_is_scoped_by_backend(geo, monkeypatch):
+    geo_server, calls = geo
+    nominatim = asyncio.run(geo_server._geocode("Hamra", "lb", 1))
+    monkeypatch.setattr(geo_server, "GEOCODER_BACKEND", "local")
+    local = asyncio.run(geo_server._geocode("Hamra", "lb", 1))
+    assert nominatim[0]["display_name"] == "Nominatim"
+    assert local[0]["display_name"] == "Local"
+    assert calls == ["Hamra", "local Hamra"]
@@ -0,0 +1,91 @@
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("agents")
+
+from agents.tool_context import ToolContext  # noqa: E402
+from mcp import types  # noqa: E402
+
+from agent.composite_tools import composite_tools  # noqa: E402
+
+PLACES = {
+    "aub": ("American University of Beirut", "33.9002", "35.4800"),
+    "airport": ("Beirut–Rafic Hariri International Airport", "33.8209", "35.4884"),
+}
+
+
+class FakeServer:
+    """
+    Stands in for a connected MCPServer: records calls, answers like the real tools.
+    """
+
+    def __init__(self, answer):
+        self.answer = answer
+        self.calls = []
+
+    async def call_tool(self, tool_name, arguments, meta=None):
+        self.calls.append((tool_name, arguments))
+        body = self.answer(tool_name, arguments)
+        return types.CallToolResult(content=[types.TextContent(type="text", text=json.dumps(body))])
+
+
+def _geocode(tool_name, arguments):
+    assert tool_name == "geocode_place"
+    match = PLACES.get(arguments["query"].strip().lower())
+    results = [] if match is None else [{"display_name": match[0], "lat": match[1], "lon": match[2]}]
+    return {"query": arguments["query"], "results": results}
+
+
+def _routing(tool_name, arguments):
+    if tool_name == "route_between":
+        return {"distance_m": 9800.0, "duration_s": 840.0, "legs": None, "geometry": None}
+    n = len(arguments.get("coordinates") or arguments["sources"])
+    m = len(arguments.get("coordinates") or arguments["destinations"])
+    return {"sources": [], "destinations": [], "durations": [[60.0] * m] * n, "distances": None}
+
+
+def _invoke(tools, name, arguments):
+    (tool,) = [t for t in tools if t.name == name]
+    context = ToolContext(context=None, tool_name=name, tool_call_id="call", tool_arguments=json.dumps(arguments))
+    return asyncio.run(tool.on_invoke_tool(context, json.dumps(arguments)))
+
+
+@pytest.fixture
+def servers():
+    return FakeServer(_geocode), FakeServer(_routing)
+
+
+def test_route_between_places_chains_geocode_and_route(servers):
+    geo, routing = servers
+    body = json.loads(_invoke(composite_tools(geo, routing), "route_between_places", {"origin": "AUB", "destination": "airport"}))
+    assert body["origin"]["name"] == "American University of Beirut"
+    assert body["destination"]["lat"] == pytest.approx(33.8209)
+    assert (body["distance_m"], body["duration_s"]) == (9800.0, 840.0)
+    assert [name for name, _ in geo.calls] == ["geocode_place", "geocode_place"]
+    ((name, arguments),) = routing.calls
+    assert name == "route_between"
+    assert (arguments["start_lat"], arguments["end_lon"]) == (pytest.approx(33.9002), pytest.approx(35.4884))
+    # full results from the servers, the tool trims them itself
+    assert arguments["max_bytes"] == 0
+
+
+def test_matrix_between_places_geocodes_each_distinct_name_once(servers):
+    geo, routing = servers
+    places = ["AUB", "  aub ", "airport", "33.89,35.50"]
+    body = json.loads(_invoke(composite_tools(geo, routing), "matrix_between_places", {"places": places}))
+    assert sorted(arguments["query"] for _, arguments in geo.calls) == ["AUB", "airport"]
+    assert len(body["sources"]) == 4
+    assert body["sources"][3] == {"query": "33.89,35.50", "lat": 33.89, "lon": 35.5}
+    ((name, arguments),) = routing.calls
+    assert name == "distance_matrix"
+    assert len(arguments["coordinates"]) == 4
+    assert len(body["durations"]) == 4
+
+
+def test_unmatched_names_are_listed(servers):
+    geo, routing = servers
+    text = _invoke(composite_tools(geo, routing), "route_between_places", {"origin": "AUB", "destination": "Atlantis"})
+    assert "Atlantis" in json.loads(text)["error"]
+    assert routing.calls == []
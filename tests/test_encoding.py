@@ -0,0 +1,78 @@
+import base64
+import random
+
+import numpy as np
+import pytest
+
+from maps.encoding import (
+    UINT32_NODATA,
+    decode_polyline,
+    encode_matrix,
+    encode_polyline,
+    matrix_to_json,
+    pack_matrix,
+)
+
+# the example from Google's polyline algorithm documentation
+GOOGLE_POINTS = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+GOOGLE_POLYLINE = "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+
+
+def _unpack(packed: dict) -> np.ndarray:
+    dtype = "<f4" if packed["dtype"] == "float32" else "<u4"
+    return np.frombuffer(base64.b64decode(packed["data"]), dtype=dtype).reshape(packed["shape"])
+
+
+def test_polyline_matches_reference():
+    assert encode_polyline(GOOGLE_POINTS) == GOOGLE_POLYLINE
+    assert decode_polyline(GOOGLE_POLYLINE) == GOOGLE_POINTS
+
+
+@pytest.mark.parametrize("precision", [5, 6])
+def test_polyline_round_trip(precision):
+    rng = random.Random(precision)
+    points = [(rng.uniform(-90, 90), rng.uniform(-180, 180)) for _ in range(200)]
+    decoded = decode_polyline(encode_polyline(points, precision), precision)
+    assert len(decoded) == len(points)
+    for (lat, lon), (dlat, dlon) in zip(points, decoded):
+        assert abs(lat - dlat) <= 0.5 / 10**precision + 1e-12
+        assert abs(lon - dlon) <= 0.5 / 10**precision + 1e-12
+
+
+def test_polyline_empty():
+    assert encode_polyline([]) == ""
+    assert decode_polyline("") == []
+
+
+def test_matrix_to_json_nan_is_null():
+    matrix = np.array([[0.0, 1.5], [np.nan, 0.0]])
+    assert matrix_to_json(matrix) == [[0.0, 1.5], [None, 0.0]]
+
+
+def test_pack_float32_round_trip():
+    matrix = np.array([[0.0, 12.25, np.nan], [3.5, 0.0, 7.0]])
+    packed = pack_matrix(matrix, "float32")
+    assert packed["shape"] == [2, 3]
+    assert packed["order"] == "row-major"
+    assert packed["byteorder"] == "little"
+    assert packed["nodata"] == "NaN"
+    np.testing.assert_array_equal(_unpack(packed), matrix.astype(np.float32))
+
+
+def test_pack_uint32_rounds_and_marks_nodata():
+    matrix = np.array([[0.4, 12.6], [np.nan, 3.5]])
+    packed = pack_matrix(matrix, "uint32")
+    assert packed["nodata"] == UINT32_NODATA
+    assert _unpack(packed).tolist() == [[0, 13], [UINT32_NODATA, 4]]
+
+
+def test_pack_unknown_dtype():
+    with pytest.raises(ValueError):
+        pack_matrix(np.zeros((2, 2)), "float16")
+
+
+def test_encode_matrix_dispatch():
+    matrix = np.eye(2)
+    assert encode_matrix(None, "json") is None
+    assert encode_matrix(matrix, "json") == [[1.0, 0.0], [0.0, 1.0]]
+    assert encode_matrix(matrix, "float32")["dtype"] == "float32"
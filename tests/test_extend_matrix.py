@@ -0,0 +1,94 @@
+import asyncio
+import json
+
+import numpy as np
+import pytest
+
+from maps import routing_server
+
+POINTS = [[33.89, 35.50], [34.12, 35.65], [33.56, 35.37], [33.27, 35.20], [34.43, 35.83]]
+
+
+def _cell(src: list, dst: list) -> float:
+    # a made-up travel time that tells every (source, destination) cell apart
+    return round(1000 * src[0] + dst[0], 2)
+
+
+@pytest.fixture
+def tables(monkeypatch):
+    """
+    Stand-in for _matrix; records which source x destination blocks were asked for.
+    """
+    calls = []
+
+    def waypoints(points):
+        return [{"location": [lon, lat]} for lat, lon in points]
+
+    async def matrix(profile, sources, destinations, annotations, symmetric, remember=True):
+        calls.append((list(sources), list(destinations)))
+        durations = np.array([[_cell(s, d) for d in destinations] for s in sources])
+        return durations, durations * 10, waypoints(sources), waypoints(destinations)
+
+    monkeypatch.setattr(routing_server, "_matrix", matrix)
+    monkeypatch.setattr(routing_server, "MATRIX_HANDLES", routing_server.TTLCache("test_handles", 8, 60.0))
+    return calls
+
+
+def _expected(sources: list, destinations: list) -> list:
+    return [[_cell(s, d) for d in destinations] for s in sources]
+
+
+def _run(*steps):
+    # one event loop for the whole session: the handle's lock lives on it
+    async def run():
+        bodies = []
+        for tool, arguments in steps:
+            if bodies and "handle" not in arguments:
+                arguments = {**arguments, "handle": bodies[0]["handle"]}
+            bodies.append(json.loads((await tool(arguments))[0].text))
+        return bodies
+
+    return asyncio.run(run())
+
+
+def test_adding_points_queries_only_the_new_strips(tables):
+    old, new = POINTS[:3], POINTS[3:]
+    first, extended = _run(
+        (routing_server._tool_distance_matrix, {"coordinates": old, "handle": True}),
+        (routing_server._tool_extend_matrix, {"coordinates": new}),
+    )
+    assert first["durations"] == _expected(old, old)
+    assert extended["handle"] == first["handle"]
+    assert extended["durations"] == _expected(POINTS, POINTS)
+    assert len(extended["sources"]) == len(extended["destinations"]) == 5
+    # the old 3 x 3 block came from the handle, not from another query
+    assert tables == [(old, old), (new, POINTS), (old, new)]
+
+
+def test_extend_sources_and_destinations_separately(tables):
+    sources, destinations = POINTS[:2], POINTS[2:4]
+    first, more_rows, more_cols = _run(
+        (routing_server._tool_distance_matrix, {"sources": sources, "destinations": destinations, "handle": True}),
+        (routing_server._tool_extend_matrix, {"sources": [POINTS[4]]}),
+        (routing_server._tool_extend_matrix, {"destinations": [POINTS[0]]}),
+    )
+    assert first["durations"] == _expected(sources, destinations)
+    assert more_rows["durations"] == _expected(sources + [POINTS[4]], destinations)
+    assert more_cols["durations"] == _expected(sources + [POINTS[4]], destinations + [POINTS[0]])
+    assert tables[1:] == [
+        ([POINTS[4]], destinations),
+        (sources + [POINTS[4]], [POINTS[0]]),
+    ]
+
+
+def test_non_square_matrix_cannot_take_coordinates(tables):
+    with pytest.raises(ValueError, match="separate sources and destinations"):
+        _run(
+            (routing_server._tool_distance_matrix, {"sources": POINTS[:2], "destinations": POINTS[2:], "handle": True}),
+            (routing_server._tool_extend_matrix, {"coordinates": [POINTS[0]]}),
+        )
+
+
+def test_unknown_handle(tables):
+    with pytest.raises(ValueError, match="Unknown or expired matrix handle"):
+        _run((routing_server._tool_extend_matrix, {"handle": "nope", "coordinates": [POINTS[0]]}))
@@ -0,0 +1,90 @@
+import math
+
+import numpy as np
+import pytest
+
+from maps.isochrone import IsochroneGrid, _marching_squares, _signed_area
+from maps.road_index import M_PER_DEG
+
+
+def _radial(size: int) -> np.ndarray:
+    # distance from the lattice center, in lattice units
+    rows, cols = np.mgrid[0:size, 0:size]
+    center = (size - 1) / 2
+    return np.hypot(rows - center, cols - center)
+
+
+def test_marching_squares_disc_is_one_ccw_ring():
+    grid = _radial(41)
+    rings = _marching_squares(grid, 10.0)
+    assert len(rings) == 1
+    ring = rings[0]
+    assert ring[0] == ring[-1]
+    area = _signed_area(ring[:-1])
+    assert area > 0
+    assert area == pytest.approx(math.pi * 10.0**2, rel=0.02)
+
+
+def test_marching_squares_annulus_has_a_cw_hole():
+    # inside = between radius 6 and 14
+    grid = np.abs(_radial(41) - 10.0)
+    rings = _marching_squares(grid, 4.0)
+    areas = sorted(_signed_area(ring[:-1]) for ring in rings)
+    assert len(areas) == 2
+    assert areas[0] == pytest.approx(-math.pi * 6.0**2, rel=0.05)
+    assert areas[1] == pytest.approx(math.pi * 14.0**2, rel=0.02)
+
+
+def test_marching_squares_nothing_inside():
+    assert _marching_squares(np.full((5, 5), 10.0), 1.0) == []
+
+
+def _evaluate_all(grid: IsochroneGrid, seconds_per_m: float) -> None:
+    rows, cols = np.mgrid[0 : grid.size, 0 : grid.size]
+    lat, lon = grid.to_latlon(rows.ravel(), cols.ravel())
+    north = (lat - grid.lat) * M_PER_DEG
+    east = (lon - grid.lon) * M_PER_DEG * math.cos(math.radians(grid.lat))
+    grid.set_values(rows.ravel(), cols.ravel(), np.hypot(north, east) * seconds_per_m)
+
+
+def test_contour_area_matches_a_uniform_speed_disc():
+    # 10 m/s everywhere: the 300 s isochrone is a 3 km disc
+    grid = IsochroneGrid(33.9, 35.5, radius_m=5_000, resolution=41, levels=0)
+    _evaluate_all(grid, 0.1)
+    polygons = grid.contours(grid.filled([300.0]), 300.0)
+    assert len(polygons) == 1
+    assert len(polygons[0]) == 1
+    assert grid.area_km2(polygons) == pytest.approx(math.pi * 3.0**2, rel=0.02)
+    lat, lon = polygons[0][0][0]
+    assert abs(lat - 33.9) < 0.05 and abs(lon - 35.5) < 0.05
+
+
+def test_refinement_only_targets_straddling_cells():
+    grid = IsochroneGrid(33.9, 35.5, radius_m=5_000, resolution=9, levels=2)
+    rows, cols = grid.coarse_points()
+    lat, lon = grid.to_latlon(rows, cols)
+    north = (lat - grid.lat) * M_PER_DEG
+    east = (lon - grid.lon) * M_PER_DEG * math.cos(math.radians(grid.lat))
+    grid.set_values(rows, cols, np.hypot(north, east) * 0.1)
+
+    new_rows, new_cols = grid.refine_points(grid.stride, [300.0])
+    assert len(new_rows) > 0
+    # fewer than the full set of midpoints at this level
+    assert len(new_rows) < (grid.size // 2 + 1) ** 2 - len(rows)
+    assert not grid.known[new_rows, new_cols].any()
+    # every new point lies in a cell whose corner times straddle 300 s
+    center = (grid.size - 1) / 2
+    scale = 2 * grid.radius_m / (grid.size - 1)
+    distance_m = np.hypot(new_rows - center, new_cols - center) * scale
+    assert (np.abs(distance_m - 3_000) < grid.stride * scale * 1.5).all()
+
+
+def test_filled_keeps_known_values_and_fills_the_rest():
+    grid = IsochroneGrid(33.9, 35.5, radius_m=1_000, resolution=3, levels=1)
+    rows, cols = grid.coarse_points()
+    grid.set_values(rows, cols, np.arange(len(rows), dtype=float) * 10)
+    filled = grid.filled([100.0])
+    assert not np.isnan(filled).any()
+    np.testing.assert_array_equal(filled[rows, cols], np.arange(len(rows), dtype=float) * 10)
+    # center of the first coarse cell = mean of its four corners
+    assert filled[1, 1] == pytest.approx((filled[0, 0] + filled[0, 2] + filled[2, 0] + filled[2, 2]) / 4)
@@ -0,0 +1,67 @@
+import pytest
+
+from maps.local_router import way_rule
+
+
+@pytest.mark.parametrize(
+    "tags",
+    [
+        {"highway": "primary", "junction": "roundabout"},
+        {"highway": "residential", "junction": "roundabout"},
+        {"highway": "motorway"},
+    ],
+)
+def test_untagged_roundabouts_and_motorways_are_oneway(tags):
+    speed, forward, backward = way_rule(tags, "driving")
+    assert speed > 0
+    assert (forward, backward) == (True, False)
+
+
+def test_explicit_oneway_tag_wins_over_implied():
+    assert way_rule({"highway": "motorway", "oneway": "no"}, "driving")[1:] == (True, True)
+    assert way_rule({"highway": "primary", "junction": "roundabout", "oneway": "-1"}, "driving")[1:] == (False, True)
+
+
+@pytest.mark.parametrize("value", ["yes", "true", "1"])
+def test_oneway_yes(value):
+    assert way_rule({"highway": "residential", "oneway": value}, "driving")[1:] == (True, False)
+
+
+def test_plain_road_is_two_way():
+    assert way_rule({"highway": "residential"}, "driving")[1:] == (True, True)
+
+
+def test_walking_ignores_oneway():
+    assert way_rule({"highway": "primary", "junction": "roundabout"}, "walking")[1:] == (True, True)
+
+
+def test_cycling_oneway_bicycle_exception():
+    assert way_rule({"highway": "residential", "oneway": "yes"}, "cycling")[1:] == (True, False)
+    assert way_rule({"highway": "residential", "oneway": "yes", "oneway:bicycle": "no"}, "cycling")[1:] == (True, True)
+
+
+@pytest.mark.parametrize(
+    "tags, profile",
+    [
+        ({"highway": "footway"}, "driving"),
+        ({"highway": "motorway"}, "walking"),
+        ({"highway": "residential", "access": "private"}, "driving"),
+        ({"highway": "residential", "area": "yes"}, "driving"),
+        ({"highway": "residential", "motor_vehicle": "no"}, "driving"),
+        ({"building": "yes"}, "driving"),
+    ],
+)
+def test_not_routable(tags, profile):
+    assert way_rule(tags, profile) is None
+
+
+def test_maxspeed_capped():
+    slow, _, _ = way_rule({"highway": "primary", "maxspeed": "30"}, "driving")
+    fast, _, _ = way_rule({"highway": "primary", "maxspeed": "300"}, "driving")
+    assert slow == 30
+    assert fast < 300
+
+
+def test_unknown_profile():
+    with pytest.raises(ValueError):
+        way_rule({"highway": "primary"}, "flying")
@@ -0,0 +1,75 @@
+import asyncio
+import json
+
+import pytest
+
+from maps import routing_server
+from maps.routing_server import _plan_match_chunks
+
+# 22 points in windows of 10; an overlap of 30 is clamped to 5 → chunks start at 0, 5, 10, 15
+SIZE = 10
+N = 22
+
+
+def _fake_match(failing: set[int]):
+    async def match_chunk(profile, points, radius_m):
+        # the trace point's latitude is its index; every leg's distance names its chunk
+        first = int(points[0][0])
+        if first in failing:
+            return None
+        return {
+            "tracepoints": [{"matchings_index": 0, "waypoint_index": w} for w in range(len(points))],
+            "matchings": [
+                {
+                    "confidence": 0.9,
+                    "legs": [{"distance": float(first), "duration": 1.0, "steps": []} for _ in points[1:]],
+                }
+            ],
+        }
+
+    return match_chunk
+
+
+@pytest.fixture
+def match_trace(monkeypatch):
+    monkeypatch.setattr(routing_server, "ROUTING_BACKEND", "osrm")
+    monkeypatch.setattr(routing_server, "OSRM_MATCH_MAX_COORDS", SIZE)
+    monkeypatch.setattr(routing_server, "MATCH_CHUNK_OVERLAP", 30)
+
+    def run(failing=()):
+        monkeypatch.setattr(routing_server, "_match_chunk", _fake_match(set(failing)))
+        arguments = {"points": [[float(i), 35.5] for i in range(N)], "legs": True, "encoding": "json"}
+        return json.loads(asyncio.run(routing_server._tool_match_trace(arguments))[0].text)
+
+    return run
+
+
+def test_plan_clamps_the_overlap():
+    chunks = _plan_match_chunks(N, SIZE, 30)
+    assert [(c.start, c.stop) for c in chunks] == [(0, 10), (5, 15), (10, 20), (15, 22)]
+    assert _plan_match_chunks(5, SIZE, 3) == [range(5)]
+
+
+def test_legs_come_from_the_middle_of_each_overlap(match_trace):
+    body = match_trace()
+    assert body["chunks"] == 4
+    assert body["matched"] == N
+    assert body["unmatched_indices"] == []
+    (stretch,) = body["matchings"]
+    assert (stretch["from_index"], stretch["to_index"]) == (0, N - 1)
+    # overlaps of 5: the boundaries sit at 5 + 2, 10 + 2 and 15 + 2
+    owners = {start: distance for start, _end, distance, _duration in body["legs"]}
+    assert sorted(owners) == list(range(N - 1))
+    expected = {i: 0 if i < 7 else 5 if i < 12 else 10 if i < 17 else 15 for i in range(N - 1)}
+    assert owners == expected
+
+
+def test_a_neighbour_fills_in_for_a_failed_chunk(match_trace):
+    body = match_trace(failing={5})
+    owners = {start: distance for start, _end, distance, _duration in body["legs"]}
+    # chunk 0 ends at point 9 and chunk 10 starts there: only the 9 → 10 leg is lost
+    assert sorted(owners) == [i for i in range(N - 1) if i != 9]
+    assert owners[7] == owners[8] == 0
+    assert owners[10] == owners[11] == 10
+    assert [(m["from_index"], m["to_index"]) for m in body["matchings"]] == [(0, 9), (10, N - 1)]
+    assert body["unmatched_indices"] == []
@@ -0,0 +1,102 @@
+import asyncio
+import json
+
+import numpy as np
+import pytest
+
+from maps import output
+from maps.encoding import pack_matrix
+from maps.output import _shrink, next_page, project, render
+
+
+def _render(result, arguments, page=()):
+    return json.loads(asyncio.run(render(result, arguments, page=page))[0].text)
+
+
+def _rows(n):
+    return {"count": n, "results": [{"name": f"place {i}", "lat": 33.9 + i / 1000, "lon": 35.5} for i in range(n)]}
+
+
+def test_project_dotted_paths_reach_into_lists():
+    result = {"distance_m": 10, "duration_s": 2, "results": [{"lat": 1, "lon": 2, "name": "a"}]}
+    assert project(result, ["distance_m", "results.lat"]) == {"distance_m": 10, "results": [{"lat": 1}]}
+
+
+def test_project_shorter_path_keeps_everything_below():
+    result = {"results": [{"lat": 1, "lon": 2}]}
+    assert project(result, ["results", "results.lat"]) == result
+    assert project(result, ["results.lat", "results"]) == result
+
+
+def test_project_unknown_field():
+    with pytest.raises(ValueError, match="Unknown field"):
+        project({"a": 1}, ["b"])
+
+
+def test_no_budget_by_default():
+    assert output.OUTPUT_MAX_BYTES == 0
+    result = _rows(500)
+    assert _render(result, {}, page=("results",)) == result
+
+
+def test_fits_in_budget_unchanged():
+    result = _rows(2)
+    assert _render(result, {"max_bytes": 10_000}, page=("results",)) == result
+
+
+def test_pages_reassemble_to_the_full_result():
+    result = _rows(200)
+    budget = 2_000
+    body = _render(result, {"max_bytes": budget}, page=("results",))
+    rows = list(body["results"])
+    pages = 1
+    while body["page"]["next_cursor"]:
+        text = asyncio.run(next_page({"cursor": body["page"]["next_cursor"], "max_bytes": budget}))[0].text
+        assert len(text.encode()) <= budget
+        body = json.loads(text)
+        rows += body["results"]
+        pages += 1
+    assert rows == result["results"]
+    assert pages > 1
+    assert body["page"]["total"] == 200
+    assert body["count"] == 200
+
+
+def test_bad_cursor():
+    with pytest.raises(ValueError, match="cursor"):
+        asyncio.run(next_page({"cursor": "nope.0"}))
+
+
+def test_packed_matrix_is_never_cut():
+    matrix = np.arange(250 * 250, dtype=float).reshape(250, 250)
+    packed = pack_matrix(matrix, "float32")
+    result = {"sources": [[0, 0]] * 250, "durations": packed, "distances": None}
+    body = _render(result, {"max_bytes": 1_000}, page=("sources", "durations", "distances"))
+    assert body == result
+    assert "omitted" not in body
+
+
+def test_shrink_cuts_largest_member_first_and_reports_it():
+    body = {"geometry": "x" * 5_000, "legs": list(range(100)), "distance_m": 12.5}
+    shrunk = _shrink(body, 400)
+    assert len(json.dumps(shrunk, separators=(",", ":")).encode()) <= 400
+    assert shrunk["geometry"] is None
+    assert shrunk["distance_m"] == 12.5
+    fields = {entry["field"] for entry in shrunk["omitted"]}
+    assert "geometry" in fields
+    # copy-on-write: the input is untouched
+    assert len(body["geometry"]) == 5_000
+    assert len(body["legs"]) == 100
+
+
+def test_shrink_list_keeps_prefix():
+    shrunk = _shrink({"legs": list(range(1_000))}, 300)
+    legs = shrunk["legs"]
+    assert legs == list(range(len(legs)))
+    (entry,) = shrunk["omitted"]
+    assert entry == {"field": "legs", "kept": len(legs), "total": 1_000}
+
+
+def test_shrink_is_deterministic():
+    body = {"a": "y" * 900, "b": [{"c": "z" * 300}] * 10}
+    assert _shrink(body, 500) == _shrink(body, 500)
@@ -0,0 +1,66 @@
+import asyncio
+import json
+
+import pytest
+
+from maps.cache import TTLCache
+from maps.geo_utils import geohash_encode, zoom_to_geohash_precision
+
+geo_server = pytest.importorskip("maps.geo_server")
+
+POINT = (33.90001, 35.48001)
+# ~2 m away, same 8-character (zoom 18) cell
+JITTER = (33.90003, 35.48003)
+# ~100 m away
+NEXT_STREET = (33.9009, 35.4809)
+
+
+@pytest.fixture
+def nominatim(monkeypatch):
+    monkeypatch.setattr(geo_server, "REVERSE_CACHE", TTLCache("test_reverse"))
+    monkeypatch.setattr(geo_server, "REVERSE_CACHE_MAX_ERROR_M", 0.0)
+    calls = []
+
+    async def nominatim_get(path, params, priority="interactive"):
+        calls.append((params["lat"], params["lon"], params["zoom"]))
+        return {"lat": str(params["lat"]), "lon": str(params["lon"]), "display_name": f"#{len(calls)}", "address": {}}
+
+    monkeypatch.setattr(geo_server, "_nominatim_get", nominatim_get)
+    return calls
+
+
+def _reverse(point, zoom=18):
+    arguments = {"lat": point[0], "lon": point[1], "zoom": zoom}
+    return json.loads(asyncio.run(geo_server._tool_reverse_geocode(arguments))[0].text)
+
+
+def test_gps_jitter_hits_the_same_cell(nominatim):
+    precision = zoom_to_geohash_precision(18)
+    assert geohash_encode(*POINT, precision) == geohash_encode(*JITTER, precision)
+    assert _reverse(POINT) == _reverse(JITTER)
+    assert len(nominatim) == 1
+
+
+def test_another_cell_is_another_lookup(nominatim):
+    precision = zoom_to_geohash_precision(18)
+    assert geohash_encode(*POINT, precision) != geohash_encode(*NEXT_STREET, precision)
+    assert _reverse(POINT)["display_name"] != _reverse(NEXT_STREET)["display_name"]
+    assert len(nominatim) == 2
+
+
+def test_cell_size_follows_zoom(nominatim):
+    # at city zoom the next street is in the same (much bigger) cell
+    assert _reverse(POINT, zoom=10) == _reverse(NEXT_STREET, zoom=10)
+    # and a zoom-18 answer isn't reused for zoom 10, or the other way round
+    _reverse(POINT, zoom=18)
+    assert [zoom for _, _, zoom in nominatim] == [10, 18]
+
+
+def test_max_error_guard(nominatim, monkeypatch):
+    monkeypatch.setattr(geo_server, "REVERSE_CACHE_MAX_ERROR_M", 1.0)
+    _reverse(POINT)
+    # same cell, but farther than 1 m from the point that produced the answer
+    _reverse(JITTER)
+    assert len(nominatim) == 2
+    _reverse(JITTER)
+    assert len(nominatim) == 2
@@ -0,0 +1,73 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from maps import routing_server
+from maps.cache import TTLCache
+
+START = (33.89380, 35.50180)
+END = (34.12300, 35.65190)
+# a few meters off, rounds to the same ROUTE_CACHE_PRECISION = 4 key
+WOBBLE = (33.89382, 35.50183)
+
+
+@pytest.fixture
+def backends(monkeypatch):
+    monkeypatch.setattr(routing_server, "ROUTE_CACHE", TTLCache("test_route"))
+    monkeypatch.setattr(routing_server, "MATRIX_CELL_CACHE", TTLCache("test_cells"))
+    monkeypatch.setattr(routing_server, "ROUTE_CACHE_PRECISION", 4)
+    monkeypatch.setattr(routing_server, "ROUTING_BACKEND", "osrm")
+    calls = []
+
+    async def osrm_get(path, params=None, priority="interactive"):
+        calls.append(("osrm", path))
+        return {"routes": [{"distance": 28_000.0, "duration": 1_900.0, "legs": [], "geometry": None}]}
+
+    class Local:
+        def route(self, start_lat, start_lon, end_lat, end_lon, geometry=False):
+            calls.append(("local", start_lat))
+            return {"distance": 27_500.0, "duration": 2_100.0, "legs": [], "geometry": None}
+
+    monkeypatch.setattr(routing_server, "_osrm_get", osrm_get)
+    monkeypatch.setattr(routing_server, "_local_router", lambda profile: Local())
+    return calls
+
+
+def _route(start=START, end=END, profile="driving", overview="false"):
+    return asyncio.run(routing_server._route(*start, *end, profile=profile, overview=overview))
+
+
+def test_wobbling_endpoints_share_a_route(backends):
+    assert _route() == _route(start=WOBBLE)
+    assert len(backends) == 1
+
+
+def test_profile_and_overview_are_part_of_the_key(backends):
+    _route()
+    _route(profile="walking")
+    _route(overview="full")
+    assert len(backends) == 3
+
+
+def test_routes_are_cached_per_backend(backends, monkeypatch):
+    osrm = _route()
+    monkeypatch.setattr(routing_server, "ROUTING_BACKEND", "local")
+    local = _route()
+    assert (osrm["distance_m"], local["distance_m"]) == (28_000.0, 27_500.0)
+    assert [backend for backend, _ in backends] == ["osrm", "local"]
+
+
+def test_matrix_cells_answer_route_between_for_their_backend_only(backends, monkeypatch):
+    durations = np.array([[0.0, 1_800.0], [1_850.0, 0.0]])
+    distances = np.array([[0.0, 27_000.0], [27_100.0, 0.0]])
+    routing_server._remember_matrix_cells("driving", [START, END], [START, END], durations, distances)
+
+    route = _route()
+    assert route["from_matrix"] is True
+    assert (route["duration_s"], route["distance_m"]) == (1_800.0, 27_000.0)
+    assert backends == []
+
+    monkeypatch.setattr(routing_server, "ROUTING_BACKEND", "local")
+    assert "from_matrix" not in _route()
+    assert [backend for backend, _ in backends] == ["local"]
@@ -0,0 +1,82 @@
+import asyncio
+import json
+
+import pytest
+
+from maps import routing_server
+from maps.encoding import decode_polyline, encode_polyline
+
+BEIRUT = [33.8938, 35.5018]
+BYBLOS = [34.1230, 35.6519]
+SIDON = [33.5571, 35.3729]
+
+
+@pytest.fixture
+def routed(monkeypatch):
+    """
+    Stand-in for _route: distance and duration from the coordinates, and a
+    two-point geometry, so rows can be traced back to their pair.
+    """
+    calls = []
+
+    async def route(start_lat, start_lon, end_lat, end_lon, profile, overview, encoding, priority="interactive"):
+        calls.append((start_lat, start_lon, end_lat, end_lon))
+        if (start_lat, start_lon) == (end_lat, end_lon):
+            raise RuntimeError("NoRoute")
+        geometry = encode_polyline([(start_lat, start_lon), (end_lat, end_lon)]) if overview != "false" else None
+        return {
+            "distance_m": 1000 * start_lat + end_lat,
+            "duration_s": 10 * start_lon + end_lon,
+            "legs": None,
+            "geometry": geometry,
+        }
+
+    monkeypatch.setattr(routing_server, "_route", route)
+    return calls
+
+
+def _route_many(**arguments):
+    return json.loads(asyncio.run(routing_server._tool_route_many(arguments))[0].text)
+
+
+def test_rows_follow_the_input_order(routed):
+    pairs = [BEIRUT + BYBLOS, BYBLOS + SIDON, SIDON + BEIRUT]
+    body = _route_many(pairs=pairs)
+    assert body["count"] == body["unique"] == 3
+    assert body["columns"] == ["distance_m", "duration_s"]
+    for pair, row in zip(pairs, body["rows"]):
+        assert row == [round(1000 * pair[0] + pair[2], 1), round(10 * pair[1] + pair[3], 1)]
+    assert body["errors"] == []
+
+
+def test_identical_pairs_are_routed_once(routed):
+    pairs = [BEIRUT + BYBLOS, BYBLOS + SIDON, BEIRUT + BYBLOS, BEIRUT + BYBLOS]
+    body = _route_many(pairs=pairs)
+    assert body["count"] == 4
+    assert body["unique"] == 2
+    assert len(routed) == 2
+    assert body["rows"][0] == body["rows"][2] == body["rows"][3]
+    assert body["rows"][1] != body["rows"][0]
+
+
+def test_reversed_pairs_are_shared_only_when_the_profile_is_symmetric(routed):
+    pairs = [BEIRUT + BYBLOS, BYBLOS + BEIRUT]
+    assert _route_many(pairs=pairs, profile="driving")["unique"] == 2
+    routed.clear()
+    body = _route_many(pairs=pairs, profile="walking", geometry=True)
+    assert body["unique"] == 1
+    assert len(routed) == 1
+    # the reversed pair gets the geometry the other way round
+    forward, backward = (decode_polyline(row[2]) for row in body["rows"])
+    assert backward == forward[::-1]
+    assert forward[0] == pytest.approx(tuple(BEIRUT), abs=1e-5)
+    assert backward[0] == pytest.approx(tuple(BYBLOS), abs=1e-5)
+
+
+def test_a_bad_pair_only_costs_its_own_row(routed):
+    pairs = [BEIRUT + BYBLOS, BEIRUT + BEIRUT, [33.9, 35.5], BYBLOS + SIDON]
+    body = _route_many(pairs=pairs)
+    assert body["rows"][1] is None and body["rows"][2] is None
+    assert body["rows"][0] is not None and body["rows"][3] is not None
+    assert [index for index, _ in body["errors"]] == [1, 2]
+    assert "NoRoute" in body["errors"][0][1]
@@ -0,0 +1,163 @@
+import asyncio
+import time
+import types
+
+import pytest
+
+from maps import scheduler
+from maps.scheduler import SchedulerFull, TokenBucket, UpstreamScheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(scheduler, "time", types.SimpleNamespace(monotonic=fake.monotonic))
+    return fake
+
+
+def test_bucket_refills_at_the_rate(clock):
+    bucket = TokenBucket(rate=2.0, burst=2.0)
+    bucket.take()
+    bucket.take()
+    assert bucket.wait_time() == pytest.approx(0.5)
+    clock.now += 0.5
+    assert bucket.wait_time() == 0.0
+    clock.now += 10
+    bucket.take()
+    bucket.take()
+    # never more than the burst
+    assert bucket.wait_time() == pytest.approx(0.5)
+
+
+def test_pause_stops_the_refill(clock):
+    bucket = TokenBucket(rate=10.0, burst=5.0)
+    bucket.pause(2.0)
+    clock.now += 1.0
+    assert bucket.wait_time() == pytest.approx(1.0)
+    # pause over: the bucket starts empty instead of full from the 2 s it was paused
+    clock.now += 1.0
+    assert bucket.wait_time() == pytest.approx(0.1)
+    clock.now += 0.1
+    assert bucket.wait_time() == 0.0
+    bucket.take()
+    assert bucket.wait_time() == pytest.approx(0.1)
+
+
+def test_take_during_a_pause_does_not_refill(clock):
+    bucket = TokenBucket(rate=10.0, burst=5.0)
+    bucket.pause(1.0)
+    bucket.take()
+    clock.now += 1.0
+    assert bucket.tokens == -1.0
+    assert bucket.wait_time() == pytest.approx(0.2)
+
+
+def test_a_shorter_pause_does_not_cut_a_longer_one(clock):
+    bucket = TokenBucket(rate=10.0)
+    bucket.pause(5.0)
+    bucket.pause(1.0)
+    clock.now += 2.0
+    assert bucket.wait_time() == pytest.approx(3.0)
+
+
+def test_paused_scheduler_holds_its_queue():
+    async def run():
+        limiter = UpstreamScheduler("test", rate=100.0, burst=5.0)
+        limiter.pause(0.1)
+        started = time.monotonic()
+        await limiter.submit(None, lambda: asyncio.sleep(0))
+        return time.monotonic() - started
+
+    assert asyncio.run(run()) >= 0.1
+
+
+def test_identical_requests_share_one_call():
+    calls = []
+
+    async def fetch(name):
+        calls.append(name)
+        await asyncio.sleep(0.01)
+        return {"name": name}
+
+    async def run():
+        limiter = UpstreamScheduler("test", rate=0)
+        results = await asyncio.gather(
+            limiter.submit("a", lambda: fetch("a")),
+            limiter.submit("a", lambda: fetch("a")),
+            limiter.submit("b", lambda: fetch("b")),
+        )
+        return limiter, results
+
+    limiter, results = asyncio.run(run())
+    assert results == [{"name": "a"}, {"name": "a"}, {"name": "b"}]
+    assert sorted(calls) == ["a", "b"]
+    assert limiter.coalesced == 1
+    # done: the key is free again
+    assert limiter.stats()["in_flight_keys"] == 0
+
+
+def test_shared_call_hands_its_error_to_every_waiter():
+    calls = 0
+
+    async def fail():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    async def run():
+        limiter = UpstreamScheduler("test", rate=0)
+        return await asyncio.gather(
+            limiter.submit("k", fail), limiter.submit("k", fail), return_exceptions=True
+        )
+
+    errors = asyncio.run(run())
+    assert calls == 1
+    assert all(isinstance(e, RuntimeError) for e in errors)
+
+
+def test_interactive_lane_goes_before_batch():
+    order = []
+
+    def job(name):
+        async def run():
+            order.append(name)
+
+        return run
+
+    async def run():
+        limiter = UpstreamScheduler("test", rate=0, max_concurrency=1)
+        # all queued before the dispatcher first runs
+        await asyncio.gather(
+            limiter.submit(None, job("batch 1"), priority="batch"),
+            limiter.submit(None, job("batch 2"), priority="batch"),
+            limiter.submit(None, job("interactive 1")),
+            limiter.submit(None, job("interactive 2"), priority="interactive"),
+        )
+
+    asyncio.run(run())
+    assert order == ["interactive 1", "interactive 2", "batch 1", "batch 2"]
+
+
+def test_full_queue_is_rejected():
+    async def run():
+        limiter = UpstreamScheduler("test", rate=0.001, max_queue=1, deadline=0)
+        # the first one takes the only token, the second waits, the third doesn't fit
+        first = asyncio.create_task(limiter.submit(None, lambda: asyncio.sleep(0)))
+        await first
+        waiting = asyncio.create_task(limiter.submit(None, lambda: asyncio.sleep(0)))
+        await asyncio.sleep(0)
+        with pytest.raises(SchedulerFull):
+            await limiter.submit(None, lambda: asyncio.sleep(0))
+        waiting.cancel()
+        return limiter.rejected
+
+    assert asyncio.run(run()) == 1
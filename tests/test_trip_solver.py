@@ -0,0 +1,76 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from maps.trip_solver import path_cost, solve_trip
+
+
+def _random_cost(n: int, seed: int, symmetric: bool = True) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    points = rng.random((n, 2))
+    cost = np.linalg.norm(points[:, None] - points[None, :], axis=-1)
+    if not symmetric:
+        cost = cost * rng.uniform(1.0, 1.5, size=(n, n))
+    return cost
+
+
+def _brute_force(cost: np.ndarray, start: int, end: int | None) -> float:
+    n = len(cost)
+    rest = [v for v in range(n) if v not in (start, end)]
+    best = float("inf")
+    for perm in itertools.permutations(rest):
+        tail = [] if end is None else [end]
+        best = min(best, path_cost(cost, [start, *perm, *tail]))
+    return best
+
+
+@pytest.mark.parametrize("seed", range(3))
+@pytest.mark.parametrize("symmetric", [True, False])
+def test_round_trip_is_optimal_on_small_instances(seed, symmetric):
+    cost = _random_cost(8, seed, symmetric)
+    result = solve_trip(cost, max_seconds=0.5)
+    order = result["order"]
+    assert order[0] == order[-1] == 0
+    assert sorted(order[:-1]) == list(range(8))
+    assert result["cost"] == pytest.approx(_brute_force(cost, 0, 0))
+    assert result["cost"] <= result["seed_cost"] + 1e-9
+
+
+def test_fixed_start_and_end():
+    cost = _random_cost(8, 5)
+    result = solve_trip(cost, start=2, end=6, round_trip=False, max_seconds=0.5)
+    order = result["order"]
+    assert (order[0], order[-1]) == (2, 6)
+    assert sorted(order) == list(range(8))
+    assert result["cost"] == pytest.approx(_brute_force(cost, 2, 6))
+
+
+def test_open_end():
+    cost = _random_cost(8, 7)
+    result = solve_trip(cost, start=0, end=None, round_trip=False, max_seconds=0.5)
+    order = result["order"]
+    assert order[0] == 0
+    assert sorted(order) == list(range(8))
+    assert result["cost"] == pytest.approx(_brute_force(cost, 0, None))
+
+
+def test_unreachable_pairs_are_avoided():
+    cost = _random_cost(6, 1)
+    cost[0, 1] = cost[1, 0] = np.nan
+    order = solve_trip(cost, max_seconds=0.2)["order"]
+    pairs = set(zip(order, order[1:]))
+    assert (0, 1) not in pairs and (1, 0) not in pairs
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {"start": 9},
+        {"start": 0, "end": 3, "round_trip": True},
+        {"start": 2, "end": 2, "round_trip": False},
+    ],
+)
+def test_invalid_endpoints(kwargs):
+    with pytest.raises(ValueError):
+        solve_trip(_random_cost(5, 0), **kwargs)
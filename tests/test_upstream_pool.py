@@ -0,0 +1,185 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from maps import http_clients, upstream_pool
+from maps.scheduler import UpstreamScheduler
+from maps.upstream_pool import EndpointPool, UpstreamUnavailable
+
+HEALTHY = "http://healthy"
+SLOW = "http://slow"
+BROKEN = "http://broken"
+REFUSING = "http://refusing"
+
+
+def _healthy(request):
+    return httpx.Response(200, json={"from": "healthy"})
+
+
+def _broken(request):
+    return httpx.Response(503)
+
+
+def _refusing(request):
+    raise httpx.ConnectError("connection refused", request=request)
+
+
+class _Slow:
+    """
+    Answers after `seconds`; remembers whether the request was cancelled instead.
+    """
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.cancelled = False
+
+    async def __call__(self, request):
+        try:
+            await asyncio.sleep(self.seconds)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        return httpx.Response(200, json={"from": "slow"})
+
+
+@pytest.fixture(autouse=True)
+def _deterministic(monkeypatch):
+    # no random exploration, no backoff sleeps
+    monkeypatch.setattr(upstream_pool, "EXPLORE", 0.0)
+    monkeypatch.setattr(upstream_pool, "RETRY_BACKOFF", 0.0)
+
+
+def _pool(monkeypatch, handlers: dict, **kwargs) -> EndpointPool:
+    # the pool gets its per-endpoint clients from maps.http_clients
+    for url, handler in handlers.items():
+        client = httpx.AsyncClient(base_url=url, transport=httpx.MockTransport(handler))
+        monkeypatch.setitem(http_clients._clients, f"test {url}", client)
+    return EndpointPool("test", list(handlers), timeout=5.0, **kwargs)
+
+
+def _get(pool: EndpointPool) -> httpx.Response:
+    return asyncio.run(pool.get("/status"))
+
+
+@pytest.mark.parametrize("failing", [_refusing, _broken])
+def test_fails_over_to_the_healthy_endpoint(monkeypatch, failing):
+    pool = _pool(monkeypatch, {BROKEN: failing, HEALTHY: _healthy})
+    resp = _get(pool)
+    assert resp.json() == {"from": "healthy"}
+    assert pool.retried == 1
+    assert pool.endpoints[0].errors == 1
+
+
+def test_last_bad_response_when_nothing_is_healthy(monkeypatch):
+    pool = _pool(monkeypatch, {BROKEN: _broken}, retries=1)
+    assert _get(pool).status_code == 503
+    assert pool.endpoints[0].requests == 2
+
+
+def _warm(pool: EndpointPool) -> None:
+    # enough latency samples for a hedge delay, and the first endpoint ranked first
+    for endpoint in pool.endpoints:
+        endpoint.window.extend([0.01] * upstream_pool.MIN_SAMPLES)
+    pool.endpoints[0].ewma_s = 0.001
+    pool.endpoints[1].ewma_s = 0.01
+    # well inside the hedge budget
+    pool.requests = 100
+
+
+def test_hedge_fires_after_the_delay_and_the_loser_is_cancelled(monkeypatch):
+    slow = _Slow(5.0)
+    pool = _pool(monkeypatch, {SLOW: slow, HEALTHY: _healthy})
+    _warm(pool)
+    started = time.perf_counter()
+    resp = _get(pool)
+    elapsed = time.perf_counter() - started
+    assert resp.json() == {"from": "healthy"}
+    assert upstream_pool.HEDGE_MIN_DELAY <= elapsed < 1.0
+    assert pool.hedged == 1
+    assert pool.endpoints[1].hedge_wins == 1
+    assert slow.cancelled
+    assert pool.endpoints[0].inflight == 0
+
+
+def test_no_hedge_when_the_answer_is_quick(monkeypatch):
+    pool = _pool(monkeypatch, {HEALTHY: _healthy, SLOW: _Slow(5.0)})
+    _warm(pool)
+    assert _get(pool).json() == {"from": "healthy"}
+    assert pool.hedged == 0
+    assert pool.endpoints[1].requests == 0
+
+
+def test_breaker_opens_and_recovers_after_half_open(monkeypatch):
+    monkeypatch.setattr(upstream_pool, "CIRCUIT_FAILURES", 2)
+    monkeypatch.setattr(upstream_pool, "CIRCUIT_COOLDOWN", 0.05)
+    state = {"healthy": False}
+
+    def flaky(request):
+        return _healthy(request) if state["healthy"] else _broken(request)
+
+    pool = _pool(monkeypatch, {BROKEN: flaky}, retries=0)
+    endpoint = pool.endpoints[0]
+    assert _get(pool).status_code == 503
+    assert endpoint.state(time.monotonic()) == "closed"
+    assert _get(pool).status_code == 503
+    assert endpoint.state(time.monotonic()) == "open"
+
+    # open: fails fast without sending anything
+    with pytest.raises(UpstreamUnavailable):
+        _get(pool)
+    assert endpoint.requests == 2
+
+    time.sleep(0.05 * 1.2 + 0.01)
+    assert endpoint.state(time.monotonic()) == "half_open"
+    state["healthy"] = True
+    assert _get(pool).status_code == 200
+    assert endpoint.state(time.monotonic()) == "closed"
+    assert endpoint.opened == 1
+
+
+def test_failed_probe_reopens_for_longer(monkeypatch):
+    monkeypatch.setattr(upstream_pool, "CIRCUIT_FAILURES", 1)
+    monkeypatch.setattr(upstream_pool, "CIRCUIT_COOLDOWN", 0.05)
+    pool = _pool(monkeypatch, {BROKEN: _broken}, retries=0)
+    endpoint = pool.endpoints[0]
+    _get(pool)
+    first = endpoint.open_until - time.monotonic()
+    time.sleep(0.05 * 1.2 + 0.01)
+    _get(pool)
+    assert endpoint.state(time.monotonic()) == "open"
+    assert endpoint.open_until - time.monotonic() > first
+    assert endpoint.opened == 2
+
+
+def test_each_retry_takes_a_scheduler_token(monkeypatch):
+    limiter = UpstreamScheduler("test", rate=1.0, burst=5.0)
+    pool = _pool(monkeypatch, {REFUSING: _refusing, BROKEN: _broken, HEALTHY: _healthy}, limiter=limiter)
+    # healthy last: make the failing ones look better so both are tried first
+    pool.endpoints[2].ewma_s = 1.0
+    assert _get(pool).json() == {"from": "healthy"}
+    assert pool.retried == 2
+    assert limiter.extra == 2
+    assert limiter.bucket.tokens == pytest.approx(3.0, abs=0.01)
+
+
+def test_each_hedge_takes_a_scheduler_token(monkeypatch):
+    limiter = UpstreamScheduler("test", rate=1.0, burst=5.0)
+    pool = _pool(monkeypatch, {SLOW: _Slow(5.0), HEALTHY: _healthy}, limiter=limiter)
+    _warm(pool)
+    assert _get(pool).json() == {"from": "healthy"}
+    assert pool.hedged == 1
+    assert limiter.extra == 1
+
+
+def test_no_hedge_without_a_free_token(monkeypatch):
+    limiter = UpstreamScheduler("test", rate=1.0, burst=1.0)
+    # the queued request already spent the only token
+    limiter.bucket.take()
+    pool = _pool(monkeypatch, {SLOW: _Slow(0.2), HEALTHY: _healthy}, limiter=limiter)
+    _warm(pool)
+    assert _get(pool).json() == {"from": "slow"}
+    assert pool.hedged == 0
+    assert limiter.extra == 0
+    assert pool.endpoints[1].requests == 0